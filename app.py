@@ -1,7 +1,10 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
+from urllib.parse import quote
 from flask_cors import CORS
 import os
 import sys
+import time
+import queue
 import traceback
 from datetime import datetime
 import logging
@@ -23,6 +26,22 @@ except ImportError as e:
     logger.error(f"导入邮件同步模块错误: {e}")
     EmailSyncAction = None
 
+from email_providers import EmailProviderFactory, FETCH_MODES, ATTACHMENT_MODES
+from imap_utils import normalize_search_filters, decode_page_cursor
+from connection_pool import get_connection_pool
+from message_cache import get_default_message_cache
+from search_index import get_search_index, parse_date_param, SEARCH_FIELDS
+from sync_coalescer import get_sync_coalescer, sync_key
+from parse_pool import get_parse_pool
+from sync_jobs import get_job_manager, peek_job_manager, JOB_MIN_INTERVAL
+from mail_watcher import get_watch_hub, format_sse, check_webhook_url, WatchLimitError
+from resilience import AuthenticationError, ThrottledError, CircuitOpenError, breaker_stats
+from memory_budget import get_memory_budget
+from metrics import observe_phase, stats_collector, render_metrics, REGISTRY, PHASE_SECONDS
+from response_encoding import (
+    negotiate_format, negotiate_encoding, compress_chunks, iter_document, encode_record, media_type
+)
+
 app = Flask(__name__)
 CORS(app)  # 启用跨域支持
 
@@ -48,15 +67,115 @@ def index():
             'health': '/health',
             'status': '/api/status',
             'supported_providers': '/api/providers',
-            'sync_email': '/api/sync/email'
+            'sync_email': '/api/sync/email',
+            'sync_batch': '/api/sync/batch',
+            'sync_jobs': '/api/jobs',
+            'sync_schedules': '/api/schedules',
+            'download_attachment': '/api/attachments/<uid>/<part>',
+            'search': '/api/search',
+            'watch': '/api/watch/<account>',
+            'watch_webhooks': '/api/watch/<account>/webhooks',
+            'metrics': '/metrics'
         }
     })
 
 
 
+def _record_stream(records, fmt='json', metrics_provider=''):
+    """逐条序列化流式获取的记录：json 为NDJSON（每条记录一行），msgpack/cbor 为对象序列"""
+    for record in records:
+        if record.get('type') == 'summary':
+            record['timestamp'] = datetime.now().isoformat()
+            logger.info(f"流式邮件获取完成: 共 {record.get('total_emails', 0)} 封, 成功: {record.get('success')}")
+        with observe_phase(metrics_provider, 'serialize'):
+            data = encode_record(record, fmt)
+        yield data
+
+def _timed_serialize(chunks, metrics_provider=''):
+    """响应体在返回过程中逐段编码和压缩，各段耗时合计后记为一次 serialize 阶段"""
+    elapsed = 0.0
+    iterator = iter(chunks)
+    while True:
+        started = time.perf_counter()
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            elapsed += time.perf_counter() - started
+        yield chunk
+    PHASE_SECONDS.observe(elapsed, provider=metrics_provider, phase='serialize')
+
+def _encoded_response(chunks, mimetype, encoding=None):
+    """流式响应，encoding 为协商出的压缩算法"""
+    headers = {'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(chunks, mimetype=mimetype, headers=headers)
+
+def _build_sync_config(data):
+    """校验请求参数并构造 EmailSyncAction 配置，返回 (配置, 错误信息)"""
+    # 验证必需参数（仅邮件相关）
+    required_params = ['email_username', 'email_password']
+    missing_params = [param for param in required_params if not data.get(param)]
+    
+    if missing_params:
+        return None, f'缺少必需参数: {", ".join(missing_params)}'
+    
+    # 验证邮箱类型
+    email_provider = data.get('provider', data.get('email_provider', 'feishu'))
+    supported_providers = EmailProviderFactory.get_supported_providers()
+    
+    if email_provider not in supported_providers:
+        return None, f'不支持的邮箱类型: {email_provider}. 支持的类型: {supported_providers}'
+    
+    fetch_mode = data.get('mode', 'full')
+    if fetch_mode not in FETCH_MODES:
+        return None, f'不支持的获取模式: {fetch_mode}. 支持的模式: {list(FETCH_MODES)}'
+    
+    attachment_mode = data.get('attachment_mode', 'inline')
+    if attachment_mode not in ATTACHMENT_MODES:
+        return None, f'不支持的附件模式: {attachment_mode}. 支持的模式: {list(ATTACHMENT_MODES)}'
+    
+    folders = data.get('folders')
+    if folders is not None and not isinstance(folders, (str, list)):
+        return None, 'folders 参数必须是文件夹名列表或逗号分隔的字符串'
+    
+    try:
+        normalize_search_filters(data.get('filters'))
+        if data.get('cursor'):
+            decode_page_cursor(data['cursor'])
+            if data.get('incremental') or data.get('delta') or data.get('folders'):
+                return None, '分页游标不能与增量同步或多文件夹同步同时使用'
+    except ValueError as e:
+        return None, str(e)
+    
+    # 创建邮件获取器实例，传入配置
+    config = {
+        'email_username': data['email_username'],
+        'email_password': data['email_password'],
+        'email_provider': email_provider,
+        'email_count': data.get('email_count', 50),
+        'fetch_batch_size': data.get('fetch_batch_size', 100),
+        'email_folder': data.get('folder', 'INBOX'),
+        'email_folders': data.get('folders'),
+        'folder_concurrency': data.get('folder_concurrency', int(os.getenv('FOLDER_CONCURRENCY', '2'))),
+        'incremental': bool(data.get('incremental', False)),
+        'delta': bool(data.get('delta', False)),
+        'fetch_mode': fetch_mode,
+        'attachment_mode': attachment_mode,
+        'search_filters': data.get('filters') or None,
+        'page_cursor': data.get('cursor') or None
+    }
+    return config, None
+
 @app.route('/api/sync/email', methods=['POST'])
 def sync_emails():
-    """触发邮件获取"""
+    """触发邮件获取
+
+    参数和凭据完全相同的并发请求共用一次同步（SYNC_COALESCE_ENABLED），合并只在同一 gunicorn worker 内进行，
+    落在不同 worker 上的相同请求各自同步
+    """
     try:
         if EmailSyncAction is None:
             return jsonify({
@@ -68,56 +187,71 @@ def sync_emails():
         # 获取请求参数
         data = request.get_json() or {}
         
-        # 验证必需参数（仅邮件相关）
-        required_params = ['email_username', 'email_password']
-        missing_params = [param for param in required_params if not data.get(param)]
-        
-        if missing_params:
+        config, error = _build_sync_config(data)
+        if error:
             return jsonify({
                 'success': False,
-                'error': f'缺少必需参数: {", ".join(missing_params)}',
+                'error': error,
                 'timestamp': datetime.now().isoformat(),
                 'message': '邮件获取失败'
             }), 400
         
-        # 验证邮箱类型
-        email_provider = data.get('provider', data.get('email_provider', 'feishu'))
-        from email_providers import EmailProviderFactory
-        supported_providers = EmailProviderFactory.get_supported_providers()
-        
-        if email_provider not in supported_providers:
+        response_format, error = negotiate_format(data.get('format'), request.headers.get('Accept', ''))
+        if error:
             return jsonify({
                 'success': False,
-                'error': f'不支持的邮箱类型: {email_provider}. 支持的类型: {supported_providers}',
+                'error': error,
                 'timestamp': datetime.now().isoformat(),
                 'message': '邮件获取失败'
             }), 400
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
         
         logger.info(f"开始邮件获取，用户: {data['email_username']}")
         
-        # 创建邮件获取器实例，传入配置
-        config = {
-            'email_username': data['email_username'],
-            'email_password': data['email_password'],
-            'email_provider': email_provider,
-            'email_count': data.get('email_count', 50)
-        }
+        # 流式模式：stream=true 或 Accept: application/x-ndjson
+        stream = str(data.get('stream', '')).lower() in ('true', '1') or \
+            'application/x-ndjson' in request.headers.get('Accept', '')
+        if stream and 'fetch_batch_size' not in data:
+            # 逐封获取，内存占用以单封邮件为上限，首字节时间为一封邮件的获取时间
+            config['fetch_batch_size'] = 1
         
         logger.info(f"邮件获取配置 - 用户: {config['email_username']}, 数量: {config['email_count']}, 提供商: {config['email_provider']}")
         
-        syncer = EmailSyncAction(config)
+        metrics_provider = EmailProviderFactory.metrics_name(config['email_provider'])
         
-        # 执行邮件获取
-        result = syncer.sync_emails()
+        if stream:
+            syncer = EmailSyncAction(config)
+            records = _record_stream(syncer.iter_sync_emails(), response_format, metrics_provider)
+            return _encoded_response(stream_with_context(compress_chunks(records, encoding, flush_each=True)),
+                                     media_type(response_format, stream=True), encoding)
         
-        logger.info(f"邮件获取完成: {result}")
+        # 执行邮件获取：参数和凭据完全相同的并发请求共用一次同步，非增量请求可复用刚完成的结果。
+        # 同步器只在实际执行同步的请求中创建，等待合并结果的请求不创建
+        coalesced = None
+        if os.getenv('SYNC_COALESCE_ENABLED', 'true').lower() == 'true':
+            result, coalesced = get_sync_coalescer().run(
+                sync_key(config), lambda: EmailSyncAction(dict(config)).sync_emails(),
+                reuse=not (config['incremental'] or config['delta']),
+                metrics_provider=metrics_provider
+            )
+        else:
+            result = EmailSyncAction(config).sync_emails()
         
-        return jsonify({
+        logger.info(f"邮件获取完成: 共 {result.get('total_emails', 0)} 封, 成功: {result.get('success')}" +
+                    (f"（与相同请求合并: {coalesced}）" if coalesced else ''))
+        
+        document = {
             'success': True,
             'data': result,
             'timestamp': datetime.now().isoformat(),
             'message': '邮件同步完成'
-        }), 200
+        }
+        chunks = _timed_serialize(compress_chunks(iter_document(document, response_format), encoding),
+                                  metrics_provider)
+        response = _encoded_response(chunks, media_type(response_format), encoding)
+        if coalesced:
+            response.headers['X-Sync-Coalesced'] = coalesced
+        return response
         
     except Exception as e:
         error_msg = str(e)
@@ -133,6 +267,543 @@ def sync_emails():
             'message': '邮件同步失败'
         }), 500
 
+@app.route('/api/sync/batch', methods=['POST'])
+def sync_batch():
+    """批量获取多个账号的邮件
+    
+    请求体: {"accounts": [<与 /api/sync/email 相同的参数>, ...],
+             "max_workers": 8, "provider_concurrency": {"gmail": 2}}
+    """
+    try:
+        if EmailSyncAction is None:
+            return jsonify({
+                'success': False,
+                'error': '邮件获取模块未正确加载',
+                'timestamp': datetime.now().isoformat()
+            }), 500
+        
+        from batch_sync import BatchSyncRunner, BATCH_MAX_WORKERS, BATCH_MAX_ACCOUNTS
+        
+        data = request.get_json() or {}
+        accounts = data.get('accounts')
+        if not isinstance(accounts, list) or not accounts:
+            return jsonify({
+                'success': False,
+                'error': '缺少必需参数: accounts（账号配置列表）',
+                'timestamp': datetime.now().isoformat(),
+                'message': '批量邮件获取失败'
+            }), 400
+        
+        if len(accounts) > BATCH_MAX_ACCOUNTS:
+            return jsonify({
+                'success': False,
+                'error': f'账号数量 {len(accounts)} 超过单次上限 {BATCH_MAX_ACCOUNTS}',
+                'timestamp': datetime.now().isoformat(),
+                'message': '批量邮件获取失败'
+            }), 400
+        
+        # 参数校验失败的账号直接记录错误，不影响其他账号
+        configs = []
+        results = [None] * len(accounts)
+        positions = []
+        for index, account in enumerate(accounts):
+            config, error = _build_sync_config(account if isinstance(account, dict) else {})
+            if error:
+                results[index] = {
+                    'index': index,
+                    'email_username': account.get('email_username') if isinstance(account, dict) else None,
+                    'success': False,
+                    'error': error
+                }
+                continue
+            configs.append(config)
+            positions.append(index)
+        
+        provider_concurrency = data.get('provider_concurrency')
+        try:
+            if provider_concurrency is not None and not isinstance(provider_concurrency, dict):
+                raise ValueError('provider_concurrency 必须是 {服务商: 并发数} 对象')
+            max_workers = min(int(data.get('max_workers') or BATCH_MAX_WORKERS), BATCH_MAX_WORKERS)
+            runner = BatchSyncRunner(max_workers=max_workers, provider_concurrency=provider_concurrency)
+        except (TypeError, ValueError) as e:
+            return jsonify({
+                'success': False,
+                'error': f'并发参数无效: {str(e)}',
+                'timestamp': datetime.now().isoformat(),
+                'message': '批量邮件获取失败'
+            }), 400
+        
+        logger.info(f"开始批量邮件获取，账号数: {len(accounts)}, 并发: {max_workers}")
+        started = datetime.now()
+        for position, account_result in zip(positions, runner.run(configs)):
+            account_result['index'] = position
+            results[position] = account_result
+        elapsed = (datetime.now() - started).total_seconds()
+        
+        succeeded = sum(1 for r in results if r['success'])
+        logger.info(f"批量邮件获取完成: 成功 {succeeded}/{len(results)}, 耗时 {elapsed:.2f}s")
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'total_accounts': len(results),
+                'succeeded': succeeded,
+                'failed': len(results) - succeeded,
+                'elapsed_seconds': round(elapsed, 3),
+                'results': results
+            },
+            'timestamp': datetime.now().isoformat(),
+            'message': '批量邮件同步完成'
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"批量邮件同步失败: {str(e)}")
+        logger.error(f"错误堆栈: {traceback.format_exc()}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat(),
+            'message': '批量邮件同步失败'
+        }), 500
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_sync_job():
+    """提交后台同步任务，立即返回任务ID
+    
+    请求参数与 /api/sync/email 相同，任务状态和结果通过 GET /api/jobs/<job_id> 查询
+    """
+    try:
+        if EmailSyncAction is None:
+            return jsonify({
+                'success': False,
+                'error': '邮件获取模块未正确加载',
+                'timestamp': datetime.now().isoformat()
+            }), 500
+        
+        data = request.get_json() or {}
+        config, error = _build_sync_config(data)
+        if error:
+            return jsonify({
+                'success': False,
+                'error': error,
+                'timestamp': datetime.now().isoformat(),
+                'message': '提交同步任务失败'
+            }), 400
+        
+        job = get_job_manager().submit(config)
+        logger.info(f"已提交后台同步任务 {job['job_id']}，用户: {data['email_username']}")
+        return jsonify({
+            'success': True,
+            'data': job,
+            'timestamp': datetime.now().isoformat(),
+            'message': '同步任务已提交'
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"提交同步任务失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat(),
+            'message': '提交同步任务失败'
+        }), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_sync_job(job_id):
+    """查询后台同步任务的状态和结果"""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': f'任务不存在: {job_id}',
+            'timestamp': datetime.now().isoformat()
+        }), 404
+    return jsonify({
+        'success': True,
+        'data': job,
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
+@app.route('/api/schedules', methods=['POST'])
+def create_sync_schedule():
+    """添加周期性同步计划
+    
+    请求参数与 /api/sync/email 相同，另加 interval_seconds（同步间隔，秒）
+    """
+    try:
+        if EmailSyncAction is None:
+            return jsonify({
+                'success': False,
+                'error': '邮件获取模块未正确加载',
+                'timestamp': datetime.now().isoformat()
+            }), 500
+        
+        data = request.get_json() or {}
+        config, error = _build_sync_config(data)
+        if not error:
+            try:
+                interval_seconds = int(data.get('interval_seconds') or 0)
+            except (TypeError, ValueError):
+                interval_seconds = 0
+            if interval_seconds < JOB_MIN_INTERVAL:
+                error = f'interval_seconds 不能小于 {JOB_MIN_INTERVAL} 秒'
+        if error:
+            return jsonify({
+                'success': False,
+                'error': error,
+                'timestamp': datetime.now().isoformat(),
+                'message': '添加同步计划失败'
+            }), 400
+        
+        schedule = get_job_manager().add_schedule(config, interval_seconds,
+                                                  run_immediately=bool(data.get('run_immediately', True)))
+        logger.info(f"已添加同步计划 {schedule['schedule_id']}，用户: {data['email_username']}, 间隔: {interval_seconds}s")
+        return jsonify({
+            'success': True,
+            'data': schedule,
+            'timestamp': datetime.now().isoformat(),
+            'message': '同步计划已添加'
+        }), 201
+        
+    except Exception as e:
+        logger.error(f"添加同步计划失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat(),
+            'message': '添加同步计划失败'
+        }), 500
+
+@app.route('/api/schedules', methods=['GET'])
+def list_sync_schedules():
+    """列出同步计划"""
+    return jsonify({
+        'success': True,
+        'data': get_job_manager().list_schedules(),
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
+@app.route('/api/schedules/<schedule_id>', methods=['DELETE'])
+def delete_sync_schedule(schedule_id):
+    """删除同步计划（已提交的任务不受影响）"""
+    if not get_job_manager().delete_schedule(schedule_id):
+        return jsonify({
+            'success': False,
+            'error': f'同步计划不存在: {schedule_id}',
+            'timestamp': datetime.now().isoformat()
+        }), 404
+    return jsonify({
+        'success': True,
+        'timestamp': datetime.now().isoformat(),
+        'message': '同步计划已删除'
+    }), 200
+
+@app.route('/api/attachments/<int:uid>/<part>', methods=['GET'])
+def download_attachment(uid, part):
+    """按UID和部件编号流式下载单个附件
+    
+    认证信息通过请求头传递：X-Email-Username、X-Email-Password、X-Email-Provider（可选，默认feishu）
+    查询参数：folder（可选，默认INBOX）
+    """
+    username = request.headers.get('X-Email-Username')
+    password = request.headers.get('X-Email-Password')
+    if not username or not password:
+        return jsonify({
+            'success': False,
+            'error': '缺少必需的请求头: X-Email-Username, X-Email-Password',
+            'timestamp': datetime.now().isoformat()
+        }), 400
+    
+    provider_type = request.headers.get('X-Email-Provider', request.args.get('provider', 'feishu'))
+    folder = request.args.get('folder', 'INBOX')
+    
+    try:
+        provider = EmailProviderFactory.create_provider(provider_type, username, password)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 400
+    
+    pool = get_connection_pool()
+    try:
+        pool.acquire(provider)
+    except Exception as e:
+        logger.error(f"获取附件失败 (UID: {uid}, 部件: {part}): {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'获取附件失败: {str(e)}',
+            'timestamp': datetime.now().isoformat()
+        }), 502
+    
+    try:
+        attachment = provider.get_attachment(uid, part, folder=folder)
+    except Exception as e:
+        pool.release(provider, broken=True)
+        logger.error(f"获取附件失败 (UID: {uid}, 部件: {part}): {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'获取附件失败: {str(e)}',
+            'timestamp': datetime.now().isoformat()
+        }), 502
+    
+    if attachment is None:
+        pool.release(provider)
+        return jsonify({
+            'success': False,
+            'error': f'附件不存在 (UID: {uid}, 部件: {part})',
+            'timestamp': datetime.now().isoformat()
+        }), 404
+    
+    def generate():
+        broken = True
+        try:
+            for chunk in attachment['content']:
+                yield chunk
+            broken = False
+        finally:
+            # 客户端中途断开时连接上可能还有未读完的响应，直接丢弃
+            pool.release(provider, broken=broken)
+    
+    filename = attachment['filename'] or f'attachment-{uid}-{part}'
+    headers = {
+        'Content-Disposition': f"attachment; filename*=UTF-8''{quote(filename)}"
+    }
+    return Response(stream_with_context(generate()), mimetype=attachment['content_type'], headers=headers)
+
+@app.route('/api/search', methods=['GET'])
+def search_emails():
+    """在本地搜索索引中搜索已同步的邮件，不访问邮箱服务器
+    
+    认证信息通过请求头传递：X-Email-Username、X-Email-Password、X-Email-Provider（可选，默认feishu），
+    须与最近一次成功同步时使用的凭据一致，否则返回 401；同一账号连续验证失败过多时返回 429
+    查询参数：q（全部字段）、subject/from/to/body/attachment（字段条件）、folder、since/until（ISO日期）、
+    has_attachments（true/false）、sort（rank/date）、limit（默认20，最大100）、offset
+    """
+    username = request.headers.get('X-Email-Username')
+    password = request.headers.get('X-Email-Password')
+    if not username or not password:
+        return jsonify({
+            'success': False,
+            'error': '缺少必需的请求头: X-Email-Username, X-Email-Password',
+            'timestamp': datetime.now().isoformat()
+        }), 400
+    
+    provider_type = request.headers.get('X-Email-Provider', request.args.get('provider', 'feishu'))
+    supported_providers = EmailProviderFactory.get_supported_providers()
+    if provider_type.lower() not in supported_providers:
+        return jsonify({
+            'success': False,
+            'error': f'不支持的邮箱类型: {provider_type}. 支持的类型: {supported_providers}',
+            'timestamp': datetime.now().isoformat()
+        }), 400
+    
+    index = _search_index()
+    if index is None:
+        return jsonify({
+            'success': False,
+            'error': '本地搜索索引未启用',
+            'timestamp': datetime.now().isoformat()
+        }), 503
+    
+    provider = EmailProviderFactory.metrics_name(provider_type)
+    retry_after = index.auth_retry_after(provider, username)
+    if retry_after is not None:
+        return jsonify({
+            'success': False,
+            'error': '验证失败次数过多，请稍后再试',
+            'timestamp': datetime.now().isoformat()
+        }), 429, {'Retry-After': str(int(retry_after) + 1)}
+    # 账号未同步和密码错误返回相同的响应，不暴露账号是否存在
+    if not index.verify(provider, username, password):
+        return jsonify({
+            'success': False,
+            'error': '凭据无效，或该账号尚未同步',
+            'timestamp': datetime.now().isoformat(),
+            'message': '请使用最近一次通过 /api/sync/email 同步时的凭据'
+        }), 401
+    
+    has_attachments = request.args.get('has_attachments')
+    try:
+        limit = min(max(1, int(request.args.get('limit', 20))), 100)
+        offset = max(0, int(request.args.get('offset', 0)))
+        started = time.perf_counter()
+        result = index.search(
+            provider, username,
+            query=request.args.get('q'),
+            fields={name: request.args[name] for name in SEARCH_FIELDS if request.args.get(name)},
+            folder=request.args.get('folder'),
+            since=parse_date_param(request.args.get('since')),
+            until=parse_date_param(request.args.get('until'), end=True),
+            has_attachments=None if has_attachments is None else has_attachments.lower() == 'true',
+            sort=request.args.get('sort', 'rank'),
+            limit=limit,
+            offset=offset
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'total': result['total'],
+        'emails': result['emails'],
+        'limit': limit,
+        'offset': offset,
+        'query_seconds': round(time.perf_counter() - started, 4),
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
+def _watch_credentials(account):
+    """从请求头读取监听接口的认证信息，返回 (邮箱类型, 密码, 错误响应)"""
+    password = request.headers.get('X-Email-Password')
+    if not password:
+        return None, None, (jsonify({
+            'success': False,
+            'error': '缺少必需的请求头: X-Email-Password',
+            'timestamp': datetime.now().isoformat()
+        }), 400)
+    username = request.headers.get('X-Email-Username')
+    if username and username.lower() != account.lower():
+        return None, None, (jsonify({
+            'success': False,
+            'error': 'X-Email-Username 与路径中的账号不一致',
+            'timestamp': datetime.now().isoformat()
+        }), 400)
+    provider_type = request.headers.get('X-Email-Provider', request.args.get('provider', 'feishu'))
+    return provider_type, password, None
+
+def _watch_error(e):
+    """监听接口的错误响应：凭据不一致 403，邮箱认证失败 401，参数错误 400，
+    监听数已满或邮箱服务器熔断、限流 503（带 Retry-After），连接失败 502"""
+    headers = {}
+    if isinstance(e, PermissionError):
+        status = 403
+    elif isinstance(e, AuthenticationError):
+        status = 401
+    elif isinstance(e, ValueError):
+        status = 400
+    elif isinstance(e, (WatchLimitError, ThrottledError, CircuitOpenError)):
+        status = 503
+        if getattr(e, 'retry_after', None):
+            headers['Retry-After'] = str(int(e.retry_after) + 1)
+    else:
+        status = 502
+    return jsonify({
+        'success': False,
+        'error': str(e),
+        'error_type': getattr(e, 'kind', 'error'),
+        'timestamp': datetime.now().isoformat(),
+        'message': '启动新邮件监听失败'
+    }), status, headers
+
+@app.route('/api/watch/<account>', methods=['GET'])
+def watch_mailbox(account):
+    """以 Server-Sent Events 推送新邮件事件
+    
+    认证信息通过请求头传递：X-Email-Password、X-Email-Provider（可选，默认feishu）
+    查询参数：folder（可选，默认INBOX）
+    """
+    provider_type, password, error = _watch_credentials(account)
+    if error:
+        return error
+    folder = request.args.get('folder', 'INBOX')
+    heartbeat = float(os.getenv('WATCH_SSE_HEARTBEAT', '15'))
+    
+    hub = get_watch_hub()
+    try:
+        watcher, events = hub.subscribe(provider_type, account, password, folder)
+    except Exception as e:
+        logger.error(f"启动新邮件监听失败 ({account}/{folder}): {str(e)}")
+        return _watch_error(e)
+    
+    def generate():
+        try:
+            ready = {'id': 0, 'type': 'ready', **{k: v for k, v in watcher.info().items()
+                                                  if k in ('account', 'folder', 'mode', 'uidvalidity', 'last_uid')}}
+            yield format_sse(ready)
+            while True:
+                try:
+                    yield format_sse(events.get(timeout=heartbeat))
+                except queue.Empty:
+                    if not watcher.is_alive():
+                        # 监听已停止（如认证失败），结束事件流
+                        return
+                    # 保持连接，并让服务器及时发现已断开的客户端
+                    yield ': keepalive\n\n'
+        finally:
+            hub.unsubscribe(watcher, events)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/watch/<account>/webhooks', methods=['POST'])
+def add_watch_webhook(account):
+    """注册 webhook：请求体 {"url": "...", "folder": "INBOX"}，认证信息同 /api/watch/<account>"""
+    provider_type, password, error = _watch_credentials(account)
+    if error:
+        return error
+    data = request.get_json() or {}
+    url = data.get('url', '')
+    try:
+        check_webhook_url(url)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 400
+    try:
+        watcher = get_watch_hub().add_webhook(provider_type, account, password, url, data.get('folder', 'INBOX'))
+    except Exception as e:
+        logger.error(f"注册 webhook 失败 ({account}): {str(e)}")
+        return _watch_error(e)
+    return jsonify({
+        'success': True,
+        'watcher': watcher,
+        'timestamp': datetime.now().isoformat()
+    }), 201
+
+@app.route('/api/watch/<account>/webhooks', methods=['DELETE'])
+def remove_watch_webhook(account):
+    """注销 webhook：查询参数 url、folder（可选，默认INBOX）"""
+    provider_type, password, error = _watch_credentials(account)
+    if error:
+        return error
+    try:
+        removed = get_watch_hub().remove_webhook(provider_type, account, password, request.args.get('url', ''),
+                                                 request.args.get('folder', 'INBOX'))
+    except Exception as e:
+        return _watch_error(e)
+    if not removed:
+        return jsonify({
+            'success': False,
+            'error': 'webhook 不存在',
+            'timestamp': datetime.now().isoformat()
+        }), 404
+    return jsonify({'success': True, 'timestamp': datetime.now().isoformat()})
+
+def _message_cache_stats():
+    """邮件缓存统计；未启用缓存时返回 None，不创建缓存数据库"""
+    if os.getenv('MESSAGE_CACHE_ENABLED', 'false').lower() != 'true':
+        return None
+    return get_default_message_cache().stats()
+
+def _search_index():
+    """本地搜索索引；未启用（SEARCH_INDEX_ENABLED）时返回 None，不创建索引数据库"""
+    if os.getenv('SEARCH_INDEX_ENABLED', 'false').lower() != 'true':
+        return None
+    return get_search_index()
+
+def _job_stats():
+    """后台任务统计；本进程尚未使用后台任务时返回 None，不为状态查询启动任务线程"""
+    manager = peek_job_manager()
+    return manager.stats() if manager else None
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
     """获取服务状态"""
@@ -145,6 +816,15 @@ def get_status():
             'modules': {
                 'email_syncer_loaded': email_syncer_ready
             },
+            'connection_pool': get_connection_pool().stats(),
+            'message_cache': _message_cache_stats(),
+            'search_index': _search_index().stats() if _search_index() else None,
+            'sync_coalescer': get_sync_coalescer().stats(),
+            'jobs': _job_stats(),
+            'parse_pool': get_parse_pool().stats() if get_parse_pool() else None,
+            'watch': get_watch_hub().stats(),
+            'circuit_breakers': breaker_stats(),
+            'memory_budget': get_memory_budget().stats(),
             'timestamp': datetime.now().isoformat(),
             'message': '邮件同步服务已就绪，所有配置通过HTTP请求参数传递'
         }), 200
@@ -157,27 +837,46 @@ def get_status():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+_metrics_collectors_registered = False
+
+def _register_metrics_collectors():
+    """首次抓取时注册各组件的统计信息，输出为 gauge"""
+    global _metrics_collectors_registered
+    if _metrics_collectors_registered:
+        return
+    _metrics_collectors_registered = True
+    REGISTRY.add_collector(stats_collector('email_connection_pool', '连接池状态', lambda: get_connection_pool().stats()))
+    REGISTRY.add_collector(stats_collector('email_message_cache', '邮件缓存状态', _message_cache_stats))
+    REGISTRY.add_collector(stats_collector('email_search_index', '本地搜索索引状态',
+                                           lambda: _search_index().stats() if _search_index() else None))
+    REGISTRY.add_collector(stats_collector('email_sync_coalescer', '同步请求合并状态',
+                                           lambda: get_sync_coalescer().stats()))
+    REGISTRY.add_collector(stats_collector('email_jobs', '后台任务状态', _job_stats))
+    REGISTRY.add_collector(stats_collector('email_parse_pool', '解析进程池状态',
+                                           lambda: get_parse_pool().stats() if get_parse_pool() else None))
+    REGISTRY.add_collector(stats_collector('email_watch', '新邮件监听状态', lambda: get_watch_hub().stats()))
+    REGISTRY.add_collector(stats_collector('email_memory_budget', '邮件内容内存预算', lambda: get_memory_budget().stats()))
+    REGISTRY.add_collector(_breaker_metrics)
+
+def _breaker_metrics():
+    for host, stats in breaker_stats().items():
+        yield 'email_circuit_breaker_open', '邮箱服务器熔断状态（0 正常，1 熔断，0.5 试探中）', {'host': host}, \
+            {'closed': 0, 'half_open': 0.5, 'open': 1}[stats['state']]
+        yield 'email_circuit_breaker_rejected', '熔断期间拒绝的连接数', {'host': host}, stats['rejected']
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 文本格式的运行指标（每个 worker 进程单独统计）"""
+    _register_metrics_collectors()
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/providers', methods=['GET'])
 def get_supported_providers():
     """获取支持的邮箱提供商列表"""
     try:
-        from email_providers import EmailProviderFactory
-        providers = EmailProviderFactory.get_supported_providers()
-        
-        # 提供商详细信息
-        provider_details = {
-            'lark': {'name': '飞书邮箱', 'server': 'imap.feishu.cn'},
-            'feishu': {'name': '飞书邮箱', 'server': 'imap.feishu.cn'},
-            'gmail': {'name': 'Gmail', 'server': 'imap.gmail.com'},
-            'google': {'name': 'Gmail', 'server': 'imap.gmail.com'},
-            'qq': {'name': 'QQ邮箱', 'server': 'imap.qq.com'},
-            'netease': {'name': '网易邮箱', 'server': 'imap.163.com'},
-            '163': {'name': '网易邮箱', 'server': 'imap.163.com'}
-        }
-        
         return jsonify({
-            'supported_providers': providers,
-            'provider_details': {p: provider_details.get(p, {'name': p, 'server': 'unknown'}) for p in providers},
+            'supported_providers': EmailProviderFactory.get_supported_providers(),
+            'provider_details': EmailProviderFactory.provider_details(),
             'timestamp': datetime.now().isoformat()
         })
         
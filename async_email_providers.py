@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""基于asyncio的IMAP引擎
+与 email_providers 中基于 imaplib 的实现并列，单个进程可以同时维持大量IMAP会话
+服务器配置和邮件解析复用同步提供商的实现，响应数据格式与 imaplib 保持一致
+"""
+
+import re
+import ssl
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+
+from email_providers import (
+    EmailProvider, FETCH_MODES, DEFAULT_FETCH_BATCH_SIZE, FOLDER_STATUS_ITEMS, PAGE_SEARCH_WINDOW,
+    SIZE_FETCH_BATCH_SIZE, resolve_special_use, default_ssl_context
+)
+from memory_budget import MemoryLease
+from metrics import observe_phase, response_bytes, FETCHED_BYTES, ERRORS
+from resilience import call_with_retry_async, classified_error
+from imap_utils import (
+    build_message_sets, parse_fetch_response, normalize_search_filters,
+    encode_imap_utf7, parse_list_response, parse_status_response
+)
+
+logger = logging.getLogger(__name__)
+
+_UNTAGGED_NUMBERED_RE = re.compile(rb'(\d+) ([A-Za-z-]+)(?: (.*))?$', re.S)
+_UNTAGGED_RE = re.compile(rb'([A-Za-z-]+)(?: (.*))?$', re.S)
+_RESPONSE_CODE_RE = re.compile(rb'\[([A-Za-z-]+)(?: ([^\]]*))?\]')
+_LITERAL_RE = re.compile(rb'\{(\d+)\}$')
+
+
+def _quote(arg: str) -> str:
+    return '"' + arg.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class AsyncIMAPClient:
+    """最小化的asyncio IMAP4客户端
+
+    command/uid 的返回值与 imaplib 相同：(状态, 数据列表)，
+    数据列表由 bytes 和 (头部, 字面量) 元组组成，可直接交给 imap_utils 解析
+    """
+
+    def __init__(self, host: str, port: int, use_ssl: bool = True,
+                 ssl_context: Optional[ssl.SSLContext] = None, timeout: float = 60):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.ssl_context = ssl_context
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.response_codes = {}
+        self._tag = 0
+        self._lock = asyncio.Lock()
+
+    async def connect(self):
+        context = None
+        if self.use_ssl:
+            context = self.ssl_context or default_ssl_context()
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=context), self.timeout
+        )
+        greeting = await self._readline()
+        if not greeting.startswith(b'* OK') and not greeting.startswith(b'* PREAUTH'):
+            raise ConnectionError(f"IMAP服务器拒绝连接: {greeting!r}")
+
+    async def _readline(self) -> bytes:
+        line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+        if not line:
+            raise ConnectionError("IMAP连接已关闭")
+        return line
+
+    async def _read_untagged(self, line: bytes) -> Tuple[str, List[Any]]:
+        """读取一条未标记响应（含字面量），返回 (类型, imaplib格式的数据项)"""
+        rest = line[2:].rstrip(b'\r\n')
+        match = _UNTAGGED_NUMBERED_RE.match(rest)
+        if match:
+            typ = match.group(2).decode().upper()
+            dat = match.group(1) + (b' ' + match.group(3) if match.group(3) else b'')
+        else:
+            match = _UNTAGGED_RE.match(rest)
+            typ = match.group(1).decode().upper() if match else 'UNKNOWN'
+            dat = (match.group(2) or b'') if match else rest
+            for code in _RESPONSE_CODE_RE.finditer(dat):
+                self.response_codes.setdefault(code.group(1).decode().upper(), []).append(code.group(2) or b'')
+
+        items = []
+        literal = _LITERAL_RE.search(dat)
+        while literal:
+            data = await asyncio.wait_for(self.reader.readexactly(int(literal.group(1))), self.timeout)
+            items.append((dat, data))
+            dat = (await self._readline()).rstrip(b'\r\n')
+            literal = _LITERAL_RE.search(dat)
+        items.append(dat)
+        return typ, items
+
+    async def command(self, *args: str, literal: Optional[bytes] = None) -> Tuple[str, Dict[str, List[Any]], bytes]:
+        """发送命令并读取全部响应，返回 (状态, {类型: 数据项}, 完成文本)
+
+        literal 与 imaplib 的 literal 属性相同：作为最后一个参数以 {n} 字面量发送
+        """
+        async with self._lock:
+            self._tag += 1
+            tag = f'A{self._tag:04d}'.encode()
+            line = tag + b' ' + ' '.join(args).encode()
+            if literal is not None:
+                line += b' {%d}' % len(literal)
+            self.writer.write(line + b'\r\n')
+            await self.writer.drain()
+            untagged = {}
+            while True:
+                line = await self._readline()
+                if line.startswith(b'+') and literal is not None:
+                    # 服务器准备好接收字面量
+                    self.writer.write(literal + b'\r\n')
+                    await self.writer.drain()
+                    literal = None
+                elif line.startswith(b'* '):
+                    typ, items = await self._read_untagged(line)
+                    untagged.setdefault(typ, []).extend(items)
+                elif line.startswith(tag + b' '):
+                    status, _, text = line[len(tag) + 1:].rstrip(b'\r\n').partition(b' ')
+                    return status.decode().upper(), untagged, text
+
+    async def login(self, username: str, password: str) -> Tuple[str, List[Any]]:
+        status, _, text = await self.command('LOGIN', _quote(username), _quote(password))
+        if status != 'OK':
+            raise PermissionError(f"IMAP登录失败: {text.decode(errors='ignore')}")
+        return status, [text]
+
+    async def select(self, folder: str = 'INBOX') -> Tuple[str, List[Any]]:
+        self.response_codes = {}
+        status, untagged, text = await self.command('SELECT', _quote(encode_imap_utf7(folder)))
+        return status, untagged.get('EXISTS', [text])
+
+    async def list(self, directory: str = '""', pattern: str = '*') -> Tuple[str, List[Any]]:
+        status, untagged, text = await self.command('LIST', directory, pattern)
+        return status, untagged.get('LIST', [text] if status != 'OK' else [])
+
+    async def status(self, folder: str, names: str) -> Tuple[str, List[Any]]:
+        status, untagged, text = await self.command('STATUS', _quote(encode_imap_utf7(folder)), names)
+        return status, untagged.get('STATUS', [text])
+
+    def response(self, code: str) -> Tuple[str, List[Any]]:
+        """与 imaplib.IMAP4.response 相同：取出并清除响应码数据"""
+        return code, self.response_codes.pop(code.upper(), [None])
+
+    async def uid(self, command: str, *args: Optional[str], literal: Optional[bytes] = None) -> Tuple[str, List[Any]]:
+        status, untagged, text = await self.command('UID', command.upper(), *[a for a in args if a is not None],
+                                                    literal=literal)
+        return status, untagged.get(command.upper(), [text] if status != 'OK' else [])
+
+    async def noop(self) -> Tuple[str, List[Any]]:
+        status, _, text = await self.command('NOOP')
+        return status, [text]
+
+    async def logout(self):
+        try:
+            await self.command('LOGOUT')
+        finally:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+
+
+class AsyncEmailProvider:
+    """asyncio版本的邮箱提供商
+
+    包装一个同步的 EmailProvider 实例，复用其服务器配置、获取模式和解析逻辑，
+    只将网络交互替换为 AsyncIMAPClient
+    """
+
+    def __init__(self, provider: EmailProvider):
+        self.provider = provider
+        self.imap_client = None
+        self.mailbox_state = None
+
+    async def open(self):
+        """连接并登录IMAP服务器，重试和熔断同 EmailProvider.open_imap，失败时抛出已分类的异常"""
+        server = self.provider.get_imap_config()['server']
+        await call_with_retry_async(server, self._open)
+        logger.info(f"IMAP连接成功(asyncio): {server}")
+
+    async def _open(self):
+        imap_config = self.provider.get_imap_config()
+        client = AsyncIMAPClient(
+            imap_config['server'],
+            imap_config['port'],
+            use_ssl=imap_config.get('ssl', True),
+            ssl_context=imap_config.get('ssl_context')
+        )
+        try:
+            with observe_phase(self.provider.metrics_name, 'connect'):
+                await client.connect()
+            with observe_phase(self.provider.metrics_name, 'login'):
+                await client.login(self.provider.username, self.provider.password)
+        except Exception as e:
+            if client.writer is not None:
+                client.writer.close()
+            raise classified_error(e, imap_config['server'], 'login') from e
+        self.imap_client = client
+
+    async def connect(self) -> bool:
+        """连接并登录IMAP服务器，失败时返回False；需要区分失败原因时使用 open"""
+        try:
+            await self.open()
+            return True
+        except Exception as e:
+            logger.error(f"IMAP连接失败(asyncio): {str(e)}")
+            self.imap_client = None
+            return False
+
+    async def disconnect(self):
+        if self.imap_client:
+            try:
+                await self.imap_client.logout()
+            except Exception:
+                pass
+            self.imap_client = None
+
+    async def list_folders(self) -> List[Dict[str, Any]]:
+        """列出全部文件夹，返回值同 EmailProvider.list_folders"""
+        if not self.imap_client:
+            await self.open()
+        typ, data = await self.imap_client.list()
+        if typ != 'OK':
+            raise RuntimeError(f"列出文件夹失败: {data}")
+        return parse_list_response(data)
+
+    async def folder_status(self, folder: str) -> Dict[str, int]:
+        """获取文件夹的 messages/uidnext/uidvalidity，返回值同 EmailProvider.folder_status"""
+        if not self.imap_client:
+            await self.open()
+        typ, data = await self.imap_client.status(folder, FOLDER_STATUS_ITEMS)
+        if typ != 'OK':
+            raise RuntimeError(f"获取文件夹 {folder} 状态失败: {data}")
+        return parse_status_response(data)
+
+    async def resolve_folders(self, folders: List[str]) -> List[str]:
+        """解析文件夹列表中的特殊用途标记，同 EmailProvider.resolve_folders"""
+        listing = await self.list_folders() if any(f.startswith('\\') for f in folders) else []
+        return resolve_special_use(folders, listing)
+
+    async def get_emails(self, folder: str = 'INBOX', count: int = 50,
+                         since_uid: Optional[int] = None,
+                         uidvalidity: Optional[int] = None,
+                         mode: str = 'full',
+                         filters: Optional[Dict[str, Any]] = None,
+                         before_uid: Optional[int] = None) -> List[Dict[str, Any]]:
+        """获取邮件列表，参数和返回值同 EmailProvider.get_emails"""
+        self.mailbox_state = None
+        if mode not in FETCH_MODES:
+            raise ValueError(f"不支持的获取模式: {mode}. 支持的模式: {list(FETCH_MODES)}")
+        try:
+            return [email_info async for email_info in self.iter_emails(
+                folder, count, since_uid=since_uid, uidvalidity=uidvalidity, mode=mode, filters=filters,
+                before_uid=before_uid)]
+        except Exception as e:
+            logger.error(f"获取邮件失败(asyncio): {str(e)}")
+            ERRORS.inc(provider=self.provider.metrics_name, phase='get_emails', type=type(e).__name__)
+            self.mailbox_state = None
+            error = classified_error(e, self.provider.get_imap_config()['server'])
+            if error is e:
+                raise
+            raise error from e
+
+    async def iter_emails(self, folder: str = 'INBOX', count: int = 50,
+                          since_uid: Optional[int] = None,
+                          uidvalidity: Optional[int] = None,
+                          mode: str = 'full',
+                          filters: Optional[Dict[str, Any]] = None,
+                          before_uid: Optional[int] = None):
+        """逐封获取邮件的异步生成器，参数同 EmailProvider.iter_emails"""
+        provider = self.provider
+        self.mailbox_state = None
+        if mode not in FETCH_MODES:
+            raise ValueError(f"不支持的获取模式: {mode}. 支持的模式: {list(FETCH_MODES)}")
+
+        if not self.imap_client:
+            await self.open()
+
+        with observe_phase(provider.metrics_name, 'select'):
+            typ, data = await self.imap_client.select(folder)
+        if typ != 'OK':
+            raise RuntimeError(f"选择文件夹 {folder} 失败: {data}")
+        _, values = self.imap_client.response('UIDVALIDITY')
+        current_uidvalidity = int(values[-1]) if values and values[-1] else None
+        incremental = provider._is_incremental(since_uid, uidvalidity, current_uidvalidity)
+
+        filters = normalize_search_filters(filters)
+        if before_uid is not None:
+            if provider._page_expired(uidvalidity, current_uidvalidity):
+                message_uids = [b'']
+            else:
+                message_uids = await self._search_page(filters, before_uid, count)
+        else:
+            message_uids = await self._search_uids(filters, since_uid if incremental else None)
+
+        selected_uids = provider._select_uids(message_uids, count, since_uid if incremental else None)
+        self.mailbox_state = provider._mailbox_state(folder, current_uidvalidity, selected_uids,
+                                                     since_uid if incremental else None,
+                                                     provider._has_more(message_uids, selected_uids, count,
+                                                                        since_uid if incremental else None),
+                                                     provider._has_older(message_uids, selected_uids,
+                                                                         since_uid if incremental else None))
+
+        items, required = provider._fetch_items(mode)
+        batch_size = max(1, int(provider.config.get('fetch_batch_size') or DEFAULT_FETCH_BATCH_SIZE))
+        ordered = list(reversed(selected_uids))  # 最新的邮件在前
+        cached = provider._cached_emails(folder, current_uidvalidity, ordered, mode,
+                                         None if incremental or filters or before_uid is not None else message_uids)
+        missing = [uid for uid in ordered if uid not in cached]
+        parse_pool = provider.config.get('parse_pool')
+        lease = provider.config.get('memory_lease') or MemoryLease()
+        try:
+            sizes = await self._fetch_sizes(missing) if missing and provider._limits_memory(mode) else None
+            requested, pending = set(), {}
+            for uid in ordered:
+                if uid in cached:
+                    yield cached.pop(uid)
+                    continue
+                if uid not in requested:
+                    start = len(requested)
+                    batch_uids = missing[start:start + batch_size]
+                    requested.update(batch_uids)
+                    omitted = provider._plan_memory(folder, batch_uids, sizes, lease) if sizes is not None else {}
+                    responses = await self._fetch_batch(batch_uids, items, batch_size, omitted)
+                    if parse_pool is not None and mode == 'full':
+                        parse_pool.submit_batch(responses, provider.config.get('attachment_mode') or 'inline')
+                    pending.update(responses)
+                response = pending.pop(uid, None)
+                if response and 'PARSED' in response:
+                    # 等待解析进程池的结果，不阻塞事件循环
+                    await asyncio.wait([asyncio.wrap_future(response['PARSED'])])
+                    email_info = provider._build_email(uid, response, mode, required)
+                elif mode == 'full':
+                    # 没有解析进程池时 MIME 解析和附件 base64 编码在线程中执行，不阻塞事件循环
+                    email_info = await asyncio.to_thread(provider._build_email, uid, response, mode, required)
+                else:
+                    email_info = provider._build_email(uid, response, mode, required)
+                lease.release((folder, uid))
+                if email_info is None:
+                    self.mailbox_state['skipped_uids'].append(uid)
+                    continue
+                if email_info.get('content_omitted'):
+                    self.mailbox_state['omitted_uids'].append(uid)
+                provider._store_cached(folder, current_uidvalidity, mode, email_info)
+                yield email_info
+        finally:
+            if lease is not provider.config.get('memory_lease'):
+                lease.close()
+
+    async def _search_page(self, filters: Dict[str, Any], before_uid: int, count: int) -> List[bytes]:
+        """分页搜索，同 EmailProvider._search_page"""
+        found = []
+        upper, window = int(before_uid) - 1, max(PAGE_SEARCH_WINDOW, count * 2)
+        while upper >= 1 and len(found) <= count:
+            lower = max(1, upper - window + 1)
+            data = await self._search_uids(filters, uid_set=f'{lower}:{upper}')
+            found = self.provider._window_uids(data, lower, upper) + found
+            upper, window = lower - 1, window * 4
+        return [b' '.join(str(uid).encode() for uid in found)]
+
+    async def _search_uids(self, filters: Dict[str, Any], since_uid: Optional[int] = None,
+                           uid_set: Optional[str] = None) -> List[bytes]:
+        """执行 UID SEARCH，搜索条件的编译同 EmailProvider._search_uids"""
+        uid_range = self.provider._uid_range(since_uid, uid_set)
+        searches = self.provider._search_commands(filters) if filters else []
+        if not searches:
+            searches = [([] if uid_range else ['ALL'], None)]
+        result = None
+        for criteria, literal in searches:
+            charset = ['CHARSET', 'UTF-8'] if literal is not None else []
+            with observe_phase(self.provider.metrics_name, 'search'):
+                typ, data = await self.imap_client.uid('SEARCH', *charset, *uid_range, *criteria, literal=literal)
+            if typ != 'OK':
+                raise RuntimeError(f"搜索邮件失败: {data}")
+            uids = set(b' '.join(d for d in data if isinstance(d, bytes)).split())
+            result = uids if result is None else result & uids
+        return [b' '.join(sorted(result, key=int))]
+
+    async def _fetch_batch(self, batch_uids: List[int], items: str, batch_size: int,
+                           omitted: Optional[Dict[int, str]] = None) -> Dict[int, Dict[str, Any]]:
+        """获取一批邮件，返回 {UID: 响应字典}；omitted 中的邮件只获取描述符，同 EmailProvider._fetch_batches"""
+        omitted = omitted or {}
+        by_seq = {}
+        for fetch_uids, fetch_items in (([uid for uid in batch_uids if uid not in omitted], items),
+                                        (list(omitted), self.provider._envelope_fetch_items())):
+            for message_set in build_message_sets(fetch_uids, batch_size) if fetch_uids else []:
+                with observe_phase(self.provider.metrics_name, 'fetch'):
+                    typ, data = await self.imap_client.uid('FETCH', message_set, fetch_items)
+                FETCHED_BYTES.inc(response_bytes(data), provider=self.provider.metrics_name)
+                if typ != 'OK':
+                    logger.error(f"批量获取邮件失败 ({message_set}): {data}")
+                    ERRORS.inc(provider=self.provider.metrics_name, phase='fetch', type=typ)
+                    continue
+                for response in parse_fetch_response(data):
+                    by_seq.setdefault(response['seq'], {}).update(response)
+                data = None
+        responses = {response['UID']: response for response in by_seq.values() if 'UID' in response}
+        for uid, reason in omitted.items():
+            if uid in responses:
+                responses[uid]['OMITTED'] = reason
+        return responses
+
+    async def _fetch_sizes(self, uids: List[int]) -> Dict[int, int]:
+        """查询邮件大小，同 EmailProvider._fetch_sizes"""
+        sizes = {}
+        for message_set in build_message_sets(uids, SIZE_FETCH_BATCH_SIZE):
+            with observe_phase(self.provider.metrics_name, 'fetch'):
+                typ, data = await self.imap_client.uid('FETCH', message_set, '(UID RFC822.SIZE)')
+            if typ != 'OK':
+                logger.warning(f"查询邮件大小失败 ({message_set}): {data}")
+                ERRORS.inc(provider=self.provider.metrics_name, phase='fetch', type=typ)
+                continue
+            sizes.update(self.provider._size_map(data))
+        return sizes
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""多账号批量同步
+使用有界的线程池（或asyncio引擎下的协程）执行多个 EmailSyncAction，
+并按邮箱服务商限制并发数，避免触发Gmail/QQ等服务商的频率限制
+"""
+
+import os
+import time
+import asyncio
+import threading
+import logging
+from collections import Counter, deque
+from typing import List, Dict, Any, Optional
+
+from email_providers import EmailProviderFactory
+from email_sync_action import EmailSyncAction
+
+logger = logging.getLogger(__name__)
+
+# 默认每个服务商同时同步的账号数（按服务商类名区分，别名共享同一限制）
+DEFAULT_PROVIDER_CONCURRENCY = {
+    'gmail': 4,
+    'qq': 2,
+    'netease': 2,
+    'lark': 4,
+}
+
+
+def _parse_provider_concurrency(value: str) -> Dict[str, int]:
+    """解析 "gmail=4,qq=2" 形式的配置"""
+    limits = {}
+    for item in (value or '').split(','):
+        name, _, limit = item.partition('=')
+        if name.strip() and limit.strip().isdigit():
+            limits[name.strip().lower()] = int(limit)
+    return limits
+
+
+def _to_int(value) -> int:
+    """将客户端传入的并发数转为整数，不是整数时抛出 ValueError"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"并发数必须是整数: {value!r}")
+    return int(value)
+
+
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '8'))
+BATCH_MAX_ACCOUNTS = int(os.getenv('BATCH_MAX_ACCOUNTS', '500'))
+BATCH_DEFAULT_PROVIDER_CONCURRENCY = int(os.getenv('BATCH_DEFAULT_PROVIDER_CONCURRENCY', '4'))
+BATCH_PROVIDER_CONCURRENCY = dict(DEFAULT_PROVIDER_CONCURRENCY,
+                                  **_parse_provider_concurrency(os.getenv('BATCH_PROVIDER_CONCURRENCY', '')))
+
+
+class BatchSyncRunner:
+    """批量同步执行器
+
+    Args:
+        max_workers: 同时同步的账号总数上限
+        provider_concurrency: {服务商类型: 并发上限}，类型可以是任意别名（如 feishu/lark）；
+            来自客户端请求，只能调低服务端配置的上限，不能调高
+        default_provider_concurrency: 未配置的服务商的并发上限
+
+    Raises:
+        ValueError: 并发数不是整数
+    """
+
+    def __init__(self, max_workers: int = BATCH_MAX_WORKERS,
+                 provider_concurrency: Optional[Dict[str, int]] = None,
+                 default_provider_concurrency: int = BATCH_DEFAULT_PROVIDER_CONCURRENCY):
+        self.max_workers = max(1, int(max_workers))
+        self.default_provider_concurrency = max(1, int(default_provider_concurrency))
+        self.provider_limits = {}
+        for provider_type, limit in BATCH_PROVIDER_CONCURRENCY.items():
+            key = self._provider_key(provider_type)
+            if key:
+                self.provider_limits[key] = max(1, int(limit))
+        for provider_type, limit in (provider_concurrency or {}).items():
+            key = self._provider_key(provider_type)
+            if key:
+                self.provider_limits[key] = max(1, min(_to_int(limit), self._limit_for(key)))
+
+    @staticmethod
+    def _provider_key(provider_type: str) -> Optional[str]:
+        """将服务商别名归一为提供商类名"""
+        provider_class = EmailProviderFactory.PROVIDERS.get(str(provider_type).lower())
+        return provider_class.__name__ if provider_class else None
+
+    def _limit_for(self, key: Optional[str]) -> int:
+        return self.provider_limits.get(key, self.default_provider_concurrency)
+
+    def run(self, configs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """同步多个账号，返回与 configs 顺序一致的结果列表
+
+        所有账号都使用 asyncio 引擎时在单个事件循环中执行，否则使用线程池
+        """
+        if configs and all(config.get('imap_engine') == 'asyncio' for config in configs):
+            return asyncio.run(self.run_async(configs))
+
+        # 按服务商排队，工作线程只领取未达到并发上限的服务商的账号，
+        # 某个服务商排满时其他服务商的账号不会排在它后面等待
+        queues = {}
+        for index, config in enumerate(configs):
+            key = self._provider_key(config.get('email_provider', 'feishu'))
+            queues.setdefault(key, deque()).append((index, config))
+        active = Counter()
+        condition = threading.Condition()
+        results = [None] * len(configs)
+        submitted = time.perf_counter()
+
+        def take():
+            """领取下一个可执行的账号（各服务商队首中最早提交的），全部领取完时返回 None"""
+            with condition:
+                while queues:
+                    ready = [key for key in queues if active[key] < self._limit_for(key)]
+                    if ready:
+                        key = min(ready, key=lambda k: queues[k][0][0])
+                        index, config = queues[key].popleft()
+                        if not queues[key]:
+                            del queues[key]
+                        active[key] += 1
+                        return key, index, config
+                    condition.wait()
+                return None
+
+        def work():
+            while True:
+                item = take()
+                if item is None:
+                    return
+                key, index, config = item
+                started = time.perf_counter()
+                try:
+                    result = self._sync_one(config)
+                    results[index] = self._account_result(index, config, result, submitted, started)
+                finally:
+                    with condition:
+                        active[key] -= 1
+                        condition.notify_all()
+
+        workers = [threading.Thread(target=work, name=f'batch-sync-{i}', daemon=True)
+                   for i in range(min(self.max_workers, len(configs)))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return results
+
+    async def run_async(self, configs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """asyncio引擎下的批量同步"""
+        total = asyncio.Semaphore(self.max_workers)
+        semaphores = {}
+        for config in configs:
+            key = self._provider_key(config.get('email_provider', 'feishu'))
+            semaphores.setdefault(key, asyncio.Semaphore(self._limit_for(key)))
+
+        submitted = time.perf_counter()
+
+        async def run_one(index, config):
+            key = self._provider_key(config.get('email_provider', 'feishu'))
+            # 先等待服务商的名额再占用总并发名额，排队的账号不占用其他服务商可用的名额
+            async with semaphores[key], total:
+                started = time.perf_counter()
+                try:
+                    result = await EmailSyncAction(config).sync_emails_async()
+                except Exception as e:
+                    result = {'success': False, 'error': str(e), 'logs': []}
+                return self._account_result(index, config, result, submitted, started)
+
+        return await asyncio.gather(*(run_one(i, config) for i, config in enumerate(configs)))
+
+    @staticmethod
+    def _sync_one(config: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return EmailSyncAction(config).sync_emails()
+        except Exception as e:
+            logger.error(f"批量同步账号 {config.get('email_username')} 失败: {str(e)}")
+            return {'success': False, 'error': str(e), 'logs': []}
+
+    @staticmethod
+    def _account_result(index: int, config: Dict[str, Any], result: Dict[str, Any],
+                        submitted: float, started: float) -> Dict[str, Any]:
+        finished = time.perf_counter()
+        return {
+            'index': index,
+            'email_username': config.get('email_username'),
+            'provider': config.get('email_provider'),
+            'success': bool(result.get('success')),
+            'queued_seconds': round(started - submitted, 3),
+            'elapsed_seconds': round(finished - started, 3),
+            'data': result
+        }
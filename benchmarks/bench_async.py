@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""asyncio引擎并发基准测试
+对比 imaplib 引擎（固定数量的同步worker，模拟2个gunicorn worker）与 asyncio 引擎
+在不同并发账号数下的总耗时和单账号延迟
+
+用法: python benchmarks/bench_async.py --accounts 1 10 50 200 --latency-ms 20
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_providers import EmailProviderFactory
+from email_sync_action import EmailSyncAction
+from bench_fetch import LocalEmailProvider
+from fake_imap_server import FakeIMAPServer, FakeMailbox, make_message
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def _account_config(index, count, engine):
+    return {
+        'email_username': f'bench{index}@example.com',
+        'email_password': 'bench',
+        'email_provider': 'bench-local',
+        'email_count': count,
+        'imap_engine': engine,
+        'use_connection_pool': False
+    }
+
+
+def run_threaded(accounts, count, workers):
+    # 单账号延迟从整批提交时开始计算，包含排队等待worker的时间
+    started = time.perf_counter()
+
+    def run_one(index):
+        result = EmailSyncAction(_account_config(index, count, 'imaplib')).sync_emails()
+        return time.perf_counter() - started, result['success']
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(run_one, range(accounts)))
+    return time.perf_counter() - started, outcomes
+
+
+def run_asyncio(accounts, count, concurrency):
+    started = time.perf_counter()
+
+    async def run_one(index, semaphore):
+        async with semaphore:
+            result = await EmailSyncAction(_account_config(index, count, 'asyncio')).sync_emails_async()
+            return time.perf_counter() - started, result['success']
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(run_one(i, semaphore) for i in range(accounts)))
+
+    outcomes = asyncio.run(run_all())
+    return time.perf_counter() - started, outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='asyncio引擎并发基准测试')
+    parser.add_argument('--accounts', type=int, nargs='+', default=[1, 10, 50, 200])
+    parser.add_argument('--count', type=int, default=20, help='每个账号获取的邮件数')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='模拟的每命令网络往返时间')
+    parser.add_argument('--workers', type=int, default=2, help='imaplib引擎的同步worker数量')
+    parser.add_argument('--concurrency', type=int, default=500, help='asyncio引擎的并发会话上限')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    server = FakeIMAPServer({'INBOX': FakeMailbox([make_message(i) for i in range(args.count)])},
+                            latency=args.latency_ms / 1000.0).start()
+
+    class BenchLocalProvider(LocalEmailProvider):
+        def __init__(self, username, password, **kwargs):
+            super().__init__(username, password, host='127.0.0.1', port=server.port, **kwargs)
+
+    EmailProviderFactory.PROVIDERS['bench-local'] = BenchLocalProvider
+
+    # 基准测试只关心耗时，屏蔽同步过程中的逐条日志输出
+    EmailSyncAction.log_message = lambda self, level, message, details=None: None
+
+    results = []
+    try:
+        for accounts in args.accounts:
+            for engine in ('imaplib', 'asyncio'):
+                if engine == 'imaplib':
+                    wall, outcomes = run_threaded(accounts, args.count, args.workers)
+                else:
+                    wall, outcomes = run_asyncio(accounts, args.count, args.concurrency)
+                latencies = [latency for latency, _ in outcomes]
+                result = {
+                    'engine': engine,
+                    'accounts': accounts,
+                    'failed': sum(1 for _, ok in outcomes if not ok),
+                    'wall_seconds': round(wall, 3),
+                    'p50_seconds': round(_percentile(latencies, 50), 3),
+                    'p95_seconds': round(_percentile(latencies, 95), 3),
+                }
+                results.append(result)
+                if not args.json:
+                    print(f"engine={engine:<8} accounts={accounts:>4} wall={result['wall_seconds']:.3f}s "
+                          f"p50={result['p50_seconds']:.3f}s p95={result['p95_seconds']:.3f}s failed={result['failed']}")
+    finally:
+        server.stop()
+
+    if args.json:
+        print(json.dumps({'latency_ms': args.latency_ms, 'count': args.count, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""相同同步请求合并基准测试
+同时发出 N 个参数完全相同的 /api/sync/email 请求（Flask 测试客户端，每个请求一个线程），
+对比开启和关闭合并（SYNC_COALESCE_ENABLED）时服务器收到的 IMAP 命令数、实际执行的同步次数和总耗时
+
+用法: python benchmarks/bench_coalesce.py --concurrency 1 5 20 --count 50 --latency-ms 20
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('MESSAGE_CACHE_ENABLED', 'false')
+os.environ.setdefault('SEARCH_INDEX_ENABLED', 'false')
+os.environ.setdefault('IMAP_POOL_ENABLED', 'false')
+
+from email_providers import EmailProviderFactory
+from fake_imap_server import FakeIMAPServer, FakeMailbox, make_message
+from bench_fetch import LocalEmailProvider
+
+
+def run_case(server: FakeIMAPServer, client_factory, coalescer, concurrency: int, count: int, enabled: bool):
+    os.environ['SYNC_COALESCE_ENABLED'] = 'true' if enabled else 'false'
+    body = {'email_username': 'bench', 'email_password': 'bench', 'provider': 'bench-local', 'email_count': count,
+            'mode': 'envelope'}
+    statuses = []
+
+    def request():
+        response = client_factory().post('/api/sync/email', json=body)
+        statuses.append((response.status_code, response.headers.get('X-Sync-Coalesced')))
+
+    server.reset_stats()
+    executions = coalescer.stats()['executions']
+    threads = [threading.Thread(target=request) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'concurrency': concurrency,
+        'coalesce': enabled,
+        'seconds': round(time.perf_counter() - started, 3),
+        'imap_commands': server.command_count,
+        'syncs': coalescer.stats()['executions'] - executions if enabled else concurrency,
+        'coalesced': sum(1 for _, source in statuses if source),
+        'errors': sum(1 for status, _ in statuses if status != 200)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='相同同步请求合并基准测试')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 5, 20])
+    parser.add_argument('--count', type=int, default=50, help='每次同步获取的邮件数')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='模拟的每命令网络往返时间')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args()
+
+    mailbox = FakeMailbox([make_message(i) for i in range(args.count)])
+    server = FakeIMAPServer({'INBOX': mailbox}, latency=args.latency_ms / 1000.0).start()
+
+    class BenchProvider(LocalEmailProvider):
+        def __init__(self, username, password, **kwargs):
+            super().__init__(username, password, host='127.0.0.1', port=server.port, **kwargs)
+
+    EmailProviderFactory.PROVIDERS['bench-local'] = BenchProvider
+    # 导入应用前注册提供商；合并器的 TTL 设为 0，只比较进行中的请求的合并
+    os.environ['SYNC_COALESCE_TTL'] = '0'
+    from app import app
+    from sync_coalescer import get_sync_coalescer
+
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            for enabled in (False, True):
+                result = run_case(server, app.test_client, get_sync_coalescer(), concurrency, args.count, enabled)
+                results.append(result)
+                if not args.json:
+                    print(f"concurrency={concurrency:>3} coalesce={str(enabled):<5} syncs={result['syncs']:>3} "
+                          f"imap_commands={result['imap_commands']:>5} coalesced={result['coalesced']:>3} "
+                          f"errors={result['errors']} {result['seconds']:.3f}s")
+    finally:
+        server.stop()
+
+    if args.json:
+        print(json.dumps({'count': args.count, 'latency_ms': args.latency_ms, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
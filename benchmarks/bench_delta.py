@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""delta 同步基准测试
+在不同大小的文件夹中修改固定数量邮件的标志并删除几封邮件，对比 qresync/condstore/snapshot
+三种方式查询变化（EmailProvider.get_changes）的耗时、往返次数、服务器响应字节数和保存的状态大小，
+以及重新获取整个窗口（原有做法：列表模式获取全部邮件）的开销
+
+用法: python benchmarks/bench_delta.py --sizes 1000 10000 --changes 20 --latency-ms 2
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_imap_server import FakeIMAPServer, FakeMailbox, make_message
+from bench_fetch import LocalEmailProvider
+
+METHODS = {
+    'qresync': {'qresync': True},
+    'condstore': {'condstore': True},
+    'snapshot': {},
+}
+
+
+def _measure(server: FakeIMAPServer, action):
+    server.reset_stats()
+    started = time.perf_counter()
+    result = action()
+    return result, {
+        'seconds': round(time.perf_counter() - started, 4),
+        'round_trips': server.command_count,
+        'response_bytes': server.bytes_sent
+    }
+
+
+def run_case(size: int, method: str, changes: int, deletions: int, latency: float):
+    mailbox = FakeMailbox([make_message(i, body_size=256) for i in range(size)])
+    server = FakeIMAPServer({'INBOX': mailbox}, latency=latency, **METHODS[method]).start()
+    provider = LocalEmailProvider('bench', 'bench', host='127.0.0.1', port=server.port)
+    provider.connect()
+    try:
+        last_uid = mailbox.messages[-1]['uid']
+        state = provider.get_changes('INBOX', None, last_uid)['state']
+        # 修改分散在整个文件夹中的邮件的标志，删除几封邮件
+        step = max(1, size // max(1, changes))
+        for message in mailbox.messages[::step][:changes]:
+            mailbox.set_flags(message, message['flags'] ^ {'\\Flagged'})
+        mailbox.expunge([message['uid'] for message in mailbox.messages[1::step][:deletions]])
+
+        delta, cost = _measure(server, lambda: provider.get_changes('INBOX', state, last_uid))
+        _, refetch = _measure(server, lambda: provider.get_emails(count=size, mode='envelope'))
+    finally:
+        provider.disconnect()
+        server.stop()
+    return {
+        'size': size,
+        'method': delta['method'],
+        'changed': len(delta['flags']),
+        'vanished': len(delta['vanished']),
+        'delta': cost,
+        'state_bytes': len(json.dumps(delta['state'])),
+        'refetch': refetch
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='delta 同步基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--methods', nargs='+', default=list(METHODS), choices=list(METHODS))
+    parser.add_argument('--changes', type=int, default=20, help='修改标志的邮件数')
+    parser.add_argument('--deletions', type=int, default=5, help='删除的邮件数')
+    parser.add_argument('--latency-ms', type=float, default=2.0, help='模拟的每命令网络往返时间')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        for method in args.methods:
+            result = run_case(size, method, args.changes, args.deletions, args.latency_ms / 1000.0)
+            results.append(result)
+            if not args.json:
+                print(f"size={size:>6} method={result['method']:<10} changed={result['changed']:>3} "
+                      f"vanished={result['vanished']:>3} delta={result['delta']['seconds']:.3f}s "
+                      f"rt={result['delta']['round_trips']:>2} bytes={result['delta']['response_bytes']:>8} "
+                      f"state={result['state_bytes']}B refetch={result['refetch']['seconds']:.3f}s "
+                      f"refetch_bytes={result['refetch']['response_bytes']}")
+
+    if args.json:
+        print(json.dumps({'latency_ms': args.latency_ms, 'changes': args.changes, 'deletions': args.deletions,
+                          'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""同步结果编码基准测试
+用合成邮箱解析出的同步结果，对比原有的 jsonify 输出（ensure_ascii、键排序）与
+response_encoding 中各响应格式（json/msgpack/cbor）和压缩算法（gzip/br/zstd）组合的
+响应体大小和编码耗时（含压缩）。未安装的可选库对应的组合会被跳过
+
+用法: python benchmarks/bench_encoding.py --count 200 --mix plain:40,cjk:20,small:30,large:10 --repeat 5
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from email_providers import parse_raw_email
+from response_encoding import available_formats, available_encodings, compress_chunks, iter_document
+from mailbox_generator import generate_messages, describe, DEFAULT_MIX
+
+
+def build_document(messages, attachment_mode: str = 'inline'):
+    """构造与 /api/sync/email 相同结构的响应文档"""
+    emails = []
+    for uid, raw in enumerate(messages, 1):
+        email_info = parse_raw_email(raw, attachment_mode)
+        email_info['uid'] = uid
+        for attachment in email_info['attachments']:
+            attachment['uid'] = uid
+        emails.append(email_info)
+    return {
+        'success': True,
+        'data': {'success': True, 'total_emails': len(emails), 'emails': emails, 'logs': []},
+        'timestamp': datetime.now().isoformat(),
+        'message': '邮件同步完成'
+    }
+
+
+def legacy_encode(document) -> bytes:
+    """原有输出：Flask jsonify 的默认参数（非调试模式）"""
+    return json.dumps(document, ensure_ascii=True, sort_keys=True, separators=(',', ':')).encode()
+
+
+def measure(encode, repeat: int):
+    timings, size = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(encode())
+        timings.append(time.perf_counter() - started)
+    return size, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='同步结果编码基准测试')
+    parser.add_argument('--count', type=int, default=200, help='邮件数')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='邮件类型比例，见 mailbox_generator.py')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--attachment-mode', default='inline', choices=['inline', 'descriptor'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args()
+
+    messages = generate_messages(args.count, args.mix, args.seed)
+    mailbox = describe(messages)
+    document = build_document(messages, args.attachment_mode)
+    del messages
+
+    results = []
+    size, seconds = measure(lambda: legacy_encode(document), args.repeat)
+    results.append({'format': 'jsonify', 'encoding': 'identity', 'bytes': size, 'seconds': seconds})
+    for fmt in available_formats():
+        for encoding in [None] + available_encodings():
+            size, seconds = measure(lambda: b''.join(compress_chunks(iter_document(document, fmt), encoding)),
+                                    args.repeat)
+            results.append({'format': fmt, 'encoding': encoding or 'identity', 'bytes': size, 'seconds': seconds})
+    baseline = results[0]
+    for result in results:
+        result['size_ratio'] = round(result['bytes'] / baseline['bytes'], 3)
+        result['seconds'] = round(result['seconds'], 4)
+
+    if args.json:
+        print(json.dumps({'mailbox': dict(mailbox, mix=args.mix, seed=args.seed), 'results': results},
+                         ensure_ascii=False, indent=2))
+        return
+    print(f"邮件 {mailbox['messages']} 封，原始大小 {mailbox['total_bytes'] / 1024 / 1024:.1f}MB")
+    print(f"{'format':<10}{'encoding':<10}{'MB':>10}{'ratio':>8}{'ms':>10}")
+    for r in results:
+        print(f"{r['format']:<10}{r['encoding']:<10}{r['bytes'] / 1024 / 1024:>10.2f}{r['size_ratio']:>8}"
+              f"{r['seconds'] * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""批量FETCH基准测试
+对比逐封获取（fetch_batch_size=1）与批量获取在 50/500/5000 封邮件下的往返次数和耗时
+
+用法: python benchmarks/bench_fetch.py --latency-ms 2 --counts 50 500 5000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_providers import EmailProvider
+from fake_imap_server import FakeIMAPServer, FakeMailbox, make_message
+
+
+class LocalEmailProvider(EmailProvider):
+    """连接本地模拟服务器的提供商（明文IMAP）"""
+
+    def get_imap_config(self):
+        return {'server': self.config['host'], 'port': self.config['port'], 'ssl': False}
+
+    def get_smtp_config(self):
+        return {'server': self.config['host'], 'port': 0}
+
+
+def run_case(server: FakeIMAPServer, count: int, batch_size: int):
+    provider = LocalEmailProvider('bench', 'bench', host='127.0.0.1', port=server.port,
+                                  fetch_batch_size=batch_size)
+    provider.connect()
+    server.reset_stats()
+    started = time.perf_counter()
+    emails = provider.get_emails(count=count)
+    elapsed = time.perf_counter() - started
+    round_trips = server.command_count
+    provider.disconnect()
+    return {
+        'count': count,
+        'batch_size': batch_size,
+        'fetched': len(emails),
+        'round_trips': round_trips,
+        'seconds': round(elapsed, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量FETCH基准测试')
+    parser.add_argument('--counts', type=int, nargs='+', default=[50, 500, 5000])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100, 500])
+    parser.add_argument('--latency-ms', type=float, default=2.0, help='模拟的每命令网络往返时间')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args()
+
+    total = max(args.counts)
+    mailbox = FakeMailbox([make_message(i) for i in range(total)])
+    server = FakeIMAPServer({'INBOX': mailbox}, latency=args.latency_ms / 1000.0).start()
+
+    results = []
+    try:
+        for count in args.counts:
+            for batch_size in args.batch_sizes:
+                result = run_case(server, count, batch_size)
+                results.append(result)
+                if not args.json:
+                    print(f"count={result['count']:>5} batch={result['batch_size']:>4} "
+                          f"round_trips={result['round_trips']:>5} time={result['seconds']:.3f}s")
+    finally:
+        server.stop()
+
+    if args.json:
+        print(json.dumps({'latency_ms': args.latency_ms, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""MIME解析基准测试
+对比原有的两遍遍历解析（完整解码正文和附件）与 parse_email_message 的单遍解析，
+输出每封邮件的平均耗时、tracemalloc 峰值内存，并校验两者结果一致
+
+语料默认由脚本生成（大型HTML邮件、多附件邮件、中文正文、内嵌邮件），
+也可以通过 --corpus 指定包含 .eml 文件的目录
+
+用法: python benchmarks/bench_parse.py --repeat 20 [--corpus ./eml] [--policy-default]
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import email
+import argparse
+import tracemalloc
+from email import policy
+from email.message import EmailMessage
+from email.header import decode_header
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_providers import parse_email_message, parse_message_bytes, BODY_PREVIEW_CHARS
+
+
+def _newsletter(index: int) -> bytes:
+    msg = EmailMessage()
+    msg['Subject'] = f'=?utf-8?b?{base64.b64encode(f"每周精选 第{index}期".encode()).decode()}?='
+    msg['From'] = 'Newsletter <news@example.com>'
+    msg['To'] = 'reader@example.com'
+    msg['Date'] = 'Mon, 01 Jan 2024 10:00:00 +0800'
+    rows = ''.join(f'<tr><td style="padding:8px;font-family:Arial">文章 {i} — 这是一段较长的摘要文字，'
+                   f'用于模拟真实的营销邮件内容。</td></tr>' for i in range(2000))
+    msg.set_content('纯文本版本：' + '这是一段正文。' * 3000)
+    msg.add_alternative(f'<html><body><table>{rows}</table></body></html>', subtype='html')
+    return msg.as_bytes()
+
+
+def _many_attachments(index: int, count: int = 20, size: int = 200 * 1024) -> bytes:
+    msg = EmailMessage()
+    msg['Subject'] = f'Report {index} with attachments'
+    msg['From'] = 'reports@example.com'
+    msg['To'] = 'team@example.com'
+    msg['Date'] = 'Mon, 01 Jan 2024 10:00:00 +0800'
+    msg.set_content('Please find the attached files.\n')
+    for i in range(count):
+        msg.add_attachment(os.urandom(size), maintype='application', subtype='octet-stream',
+                           filename=f'附件-{index}-{i}.bin')
+    return msg.as_bytes()
+
+
+def _chinese_plain(index: int) -> bytes:
+    msg = EmailMessage()
+    msg['Subject'] = f'会议纪要 {index}'
+    msg['From'] = '张三 <zhangsan@example.com>'
+    msg['To'] = 'lisi@example.com'
+    msg['Date'] = 'Mon, 01 Jan 2024 10:00:00 +0800'
+    msg.set_content('会议讨论了下季度的计划。' * 500, cte='base64')
+    return msg.as_bytes()
+
+
+def _forwarded(index: int) -> bytes:
+    inner = email.message_from_bytes(_many_attachments(index, count=2, size=50 * 1024))
+    msg = EmailMessage()
+    msg['Subject'] = f'Fwd: Report {index}'
+    msg['From'] = 'forwarder@example.com'
+    msg['To'] = 'team@example.com'
+    msg.set_content('See forwarded message.\n')
+    msg.add_attachment(inner)
+    return msg.as_bytes()
+
+
+def build_corpus(copies: int = 3):
+    corpus = []
+    for index in range(copies):
+        corpus.append(('newsletter', _newsletter(index)))
+        corpus.append(('many_attachments', _many_attachments(index)))
+        corpus.append(('chinese_plain', _chinese_plain(index)))
+        corpus.append(('forwarded', _forwarded(index)))
+    return corpus
+
+
+def load_corpus(directory: str):
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.eml'):
+            with open(os.path.join(directory, name), 'rb') as f:
+                corpus.append((name, f.read()))
+    return corpus
+
+
+def _legacy_decode_mime_words(s):
+    if not s:
+        return ""
+    decoded_string = ""
+    for fragment, encoding in decode_header(s):
+        if isinstance(fragment, bytes):
+            decoded_string += fragment.decode(encoding or 'utf-8', errors='ignore')
+        else:
+            decoded_string += fragment
+    return decoded_string
+
+
+def legacy_parse(raw: bytes):
+    """原有实现：正文和附件分两次遍历，完整解码正文和每个附件"""
+    email_message = email.message_from_bytes(raw)
+    body = ""
+    if email_message.is_multipart():
+        for part in email_message.walk():
+            if part.get_content_type() == "text/plain":
+                try:
+                    body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
+                    break
+                except Exception:
+                    continue
+    else:
+        body = email_message.get_payload(decode=True).decode('utf-8', errors='ignore')
+    attachments = []
+    for part in email_message.walk():
+        filename = part.get_filename()
+        if filename:
+            content = part.get_payload(decode=True)
+            if not content:
+                continue
+            attachments.append({
+                'filename': _legacy_decode_mime_words(filename),
+                'size': len(content),
+                'content_type': part.get_content_type(),
+                'content': base64.b64encode(content).decode('utf-8')
+            })
+    return {
+        'subject': _legacy_decode_mime_words(email_message.get('Subject', '')),
+        'sender': _legacy_decode_mime_words(email_message.get('From', '')),
+        'body': body[:BODY_PREVIEW_CHARS],
+        'attachments': attachments
+    }
+
+
+def current_parse(raw: bytes, attachment_mode: str = 'inline'):
+    return parse_email_message(parse_message_bytes(raw), attachment_mode)
+
+
+def policy_default_parse(raw: bytes):
+    """参考：policy.default 解析（只解析，不提取内容）"""
+    message = email.message_from_bytes(raw, policy=policy.default)
+    for part in message.walk():
+        part.get_filename()
+    return message['Subject']
+
+
+def _comparable(result):
+    return {
+        'subject': result['subject'],
+        'sender': result['sender'],
+        'body': result['body'],
+        'attachments': [(a['filename'], a['size'], a['content_type'], a.get('content'))
+                        for a in result['attachments']]
+    }
+
+
+def measure(func, corpus, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for _, raw in corpus:
+            func(raw)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    for _, raw in corpus:
+        func(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'us_per_message': round(elapsed / (repeat * len(corpus)) * 1e6, 1),
+        'peak_kb': round(peak / 1024, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MIME解析基准测试')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--corpus', help='包含 .eml 文件的目录，默认使用生成的语料')
+    parser.add_argument('--policy-default', action='store_true', help='同时测量 policy.default 的解析耗时')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else build_corpus()
+    mismatches = [name for name, raw in corpus
+                  if _comparable(legacy_parse(raw)) != _comparable(current_parse(raw))]
+
+    kinds = sorted({name for name, _ in corpus}) if not args.corpus else ['all']
+    results = []
+    for kind in kinds:
+        subset = corpus if kind == 'all' else [item for item in corpus if item[0] == kind]
+        cases = {
+            'legacy': legacy_parse,
+            'single_pass': current_parse,
+            'single_pass_descriptor': lambda raw: current_parse(raw, 'descriptor'),
+        }
+        if args.policy_default:
+            cases['policy_default_parse_only'] = policy_default_parse
+        for case, func in cases.items():
+            results.append(dict(kind=kind, case=case, **measure(func, subset, args.repeat)))
+
+    if args.json:
+        print(json.dumps({'mismatches': mismatches, 'results': results}, ensure_ascii=False, indent=2))
+        return
+    print(f"{'kind':<18}{'case':<28}{'us/msg':>12}{'peak KB':>12}")
+    for r in results:
+        print(f"{r['kind']:<18}{r['case']:<28}{r['us_per_message']:>12}{r['peak_kb']:>12}")
+    print(f"结果不一致的邮件: {mismatches or '无'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""解析进程池基准测试
+在本地模拟服务器上以完整模式获取邮件，对比当前线程解析与不同进程数的解析进程池的耗时
+
+用法: python benchmarks/bench_parse_pool.py --count 200 --workers 0 2 4 --latency-ms 5
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parse_pool import ParsePool
+from bench_fetch import LocalEmailProvider
+from bench_parse import _newsletter, _many_attachments
+from fake_imap_server import FakeIMAPServer, FakeMailbox
+
+
+def run_case(server: FakeIMAPServer, count: int, batch_size: int, pool, attachment_mode: str):
+    provider = LocalEmailProvider('bench', 'bench', host='127.0.0.1', port=server.port,
+                                  fetch_batch_size=batch_size, parse_pool=pool,
+                                  attachment_mode=attachment_mode)
+    provider.connect()
+    started = time.perf_counter()
+    emails = provider.get_emails(count=count)
+    elapsed = time.perf_counter() - started
+    provider.disconnect()
+    return {
+        'workers': pool.workers if pool else 0,
+        'batch_size': batch_size,
+        'attachment_mode': attachment_mode,
+        'fetched': len(emails),
+        'seconds': round(elapsed, 3),
+        'emails_per_second': round(len(emails) / elapsed, 1) if elapsed else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='解析进程池基准测试')
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 2, 4])
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--attachment-mode', default='inline', choices=['inline', 'descriptor'])
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='模拟的每命令网络往返时间')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args()
+
+    messages = []
+    for index in range(args.count):
+        messages.append(_newsletter(index) if index % 2 else _many_attachments(index, count=4, size=64 * 1024))
+    server = FakeIMAPServer({'INBOX': FakeMailbox(messages)}, latency=args.latency_ms / 1000.0).start()
+
+    results = []
+    try:
+        for workers in args.workers:
+            pool = ParsePool(workers=workers, min_batch=1) if workers else None
+            if pool:
+                # 预先启动工作进程，不计入耗时
+                pool.submit(messages[0]).result()
+            result = run_case(server, args.count, args.batch_size, pool, args.attachment_mode)
+            results.append(result)
+            if pool:
+                pool.shutdown()
+            if not args.json:
+                print(f"workers={result['workers']:>2} batch={result['batch_size']:>4} "
+                      f"time={result['seconds']:.3f}s rate={result['emails_per_second']}/s")
+    finally:
+        server.stop()
+
+    if args.json:
+        print(json.dumps({'latency_ms': args.latency_ms, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""本地搜索索引基准测试
+将合成邮箱写入搜索索引（SearchIndex），记录写入吞吐量和索引大小，再测量一组查询（全文、中文、
+字段条件、前缀、日期范围）的 p50/p95 延迟；--compare-imap 时对比原有做法：
+从模拟服务器重新获取全部邮件（full 模式）后在客户端按主题/正文过滤
+
+用法: python benchmarks/bench_search.py --counts 1000 10000 --repeat 50 --compare-imap --latency-ms 2
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from email_providers import parse_raw_email
+from search_index import SearchIndex, index_document, parse_date_param
+from fake_imap_server import FakeIMAPServer, FakeMailbox
+from mailbox_generator import generate_messages
+from bench_fetch import LocalEmailProvider
+
+# 查询名 -> SearchIndex.search 的参数
+QUERIES = {
+    'term': {'query': 'invoice'},
+    'phrase': {'query': '"project update"'},
+    'cjk': {'query': '会议'},
+    'prefix': {'query': 'sched*'},
+    'field': {'fields': {'from': 'sender7'}},
+    'date_range': {'since': parse_date_param('2024-01-02'), 'until': parse_date_param('2024-01-03', end=True)},
+    'term_by_date': {'query': 'review', 'sort': 'date'},
+}
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_case(count: int, mix: str, repeat: int, seed: int):
+    raws = generate_messages(count, mix=mix, seed=seed)
+    documents = [index_document({**parse_raw_email(raw, 'descriptor'), 'uid': uid})
+                 for uid, raw in enumerate(raws, 1)]
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'search.db')
+        index = SearchIndex(db_path, max_messages=count)
+        started = time.perf_counter()
+        for start in range(0, len(documents), 100):
+            index.add('bench', 'bench', 'INBOX', 1, documents[start:start + 100])
+        index_seconds = time.perf_counter() - started
+        disk_bytes = index.stats()['disk_bytes']
+
+        queries = {}
+        for name, params in QUERIES.items():
+            timings, total = [], 0
+            for _ in range(repeat):
+                t = time.perf_counter()
+                total = index.search('bench', 'bench', limit=20, **params)['total']
+                timings.append(time.perf_counter() - t)
+            queries[name] = {'matches': total, 'p50_ms': round(statistics.median(timings) * 1000, 3),
+                             'p95_ms': round(_percentile(timings, 0.95) * 1000, 3)}
+    return {
+        'count': count,
+        'index_seconds': round(index_seconds, 3),
+        'messages_per_second': round(count / index_seconds, 1),
+        'disk_bytes': disk_bytes,
+        'queries': queries
+    }, raws
+
+
+def imap_search(raws, latency: float, term: str):
+    """原有做法：重新获取全部邮件后在客户端过滤"""
+    server = FakeIMAPServer({'INBOX': FakeMailbox(raws)}, latency=latency).start()
+    provider = LocalEmailProvider('bench', 'bench', host='127.0.0.1', port=server.port, attachment_mode='descriptor')
+    try:
+        provider.connect()
+        started = time.perf_counter()
+        emails = provider.get_emails(count=len(raws))
+        matches = [email for email in emails if term in email['subject'].lower() or term in email['body'].lower()]
+        return {'seconds': round(time.perf_counter() - started, 3), 'matches': len(matches),
+                'round_trips': server.command_count}
+    finally:
+        provider.disconnect()
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地搜索索引基准测试')
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--mix', default='plain:45,html:20,cjk:25,small:10', help='邮件类型比例')
+    parser.add_argument('--repeat', type=int, default=50, help='每个查询的重复次数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare-imap', action='store_true', help='对比重新获取全部邮件后在客户端过滤')
+    parser.add_argument('--latency-ms', type=float, default=2.0, help='--compare-imap 时模拟的每命令网络往返时间')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args()
+
+    results = []
+    for count in args.counts:
+        result, raws = run_case(count, args.mix, args.repeat, args.seed)
+        if args.compare_imap:
+            result['imap_refetch'] = imap_search(raws, args.latency_ms / 1000.0, 'invoice')
+        results.append(result)
+        if args.json:
+            continue
+        print(f"count={count:>6} 写入 {result['index_seconds']:.2f}s ({result['messages_per_second']:.0f} 封/秒) "
+              f"索引 {result['disk_bytes'] / 1024 / 1024:.1f}MB")
+        for name, query in result['queries'].items():
+            print(f"  {name:<14} matches={query['matches']:>6} p50={query['p50_ms']:>8.3f}ms "
+                  f"p95={query['p95_ms']:>8.3f}ms")
+        if args.compare_imap:
+            refetch = result['imap_refetch']
+            print(f"  {'imap_refetch':<14} matches={refetch['matches']:>6} {refetch['seconds']:.3f}s "
+                  f"rt={refetch['round_trips']}")
+
+    if args.json:
+        print(json.dumps({'mix': args.mix, 'repeat': args.repeat, 'results': results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
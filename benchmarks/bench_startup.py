@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""冷启动基准测试
+缩容到零的实例收到第一个请求时需要先启动解释器并导入应用。每次在新的子进程中测量
+导入 app 的耗时和之后第一次请求各接口的延迟，并用 -X importtime 列出自身耗时最多的模块。
+
+用法: python benchmarks/bench_startup.py --repeat 5 --top 15
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 冷启动后依次请求的接口（不需要邮箱凭据）
+ENDPOINTS = ('/health', '/api/providers', '/api/status', '/metrics')
+
+_PROBE = r'''
+import sys, json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+timings = {}
+for path in sys.argv[1:]:
+    t = time.perf_counter()
+    response = client.get(path)
+    timings[path] = [time.perf_counter() - t, response.status_code]
+print(json.dumps({'import_seconds': imported - started, 'requests': timings}))
+'''
+
+
+def run_probe():
+    """在新的解释器中导入应用并请求各接口一次"""
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', _PROBE, *ENDPOINTS], cwd=ROOT, capture_output=True,
+                            text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_seconds'] = time.perf_counter() - started
+    return result
+
+
+def import_profile(top: int):
+    """-X importtime 输出中自身耗时（不含子模块）最多的模块"""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append({'module': name.strip(), 'self_ms': int(self_us) / 1000,
+                        'cumulative_ms': int(cumulative_us) / 1000})
+    return sorted(modules, key=lambda m: m['self_ms'], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='冷启动基准测试')
+    parser.add_argument('--repeat', type=int, default=5, help='启动次数')
+    parser.add_argument('--top', type=int, default=15, help='列出自身导入耗时最多的模块数')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args()
+
+    runs = [run_probe() for _ in range(args.repeat)]
+    summary = {
+        'process_ms': statistics.median(r['process_seconds'] for r in runs) * 1000,
+        'import_ms': statistics.median(r['import_seconds'] for r in runs) * 1000,
+        'first_request_ms': {path: statistics.median(r['requests'][path][0] for r in runs) * 1000
+                             for path in ENDPOINTS},
+        'status_codes': {path: runs[-1]['requests'][path][1] for path in ENDPOINTS},
+        'slowest_imports': import_profile(args.top)
+    }
+
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return
+    print(f"启动 {args.repeat} 次（中位数）: 进程 {summary['process_ms']:.1f}ms，导入 app {summary['import_ms']:.1f}ms")
+    for path in ENDPOINTS:
+        print(f"  首次 GET {path:<16}{summary['first_request_ms'][path]:>8.1f}ms  HTTP {summary['status_codes'][path]}")
+    print(f"\n{'module':<40}{'self ms':>10}{'cum ms':>10}")
+    for module in summary['slowest_imports']:
+        print(f"{module['module']:<40}{module['self_ms']:>10.1f}{module['cumulative_ms']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""/api/sync/email 端到端基准测试
+启动使用自签名证书的 IMAPS 模拟服务器，装入合成邮箱，在不同 email_count 下
+通过 Flask 测试客户端调用 /api/sync/email（包含路由、IMAP获取、解析和JSON序列化），
+记录延迟、吞吐量、IMAP命令数和峰值内存（RSS）。
+
+每个 email_count 在独立的子进程（spawn）中运行，峰值RSS只包含该用例；
+子进程中第一次请求包含TLS握手和登录（冷启动），之后的请求在启用连接池时复用连接。
+结果写入JSON文件，可用 --baseline 与之前的结果对比。
+
+用法: python benchmarks/bench_sync_api.py --counts 10 100 1000 --repeat 5 --mix plain:60,small:30,large:10
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import resource
+import statistics
+import subprocess
+import multiprocessing
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_async import _percentile
+from fake_imap_server import FakeIMAPServer, FakeMailbox, self_signed_certificate, server_ssl_context
+from mailbox_generator import generate_messages, describe, DEFAULT_MIX
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def _peak_rss_kb() -> int:
+    """当前进程的峰值RSS（KB）
+
+    Linux 上 ru_maxrss 会保留 fork 前父进程的峰值（父进程持有整个模拟邮箱），
+    因此优先读取 /proc/self/status 中 exec 后重新计算的 VmHWM
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以KB为单位
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _run_case(params, results):
+    """子进程：注册指向模拟服务器的提供商，导入应用并重复请求 /api/sync/email"""
+    os.environ['IMAP_POOL_ENABLED'] = 'true' if params['pool'] else 'false'
+    os.environ['MESSAGE_CACHE_ENABLED'] = 'true' if params['cache'] else 'false'
+    os.environ['MESSAGE_CACHE_DB_PATH'] = ''
+    # 相同请求在 SYNC_COALESCE_TTL 内直接复用上次的结果，与邮件缓存一样随 --cache 开启
+    os.environ['SYNC_COALESCE_TTL'] = os.getenv('SYNC_COALESCE_TTL', '2') if params['cache'] else '0'
+    os.environ['IMAP_ENGINE'] = params['engine']
+
+    from email_providers import EmailProvider, EmailProviderFactory
+    from fake_imap_server import client_ssl_context
+
+    context = client_ssl_context(params['cert_path'])
+
+    class FakeTLSProvider(EmailProvider):
+        def get_imap_config(self):
+            return {'server': '127.0.0.1', 'port': params['port'], 'ssl': True, 'ssl_context': context}
+
+        def get_smtp_config(self):
+            return {'server': '127.0.0.1', 'port': 0}
+
+    EmailProviderFactory.PROVIDERS['bench-tls'] = FakeTLSProvider
+    from app import app
+
+    client = app.test_client()
+    payload = {
+        'email_username': 'bench@example.com',
+        'email_password': 'bench',
+        'provider': 'bench-tls',
+        'email_count': params['email_count'],
+        'fetch_batch_size': params['batch_size'],
+        'mode': params['mode'],
+        'attachment_mode': params['attachment_mode']
+    }
+    baseline_rss = _peak_rss_kb()
+    latencies, fetched, response_bytes = [], 0, 0
+    for _ in range(params['repeat']):
+        started = time.perf_counter()
+        response = client.post('/api/sync/email', json=payload)
+        latencies.append(time.perf_counter() - started)
+        body = response.get_json() or {}
+        data = body.get('data') or {}
+        if response.status_code != 200 or not data.get('success'):
+            results.put({'error': data.get('error') or body.get('error') or f'HTTP {response.status_code}'})
+            return
+        fetched = data['total_emails']
+        response_bytes = len(response.data)
+    results.put({
+        'latencies': latencies,
+        'fetched': fetched,
+        'response_bytes': response_bytes,
+        'rss_baseline_kb': baseline_rss,
+        'peak_rss_kb': _peak_rss_kb()
+    })
+
+
+def run_case(server: FakeIMAPServer, cert_path: str, email_count: int, args):
+    params = {
+        'port': server.port,
+        'cert_path': cert_path,
+        'email_count': email_count,
+        'repeat': args.repeat,
+        'batch_size': args.batch_size,
+        'mode': args.mode,
+        'attachment_mode': args.attachment_mode,
+        'engine': args.engine,
+        'pool': args.pool,
+        'cache': args.cache
+    }
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    server.reset_stats()
+    process = context.Process(target=_run_case, args=(params, results))
+    process.start()
+    outcome = results.get(timeout=args.timeout)
+    process.join()
+    if 'error' in outcome:
+        raise RuntimeError(f"email_count={email_count} 获取失败: {outcome['error']}")
+
+    latencies = outcome['latencies']
+    # 第一次请求包含建立连接，其余为稳定状态
+    steady = latencies[1:] or latencies
+    median = statistics.median(steady)
+    return {
+        'email_count': email_count,
+        'fetched': outcome['fetched'],
+        'repeat': args.repeat,
+        'first_request_seconds': round(latencies[0], 4),
+        'latency_seconds': {
+            'min': round(min(steady), 4),
+            'p50': round(median, 4),
+            'p95': round(_percentile(steady, 95), 4),
+            'max': round(max(steady), 4)
+        },
+        'emails_per_second': round(outcome['fetched'] / median, 1) if median else None,
+        'response_bytes': outcome['response_bytes'],
+        'imap_commands_per_request': round(server.command_count / args.repeat, 1),
+        'rss_baseline_kb': outcome['rss_baseline_kb'],
+        'peak_rss_kb': outcome['peak_rss_kb']
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path: str):
+    """与之前的结果按 email_count 对比，打印延迟、吞吐量和峰值内存的变化"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {case['email_count']: case for case in json.load(f)['results']}
+
+    def change(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+
+    print(f"\n与 {baseline_path} 对比:")
+    for case in results:
+        old = baseline.get(case['email_count'])
+        if old is None:
+            continue
+        print(f"count={case['email_count']:>6} "
+              f"p50 {change(case['latency_seconds']['p50'], old['latency_seconds']['p50'])} "
+              f"rate {change(case['emails_per_second'] or 0, old['emails_per_second'] or 0)} "
+              f"rss {change(case['peak_rss_kb'], old['peak_rss_kb'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/api/sync/email 端到端基准测试')
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 100, 1000], help='email_count 取值')
+    parser.add_argument('--mailbox-size', type=int, default=None, help='邮箱邮件数，默认为最大的 email_count')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='邮件类型比例，见 mailbox_generator.py')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--body-size', type=int, default=2048)
+    parser.add_argument('--repeat', type=int, default=5, help='每个用例的请求次数（第一次单独记录）')
+    parser.add_argument('--mode', default='full', choices=['full', 'envelope'])
+    parser.add_argument('--attachment-mode', default='inline', choices=['inline', 'descriptor'])
+    parser.add_argument('--engine', default='imaplib', choices=['imaplib', 'asyncio'])
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--no-pool', dest='pool', action='store_false', help='不使用连接池，每次请求重新握手和登录')
+    parser.add_argument('--cache', action='store_true', help='启用邮件缓存和相同请求的结果复用（默认关闭，否则重复请求不再获取和解析）')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='模拟的每命令网络往返时间')
+    parser.add_argument('--timeout', type=float, default=600, help='单个用例的超时时间（秒）')
+    parser.add_argument('--output', default=None, help='结果JSON路径，默认 benchmarks/results/sync_api-<时间>.json')
+    parser.add_argument('--baseline', default=None, help='用于对比的之前的结果JSON')
+    args = parser.parse_args()
+
+    mailbox_size = args.mailbox_size or max(args.counts)
+    messages = generate_messages(mailbox_size, args.mix, args.seed, args.body_size)
+    mailbox_info = describe(messages)
+    cert_path, key_path = self_signed_certificate()
+    server = FakeIMAPServer({'INBOX': FakeMailbox(messages)}, latency=args.latency_ms / 1000.0,
+                            ssl_context=server_ssl_context(cert_path, key_path)).start()
+    del messages
+
+    results = []
+    try:
+        for email_count in args.counts:
+            result = run_case(server, cert_path, email_count, args)
+            results.append(result)
+            print(f"count={email_count:>6} fetched={result['fetched']:>6} "
+                  f"first={result['first_request_seconds']:.3f}s p50={result['latency_seconds']['p50']:.3f}s "
+                  f"p95={result['latency_seconds']['p95']:.3f}s rate={result['emails_per_second']}/s "
+                  f"rss={result['peak_rss_kb'] / 1024:.1f}MB")
+    finally:
+        server.stop()
+        shutil.rmtree(os.path.dirname(cert_path), ignore_errors=True)
+
+    report = {
+        'benchmark': 'sync_api',
+        'timestamp': datetime.now().isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': {
+            'mailbox': dict(mailbox_info, mix=args.mix, seed=args.seed, body_size=args.body_size),
+            'repeat': args.repeat,
+            'mode': args.mode,
+            'attachment_mode': args.attachment_mode,
+            'engine': args.engine,
+            'batch_size': args.batch_size,
+            'pool': args.pool,
+            'cache': args.cache,
+            'latency_ms': args.latency_ms,
+            'tls': True
+        },
+        'results': results
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"sync_api-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
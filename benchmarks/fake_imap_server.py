@@ -0,0 +1,609 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""本地IMAP模拟服务器（仅用于基准测试）
+实现 EmailProvider 用到的IMAP命令子集，可模拟网络往返延迟并统计命令次数，
+可选使用自签名证书的TLS（IMAPS），使基准测试包含TLS握手和加解密的开销；
+可选支持 CONDSTORE/QRESYNC（MODSEQ、CHANGEDSINCE、VANISHED），用于 delta 同步的基准测试
+"""
+
+import os
+import re
+import ssl
+import sys
+import select
+import time
+import shutil
+import tempfile
+import subprocess
+import threading
+import socketserver
+import email
+import email.utils
+import email.header
+import email.policy
+from email import policy
+from email.message import EmailMessage
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from imap_utils import parse_imap_list, imap_text, encode_imap_utf7, decode_imap_utf7, compact_uid_set
+
+
+def make_message(index: int, body_size: int = 2048) -> bytes:
+    """生成一封简单的测试邮件"""
+    msg = EmailMessage()
+    msg['Subject'] = f'测试邮件 #{index}'
+    msg['From'] = f'sender{index % 17}@example.com'
+    msg['To'] = 'bench@example.com'
+    msg['Date'] = 'Mon, 06 May 2024 10:00:00 +0800'
+    msg['Message-ID'] = f'<bench-{index}@example.com>'
+    msg.set_content(('Lorem ipsum dolor sit amet. ' * (body_size // 28 + 1))[:body_size])
+    return msg.as_bytes(policy=CRLF_POLICY)
+
+
+# IMAP要求CRLF换行
+CRLF_POLICY = policy.default.clone(linesep='\r\n')
+
+
+def _quote(value) -> str:
+    if value is None:
+        return 'NIL'
+    value = str(value)
+    if any(ord(ch) > 127 for ch in value):
+        value = email.header.Header(value, 'utf-8').encode()
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _split_header(raw: bytes):
+    for separator in (b'\r\n\r\n', b'\n\n'):
+        if separator in raw:
+            header, body = raw.split(separator, 1)
+            return header + separator, body
+    return raw, b''
+
+
+def _part_bytes(part) -> bytes:
+    return part.as_bytes(policy=email.policy.compat32.clone(linesep='\r\n'))
+
+
+def envelope(msg) -> str:
+    """根据邮件头生成ENVELOPE结构"""
+    def addresses(name):
+        values = msg.get_all(name)
+        if not values:
+            return 'NIL'
+        items = []
+        for display, address in email.utils.getaddresses(values):
+            mailbox, _, host = address.partition('@')
+            items.append(f'({_quote(display or None)} NIL {_quote(mailbox)} {_quote(host)})')
+        return '(' + ''.join(items) + ')'
+
+    sender = addresses('From')
+    return '(' + ' '.join([
+        _quote(msg.get('Date')), _quote(msg.get('Subject')), sender,
+        addresses('Sender') if msg.get('Sender') else sender,
+        addresses('Reply-To') if msg.get('Reply-To') else sender,
+        addresses('To'), addresses('Cc'), addresses('Bcc'),
+        _quote(msg.get('In-Reply-To')), _quote(msg.get('Message-ID')),
+    ]) + ')'
+
+
+def bodystructure(part) -> str:
+    """根据MIME结构生成BODYSTRUCTURE"""
+    if part.is_multipart():
+        children = ''.join(bodystructure(child) for child in part.get_payload())
+        return f'({children} {_quote(part.get_content_subtype())} ("boundary" {_quote(part.get_boundary())}) NIL NIL NIL)'
+    params = [(k, v) for k, v in part.get_params(header='content-type')[1:]] if part.get_params() else []
+    params_str = '(' + ' '.join(f'{_quote(k)} {_quote(v)}' for k, v in params) + ')' if params else 'NIL'
+    _, body = _split_header(_part_bytes(part))
+    fields = [
+        _quote(part.get_content_maintype()), _quote(part.get_content_subtype()), params_str,
+        _quote(part.get('Content-ID')), 'NIL', _quote(part.get('Content-Transfer-Encoding', '7bit')),
+        str(len(body)),
+    ]
+    if part.get_content_maintype() == 'text':
+        fields.append(str(body.count(b'\n')))
+    disposition = 'NIL'
+    if part.get_content_disposition():
+        filename = part.get_filename()
+        disposition = f'({_quote(part.get_content_disposition())} ' + \
+            (f'("filename" {_quote(filename)}))' if filename else 'NIL)')
+    fields += ['NIL', disposition, 'NIL', 'NIL']
+    return '(' + ' '.join(fields) + ')'
+
+
+def section_bytes(message: Dict[str, Any], section: str) -> bytes:
+    """返回 BODY[section] 的内容"""
+    raw = message['raw']
+    section = section.upper()
+    if section == '':
+        return raw
+    if section == 'HEADER':
+        return _split_header(raw)[0]
+    if section == 'TEXT':
+        return _split_header(raw)[1]
+    path, _, suffix = section.partition('.MIME') if section.endswith('.MIME') else (section, '', '')
+    part = message['parsed']
+    for index in path.split('.'):
+        if part.is_multipart():
+            part = part.get_payload()[int(index) - 1]
+        elif index != '1':
+            raise ValueError(f'invalid section {section}')
+    header, body = _split_header(_part_bytes(part))
+    return header if section.endswith('.MIME') else body
+
+
+class FakeMailbox:
+    """内存中的邮箱文件夹"""
+
+    def __init__(self, messages: Optional[List[bytes]] = None, uidvalidity: int = 1,
+                 special_use: Optional[str] = None):
+        self.uidvalidity = uidvalidity
+        self.special_use = special_use  # 如 '\\Sent'，在 LIST 响应中返回
+        self.messages = []  # [{'uid': int, 'raw': bytes, 'flags': set, 'modseq': int}]
+        self.uidnext = 1
+        self.highestmodseq = 1
+        self.vanished = []  # [(uid, modseq)]，已删除的邮件，用于 QRESYNC 的 VANISHED 响应
+        for raw in messages or []:
+            self.append(raw)
+
+    def _next_modseq(self) -> int:
+        self.highestmodseq += 1
+        return self.highestmodseq
+
+    def append(self, raw: bytes, flags=None) -> int:
+        uid = self.uidnext
+        self.uidnext += 1
+        self.messages.append({
+            'uid': uid,
+            'raw': raw,
+            'flags': set(flags or []),
+            'parsed': email.message_from_bytes(raw),
+            'modseq': self._next_modseq()
+        })
+        return uid
+
+    def set_flags(self, message, flags):
+        """替换邮件的标志，有变化时推进 MODSEQ"""
+        if set(flags) != message['flags']:
+            message['flags'] = set(flags)
+            message['modseq'] = self._next_modseq()
+
+    def expunge(self, uids):
+        """删除指定UID的邮件"""
+        uids = set(uids)
+        modseq = self._next_modseq()
+        self.vanished.extend((m['uid'], modseq) for m in self.messages if m['uid'] in uids)
+        self.messages = [m for m in self.messages if m['uid'] not in uids]
+
+
+def self_signed_certificate(directory: Optional[str] = None):
+    """用 openssl 命令生成 localhost/127.0.0.1 的自签名证书，返回 (证书路径, 私钥路径)"""
+    if shutil.which('openssl') is None:
+        raise RuntimeError('生成自签名证书需要 openssl 命令')
+    directory = directory or tempfile.mkdtemp(prefix='fake-imap-tls-')
+    cert_path = os.path.join(directory, 'cert.pem')
+    key_path = os.path.join(directory, 'key.pem')
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '2',
+        '-keyout', key_path, '-out', cert_path, '-subj', '/CN=localhost',
+        '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1'
+    ], check=True, capture_output=True)
+    return cert_path, key_path
+
+
+def server_ssl_context(cert_path: str, key_path: str) -> ssl.SSLContext:
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+def client_ssl_context(cert_path: str) -> ssl.SSLContext:
+    """信任自签名证书的客户端上下文（仍校验主机名）"""
+    return ssl.create_default_context(cafile=cert_path)
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    """多线程IMAP模拟服务器
+
+    latency 为每条命令响应前的模拟网络往返时间（秒）；
+    提供 ssl_context 时以 IMAPS 方式在连接建立后进行TLS握手；
+    condstore/qresync 为真时声明对应扩展（以及 ENABLE、UNSELECT）
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, mailboxes: Dict[str, FakeMailbox], latency: float = 0.0,
+                 host: str = '127.0.0.1', port: int = 0, idle: bool = True,
+                 ssl_context: Optional[ssl.SSLContext] = None, condstore: bool = False, qresync: bool = False):
+        super().__init__((host, port), _IMAPHandler)
+        self.mailboxes = mailboxes
+        self.latency = latency
+        self.idle = idle
+        self.ssl_context = ssl_context
+        self.condstore = condstore or qresync
+        self.qresync = qresync
+        self.command_count = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def get_request(self):
+        sock, address = super().get_request()
+        if self.ssl_context is not None:
+            # 握手在处理线程中进行，不阻塞接受新连接
+            sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+        return sock, address
+
+    def count_command(self):
+        with self._lock:
+            self.command_count += 1
+
+    def count_bytes(self, size: int):
+        with self._lock:
+            self.bytes_sent += size
+
+    def reset_stats(self):
+        with self._lock:
+            self.command_count = 0
+            self.bytes_sent = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _parse_sequence_set(spec: str, maximum: int) -> List[int]:
+    """解析消息集合，如 1:3,5,7:*"""
+    numbers = []
+    for part in str(spec).split(','):
+        if ':' in part:
+            start, end = part.split(':', 1)
+            start = maximum if start == '*' else int(start)
+            end = maximum if end == '*' else int(end)
+            if start > end:
+                start, end = end, start
+            numbers.extend(range(start, end + 1))
+        else:
+            numbers.append(maximum if part == '*' else int(part))
+    return numbers
+
+
+_COMMAND_LITERAL_RE = re.compile(rb'\{(\d+)\+?\}$')
+_GMAIL_TERM_RE = re.compile(r'(\w+):("[^"]*"|\S+)')
+
+
+def _message_date(message):
+    try:
+        return email.utils.parsedate_to_datetime(message['parsed']['Date']).date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _header_contains(message, name: str, value: str) -> bool:
+    header = str(email.header.make_header(email.header.decode_header(message['parsed'].get(name, ''))))
+    return value.lower() in header.lower()
+
+
+def _imap_search_date(value: str):
+    return datetime.strptime(value, '%d-%b-%Y').date()
+
+
+def _search_matches(message, criteria) -> bool:
+    """判断邮件是否满足SEARCH条件（支持本项目用到的条件和 X-GM-RAW 的部分语法）"""
+    tokens = [imap_text(token) for token in criteria]
+    index = 0
+    while index < len(tokens):
+        key = tokens[index].upper()
+        value = tokens[index + 1] if index + 1 < len(tokens) else ''
+        if key == 'ALL':
+            index += 1
+            continue
+        if key in ('UNSEEN', 'FLAGGED'):
+            flag = '\\Seen' if key == 'UNSEEN' else '\\Flagged'
+            if (flag in message['flags']) == (key == 'UNSEEN'):
+                return False
+            index += 1
+            continue
+        date = _message_date(message)
+        if key == 'SINCE' and not (date and date >= _imap_search_date(value)):
+            return False
+        if key == 'BEFORE' and not (date and date < _imap_search_date(value)):
+            return False
+        if key in ('FROM', 'TO', 'SUBJECT') and not _header_contains(message, key.title(), value):
+            return False
+        if key == 'LARGER' and not len(message['raw']) > int(value):
+            return False
+        if key == 'X-GM-RAW':
+            for name, term in _GMAIL_TERM_RE.findall(value):
+                term = term.strip('"')
+                if name in ('from', 'to', 'subject'):
+                    if not _header_contains(message, name.title(), term):
+                        return False
+                elif name in ('after', 'before'):
+                    bound = datetime.strptime(term, '%Y/%m/%d').date()
+                    if not date or (date < bound if name == 'after' else date >= bound):
+                        return False
+                elif name == 'is':
+                    flag = '\\Seen' if term == 'unread' else '\\Flagged'
+                    if (flag in message['flags']) == (term == 'unread'):
+                        return False
+                elif name == 'larger' and not len(message['raw']) > int(term):
+                    return False
+        index += 2
+    return True
+
+
+class _IMAPHandler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        if isinstance(self.request, ssl.SSLSocket):
+            self.request.do_handshake()
+        super().setup()
+        self.selected = None
+        self.exists = 0
+        self.qresync_enabled = False
+
+    def send(self, data: bytes):
+        self.server.count_bytes(len(data))
+        self.wfile.write(data)
+
+    def handle(self):
+        self.send(b'* OK [CAPABILITY IMAP4rev1] FakeIMAP ready\r\n')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.rstrip(b'\r\n')
+            if not line:
+                continue
+            # 命令中的字面量 {n}：回复继续请求后读取字面量，以带引号的字符串拼回命令
+            literal = _COMMAND_LITERAL_RE.search(line)
+            while literal:
+                self.send(b'+ Ready\r\n')
+                self.wfile.flush()
+                data = self.rfile.read(int(literal.group(1)))
+                quoted = b'"' + data.replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"'
+                line = line[:literal.start()] + quoted + self.rfile.readline().rstrip(b'\r\n')
+                literal = _COMMAND_LITERAL_RE.search(line)
+            self.server.count_command()
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            tag, _, rest = line.partition(b' ')
+            command, _, args = rest.partition(b' ')
+            command = command.decode().upper()
+            use_uid = False
+            if command == 'UID':
+                use_uid = True
+                command, _, args = args.partition(b' ')
+                command = command.decode().upper()
+            handler = getattr(self, 'cmd_' + command.lower(), None)
+            if handler is None:
+                self.send(tag + b' BAD unknown command\r\n')
+                continue
+            try:
+                if handler(tag, args, use_uid) is False:
+                    return
+            except Exception as e:  # 基准测试用，错误直接回报给客户端
+                self.send(tag + f' BAD {e}\r\n'.encode())
+            self.wfile.flush()
+
+    # ---- 命令实现 ----
+
+    def cmd_capability(self, tag, args, use_uid):
+        capabilities = b'IMAP4rev1 IDLE' if self.server.idle else b'IMAP4rev1'
+        if self.server.condstore:
+            capabilities += b' CONDSTORE ENABLE UNSELECT'
+        if self.server.qresync:
+            capabilities += b' QRESYNC'
+        self.send(b'* CAPABILITY ' + capabilities + b'\r\n' + tag + b' OK CAPABILITY completed\r\n')
+
+    def cmd_enable(self, tag, args, use_uid):
+        if self.selected is not None:
+            self.send(tag + b' BAD ENABLE not allowed in selected state\r\n')
+            return
+        enabled = b''
+        if self.server.qresync and b'QRESYNC' in args.upper():
+            self.qresync_enabled = True
+            enabled = b' QRESYNC'
+        self.send(b'* ENABLED' + enabled + b'\r\n' + tag + b' OK ENABLE completed\r\n')
+
+    def cmd_unselect(self, tag, args, use_uid):
+        self.selected = None
+        self.send(tag + b' OK UNSELECT completed\r\n')
+
+    def cmd_idle(self, tag, args, use_uid):
+        """等待客户端发送 DONE，期间文件夹有新邮件时推送 EXISTS"""
+        if not self.server.idle or self.selected is None:
+            self.send(tag + b' BAD IDLE not available\r\n')
+            return
+        self.send(b'+ idling\r\n')
+        self.wfile.flush()
+        while True:
+            # TLS连接上已解密但未读取的数据不会触发 select
+            readable = (isinstance(self.connection, ssl.SSLSocket) and self.connection.pending()) or \
+                select.select([self.connection], [], [], 0.05)[0]
+            if len(self.selected.messages) != self.exists:
+                self.exists = len(self.selected.messages)
+                self.send(f'* {self.exists} EXISTS\r\n'.encode())
+                self.wfile.flush()
+            if readable:
+                line = self.rfile.readline()
+                if not line:
+                    return False
+                if line.strip().upper() == b'DONE':
+                    self.send(tag + b' OK IDLE terminated\r\n')
+                    return
+
+    def cmd_login(self, tag, args, use_uid):
+        self.send(tag + b' OK LOGIN completed\r\n')
+
+    def cmd_noop(self, tag, args, use_uid):
+        if self.selected is not None and len(self.selected.messages) != self.exists:
+            self.exists = len(self.selected.messages)
+            self.send(f'* {self.exists} EXISTS\r\n'.encode())
+        self.send(tag + b' OK NOOP completed\r\n')
+
+    def cmd_logout(self, tag, args, use_uid):
+        self.send(b'* BYE logging out\r\n' + tag + b' OK LOGOUT completed\r\n')
+        self.wfile.flush()
+        return False
+
+    def cmd_close(self, tag, args, use_uid):
+        self.selected = None
+        self.send(tag + b' OK CLOSE completed\r\n')
+
+    def _mailbox(self, args):
+        name = parse_imap_list([args])[0]
+        name = decode_imap_utf7(name.decode() if isinstance(name, bytes) else str(name))
+        return name, self.server.mailboxes.get(name)
+
+    def cmd_list(self, tag, args, use_uid):
+        lines = []
+        for name, mailbox in self.server.mailboxes.items():
+            flags = '\\HasNoChildren' + (' ' + mailbox.special_use if mailbox.special_use else '')
+            lines.append(f'* LIST ({flags}) "/" {_quote(encode_imap_utf7(name))}\r\n')
+        self.send(''.join(lines).encode() + tag + b' OK LIST completed\r\n')
+
+    def cmd_status(self, tag, args, use_uid):
+        name, mailbox = self._mailbox(args)
+        if mailbox is None:
+            self.send(tag + b' NO mailbox does not exist\r\n')
+            return
+        values = {
+            'MESSAGES': len(mailbox.messages),
+            'UIDNEXT': mailbox.uidnext,
+            'UIDVALIDITY': mailbox.uidvalidity,
+            'UNSEEN': sum(1 for m in mailbox.messages if '\\Seen' not in m['flags'])
+        }
+        wanted = parse_imap_list([args])[1]
+        items = ' '.join(f'{imap_text(item).upper()} {values[imap_text(item).upper()]}' for item in wanted)
+        self.send(f'* STATUS {_quote(encode_imap_utf7(name))} ({items})\r\n'.encode()
+                  + tag + b' OK STATUS completed\r\n')
+
+    def cmd_select(self, tag, args, use_uid):
+        name, mailbox = self._mailbox(args)
+        if mailbox is None:
+            self.send(tag + b' NO mailbox does not exist\r\n')
+            return
+        self.selected = mailbox
+        self.exists = len(mailbox.messages)
+        self.send(
+            f'* {len(mailbox.messages)} EXISTS\r\n'
+            f'* 0 RECENT\r\n'
+            f'* OK [UIDVALIDITY {mailbox.uidvalidity}] UIDs valid\r\n'
+            f'* OK [UIDNEXT {mailbox.uidnext}] Predicted next UID\r\n'.encode()
+            + (f'* OK [HIGHESTMODSEQ {mailbox.highestmodseq}] Highest\r\n'.encode() if self.server.condstore else b'')
+            + tag + b' OK [READ-WRITE] SELECT completed\r\n'
+        )
+
+    cmd_examine = cmd_select
+
+    def _resolve(self, spec, use_uid) -> List[Any]:
+        """将消息集合解析为 [(序号, 邮件)] 列表"""
+        messages = self.selected.messages
+        if not messages:
+            return []
+        if use_uid:
+            wanted = set(_parse_sequence_set(spec, messages[-1]['uid']))
+            return [(i + 1, m) for i, m in enumerate(messages) if m['uid'] in wanted]
+        wanted = sorted(set(_parse_sequence_set(spec, len(messages))))
+        return [(n, messages[n - 1]) for n in wanted if 1 <= n <= len(messages)]
+
+    def cmd_search(self, tag, args, use_uid):
+        criteria = parse_imap_list([args])
+        if len(criteria) >= 2 and str(imap_text(criteria[0])).upper() == 'CHARSET':
+            criteria = criteria[2:]
+        matched = [(i + 1, m) for i, m in enumerate(self.selected.messages)]
+        if len(criteria) >= 2 and imap_text(criteria[0]).upper() == 'UID':
+            matched = self._resolve(imap_text(criteria[1]), True)
+            criteria = criteria[2:]
+        matched = [(n, m) for n, m in matched if _search_matches(m, criteria)]
+        numbers = [str(m['uid'] if use_uid else n) for n, m in matched]
+        self.send(('* SEARCH ' + ' '.join(numbers)).rstrip().encode() + b'\r\n'
+                  + tag + b' OK SEARCH completed\r\n')
+
+    def cmd_fetch(self, tag, args, use_uid):
+        parsed = parse_imap_list([args])
+        spec, items = parsed[0], parsed[1]
+        if not isinstance(items, list):
+            items = [items]
+        names = [str(item).upper() for item in items]
+        if use_uid and 'UID' not in names:
+            names.insert(0, 'UID')
+        # CHANGEDSINCE/VANISHED 修饰符（RFC 7162）
+        modifiers = [imap_text(item).upper() for item in parsed[2]] if len(parsed) > 2 else []
+        changed_since = int(modifiers[modifiers.index('CHANGEDSINCE') + 1]) if 'CHANGEDSINCE' in modifiers else None
+        if changed_since is not None and 'MODSEQ' not in names:
+            names.append('MODSEQ')
+        out = []
+        if 'VANISHED' in modifiers and self.qresync_enabled and use_uid:
+            upper = self.selected.messages[-1]['uid'] if self.selected.messages else 0
+            upper = max([upper] + [uid for uid, _ in self.selected.vanished])
+            wanted = set(_parse_sequence_set(spec, upper))
+            vanished = [uid for uid, modseq in self.selected.vanished if modseq > changed_since and uid in wanted]
+            if vanished:
+                out.append(f'* VANISHED (EARLIER) {compact_uid_set(vanished)}\r\n'.encode())
+        for seq, message in self._resolve(spec, use_uid):
+            if changed_since is not None and message['modseq'] <= changed_since:
+                continue
+            parts = []
+            for name in names:
+                if name == 'UID':
+                    parts.append(f'UID {message["uid"]}'.encode())
+                elif name == 'FLAGS':
+                    parts.append(f'FLAGS ({" ".join(sorted(message["flags"]))})'.encode())
+                elif name == 'MODSEQ':
+                    parts.append(f'MODSEQ ({message["modseq"]})'.encode())
+                elif name == 'RFC822.SIZE':
+                    parts.append(f'RFC822.SIZE {len(message["raw"])}'.encode())
+                elif name == 'RFC822':
+                    self.selected.set_flags(message, message['flags'] | {'\\Seen'})
+                    raw = message['raw']
+                    parts.append(f'RFC822 {{{len(raw)}}}\r\n'.encode() + raw)
+                elif name == 'ENVELOPE':
+                    parts.append(b'ENVELOPE ' + envelope(message['parsed']).encode())
+                elif name in ('BODYSTRUCTURE', 'BODY'):
+                    parts.append(name.encode() + b' ' + bodystructure(message['parsed']).encode())
+                elif name.startswith('BODY[') or name.startswith('BODY.PEEK['):
+                    section = name[name.index('[') + 1:name.index(']')]
+                    partial = name[name.index(']') + 1:]
+                    data = section_bytes(message, section)
+                    label = f'BODY[{section}]'
+                    if partial:
+                        offset, _, length = partial.strip('<>').partition('.')
+                        data = data[int(offset):int(offset) + int(length)] if length else data[int(offset):]
+                        label += f'<{offset}>'
+                    if not name.startswith('BODY.PEEK['):
+                        self.selected.set_flags(message, message['flags'] | {'\\Seen'})
+                    parts.append(f'{label} {{{len(data)}}}\r\n'.encode() + data)
+            out.append(f'* {seq} FETCH ('.encode() + b' '.join(parts) + b')\r\n')
+        self.send(b''.join(out) + tag + b' OK FETCH completed\r\n')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='启动本地IMAP模拟服务器')
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--port', type=int, default=1143)
+    args = parser.parse_args()
+
+    server = FakeIMAPServer({'INBOX': FakeMailbox([make_message(i) for i in range(args.messages)])},
+                            latency=args.latency_ms / 1000.0, port=args.port)
+    print(f'FakeIMAP 监听 127.0.0.1:{server.port}，邮件数 {args.messages}')
+    server.serve_forever()
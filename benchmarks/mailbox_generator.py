@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""合成邮箱生成器
+按给定数量、邮件类型比例和随机种子生成可复现的测试邮件，供模拟服务器和解析基准测试使用
+
+邮件类型：
+    plain       纯文本
+    html        HTML + 纯文本（multipart/alternative）
+    cjk         中文标题、发件人和 base64 编码的中文正文
+    small       1-3 个 8-64KB 的附件
+    large       1 个 512KB-2MB 的附件
+    forwarded   转发邮件（message/rfc822 附件内含一个小附件）
+
+用法: python benchmarks/mailbox_generator.py --count 1000 --mix plain:50,html:20,small:20,large:10 --output ./corpus
+"""
+
+import os
+import sys
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import format_datetime
+from typing import List, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_imap_server import CRLF_POLICY
+
+DEFAULT_MIX = 'plain:40,html:20,cjk:15,small:15,large:5,forwarded:5'
+
+_WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do',
+          'eiusmod', 'tempor', 'incididunt', 'labore', 'dolore', 'magna', 'aliqua', 'report', 'meeting',
+          'invoice', 'schedule', 'project', 'update', 'review')
+_CJK_PHRASES = ('会议讨论了下季度的计划', '请查收附件中的报告', '项目进度符合预期', '预算需要重新评估',
+                '客户反馈整体良好', '下周二安排评审')
+_ATTACHMENT_TYPES = (
+    ('application', 'pdf', 'pdf'),
+    ('image', 'png', 'png'),
+    ('application', 'vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    ('application', 'zip', 'zip'),
+)
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    """解析类型比例，如 plain:60,small:30,large:10（权重不必相加为100）"""
+    mix = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, weight = item.partition(':')
+        name = name.strip()
+        if name not in MESSAGE_BUILDERS:
+            raise ValueError(f"不支持的邮件类型: {name}. 支持的类型: {list(MESSAGE_BUILDERS)}")
+        weight = float(weight) if weight else 1.0
+        if weight < 0:
+            raise ValueError(f"邮件类型权重不能为负数: {item}")
+        mix.append((name, weight))
+    if not mix or sum(weight for _, weight in mix) <= 0:
+        raise ValueError(f"无效的邮件类型比例: {spec}")
+    return mix
+
+
+def _text(rng: random.Random, size: int) -> str:
+    words, length = [], 0
+    while length < size:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:size]
+
+
+def _cjk_text(rng: random.Random, size: int) -> str:
+    parts, length = [], 0
+    while length < size:
+        phrase = rng.choice(_CJK_PHRASES) + '。'
+        parts.append(phrase)
+        length += len(phrase)
+    return ''.join(parts)[:size]
+
+
+def _base_message(rng: random.Random, index: int, date: datetime, subject: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg['Subject'] = subject
+    msg['From'] = f'sender{rng.randrange(50)}@example.com'
+    msg['To'] = 'bench@example.com'
+    msg['Date'] = format_datetime(date)
+    msg['Message-ID'] = f'<synthetic-{index}@example.com>'
+    return msg
+
+
+def _add_attachment(msg: EmailMessage, rng: random.Random, size: int, index: int, number: int):
+    maintype, subtype, extension = rng.choice(_ATTACHMENT_TYPES)
+    msg.add_attachment(rng.randbytes(size), maintype=maintype, subtype=subtype,
+                       filename=f'attachment-{index}-{number}.{extension}')
+
+
+def _plain(rng, index, date, body_size):
+    msg = _base_message(rng, index, date, f'Synthetic message #{index}')
+    msg.set_content(_text(rng, body_size))
+    return msg
+
+
+def _html(rng, index, date, body_size):
+    msg = _base_message(rng, index, date, f'Newsletter #{index}')
+    text = _text(rng, body_size)
+    msg.set_content(text)
+    paragraphs = ''.join(f'<p style="font-family:Arial">{_text(rng, 200)}</p>' for _ in range(max(1, body_size // 200)))
+    msg.add_alternative(f'<html><body>{paragraphs}</body></html>', subtype='html')
+    return msg
+
+
+def _cjk(rng, index, date, body_size):
+    msg = _base_message(rng, index, date, f'会议纪要 第{index}期')
+    msg.replace_header('From', f'张三{rng.randrange(50)} <zhangsan{index % 50}@example.com>')
+    msg.set_content(_cjk_text(rng, body_size // 3), cte='base64')
+    return msg
+
+
+def _small(rng, index, date, body_size):
+    msg = _base_message(rng, index, date, f'Report #{index}')
+    msg.set_content(_text(rng, body_size))
+    for number in range(rng.randint(1, 3)):
+        _add_attachment(msg, rng, rng.randint(8 * 1024, 64 * 1024), index, number)
+    return msg
+
+
+def _large(rng, index, date, body_size):
+    msg = _base_message(rng, index, date, f'Backup #{index}')
+    msg.set_content(_text(rng, body_size))
+    _add_attachment(msg, rng, rng.randint(512 * 1024, 2 * 1024 * 1024), index, 0)
+    return msg
+
+
+def _forwarded(rng, index, date, body_size):
+    inner = _small(rng, index, date, body_size // 2)
+    msg = _base_message(rng, index, date, f'Fwd: Report #{index}')
+    msg.set_content('See forwarded message.\n')
+    msg.add_attachment(inner)
+    return msg
+
+
+MESSAGE_BUILDERS = {
+    'plain': _plain,
+    'html': _html,
+    'cjk': _cjk,
+    'small': _small,
+    'large': _large,
+    'forwarded': _forwarded,
+}
+
+
+def generate_messages(count: int, mix: str = DEFAULT_MIX, seed: int = 0, body_size: int = 2048) -> List[bytes]:
+    """生成 count 封邮件（CRLF换行），相同参数总是生成相同的内容；日期从旧到新，与UID顺序一致"""
+    rng = random.Random(seed)
+    names, weights = zip(*parse_mix(mix))
+    start = datetime(2024, 1, 1, tzinfo=timezone(timedelta(hours=8)))
+    messages = []
+    for index in range(count):
+        builder = MESSAGE_BUILDERS[rng.choices(names, weights)[0]]
+        date = start + timedelta(minutes=17 * index)
+        messages.append(builder(rng, index, date, body_size).as_bytes(policy=CRLF_POLICY))
+    return messages
+
+
+def describe(messages: List[bytes]) -> dict:
+    """邮箱的规模信息，写入基准测试结果"""
+    sizes = sorted(len(raw) for raw in messages)
+    return {
+        'messages': len(messages),
+        'total_bytes': sum(sizes),
+        'median_bytes': sizes[len(sizes) // 2] if sizes else 0,
+        'max_bytes': sizes[-1] if sizes else 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成邮箱（.eml 文件）')
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='邮件类型比例，如 plain:60,small:30,large:10')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--body-size', type=int, default=2048, help='正文字符数')
+    parser.add_argument('--output', required=True, help='输出目录')
+    args = parser.parse_args()
+
+    messages = generate_messages(args.count, args.mix, args.seed, args.body_size)
+    os.makedirs(args.output, exist_ok=True)
+    for index, raw in enumerate(messages):
+        with open(os.path.join(args.output, f'{index:06d}.eml'), 'wb') as f:
+            f.write(raw)
+    info = describe(messages)
+    print(f"已生成 {info['messages']} 封邮件，共 {info['total_bytes']} 字节: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""IMAP连接池
+进程内复用已登录的IMAP连接，避免每次请求都进行TLS握手和LOGIN
+连接按 (提供商, 用户名, 凭据哈希) 分组，每个账号的连接数有上限，防止被邮箱服务商封禁
+"""
+
+import os
+import time
+import hashlib
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, Tuple, List
+
+logger = logging.getLogger(__name__)
+
+
+class IMAPConnectionPool:
+    """IMAP连接池
+
+    Args:
+        max_per_account: 每个账号最多同时打开的连接数（空闲 + 使用中）
+        idle_timeout: 空闲连接的最长保留时间（秒），超时后关闭
+        health_check_interval: 空闲超过该时间（秒）的连接在复用前先发送NOOP检查
+        acquire_timeout: 账号连接数已满时等待空闲连接的最长时间（秒）
+    """
+
+    def __init__(self, max_per_account: int = 2, idle_timeout: float = 300,
+                 health_check_interval: float = 30, acquire_timeout: float = 30):
+        self.max_per_account = max(1, int(max_per_account))
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self._cond = threading.Condition()
+        self._idle = {}   # key -> [(imap_client, 最后使用时间)]
+        self._open = {}   # key -> 已打开的连接数
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'health_check_failures': 0,
+            'evicted': 0,
+            'discarded': 0,
+            'waits': 0
+        }
+
+    @staticmethod
+    def make_key(provider) -> Tuple[str, str, str]:
+        """连接池分组键：(提供商, 用户名, 凭据哈希)"""
+        credential_hash = hashlib.sha256(provider.password.encode('utf-8')).hexdigest()
+        return (provider.__class__.__name__, provider.username.lower(), credential_hash)
+
+    def acquire(self, provider):
+        """为提供商实例分配一个已登录的IMAP连接，设置到 provider.imap_client 并返回"""
+        key = self.make_key(provider)
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            client, last_used = None, None
+            with self._cond:
+                while True:
+                    self._evict_expired()
+                    idle = self._idle.get(key)
+                    if idle:
+                        client, last_used = idle.pop()
+                        break
+                    if self._open.get(key, 0) < self.max_per_account:
+                        self._open[key] = self._open.get(key, 0) + 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"等待IMAP连接超时，账号 {provider.username} 的连接数已达上限 {self.max_per_account}")
+                    self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+
+            if client is None:
+                return self._create(provider, key)
+
+            if time.monotonic() - last_used < self.health_check_interval or self._is_healthy(client):
+                with self._cond:
+                    self._stats['reused'] += 1
+                provider.imap_client = client
+                return client
+
+            # 健康检查失败，丢弃连接后重新分配
+            with self._cond:
+                self._stats['health_check_failures'] += 1
+            self._discard(key, client)
+
+    def release(self, provider, broken: bool = False):
+        """归还提供商实例持有的连接；broken为True时直接关闭"""
+        client = provider.imap_client
+        provider.imap_client = None
+        if client is None:
+            return
+        key = self.make_key(provider)
+        if broken:
+            self._discard(key, client)
+            return
+        with self._cond:
+            self._idle.setdefault(key, []).append((client, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, provider):
+        """上下文管理器形式：with pool.connection(provider): provider.get_emails(...)"""
+        self.acquire(provider)
+        broken = False
+        try:
+            yield provider
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.release(provider, broken=broken)
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池统计信息（不包含凭据）"""
+        with self._cond:
+            self._evict_expired()
+            accounts = {}
+            for key, count in self._open.items():
+                if not count:
+                    continue
+                name = f"{key[0]}:{key[1]}"
+                accounts[name] = {
+                    'open': count,
+                    'idle': len(self._idle.get(key, []))
+                }
+            return {
+                'max_per_account': self.max_per_account,
+                'idle_timeout': self.idle_timeout,
+                'open_connections': sum(self._open.values()),
+                'idle_connections': sum(len(v) for v in self._idle.values()),
+                'accounts': accounts,
+                **self._stats
+            }
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._cond:
+            items = [(key, client) for key, idle in self._idle.items() for client, _ in idle]
+            self._idle.clear()
+        for key, client in items:
+            self._discard(key, client)
+
+    def _create(self, provider, key):
+        """新建连接；失败时释放名额并抛出已分类的连接异常（见 resilience）"""
+        try:
+            provider.open_imap()
+        except Exception:
+            if provider.imap_client is not None:
+                _logout_quietly(provider.imap_client)
+                provider.imap_client = None
+            with self._cond:
+                self._open[key] -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['created'] += 1
+        return provider.imap_client
+
+    @staticmethod
+    def _is_healthy(client) -> bool:
+        try:
+            typ, _ = client.noop()
+            return typ == 'OK'
+        except Exception:
+            return False
+
+    def _discard(self, key, client):
+        with self._cond:
+            self._open[key] = max(0, self._open.get(key, 0) - 1)
+            self._stats['discarded'] += 1
+            self._cond.notify()
+        _logout_quietly(client)
+
+    def _evict_expired(self):
+        """关闭超过空闲时间的连接（调用方需持有锁）"""
+        now = time.monotonic()
+        expired: List[Any] = []
+        for key, idle in self._idle.items():
+            keep = []
+            for client, last_used in idle:
+                if now - last_used > self.idle_timeout:
+                    expired.append(client)
+                    self._open[key] = max(0, self._open.get(key, 0) - 1)
+                    self._stats['evicted'] += 1
+                else:
+                    keep.append((client, last_used))
+            idle[:] = keep
+        if expired:
+            logger.info(f"关闭 {len(expired)} 个空闲超时的IMAP连接")
+            self._cond.notify_all()
+            # 在后台线程中登出，避免持锁进行网络操作
+            threading.Thread(target=lambda: [_logout_quietly(c) for c in expired], daemon=True).start()
+
+
+def _logout_quietly(client):
+    try:
+        client.logout()
+    except Exception:
+        pass
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_connection_pool() -> IMAPConnectionPool:
+    """获取进程内共享的连接池（参数可通过环境变量配置）"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = IMAPConnectionPool(
+                max_per_account=int(os.getenv('IMAP_POOL_MAX_PER_ACCOUNT', '2')),
+                idle_timeout=float(os.getenv('IMAP_POOL_IDLE_TIMEOUT', '300')),
+                health_check_interval=float(os.getenv('IMAP_POOL_HEALTH_CHECK_INTERVAL', '30')),
+                acquire_timeout=float(os.getenv('IMAP_POOL_ACQUIRE_TIMEOUT', '30'))
+            )
+        return _default_pool
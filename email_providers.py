@@ -7,16 +7,436 @@
 import imaplib
 import smtplib
 import email
+import email.utils
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from typing import List, Dict, Any, Optional, Tuple
 from email.header import decode_header
+from email.parser import BytesParser
+from email.policy import compat32
+import re
+import os
 import ssl
+import json
+import base64
+import binascii
 import logging
+import threading
+from concurrent.futures import BrokenExecutor
+from imap_utils import (
+    build_message_sets, parse_fetch_response, imap_text, is_multipart_structure,
+    multipart_info, describe_body_part, iter_body_parts, envelope_addresses,
+    normalize_search_filters, build_search_criteria, build_gmail_raw_query, imap_quote,
+    encode_imap_utf7, parse_list_response, parse_status_response, compact_uid_set, expand_uid_set,
+    parse_vanished_response
+)
+from metrics import (
+    observe_phase, response_bytes, FETCHED_BYTES, MESSAGES_PARSED, MESSAGES_OMITTED, ATTACHMENT_BYTES, ERRORS,
+    DELTA_SYNCS
+)
+from resilience import call_with_retry, classified_error
+from memory_budget import (
+    MemoryLease, get_memory_budget, estimate_message_memory, LARGE_MESSAGE_BYTES, ATTACHMENT_INLINE_MAX_BYTES
+)
 
 logger = logging.getLogger(__name__)
 
+# 单条FETCH命令中包含的最大邮件数量
+DEFAULT_FETCH_BATCH_SIZE = 100
+
+# 正文长度限制（字符）
+BODY_PREVIEW_CHARS = 1000
+
+# 列表模式下获取的正文前缀字节数（需覆盖编码和MIME分隔符的开销）
+DEFAULT_PREVIEW_BYTES = 4096
+
+# 获取模式：full 下载完整邮件；envelope 只获取信封、结构和正文前缀
+FETCH_MODES = ('full', 'envelope')
+
+# 附件模式：inline 在结果中内嵌base64内容；descriptor 只返回附件描述符，内容通过附件下载接口获取
+ATTACHMENT_MODES = ('inline', 'descriptor')
+
+# 多文件夹同步时 STATUS 查询的数据项，用于跳过未变化的文件夹
+FOLDER_STATUS_ITEMS = '(MESSAGES UIDNEXT UIDVALIDITY)'
+
+# 分页搜索的初始UID窗口，窗口内邮件不足一页时按4倍扩大
+PAGE_SEARCH_WINDOW = 200
+
+# 建立连接（TCP+TLS+服务器问候）的超时和之后每条命令读取响应的超时（秒），0 表示不限制
+IMAP_CONNECT_TIMEOUT = float(os.getenv('IMAP_CONNECT_TIMEOUT', '15'))
+IMAP_READ_TIMEOUT = float(os.getenv('IMAP_READ_TIMEOUT', '60'))
+
+# 完整模式下查询邮件大小（RFC822.SIZE）时单条FETCH命令中包含的最大邮件数量
+SIZE_FETCH_BATCH_SIZE = 1000
+
+# 附件下载时每次FETCH的字节数
+DEFAULT_ATTACHMENT_CHUNK_SIZE = 1024 * 1024
+
+_MESSAGE_PARSER = BytesParser(policy=compat32)
+_HEADER_PARSER = BytesParser(policy=compat32)
+_HEADER_END_RE = re.compile(rb'\r?\n\r?\n')
+_HEADER_LINE_RE = re.compile(rb'(From |[\041-\071\073-\176]*:|[\t ])')
+_BOUNDARY_TAIL_RE = re.compile(rb'(--)?[ \t]*\r?(?:\n|$)')
+_BASE64_RE = re.compile(r'[A-Za-z0-9+/]*={0,2}')
+
+def decode_mime_words(s) -> str:
+    """解码MIME编码的字符串"""
+    if not s:
+        return ""
+    if isinstance(s, bytes):
+        s = s.decode('utf-8', errors='ignore')
+    if '=?' not in s:
+        # 没有编码字（encoded-word）时无需解码
+        return s
+    fragments = []
+    for fragment, encoding in decode_header(s):
+        if isinstance(fragment, bytes):
+            try:
+                fragments.append(fragment.decode(encoding or 'utf-8', errors='ignore'))
+            except LookupError:
+                fragments.append(fragment.decode('utf-8', errors='ignore'))
+        else:
+            fragments.append(fragment)
+    return "".join(fragments)
+
+
+def _format_addresses(addresses) -> str:
+    """将ENVELOPE地址列表格式化为 "名称 <地址>, ..." 形式"""
+    formatted = []
+    for name, address in envelope_addresses(addresses):
+        name = decode_mime_words(name)
+        formatted.append(f"{name} <{address}>" if name else address)
+    return ", ".join(formatted)
+
+
+def iter_mime_parts(part, path: str = ''):
+    """按IMAP部件编号（BODY[1.2]中的编号）遍历MIME部件，返回 (部件编号, 部件)"""
+    if part.get_content_maintype() == 'multipart' and part.is_multipart():
+        for index, child in enumerate(part.get_payload(), 1):
+            yield from iter_mime_parts(child, f'{path}.{index}' if path else str(index))
+    elif part.get_content_type() == 'message/rfc822' and part.is_multipart():
+        # 内嵌邮件：其正文为multipart时子部件直接编号在其下，否则正文编号为 .1
+        yield path or '1', part
+        inner = part.get_payload()[0]
+        if inner.get_content_maintype() == 'multipart':
+            yield from iter_mime_parts(inner, path or '1')
+        else:
+            yield from iter_mime_parts(inner, f'{path or "1"}.1')
+    else:
+        yield path or '1', part
+
+
+def encoded_payload_size(part) -> int:
+    """不解码内容，根据编码后的载荷计算附件大小（base64可精确计算）"""
+    payload = part.get_payload()
+    if not isinstance(payload, str):
+        return 0
+    encoding = str(part.get('Content-Transfer-Encoding', '')).strip().lower()
+    if encoding == 'base64':
+        stripped = payload.rstrip()
+        length = len(stripped) - stripped.count('\n') - stripped.count('\r') - stripped.count(' ')
+        padding = len(stripped) - len(stripped.rstrip('='))
+        return max(0, length * 3 // 4 - padding)
+    return len(payload)
+
+
+class _FallbackParse(Exception):
+    """快速解析无法保证与标准解析结果一致，改用标准解析"""
+
+
+def _fast_parse(raw: bytes, start: int = 0, end: Optional[int] = None, depth: int = 0):
+    """只用标准解析器解析各部件的头部，按边界切分multipart，叶子部件的正文直接作为载荷
+
+    标准解析器逐行处理整个邮件，大附件（数万行base64）的解析耗时主要在这里。
+    各部件以 raw 中的 [start, end) 范围表示，避免逐层复制正文
+    """
+    if end is None:
+        end = len(raw)
+    if depth > 20:
+        raise _FallbackParse()
+    
+    # 拆分头部和正文
+    if raw.startswith(b'\r\n', start, end):
+        header_bytes, body_start = b'', start + 2
+    elif raw.startswith(b'\n', start, end):
+        header_bytes, body_start = b'', start + 1
+    else:
+        match = _HEADER_END_RE.search(raw, start, end)
+        body_start = match.end() if match else end
+        header_bytes = raw[start:body_start]
+    for line in header_bytes.splitlines():
+        if line and not _HEADER_LINE_RE.match(line):
+            raise _FallbackParse()
+    message = _HEADER_PARSER.parsebytes(header_bytes, headersonly=True)
+    if message.defects:
+        raise _FallbackParse()
+    
+    content_type = message.get_content_type()
+    if message.get_content_maintype() == 'multipart':
+        boundary = message.get_boundary()
+        if not boundary or content_type == 'multipart/digest':
+            raise _FallbackParse()
+        marker = b'--' + boundary.encode('ascii', 'surrogateescape')
+        parts = []
+        part_start = None
+        pos = raw.find(marker, body_start, end)
+        while pos != -1:
+            # 边界行必须位于行首，其后只能是 "--"、空白和换行
+            tail = _BOUNDARY_TAIL_RE.match(raw, pos + len(marker), end) \
+                if pos == body_start or raw[pos - 1] == 0x0a else None
+            if tail:
+                part_end = pos
+                if raw.startswith(b'\r\n', pos - 2, pos) and pos - 2 >= body_start:
+                    part_end -= 2
+                elif pos > body_start:
+                    part_end -= 1
+                if part_start is None:
+                    message.preamble = str(memoryview(raw)[body_start:part_end], 'ascii', 'surrogateescape') \
+                        if part_end > body_start else None
+                else:
+                    parts.append(_fast_parse(raw, part_start, max(part_end, part_start), depth + 1))
+                if tail.group(1):
+                    break
+                part_start = tail.end()
+            pos = raw.find(marker, pos + 1, end)
+        else:
+            # 没有结束边界，交给标准解析器按其容错规则处理
+            raise _FallbackParse()
+        message.set_payload(parts)
+    elif content_type == 'message/rfc822':
+        message.set_payload([_fast_parse(raw, body_start, end, depth + 1)])
+    else:
+        message.set_payload(str(memoryview(raw)[body_start:end], 'ascii', 'surrogateescape'))
+    return message
+
+
+def parse_message_bytes(raw: bytes):
+    """解析原始邮件
+
+    使用 compat32 策略：policy.default 会为每个头部构造结构化对象，解析速度明显更慢，
+    而这里只需要少量头部的原始值。优先使用按边界切分的快速解析，无法保证结果一致时退回标准解析
+    """
+    try:
+        return _fast_parse(raw)
+    except (_FallbackParse, UnicodeError, LookupError):
+        return _MESSAGE_PARSER.parsebytes(raw)
+
+
+def decode_body_prefix(part, max_chars: int = BODY_PREVIEW_CHARS) -> str:
+    """只解码正文开头生成 max_chars 个字符所需的部分，而不是整个正文
+
+    按UTF-8每个字符最多4字节估算需要的编码后长度；解码出的字符不足时（如非UTF-8正文）
+    退回完整解码，结果与完整解码后截断一致
+    """
+    payload = part.get_payload()
+    if not isinstance(payload, str):
+        raise TypeError("multipart部件没有正文")
+    encoding = str(part.get('Content-Transfer-Encoding', '')).strip().lower()
+    needed = max_chars * 4
+    if encoding == 'base64':
+        chunk = payload[:needed * 2]  # 4/3 倍加换行
+    elif encoding == 'quoted-printable':
+        chunk = payload[:needed * 4]  # =XX 加软换行
+    else:
+        encoding = ''
+        chunk = payload[:needed]
+    truncated = len(chunk) < len(payload)
+    if truncated:
+        try:
+            decoder = TransferDecoder(encoding)
+            data = decoder.feed(chunk.encode('ascii', 'surrogateescape'))
+            text = data.decode('utf-8', errors='ignore')
+            if len(text) > max_chars:
+                return text[:max_chars]
+        except (UnicodeError, binascii.Error, ValueError):
+            pass
+    return part.get_payload(decode=True).decode('utf-8', errors='ignore')[:max_chars]
+
+
+def _attachment_info(part, part_path: str, attachment_mode: str) -> Optional[Dict[str, Any]]:
+    """提取单个部件的附件信息，不是附件时返回None"""
+    filename = part.get_filename()
+    if not filename:
+        return None
+    decoded_filename = decode_mime_words(filename)
+    
+    content = None
+    omitted = False
+    payload = part.get_payload()
+    encoding = str(part.get('Content-Transfer-Encoding', '')).strip().lower()
+    if attachment_mode == 'descriptor':
+        # 描述符模式不解码附件，按编码后的内容计算大小
+        file_size = encoded_payload_size(part)
+    elif ATTACHMENT_INLINE_MAX_BYTES and (file_size := encoded_payload_size(part)) > ATTACHMENT_INLINE_MAX_BYTES:
+        # 超过内嵌上限的附件不解码，只返回描述符，内容通过附件下载接口按块获取
+        omitted = True
+    elif encoding == 'base64' and isinstance(payload, str) and \
+            _BASE64_RE.fullmatch(content := ''.join(payload.split())) and not len(content) % 4:
+        # 载荷本身就是base64，去掉换行即可直接返回，无需解码后再编码
+        file_size = len(content) * 3 // 4 - (len(content) - len(content.rstrip('=')))
+    else:
+        data = part.get_payload(decode=True)
+        file_size = len(data) if data else 0
+        content = base64.b64encode(data).decode('utf-8') if data else None
+    if not file_size:
+        return None
+    
+    # 检查文件大小限制（飞书限制2GB）
+    max_size = 1024 * 1024 * 1024 * 2  # 2GB
+    if file_size > max_size:
+        logger.warning(f"附件 {decoded_filename} 大小 {file_size} 超过限制 {max_size}，跳过")
+        return None
+    
+    # 检查文件名长度限制（飞书限制250字符）
+    if len(decoded_filename) > 250:
+        logger.warning(f"附件文件名 {decoded_filename} 长度超过250字符，截断")
+        decoded_filename = decoded_filename[:247] + "..."
+    
+    attachment_info = {
+        'filename': decoded_filename,
+        'size': file_size,
+        'content_type': part.get_content_type(),
+        'part': part_path
+    }
+    if content is not None:
+        attachment_info['content'] = content
+    elif omitted:
+        attachment_info['content_omitted'] = 'size'
+    return attachment_info
+
+
+def parse_email_message(email_message, attachment_mode: str = 'inline') -> Dict[str, Any]:
+    """解析邮件内容
+    
+    一次遍历MIME树，同时取出第一个text/plain正文（只解码需要的前缀）和附件信息
+    """
+    multipart = email_message.is_multipart()
+    body = None
+    attachments = []
+    attachments_failed = False
+    for part_path, part in iter_mime_parts(email_message):
+        if body is None and (not multipart or part.get_content_type() == "text/plain"):
+            try:
+                body = decode_body_prefix(part)
+            except Exception:
+                if not multipart:
+                    body = str(part.get_payload())[:BODY_PREVIEW_CHARS]
+        if not attachments_failed:
+            try:
+                attachment_info = _attachment_info(part, part_path, attachment_mode)
+            except Exception as e:
+                logger.error(f"解析附件信息失败: {str(e)}")
+                # 如果解析失败，保持空列表，不影响整体功能
+                attachments_failed = True
+                attachments = []
+                continue
+            if attachment_info:
+                attachments.append(attachment_info)
+    
+    return {
+        'subject': decode_mime_words(email_message.get('Subject', '')),
+        'sender': decode_mime_words(email_message.get('From', '')),
+        'recipient': decode_mime_words(email_message.get('To', '')),
+        'date': email_message.get('Date', ''),
+        'body': body or "",  # 限制正文长度
+        'attachments': attachments,  # 改为附件详细信息数组
+        'has_attachments': len(attachments) > 0  # 保持向后兼容性
+    }
+
+
+def resolve_special_use(folders: List[str], listing: List[Dict[str, Any]]) -> List[str]:
+    """根据 LIST 结果解析特殊用途标记，无法解析的标记跳过"""
+    by_flag = {}
+    for folder in listing:
+        for flag in folder['flags']:
+            by_flag.setdefault(flag.lower(), folder['name'])
+    resolved = []
+    for folder in folders:
+        name = by_flag.get(folder.lower()) if folder.startswith('\\') else folder
+        if name is None:
+            logger.warning(f"服务器没有标记为 {folder} 的文件夹，跳过")
+            continue
+        if name not in resolved:
+            resolved.append(name)
+    return resolved
+
+
+def _flags_snapshot(flags: Dict[int, Tuple[str, ...]]) -> Dict[str, str]:
+    """将 {UID: 标志} 压缩为 {标志组合: UID集合}，大多数邮件的标志组合相同且UID连续，快照很小"""
+    groups = {}
+    for uid, values in flags.items():
+        groups.setdefault(' '.join(values), []).append(uid)
+    return {key: compact_uid_set(uids) for key, uids in groups.items()}
+
+
+def _expand_flags_snapshot(snapshot: Dict[str, str]) -> Dict[int, Tuple[str, ...]]:
+    return {uid: tuple(key.split()) for key, uid_set in snapshot.items() for uid in expand_uid_set(uid_set)}
+
+
+def parse_raw_email(raw: bytes, attachment_mode: str = 'inline') -> Dict[str, Any]:
+    """解析原始RFC822邮件为邮件信息（模块级函数，可在解析进程池中执行）"""
+    return parse_email_message(parse_message_bytes(raw), attachment_mode)
+
+
+class TransferDecoder:
+    """按块解码 Content-Transfer-Encoding，用于流式下载附件"""
+    
+    def __init__(self, encoding: str):
+        self.encoding = (encoding or '').lower()
+        self._pending = b''
+    
+    def feed(self, data: bytes) -> bytes:
+        if self.encoding == 'base64':
+            data = self._pending + data.translate(None, b' \t\r\n')
+            usable = len(data) // 4 * 4
+            self._pending = data[usable:]
+            return base64.b64decode(data[:usable]) if usable else b''
+        if self.encoding == 'quoted-printable':
+            # 只解码到最后一个完整行，避免切断 =XX 转义序列
+            data = self._pending + data
+            cut = data.rfind(b'\n') + 1
+            self._pending = data[cut:]
+            return binascii.a2b_qp(data[:cut]) if cut else b''
+        return data
+    
+    def flush(self) -> bytes:
+        pending, self._pending = self._pending, b''
+        if not pending:
+            return b''
+        if self.encoding == 'base64':
+            return base64.b64decode(pending + b'=' * (-len(pending) % 4))
+        if self.encoding == 'quoted-printable':
+            return binascii.a2b_qp(pending)
+        return pending
+
+
+_default_ssl_context = None
+_default_ssl_context_lock = threading.Lock()
+
+
+def default_ssl_context() -> ssl.SSLContext:
+    """进程内共享的证书校验上下文
+    
+    加载系统CA证书需要数十毫秒，所有未指定 ssl_context 的 IMAP/SMTP 连接共用同一个上下文
+    （imaplib/smtplib 在未传入上下文时不校验服务器证书）
+    """
+    global _default_ssl_context
+    with _default_ssl_context_lock:
+        if _default_ssl_context is None:
+            _default_ssl_context = ssl.create_default_context()
+        return _default_ssl_context
+
+
+def _metrics_name(provider_class) -> str:
+    if getattr(provider_class, 'provider_type', None):
+        return provider_class.provider_type
+    name = provider_class.__name__
+    for suffix in ('EmailProvider', 'Provider'):
+        if name.endswith(suffix) and name != suffix:
+            name = name[:-len(suffix)]
+            break
+    return name.lower()
+
+
 class EmailProvider(ABC):
     """邮箱提供商基类"""
     
@@ -26,10 +446,17 @@ class EmailProvider(ABC):
         self.config = kwargs
         self.imap_client = None
         self.smtp_client = None
+        self.mailbox_state = None
+        self._capabilities = None
+    
+    @property
+    def metrics_name(self) -> str:
+        """指标中的 provider 标签，如 GmailProvider -> gmail"""
+        return _metrics_name(self.__class__)
     
     @abstractmethod
     def get_imap_config(self) -> Dict[str, Any]:
-        """获取IMAP配置"""
+        """获取IMAP配置：server、port，可选 ssl（默认 True）和 ssl_context（默认使用系统证书校验）"""
         pass
     
     @abstractmethod
@@ -37,16 +464,43 @@ class EmailProvider(ABC):
         """获取SMTP配置"""
         pass
     
+    def open_imap(self):
+        """连接并登录IMAP服务器
+        
+        经过该服务器的熔断器，超时、连接断开等临时故障按指数退避重试；
+        失败时抛出 resilience 中已分类的异常（AuthenticationError、TransientError、
+        ThrottledError、CircuitOpenError）
+        """
+        server = self.get_imap_config()['server']
+        call_with_retry(server, self._open_imap)
+        logger.info(f"IMAP连接成功: {server}")
+    
+    def _open_imap(self):
+        """建立一次连接并登录，服务器拒绝 LOGIN 时抛出 AuthenticationError（限流时为 ThrottledError）"""
+        imap_config = self.get_imap_config()
+        with observe_phase(self.metrics_name, 'connect'):
+            if imap_config.get('ssl', True):
+                client = imaplib.IMAP4_SSL(imap_config['server'], imap_config['port'],
+                                           ssl_context=imap_config.get('ssl_context') or default_ssl_context(),
+                                           timeout=IMAP_CONNECT_TIMEOUT or None)
+            else:
+                client = imaplib.IMAP4(imap_config['server'], imap_config['port'], timeout=IMAP_CONNECT_TIMEOUT or None)
+        try:
+            with observe_phase(self.metrics_name, 'login'):
+                client.login(self.username, self.password)
+        except Exception as e:
+            try:
+                client.shutdown()
+            except Exception:
+                pass
+            raise classified_error(e, imap_config['server'], 'login') from e
+        client.sock.settimeout(IMAP_READ_TIMEOUT or None)
+        self.imap_client = client
+    
     def connect_imap(self) -> bool:
-        """连接IMAP服务器"""
+        """连接IMAP服务器，失败时返回False；需要区分失败原因时使用 open_imap"""
         try:
-            imap_config = self.get_imap_config()
-            self.imap_client = imaplib.IMAP4_SSL(
-                imap_config['server'], 
-                imap_config['port']
-            )
-            self.imap_client.login(self.username, self.password)
-            logger.info(f"IMAP连接成功: {imap_config['server']}")
+            self.open_imap()
             return True
         except Exception as e:
             logger.error(f"IMAP连接失败: {str(e)}")
@@ -58,7 +512,8 @@ class EmailProvider(ABC):
             smtp_config = self.get_smtp_config()
             self.smtp_client = smtplib.SMTP_SSL(
                 smtp_config['server'], 
-                smtp_config['port']
+                smtp_config['port'],
+                context=default_ssl_context()
             )
             self.smtp_client.login(self.username, self.password)
             logger.info(f"SMTP连接成功: {smtp_config['server']}")
@@ -67,141 +522,790 @@ class EmailProvider(ABC):
             logger.error(f"SMTP连接失败: {str(e)}")
             return False
     
-    def get_emails(self, folder: str = 'INBOX', count: int = 50) -> List[Dict[str, Any]]:
-        """获取邮件列表"""
+    def get_emails(self, folder: str = 'INBOX', count: int = 50,
+                   since_uid: Optional[int] = None,
+                   uidvalidity: Optional[int] = None,
+                   mode: str = 'full',
+                   filters: Optional[Dict[str, Any]] = None,
+                   before_uid: Optional[int] = None) -> List[Dict[str, Any]]:
+        """获取邮件列表
+        
+        Args:
+            folder: 邮箱文件夹
+            count: 最多获取的邮件数量
+            since_uid: 增量模式，只获取UID大于该值的邮件
+            uidvalidity: 上次同步时的UIDVALIDITY，与服务器不一致时since_uid失效，退回全量获取
+            mode: full 下载完整邮件（RFC822）；envelope 只获取 ENVELOPE、BODYSTRUCTURE、
+                RFC822.SIZE 和正文前缀，附件只返回元信息，不下载附件内容
+            filters: 搜索条件（见 imap_utils.SEARCH_FILTERS），在服务器端通过SEARCH筛选，
+                只获取匹配的邮件
+            before_uid: 分页，获取UID小于该值的最新 count 封邮件；此时 uidvalidity 为游标中的值，
+                与服务器不一致时不返回邮件
+        
+        获取完成后 self.mailbox_state 记录本次的 folder/uidvalidity/last_uid，
+        可作为下次增量同步的水位线；oldest_uid/has_older 用于生成下一页的游标
+        """
+        self.mailbox_state = None
+        if mode not in FETCH_MODES:
+            raise ValueError(f"不支持的获取模式: {mode}. 支持的模式: {list(FETCH_MODES)}")
+        
+        try:
+            return list(self.iter_emails(folder, count, since_uid=since_uid, uidvalidity=uidvalidity,
+                                         mode=mode, filters=filters, before_uid=before_uid))
+        except Exception as e:
+            logger.error(f"获取邮件失败: {str(e)}")
+            ERRORS.inc(provider=self.metrics_name, phase='get_emails', type=type(e).__name__)
+            # 获取失败时不返回水位线，避免调用方跳过未获取的邮件
+            self.mailbox_state = None
+            error = classified_error(e, self.get_imap_config()['server'])
+            if error is e:
+                raise
+            raise error from e
+    
+    def iter_emails(self, folder: str = 'INBOX', count: int = 50,
+                    since_uid: Optional[int] = None,
+                    uidvalidity: Optional[int] = None,
+                    mode: str = 'full',
+                    filters: Optional[Dict[str, Any]] = None,
+                    before_uid: Optional[int] = None):
+        """逐封获取邮件的生成器，参数同 get_emails
+        
+        每封邮件解析完成后立即返回，已返回的邮件原始数据随即释放，
+        内存占用上限为一个FETCH批次（fetch_batch_size）。
+        设置了内存预算或单封上限时，完整模式下按 RFC822.SIZE 从内存预算（memory_budget）中预留内存，
+        每封邮件解析后立即归还；超过单封上限或预算不足的邮件只返回描述符（content_omitted 为 size/memory），
+        UID 记录在 mailbox_state['omitted_uids']。config['memory_lease'] 为请求共享的预留。
+        连接或获取失败时直接抛出异常；单封邮件解析失败时跳过，UID 记录在 mailbox_state['skipped_uids']。
+        self.mailbox_state 在返回第一封邮件前设置。
+        """
+        self.mailbox_state = None
+        if mode not in FETCH_MODES:
+            raise ValueError(f"不支持的获取模式: {mode}. 支持的模式: {list(FETCH_MODES)}")
+        
         if not self.imap_client:
-            if not self.connect_imap():
-                return []
+            self.open_imap()
+        
+        current_uidvalidity = self._select_folder(folder)
+        incremental = self._is_incremental(since_uid, uidvalidity, current_uidvalidity)
+        
+        filters = normalize_search_filters(filters)
+        if before_uid is not None:
+            if self._page_expired(uidvalidity, current_uidvalidity):
+                message_uids = [b'']
+            else:
+                message_uids = self._search_page(filters, before_uid, count)
+        else:
+            message_uids = self._search_uids(filters, since_uid if incremental else None)
+        
+        selected_uids = self._select_uids(message_uids, count, since_uid if incremental else None)
+        self.mailbox_state = self._mailbox_state(folder, current_uidvalidity, selected_uids,
+                                                 since_uid if incremental else None,
+                                                 self._has_more(message_uids, selected_uids, count,
+                                                                since_uid if incremental else None),
+                                                 self._has_older(message_uids, selected_uids,
+                                                                 since_uid if incremental else None))
         
+        items, required = self._fetch_items(mode)
+        ordered = list(reversed(selected_uids))  # 最新的邮件在前
+        cached = self._cached_emails(folder, current_uidvalidity, ordered, mode,
+                                     None if incremental or filters or before_uid is not None else message_uids)
+        # 只获取缓存未命中的邮件，按原顺序与缓存结果合并
+        missing = [uid for uid in ordered if uid not in cached]
+        lease = self.config.get('memory_lease') or MemoryLease()
         try:
-            self.imap_client.select(folder)
-            _, message_ids = self.imap_client.search(None, 'ALL')
-            
-            if not message_ids[0]:
-                return []
-            
-            # 获取最新的邮件
-            ids = message_ids[0].split()
-            latest_ids = ids[-count:] if len(ids) > count else ids
-            
-            emails = []
-            for msg_id in reversed(latest_ids):  # 最新的邮件在前
-                try:
-                    _, msg_data = self.imap_client.fetch(msg_id, '(RFC822)')
-                    email_body = msg_data[0][1]
-                    email_message = email.message_from_bytes(email_body)
-                    
-                    # 解析邮件信息
-                    email_info = self._parse_email(email_message)
-                    email_info['id'] = msg_id.decode()
-                    emails.append(email_info)
-                    
-                except Exception as e:
-                    logger.error(f"解析邮件失败 (ID: {msg_id}): {str(e)}")
+            plan = None
+            if missing and self._limits_memory(mode):
+                sizes = self._fetch_sizes(missing)
+                plan = lambda batch_uids: self._plan_memory(folder, batch_uids, sizes, lease)
+            batches = self._parse_in_pool(self._fetch_batches(missing, items, plan), mode)
+            requested, pending = set(), {}
+            for uid in ordered:
+                if uid in cached:
+                    yield cached.pop(uid)
+                    continue
+                while uid not in requested:
+                    batch_uids, responses = next(batches)
+                    requested.update(batch_uids)
+                    pending.update(responses)
+                email_info = self._build_email(uid, pending.pop(uid, None), mode, required)
+                # 原始邮件已解析完毕，归还为它预留的内存
+                lease.release((folder, uid))
+                if email_info is None:
+                    self.mailbox_state['skipped_uids'].append(uid)
                     continue
+                if email_info.get('content_omitted'):
+                    self.mailbox_state['omitted_uids'].append(uid)
+                self._store_cached(folder, current_uidvalidity, mode, email_info)
+                yield email_info
+        finally:
+            # 请求未传入共享的预留时，本次获取的预留在生成器结束时归还
+            if lease is not self.config.get('memory_lease'):
+                lease.close()
+    
+    def _search_commands(self, filters: Dict[str, Any]) -> List[Tuple[List[str], Optional[bytes]]]:
+        """将搜索条件编译为 UID SEARCH 命令参数，子类可覆盖（如Gmail使用X-GM-RAW）"""
+        return build_search_criteria(filters)
+    
+    def _search_uids(self, filters: Dict[str, Any], since_uid: Optional[int] = None,
+                     uid_set: Optional[str] = None) -> List[bytes]:
+        """执行 UID SEARCH，返回与 imaplib 相同格式的结果（[b'1 2 3']）
+        
+        多条命令（非ASCII条件各占一条）的结果取交集；uid_set 限定UID范围（如 '101:300'）
+        """
+        uid_range = self._uid_range(since_uid, uid_set)
+        searches = self._search_commands(filters) if filters else []
+        if not searches:
+            with observe_phase(self.metrics_name, 'search'):
+                typ, data = self.imap_client.uid('SEARCH', None, *(uid_range or ['ALL']))
+            if typ != 'OK':
+                raise RuntimeError(f"搜索邮件失败: {data}")
+            return data
+        
+        result = None
+        for criteria, literal in searches:
+            with observe_phase(self.metrics_name, 'search'):
+                if literal is not None:
+                    # imaplib 将字面量附加在命令末尾，即最后一个条件的值
+                    self.imap_client.literal = literal
+                    typ, data = self.imap_client.uid('SEARCH', 'CHARSET', 'UTF-8', *uid_range, *criteria)
+                else:
+                    typ, data = self.imap_client.uid('SEARCH', None, *uid_range, *criteria)
+            if typ != 'OK':
+                raise RuntimeError(f"搜索邮件失败: {data}")
+            uids = set((data[0] or b'').split()) if data else set()
+            result = uids if result is None else result & uids
+        return [b' '.join(sorted(result, key=int))]
+    
+    def _search_page(self, filters: Dict[str, Any], before_uid: int, count: int) -> List[bytes]:
+        """分页搜索：从 before_uid 向更早的UID按窗口搜索，找到 count+1 封或到达UID 1为止
+        
+        每页的SEARCH结果只包含窗口内的UID，开销与邮箱深度无关；
+        多出的一封用于判断是否还有更早的邮件
+        """
+        found = []
+        upper, window = int(before_uid) - 1, max(PAGE_SEARCH_WINDOW, count * 2)
+        while upper >= 1 and len(found) <= count:
+            lower = max(1, upper - window + 1)
+            data = self._search_uids(filters, uid_set=f'{lower}:{upper}')
+            found = self._window_uids(data, lower, upper) + found
+            upper, window = lower - 1, window * 4
+        return [b' '.join(str(uid).encode() for uid in found)]
+    
+    @staticmethod
+    def _uid_range(since_uid: Optional[int], uid_set: Optional[str]) -> List[str]:
+        if uid_set is not None:
+            return ['UID', uid_set]
+        return ['UID', f'{int(since_uid) + 1}:*'] if since_uid is not None else []
+    
+    @staticmethod
+    def _window_uids(data, lower: int, upper: int) -> List[int]:
+        """SEARCH结果中位于窗口内的UID（升序）"""
+        uids = (int(uid) for uid in b' '.join(d for d in data if isinstance(d, bytes)).split())
+        return sorted(uid for uid in uids if lower <= uid <= upper)
+    
+    @staticmethod
+    def _page_expired(uidvalidity, current_uidvalidity) -> bool:
+        """分页游标的UIDVALIDITY与服务器不一致时游标失效"""
+        if uidvalidity is not None and uidvalidity != current_uidvalidity:
+            logger.warning(f"UIDVALIDITY已变化 ({uidvalidity} -> {current_uidvalidity})，分页游标失效")
+            return True
+        return False
+    
+    @staticmethod
+    def _is_incremental(since_uid, uidvalidity, current_uidvalidity) -> bool:
+        """判断水位线是否可用；UIDVALIDITY变化时需要全量获取"""
+        incremental = since_uid is not None and (
+            uidvalidity is None or uidvalidity == current_uidvalidity
+        )
+        if since_uid is not None and not incremental:
+            logger.warning(f"UIDVALIDITY已变化 ({uidvalidity} -> {current_uidvalidity})，执行全量获取")
+        return incremental
+    
+    @staticmethod
+    def _select_uids(message_uids, count: int, since_uid: Optional[int]) -> List[int]:
+        """从SEARCH结果中选出本次要获取的UID（升序）"""
+        uids = sorted(int(uid) for uid in (message_uids[0] or b'').split()) if message_uids else []
+        if since_uid is not None:
+            # n:* 在没有新邮件时仍会返回最大UID，需要过滤
+            uids = [uid for uid in uids if uid > int(since_uid)]
+            # 增量模式从最早的新邮件开始取，水位线只推进到已获取的邮件，避免漏取
+            return uids[:count]
+        # 获取最新的邮件
+        return uids[-count:] if len(uids) > count else uids
+    
+    @classmethod
+    def _has_more(cls, message_uids, selected_uids: List[int], count: int, since_uid: Optional[int]) -> bool:
+        """增量模式下是否还有超出本次数量上限、留待下次获取的新邮件"""
+        if since_uid is None or len(selected_uids) < count:
+            return False
+        return len(cls._select_uids(message_uids, count + 1, since_uid)) > count
+    
+    @staticmethod
+    def _has_older(message_uids, selected_uids: List[int], since_uid: Optional[int]) -> bool:
+        """非增量模式下本页之前是否还有更早的邮件"""
+        if since_uid is not None or not message_uids:
+            return False
+        return len((message_uids[0] or b'').split()) > len(selected_uids)
+    
+    @staticmethod
+    def _mailbox_state(folder: str, uidvalidity: Optional[int], selected_uids: List[int],
+                       since_uid: Optional[int], has_more: bool = False,
+                       has_older: bool = False) -> Dict[str, Any]:
+        """本次获取后的文件夹状态（水位线），has_more 表示水位线之后还有未获取的邮件，
+        has_older 表示本页最早一封（oldest_uid）之前还有邮件，skipped_uids 为内容缺失或解析失败而跳过的邮件，
+        omitted_uids 为超过大小上限或内存预算不足而只返回描述符的邮件"""
+        if selected_uids:
+            last_uid = max(selected_uids)
+        elif since_uid is not None:
+            last_uid = int(since_uid)
+        else:
+            last_uid = 0
+        return {
+            'folder': folder,
+            'uidvalidity': uidvalidity,
+            'last_uid': last_uid,
+            'has_more': has_more,
+            'oldest_uid': min(selected_uids) if selected_uids else None,
+            'has_older': has_older,
+            'skipped_uids': [],
+            'omitted_uids': []
+        }
+    
+    def _fetch_items(self, mode: str):
+        """返回 (FETCH数据项, 必需的响应字段)"""
+        if mode == 'envelope':
+            return self._envelope_fetch_items(), 'ENVELOPE'
+        return '(UID RFC822)', 'RFC822'
+    
+    def _cache_variant(self, mode: str) -> str:
+        """影响解析结果的参数，不同参数的结果分开缓存"""
+        if mode == 'envelope':
+            return f"envelope:{int(self.config.get('preview_bytes') or DEFAULT_PREVIEW_BYTES)}"
+        return f"full:{self.config.get('attachment_mode') or 'inline'}"
+    
+    def _cache_account(self) -> str:
+        return f"{self.__class__.__name__}:{self.username.lower()}"
+    
+    def _cached_emails(self, folder: str, uidvalidity: Optional[int], uids: List[int], mode: str,
+                       message_uids=None) -> Dict[int, Dict[str, Any]]:
+        """从 message_cache 中取出已解析的邮件，返回 {UID: 邮件信息}
+        
+        传入全量 SEARCH 结果时按UID位置重新计算序号（id），序号会随邮件删除而变化
+        """
+        cache = self.config.get('message_cache')
+        if cache is None or uidvalidity is None:
+            return {}
+        cached = cache.get_many(self._cache_account(), folder, uidvalidity, uids, self._cache_variant(mode))
+        if cached and message_uids:
+            all_uids = sorted(int(uid) for uid in (message_uids[0] or b'').split())
+            sequence = {uid: index for index, uid in enumerate(all_uids, 1)}
+            for uid, email_info in cached.items():
+                email_info['id'] = str(sequence.get(uid, email_info.get('id')))
+        return cached
+    
+    def _store_cached(self, folder: str, uidvalidity: Optional[int], mode: str, email_info: Dict[str, Any]):
+        cache = self.config.get('message_cache')
+        # 因内存预算只返回描述符的结果不缓存，预算恢复后再次获取完整内容
+        if cache is None or uidvalidity is None or email_info.get('content_omitted'):
+            return
+        try:
+            cache.put(self._cache_account(), folder, uidvalidity, email_info['uid'],
+                      self._cache_variant(mode), email_info)
+        except Exception as e:
+            logger.warning(f"写入邮件缓存失败 (UID: {email_info['uid']}): {str(e)}")
+    
+    def _build_email(self, uid: int, response: Optional[Dict[str, Any]], mode: str,
+                     required: str) -> Optional[Dict[str, Any]]:
+        """将单封邮件的FETCH响应解析为邮件信息，失败时返回None"""
+        try:
+            omitted = response.get('OMITTED') if response else None
+            if not response or ('ENVELOPE' if omitted else required) not in response:
+                logger.error(f"邮件内容缺失 (UID: {uid})")
+                return None
             
-            return emails
+            # 解析邮件信息
+            with observe_phase(self.metrics_name, 'parse'):
+                if mode == 'envelope' or omitted:
+                    email_info = self._parse_envelope(response)
+                elif 'PARSED' in response:
+                    email_info = self._parsed_result(response)
+                else:
+                    email_message = parse_message_bytes(response['RFC822'])
+                    email_info = self._parse_email(email_message)
+            MESSAGES_PARSED.inc(provider=self.metrics_name, mode=mode)
+            if omitted:
+                # 正文为前缀预览，附件只有描述符，内容通过附件下载接口获取
+                email_info['content_omitted'] = omitted
+            elif mode == 'full' and email_info['attachments']:
+                ATTACHMENT_BYTES.inc(sum(a.get('size') or 0 for a in email_info['attachments']),
+                                     provider=self.metrics_name)
+            email_info['id'] = str(response['seq'])
+            email_info['uid'] = uid
+            for attachment in email_info['attachments']:
+                attachment['uid'] = uid
+            return email_info
             
         except Exception as e:
-            logger.error(f"获取邮件失败: {str(e)}")
-            return []
+            logger.error(f"解析邮件失败 (UID: {uid}): {str(e)}")
+            return None
     
-    def _parse_email(self, email_message) -> Dict[str, Any]:
-        """解析邮件内容"""
-        def decode_mime_words(s):
-            """解码MIME编码的字符串"""
-            if not s:
-                return ""
-            decoded_fragments = decode_header(s)
-            decoded_string = ""
-            for fragment, encoding in decoded_fragments:
-                if isinstance(fragment, bytes):
-                    if encoding:
-                        decoded_string += fragment.decode(encoding)
-                    else:
-                        decoded_string += fragment.decode('utf-8', errors='ignore')
-                else:
-                    decoded_string += fragment
-            return decoded_string
+    def _parse_in_pool(self, batches, mode: str):
+        """将每批邮件的解析提交到解析进程池，并在工作进程解析时获取下一批（获取与解析重叠）
         
-        # 基本信息
-        subject = decode_mime_words(email_message.get('Subject', ''))
-        sender = decode_mime_words(email_message.get('From', ''))
-        recipient = decode_mime_words(email_message.get('To', ''))
-        date = email_message.get('Date', '')
+        批次小于进程池的 min_batch 时仍在当前线程解析，避免进程间传输的开销
+        """
+        pool = self.config.get('parse_pool')
+        if pool is None or mode != 'full':
+            yield from batches
+            return
+        attachment_mode = self.config.get('attachment_mode') or 'inline'
+        previous = None
+        for batch_uids, responses in batches:
+            pool.submit_batch(responses, attachment_mode)
+            if previous is not None:
+                yield previous
+            previous = (batch_uids, responses)
+        if previous is not None:
+            yield previous
+    
+    def _parsed_result(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        """取出解析进程池的结果；进程池不可用时在当前线程解析"""
+        future = response.pop('PARSED')
+        try:
+            return future.result()
+        except BrokenExecutor as e:
+            logger.warning(f"解析进程池不可用，改为在当前线程解析: {str(e)}")
+            return self._parse_email(parse_message_bytes(response['RFC822']))
+    
+    def get_attachment(self, uid: int, part: str, folder: str = 'INBOX') -> Optional[Dict[str, Any]]:
+        """按UID和部件编号定位附件，返回附件描述符和按块解码的内容生成器
         
-        # 获取邮件正文
-        body = ""
-        if email_message.is_multipart():
-            for part in email_message.walk():
-                if part.get_content_type() == "text/plain":
-                    try:
-                        body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                        break
-                    except:
-                        continue
+        内容通过 BODY.PEEK[part]<offset.size> 分段获取，任一时刻只在内存中保留一个分段。
+        附件不存在时返回None。
+        """
+        if not self.imap_client:
+            self.open_imap()
+        
+        self._select_folder(folder)
+        typ, data = self.imap_client.uid('FETCH', str(int(uid)), '(UID BODYSTRUCTURE)')
+        responses = [r for r in parse_fetch_response(data) if r.get('UID') == int(uid)] if typ == 'OK' else []
+        if not responses or not responses[0].get('BODYSTRUCTURE'):
+            return None
+        
+        descriptor = None
+        for part_path, info in iter_body_parts(responses[0]['BODYSTRUCTURE']):
+            if part_path == part:
+                descriptor = {
+                    'uid': int(uid),
+                    'part': part_path,
+                    'filename': self._part_filename(info),
+                    'content_type': info['content_type'],
+                    'encoding': info['encoding'],
+                    'encoded_size': info['size']
+                }
+                break
+        if descriptor is None:
+            return None
+        
+        descriptor['content'] = self._iter_part_content(uid, part, descriptor['encoding'])
+        return descriptor
+    
+    def _iter_part_content(self, uid: int, part: str, encoding: str):
+        """分段获取并解码部件内容"""
+        chunk_size = int(self.config.get('attachment_chunk_size') or DEFAULT_ATTACHMENT_CHUNK_SIZE)
+        decoder = TransferDecoder(encoding)
+        offset = 0
+        while True:
+            typ, data = self.imap_client.uid('FETCH', str(int(uid)), f'(BODY.PEEK[{part}]<{offset}.{chunk_size}>)')
+            if typ != 'OK':
+                raise RuntimeError(f"获取附件内容失败 (UID: {uid}, 部件: {part}): {data}")
+            chunk = b''
+            for response in parse_fetch_response(data):
+                for key, value in response.items():
+                    if key.startswith(f'BODY[{part}]') and value:
+                        chunk = value
+            decoded = decoder.feed(chunk)
+            if decoded:
+                yield decoded
+            if len(chunk) < chunk_size:
+                break
+            offset += chunk_size
+        tail = decoder.flush()
+        if tail:
+            yield tail
+    
+    def list_folders(self) -> List[Dict[str, Any]]:
+        """列出全部文件夹，返回 [{'name', 'delimiter', 'flags'}]，name 为解码后的文件夹名"""
+        if not self.imap_client:
+            self.open_imap()
+        typ, data = self.imap_client.list()
+        if typ != 'OK':
+            raise RuntimeError(f"列出文件夹失败: {data}")
+        return parse_list_response(data)
+    
+    def folder_status(self, folder: str) -> Dict[str, int]:
+        """不选择文件夹，通过 STATUS 获取 messages/uidnext/uidvalidity"""
+        if not self.imap_client:
+            self.open_imap()
+        typ, data = self.imap_client.status(imap_quote(encode_imap_utf7(folder)), FOLDER_STATUS_ITEMS)
+        if typ != 'OK':
+            raise RuntimeError(f"获取文件夹 {folder} 状态失败: {data}")
+        return parse_status_response(data)
+    
+    def resolve_folders(self, folders: List[str]) -> List[str]:
+        """将文件夹列表中的特殊用途标记（如 \\Sent、\\Archive）替换为实际文件夹名，去重并保持顺序"""
+        listing = self.list_folders() if any(f.startswith('\\') for f in folders) else []
+        return resolve_special_use(folders, listing)
+    
+    def _select_folder(self, folder: str) -> Optional[int]:
+        """选择文件夹，返回其UIDVALIDITY"""
+        with observe_phase(self.metrics_name, 'select'):
+            typ, data = self.imap_client.select(imap_quote(encode_imap_utf7(folder)))
+        if typ != 'OK':
+            raise RuntimeError(f"选择文件夹 {folder} 失败: {data}")
+        _, values = self.imap_client.response('UIDVALIDITY')
+        if values and values[0]:
+            return int(values[-1])
+        return None
+    
+    def server_capabilities(self) -> Tuple[str, ...]:
+        """登录后服务器声明的扩展，同一连接只查询一次
+
+        imaplib 只记录登录前的 CAPABILITY，许多服务器登录后才声明 CONDSTORE/QRESYNC/ENABLE，
+        查询后同时更新 imaplib 的记录（enable() 据此检查）
+        """
+        if not self.imap_client:
+            self.open_imap()
+        if self._capabilities is None or self._capabilities[0] is not self.imap_client:
+            typ, data = self.imap_client.capability()
+            if typ == 'OK' and data and data[-1]:
+                self.imap_client.capabilities = tuple(imap_text(data[-1]).upper().split())
+            self._capabilities = (self.imap_client, tuple(self.imap_client.capabilities))
+        return self._capabilities[1]
+
+    def get_changes(self, folder: str, state: Optional[Dict[str, Any]], last_uid: int) -> Dict[str, Any]:
+        """获取已同步邮件自上次以来的标志变化和已删除（expunge）的邮件
+
+        按服务器能力选择方式，优先使用开销与变化量成正比的方式：
+            qresync    UID FETCH (CHANGEDSINCE <modseq> VANISHED)，一条命令返回变化的标志和已删除的UID
+            condstore  UID FETCH (CHANGEDSINCE <modseq>) 获取变化的标志；邮件数与保存的UID数加新邮件数
+                       不一致时才通过 UID SEARCH 与保存的UID集合比较，找出已删除的邮件
+            snapshot   服务器或文件夹不支持 MODSEQ 时获取全部邮件的标志，与保存的 UID+标志 快照比较
+        没有上次的状态（initial）或 UIDVALIDITY 已变化（reset）时只记录当前状态，不返回变化
+
+        Args:
+            folder: 邮箱文件夹
+            state: 上次返回的 state，首次为 None
+            last_uid: 本次同步后的UID水位线。只返回上次已同步的邮件（UID 不大于 state['last_uid']）的变化，
+                更新的邮件作为新邮件获取；新的 state 覆盖 1:last_uid
+
+        Returns:
+            dict: {'method', 'flags': [{'uid', 'flags'}], 'vanished': [UID], 'state': 下次传入的状态}
+        """
+        capabilities = self.server_capabilities()
+        qresync = 'QRESYNC' in capabilities and 'ENABLE' in capabilities and self._enable_qresync(capabilities)
+        uidvalidity, exists, modseq = self._examine_with_modseq(folder, qresync or 'CONDSTORE' in capabilities)
+        if modseq is None:
+            qresync = False
+
+        previous = state if state and state.get('uidvalidity') == uidvalidity else None
+        if previous is None:
+            method = 'initial' if state is None else 'reset'
+        elif modseq is not None and previous.get('modseq') is not None and (qresync or previous.get('uids') is not None):
+            method = 'qresync' if qresync else 'condstore'
+        elif previous.get('flags') is not None:
+            method = 'snapshot'
         else:
-            try:
-                body = email_message.get_payload(decode=True).decode('utf-8', errors='ignore')
-            except:
-                body = str(email_message.get_payload())
+            method = 'reset'
+        known_last = int(previous['last_uid']) if previous else 0
+        last_uid = max(int(last_uid), known_last)
+
+        changed, vanished, uids, current_flags = {}, [], None, None
+        if method == 'snapshot' or modseq is None:
+            current_flags = self._fetch_flags(last_uid)
+        if method == 'snapshot':
+            known_flags = _expand_flags_snapshot(previous['flags'])
+            changed = {uid: flags for uid, flags in current_flags.items()
+                       if uid in known_flags and known_flags[uid] != flags}
+            vanished = sorted(uid for uid in known_flags if uid <= known_last and uid not in current_flags)
+        elif method in ('qresync', 'condstore') and known_last:
+            changed, vanished = self._fetch_changed_flags(known_last, previous['modseq'], qresync)
+            if method == 'condstore':
+                vanished, uids = self._condstore_vanished(set(expand_uid_set(previous['uids'])), known_last,
+                                                          last_uid, exists)
+
+        new_state = {'uidvalidity': uidvalidity, 'last_uid': last_uid, 'modseq': modseq}
+        if modseq is None:
+            new_state['flags'] = _flags_snapshot(current_flags)
+        elif not qresync:
+            if uids is None:
+                uids = set(current_flags) if current_flags is not None else set(self._search_uid_window(1, last_uid))
+            new_state['uids'] = compact_uid_set(uids)
+
+        DELTA_SYNCS.inc(provider=self.metrics_name, method=method)
+        gone = set(vanished)
+        return {
+            'method': method,
+            'flags': [{'uid': uid, 'flags': list(changed[uid])} for uid in sorted(changed)
+                      if uid <= known_last and uid not in gone],
+            'vanished': vanished,
+            'state': new_state
+        }
+
+    def _enable_qresync(self, capabilities: Tuple[str, ...]) -> bool:
+        """ENABLE QRESYNC（只能在未选择文件夹时发送，已选择时先 UNSELECT；不支持 UNSELECT 时不启用）"""
+        if self.imap_client.state == 'SELECTED':
+            if 'UNSELECT' not in capabilities:
+                return False
+            self.imap_client.unselect()
+        typ, _ = self.imap_client.enable('QRESYNC')
+        return typ == 'OK'
+
+    def _examine_with_modseq(self, folder: str, condstore: bool) -> Tuple[Optional[int], int, Optional[int]]:
+        """只读选择文件夹，支持 CONDSTORE 时带 CONDSTORE 参数；返回 (UIDVALIDITY, 邮件数, HIGHESTMODSEQ)
+
+        文件夹不支持 MODSEQ（NOMODSEQ）时 HIGHESTMODSEQ 为 None
+        """
+        mailbox = imap_quote(encode_imap_utf7(folder))
+        with observe_phase(self.metrics_name, 'select'):
+            typ, data = self.imap_client.select(f'{mailbox} (CONDSTORE)' if condstore else mailbox, readonly=True)
+        if typ != 'OK':
+            raise RuntimeError(f"选择文件夹 {folder} 失败: {data}")
+        exists = int(data[-1]) if data and data[-1] else 0
+        values = {}
+        for code in ('UIDVALIDITY', 'HIGHESTMODSEQ'):
+            _, response = self.imap_client.response(code)
+            values[code] = int(response[-1]) if response and response[-1] else None
+        return values['UIDVALIDITY'], exists, values['HIGHESTMODSEQ'] if condstore else None
+
+    def _fetch_flags(self, last_uid: int) -> Dict[int, Tuple[str, ...]]:
+        """获取 1:last_uid 全部邮件的标志"""
+        if not last_uid:
+            return {}
+        with observe_phase(self.metrics_name, 'fetch'):
+            typ, data = self.imap_client.uid('FETCH', f'1:{last_uid}', '(UID FLAGS)')
+        FETCHED_BYTES.inc(response_bytes(data), provider=self.metrics_name)
+        if typ != 'OK':
+            raise RuntimeError(f"获取邮件标志失败: {data}")
+        return {uid: flags for uid, flags in self._flags_map(data).items() if uid <= last_uid}
+
+    def _fetch_changed_flags(self, last_uid: int, modseq: int, qresync: bool) -> Tuple[Dict[int, Tuple[str, ...]], List[int]]:
+        """获取 1:last_uid 中 MODSEQ 大于 modseq 的邮件的标志，启用 QRESYNC 时同时返回已删除的UID"""
+        modifiers = f"(CHANGEDSINCE {int(modseq)}{' VANISHED' if qresync else ''})"
+        # 丢弃之前残留的 VANISHED 响应
+        self.imap_client.response('VANISHED')
+        with observe_phase(self.metrics_name, 'fetch'):
+            typ, data = self.imap_client.uid('FETCH', f'1:{last_uid}', '(UID FLAGS)', modifiers)
+        FETCHED_BYTES.inc(response_bytes(data), provider=self.metrics_name)
+        if typ != 'OK':
+            raise RuntimeError(f"获取标志变化失败: {data}")
+        _, vanished = self.imap_client.response('VANISHED')
+        return self._flags_map(data), [uid for uid in parse_vanished_response(vanished) if uid <= last_uid]
+
+    def _condstore_vanished(self, known: set, known_last: int, last_uid: int, exists: int) -> Tuple[List[int], set]:
+        """没有 QRESYNC 时找出已删除的邮件，返回 (已删除的UID, 1:last_uid 中现有的UID)
+
+        UID 只增不减，known_last 之前的现有邮件数（总数减去更新的邮件数）等于保存的UID数时没有邮件被删除，
+        只需一次范围为新邮件的 SEARCH；否则再搜索 1:known_last 与保存的UID比较
+        """
+        newer = self._search_uid_window(known_last + 1, None)
+        if exists - len(newer) == len(known):
+            current, vanished = known, []
+        else:
+            current = set(self._search_uid_window(1, known_last))
+            vanished = sorted(known - current)
+        return vanished, current | {uid for uid in newer if uid <= last_uid}
+
+    def _search_uid_window(self, lower: int, upper: Optional[int]) -> List[int]:
+        """UID 在 lower:upper（upper 为 None 时到最后一封）之间的全部邮件"""
+        data = self._search_uids({}, uid_set=f"{lower}:{upper if upper is not None else '*'}")
+        return self._window_uids(data, lower, upper if upper is not None else float('inf'))
+
+    @staticmethod
+    def _flags_map(data) -> Dict[int, Tuple[str, ...]]:
+        """FETCH 响应中的 {UID: 排序后的标志}，忽略只对当前会话有效的 \\Recent"""
+        flags = {}
+        for response in parse_fetch_response(data):
+            if 'UID' not in response:
+                continue
+            values = response.get('FLAGS') or []
+            flags[response['UID']] = tuple(sorted(imap_text(flag) for flag in values
+                                                  if imap_text(flag).lower() != '\\recent'))
+        return flags
+
+    def _fetch_batches(self, uids: List[int], items: str, plan=None):
+        """按批次发送UID FETCH命令，每批使用一个UID集合（如 1:200 或 3,7,9）
         
-        # 提取附件详细信息
-        attachments = []
-        try:
-            for part in email_message.walk():
-                filename = part.get_filename()
-                if filename:
-                    # 解码文件名
-                    decoded_filename = decode_mime_words(filename)
-                    
-                    # 获取附件二进制内容
-                    content = part.get_payload(decode=True)
-                    if not content:
+        逐批返回 (本批UID列表, {UID: 响应字典})，调用方按原顺序取用。
+        plan(本批UID列表) 返回只获取描述符的邮件 {UID: 原因}，这些邮件改用列表模式的数据项获取，
+        响应中的 OMITTED 字段记录原因
+        """
+        batch_size = max(1, int(self.config.get('fetch_batch_size') or DEFAULT_FETCH_BATCH_SIZE))
+        for start in range(0, len(uids), batch_size):
+            batch_uids = uids[start:start + batch_size]
+            omitted = plan(batch_uids) if plan else {}
+            by_seq = {}
+            for fetch_uids, fetch_items in (([uid for uid in batch_uids if uid not in omitted], items),
+                                            (list(omitted), self._envelope_fetch_items())):
+                for message_set in build_message_sets(fetch_uids, batch_size) if fetch_uids else []:
+                    with observe_phase(self.metrics_name, 'fetch'):
+                        typ, data = self.imap_client.uid('FETCH', message_set, fetch_items)
+                    FETCHED_BYTES.inc(response_bytes(data), provider=self.metrics_name)
+                    if typ != 'OK':
+                        logger.error(f"批量获取邮件失败 ({message_set}): {data}")
+                        ERRORS.inc(provider=self.metrics_name, phase='fetch', type=typ)
                         continue
-                        
-                    file_size = len(content)
-                    
-                    # 检查文件大小限制（飞书限制2GB）
-                    max_size = 1024 * 1024 * 1024 * 2  # 2GB
-                    if file_size > max_size:
-                        logger.warning(f"附件 {decoded_filename} 大小 {file_size} 超过限制 {max_size}，跳过")
-                        continue
-                    
-                    # 检查文件名长度限制（飞书限制250字符）
-                    if len(decoded_filename) > 250:
-                        logger.warning(f"附件文件名 {decoded_filename} 长度超过250字符，截断")
-                        decoded_filename = decoded_filename[:247] + "..."
-                    
-                    # 获取MIME类型
-                    content_type = part.get_content_type()
-                    
-                    # 将二进制内容转换为base64编码以便传输
-                    import base64
-                    content_base64 = base64.b64encode(content).decode('utf-8')
-                    
-                    attachment_info = {
-                        'filename': decoded_filename,
-                        'size': file_size,
-                        'content_type': content_type,
-                        'content': content_base64  # 添加base64编码的文件内容
-                    }
-                    attachments.append(attachment_info)
-        except Exception as e:
-            logger.error(f"解析附件信息失败: {str(e)}")
-            # 如果解析失败，保持空列表，不影响整体功能
-            attachments = []
+                    # 同一封邮件可能有多条FETCH响应（如服务器主动推送FLAGS），按序号合并
+                    for response in parse_fetch_response(data):
+                        by_seq.setdefault(response['seq'], {}).update(response)
+                    data = None
+            responses = {response['UID']: response for response in by_seq.values() if 'UID' in response}
+            for uid, reason in omitted.items():
+                if uid in responses:
+                    responses[uid]['OMITTED'] = reason
+            # 只保留 responses 中的引用，调用方逐封取出后原始数据即可释放
+            by_seq = None
+            yield batch_uids, responses
+    
+    @staticmethod
+    def _limits_memory(mode: str) -> bool:
+        """完整模式下启用了内存预算或单封邮件大小上限时，获取前先查询邮件大小"""
+        return mode == 'full' and bool(get_memory_budget().limit or LARGE_MESSAGE_BYTES)
+    
+    def _fetch_sizes(self, uids: List[int]) -> Dict[int, int]:
+        """查询邮件大小（RFC822.SIZE），返回 {UID: 字节数}"""
+        sizes = {}
+        for message_set in build_message_sets(uids, SIZE_FETCH_BATCH_SIZE):
+            with observe_phase(self.metrics_name, 'fetch'):
+                typ, data = self.imap_client.uid('FETCH', message_set, '(UID RFC822.SIZE)')
+            if typ != 'OK':
+                logger.warning(f"查询邮件大小失败 ({message_set}): {data}")
+                ERRORS.inc(provider=self.metrics_name, phase='fetch', type=typ)
+                continue
+            sizes.update(self._size_map(data))
+        return sizes
+    
+    @staticmethod
+    def _size_map(data) -> Dict[int, int]:
+        return {response['UID']: int(response['RFC822.SIZE']) for response in parse_fetch_response(data)
+                if 'UID' in response and response.get('RFC822.SIZE') is not None}
+    
+    def _plan_memory(self, folder: str, batch_uids: List[int], sizes: Dict[int, int],
+                     lease: MemoryLease) -> Dict[int, str]:
+        """为一批邮件从内存预算中预留内存，返回只获取描述符的邮件 {UID: 原因}
+        
+        原因为 size（超过单封邮件上限）或 memory（预算不足）；服务器未返回大小的邮件按原方式获取
+        """
+        attachment_mode = self.config.get('attachment_mode') or 'inline'
+        omitted = {}
+        for uid in batch_uids:
+            size = sizes.get(uid)
+            if size is None:
+                continue
+            if LARGE_MESSAGE_BYTES and size > LARGE_MESSAGE_BYTES:
+                omitted[uid] = 'size'
+            elif not lease.reserve((folder, uid), estimate_message_memory(size, attachment_mode)):
+                omitted[uid] = 'memory'
+        for reason in omitted.values():
+            MESSAGES_OMITTED.inc(provider=self.metrics_name, reason=reason)
+        if omitted:
+            logger.warning(f"{len(omitted)} 封邮件过大或内存预算不足，只返回描述符: {sorted(omitted)}")
+        return omitted
+    
+    def _envelope_fetch_items(self) -> str:
+        """列表模式的FETCH数据项"""
+        preview_bytes = int(self.config.get('preview_bytes') or DEFAULT_PREVIEW_BYTES)
+        return f'(UID RFC822.SIZE ENVELOPE BODYSTRUCTURE BODY.PEEK[TEXT]<0.{preview_bytes}>)'
+    
+    def _parse_envelope(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        """根据 ENVELOPE/BODYSTRUCTURE/正文前缀 构造与 _parse_email 相同结构的邮件信息"""
+        envelope = response['ENVELOPE'] or []
+        envelope = envelope + [None] * (10 - len(envelope))
+        bodystructure = response.get('BODYSTRUCTURE') or []
+        
+        attachments = []
+        for part_path, part in iter_body_parts(bodystructure):
+            filename = self._part_filename(part)
+            if not filename:
+                continue
+            if len(filename) > 250:
+                filename = filename[:247] + "..."
+            size = part['size']
+            if part['encoding'] == 'base64':
+                # BODYSTRUCTURE给出的是编码后大小，按每76字符一行估算解码后大小
+                size = size * 57 // 78
+            attachments.append({
+                'filename': filename,
+                'size': size,
+                'content_type': part['content_type'],
+                'part': part_path
+            })
+        
+        # 正文前缀可能为 BODY[TEXT]<0>，也可能被服务器省略偏移
+        text = b''
+        for key, value in response.items():
+            if key.startswith('BODY[TEXT]'):
+                text = value or b''
+                break
+        body = self._preview_from_text(bodystructure, text) if bodystructure else ""
         
         return {
-            'subject': subject,
-            'sender': sender,
-            'recipient': recipient,
-            'date': date,
-            'body': body[:1000] if body else "",  # 限制正文长度
-            'attachments': attachments,  # 改为附件详细信息数组
-            'has_attachments': len(attachments) > 0  # 保持向后兼容性
+            'subject': decode_mime_words(envelope[1]),
+            'sender': _format_addresses(envelope[2]),
+            'recipient': _format_addresses(envelope[5]),
+            'date': imap_text(envelope[0]),
+            'body': body[:BODY_PREVIEW_CHARS] if body else "",
+            'attachments': attachments,
+            'has_attachments': len(attachments) > 0,
+            'size': response.get('RFC822.SIZE')
         }
     
+    @staticmethod
+    def _part_filename(part: Dict[str, Any]) -> str:
+        """从Content-Disposition或Content-Type参数中取附件文件名"""
+        for params in (part['disposition_params'], part['params']):
+            for key in ('filename', 'name'):
+                if params.get(key):
+                    return decode_mime_words(params[key])
+                if params.get(key + '*'):
+                    value = email.utils.decode_rfc2231(params[key + '*'])
+                    return email.utils.collapse_rfc2231_value(value)
+        return ""
+    
+    def _preview_from_text(self, bodystructure: List[Any], text: bytes) -> str:
+        """将 BODY[TEXT] 前缀与BODYSTRUCTURE中的头部信息拼成邮件，解析出正文预览"""
+        if is_multipart_structure(bodystructure):
+            subtype, params = multipart_info(bodystructure)
+            header = f'Content-Type: multipart/{subtype or "mixed"}; boundary="{params.get("boundary", "")}"\r\n'
+        else:
+            part = describe_body_part(bodystructure)
+            charset = part['params'].get('charset')
+            header = f'Content-Type: {part["content_type"]}' + (f'; charset="{charset}"' if charset else '') + '\r\n'
+            if part['encoding']:
+                header += f'Content-Transfer-Encoding: {part["encoding"]}\r\n'
+        email_message = parse_message_bytes(header.encode() + b'\r\n' + text)
+        return self._get_text_body(email_message)
+    
+    @staticmethod
+    def _get_text_body(email_message) -> str:
+        """获取邮件的text/plain正文（前 BODY_PREVIEW_CHARS 个字符）"""
+        if not email_message.is_multipart():
+            try:
+                return decode_body_prefix(email_message)
+            except Exception:
+                return str(email_message.get_payload())[:BODY_PREVIEW_CHARS]
+        for part in email_message.walk():
+            if part.get_content_type() == "text/plain":
+                try:
+                    return decode_body_prefix(part)
+                except Exception:
+                    continue
+        return ""
+    
+    def _parse_email(self, email_message) -> Dict[str, Any]:
+        """解析邮件内容"""
+        return parse_email_message(email_message, self.config.get('attachment_mode') or 'inline')
+    
     def connect(self) -> bool:
         """连接到邮箱服务器（IMAP）"""
         return self.connect_imap()
@@ -226,82 +1330,168 @@ class EmailProvider(ABC):
                 pass
 
 
-class LarkEmailProvider(EmailProvider):
-    """飞书邮箱提供商"""
-    
-    def get_imap_config(self) -> Dict[str, Any]:
-        return {
-            'server': 'imap.feishu.cn',
-            'port': 993
-        }
-    
-    def get_smtp_config(self) -> Dict[str, Any]:
-        return {
-            'server': 'smtp.feishu.cn',
-            'port': 465
-        }
+# 内置邮箱提供商：显示名称、IMAP/SMTP服务器、别名和已知支持的扩展（capabilities）。
+# capabilities 用于选择搜索方式（X-GM-EXT-1 使用 X-GM-RAW）和 /api/providers 展示，
+# 新邮件监听等功能运行时仍以服务器的 CAPABILITY 响应为准
+BUILTIN_PROVIDERS = {
+    'lark': {
+        'name': '飞书邮箱',
+        'imap': {'server': 'imap.feishu.cn', 'port': 993},
+        'smtp': {'server': 'smtp.feishu.cn', 'port': 465},
+        'aliases': ['feishu'],
+        'capabilities': []
+    },
+    'gmail': {
+        'name': 'Gmail',
+        'imap': {'server': 'imap.gmail.com', 'port': 993},
+        'smtp': {'server': 'smtp.gmail.com', 'port': 465},
+        'aliases': ['google'],
+        'capabilities': ['IDLE', 'CONDSTORE', 'X-GM-EXT-1']
+    },
+    'qq': {
+        'name': 'QQ邮箱',
+        'imap': {'server': 'imap.qq.com', 'port': 993},
+        'smtp': {'server': 'smtp.qq.com', 'port': 465},
+        'aliases': [],
+        'capabilities': ['IDLE']
+    },
+    'netease': {
+        'name': '网易邮箱',
+        'imap': {'server': 'imap.163.com', 'port': 993},
+        'smtp': {'server': 'smtp.163.com', 'port': 465},
+        'aliases': ['163'],
+        'capabilities': ['IDLE']
+    },
+}
 
 
-class GmailProvider(EmailProvider):
-    """Gmail邮箱提供商"""
-    
-    def get_imap_config(self) -> Dict[str, Any]:
-        return {
-            'server': 'imap.gmail.com',
-            'port': 993
-        }
-    
-    def get_smtp_config(self) -> Dict[str, Any]:
-        return {
-            'server': 'smtp.gmail.com',
-            'port': 465
-        }
+def normalize_provider_spec(provider_type: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+    """校验并补全提供商描述，缺少IMAP服务器或格式错误时抛出 ValueError"""
+    if not isinstance(spec, dict):
+        raise ValueError(f"邮箱提供商 {provider_type} 的配置必须是对象")
+    imap = spec.get('imap') or {}
+    if not isinstance(imap, dict) or not imap.get('server'):
+        raise ValueError(f"邮箱提供商 {provider_type} 缺少 imap.server")
+    smtp = spec.get('smtp') or {}
+    if not isinstance(smtp, dict):
+        raise ValueError(f"邮箱提供商 {provider_type} 的 smtp 配置必须是对象")
+    aliases, capabilities = spec.get('aliases') or [], spec.get('capabilities') or []
+    if not isinstance(aliases, list) or not isinstance(capabilities, list):
+        raise ValueError(f"邮箱提供商 {provider_type} 的 aliases/capabilities 必须是列表")
+    use_ssl = bool(imap.get('ssl', True))
+    return {
+        'name': str(spec.get('name') or provider_type),
+        'imap': {'server': str(imap['server']), 'port': int(imap.get('port') or (993 if use_ssl else 143)),
+                 'ssl': use_ssl},
+        'smtp': {'server': str(smtp.get('server') or ''), 'port': int(smtp.get('port') or 465)},
+        'aliases': [str(alias).lower() for alias in aliases],
+        'capabilities': [str(capability).upper() for capability in capabilities]
+    }
 
 
-class QQEmailProvider(EmailProvider):
-    """QQ邮箱提供商"""
+class ConfiguredEmailProvider(EmailProvider):
+    """由提供商描述（spec）驱动的邮箱提供商，服务器、端口和能力都来自数据，
+    新的邮箱服务通过 EmailProviderFactory.register 或 EMAIL_PROVIDERS 配置注册，无需编写子类"""
+    
+    provider_type = ''
+    spec = {}
+    details = {}
     
     def get_imap_config(self) -> Dict[str, Any]:
-        return {
-            'server': 'imap.qq.com',
-            'port': 993
-        }
+        return dict(self.spec['imap'])
     
     def get_smtp_config(self) -> Dict[str, Any]:
-        return {
-            'server': 'smtp.qq.com',
-            'port': 465
-        }
+        return dict(self.spec['smtp'])
+    
+    def _search_commands(self, filters: Dict[str, Any]) -> List[Tuple[List[str], Optional[bytes]]]:
+        """支持 X-GM-EXT-1 的服务器（Gmail）使用 X-GM-RAW 扩展，由Gmail的搜索语法一次完成全部筛选"""
+        if 'X-GM-EXT-1' not in self.spec['capabilities']:
+            return super()._search_commands(filters)
+        query = build_gmail_raw_query(filters)
+        if not query:
+            return []
+        if query.isascii():
+            return [(['X-GM-RAW', imap_quote(query)], None)]
+        return [(['X-GM-RAW'], query.encode('utf-8'))]
 
 
-class NetEaseEmailProvider(EmailProvider):
-    """网易邮箱提供商（163邮箱）"""
-    
-    def get_imap_config(self) -> Dict[str, Any]:
-        return {
-            'server': 'imap.163.com',
-            'port': 993
-        }
-    
-    def get_smtp_config(self) -> Dict[str, Any]:
-        return {
-            'server': 'smtp.163.com',
-            'port': 465
-        }
+# 内置提供商保留原有的类名：邮件缓存、连接池、批量同步的并发限制和新邮件监听都以类名区分账号所属的提供商，
+# 改名会使已有的磁盘缓存失效
+BUILTIN_CLASS_NAMES = {
+    'lark': 'LarkEmailProvider',
+    'gmail': 'GmailProvider',
+    'qq': 'QQEmailProvider',
+    'netease': 'NetEaseEmailProvider',
+}
+
+
+def _provider_class_name(provider_type: str) -> str:
+    if provider_type in BUILTIN_CLASS_NAMES:
+        return BUILTIN_CLASS_NAMES[provider_type]
+    return ''.join(part.capitalize() for part in re.split(r'[^0-9A-Za-z]+', provider_type) if part) + 'Provider'
 
 
 class EmailProviderFactory:
-    """邮箱提供商工厂类"""
-    
-    PROVIDERS = {
-        'lark': LarkEmailProvider,
-        'feishu': LarkEmailProvider,  # 别名
-        'gmail': GmailProvider,
-        'google': GmailProvider,  # 别名
-        'qq': QQEmailProvider,
-        'netease': NetEaseEmailProvider,
-        '163': NetEaseEmailProvider,  # 别名
-    }
+    """邮箱提供商工厂类
+    
+    PROVIDERS 为 名称/别名 -> 提供商类，在导入时由 BUILTIN_PROVIDERS 和 EMAIL_PROVIDERS_FILE/EMAIL_PROVIDERS
+    配置一次性生成；也可以直接注册自定义的 EmailProvider 子类
+    """
+    
+    PROVIDERS = {}
+    
+    @classmethod
+    def register(cls, provider_type: str, spec: Optional[Dict[str, Any]] = None, provider_class=None):
+        """注册邮箱提供商，返回提供商类
+        
+        传入 spec（name、imap、smtp、aliases、capabilities）时生成 ConfiguredEmailProvider 子类，
+        别名指向同一个类；同名的提供商被替换
+        """
+        provider_type = provider_type.lower()
+        if provider_class is None:
+            spec = normalize_provider_spec(provider_type, spec or {})
+            provider_class = type(_provider_class_name(provider_type), (ConfiguredEmailProvider,), {
+                '__doc__': f"{spec['name']}提供商",
+                '__module__': __name__,
+                'provider_type': provider_type,
+                'spec': spec,
+                'details': {
+                    'name': spec['name'],
+                    'server': spec['imap']['server'],
+                    'port': spec['imap']['port'],
+                    'capabilities': spec['capabilities']
+                }
+            })
+        for name in [provider_type] + list(getattr(provider_class, 'spec', {}).get('aliases', [])):
+            cls.PROVIDERS[name] = provider_class
+        return provider_class
+    
+    @classmethod
+    def load_config(cls, path: Optional[str] = None, text: Optional[str] = None):
+        """从JSON文件（EMAIL_PROVIDERS_FILE）或JSON字符串（EMAIL_PROVIDERS）注册提供商，格式为 {名称: spec}
+
+        名称或别名与内置提供商相同的配置须带 "override": true，否则抛出 ValueError，
+        避免自定义配置无意中替换内置提供商
+        """
+        builtin_names = {name for provider_type, spec in BUILTIN_PROVIDERS.items()
+                         for name in [provider_type] + spec.get('aliases', [])}
+        for source in (path, text):
+            if not source:
+                continue
+            if source is path:
+                with open(path, encoding='utf-8') as f:
+                    specs = json.load(f)
+            else:
+                specs = json.loads(source)
+            if not isinstance(specs, dict):
+                raise ValueError("邮箱提供商配置必须是 {名称: 配置} 形式的对象")
+            for provider_type, spec in specs.items():
+                names = [provider_type.lower()] + normalize_provider_spec(provider_type, spec)['aliases']
+                conflicts = sorted(builtin_names.intersection(names))
+                if conflicts and not spec.get('override'):
+                    raise ValueError(f"邮箱提供商 {provider_type} 与内置提供商重名: {', '.join(conflicts)}，"
+                                     f"确需替换时请在配置中设置 \"override\": true")
+                cls.register(provider_type, spec)
     
     @classmethod
     def create_provider(cls, provider_type: str, username: str, password: str, **kwargs) -> EmailProvider:
@@ -314,7 +1504,31 @@ class EmailProviderFactory:
         provider_class = cls.PROVIDERS[provider_type]
         return provider_class(username, password, **kwargs)
     
+    @classmethod
+    def metrics_name(cls, provider_type: str) -> str:
+        """邮箱类型对应的指标 provider 标签，别名（如 feishu/lark）归为同一个标签"""
+        provider_class = cls.PROVIDERS.get(provider_type.lower())
+        return _metrics_name(provider_class) if provider_class else provider_type.lower()
+    
     @classmethod
     def get_supported_providers(cls) -> List[str]:
         """获取支持的邮箱提供商列表"""
-        return list(cls.PROVIDERS.keys())
\ No newline at end of file
+        return list(cls.PROVIDERS.keys())
+    
+    @classmethod
+    def provider_details(cls) -> Dict[str, Dict[str, Any]]:
+        """各提供商（含别名）的显示名称、IMAP服务器、端口和已知能力，注册时已生成"""
+        return {provider_type: getattr(provider_class, 'details', None) or {'name': provider_type, 'server': 'unknown'}
+                for provider_type, provider_class in cls.PROVIDERS.items()}
+
+
+for _provider_type, _spec in BUILTIN_PROVIDERS.items():
+    EmailProviderFactory.register(_provider_type, _spec)
+
+# 兼容原有的提供商类名；在加载自定义配置之前绑定，始终指向内置提供商
+LarkEmailProvider = EmailProviderFactory.PROVIDERS['lark']
+GmailProvider = EmailProviderFactory.PROVIDERS['gmail']
+QQEmailProvider = EmailProviderFactory.PROVIDERS['qq']
+NetEaseEmailProvider = EmailProviderFactory.PROVIDERS['netease']
+
+EmailProviderFactory.load_config(os.getenv('EMAIL_PROVIDERS_FILE'), os.getenv('EMAIL_PROVIDERS'))
\ No newline at end of file
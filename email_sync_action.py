@@ -9,18 +9,77 @@
 import os
 import sys
 import json
-import time
+import asyncio
 import traceback
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import quote
+from email.utils import parsedate_to_datetime
 from email_providers import EmailProviderFactory
+from watermark_store import get_default_watermark_store
+from connection_pool import get_connection_pool
+from message_cache import get_default_message_cache
+from search_index import get_search_index, index_document
+from parse_pool import get_parse_pool
+from async_email_providers import AsyncEmailProvider
+from imap_utils import encode_page_cursor, decode_page_cursor
+from metrics import SYNCS, ERRORS
+from memory_budget import MemoryLease
+
+# IMAP引擎：imaplib（同步，默认）或 asyncio
+IMAP_ENGINES = ('imaplib', 'asyncio')
+# 未设置 IMAP_POOL_ENABLED 时是否使用连接池，命令行脚本和 HTTP 接口相同
+DEFAULT_IMAP_POOL_ENABLED = 'true'
+
+def connection_pool_enabled():
+    """是否默认使用 IMAP 连接池（IMAP_POOL_ENABLED）"""
+    return os.getenv('IMAP_POOL_ENABLED', DEFAULT_IMAP_POOL_ENABLED).lower() == 'true'
+
+def parse_folder_list(value):
+    """将文件夹配置（列表或逗号分隔的字符串）转为列表，空值返回None"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    folders = [str(folder).strip() for folder in value if str(folder).strip()]
+    return folders or None
+
+def _error_fields(error):
+    """失败结果中的错误分类：error_type 为 auth/transient/throttle/circuit_open/error，
+    熔断或限流时带 retry_after（秒）"""
+    fields = {'error_type': getattr(error, 'kind', 'error')}
+    if getattr(error, 'retry_after', None):
+        fields['retry_after'] = round(error.retry_after, 1)
+    return fields
+
+def _email_timestamp(email):
+    """邮件日期的时间戳，用于多文件夹结果按日期合并；无法解析时排在最后"""
+    try:
+        return parsedate_to_datetime(email.get('date') or '').timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return 0.0
 
 class EmailSyncAction:
-    def __init__(self, config=None):
-        """初始化邮件获取操作类"""
+    def __init__(self, config=None, watermark_store=None):
+        """初始化邮件获取操作类
+        
+        Args:
+            config: 配置字典，不提供则从环境变量读取
+            watermark_store: 增量同步水位线存储，不提供则使用默认的SQLite存储
+        """
         if config:
             self.config = self.validate_config(config)
         else:
             self.config = self.load_config_from_env()
+        self.watermark_store = watermark_store
+        # 本次请求从进程内存预算中预留的内存，请求结束（结果已返回）时归还
+        self.memory_lease = MemoryLease()
+        self.mailbox_state = None
+        self.changes = None
+        self._index_authorized = False
+        self.folder_results = None
+        self._resolved_folders = []
         self.sync_results = []
         self.sync_logs = []
         
@@ -30,7 +89,21 @@ class EmailSyncAction:
             'email_username': os.getenv('EMAIL_USERNAME'),
             'email_password': os.getenv('EMAIL_PASSWORD'),
             'email_provider': os.getenv('EMAIL_PROVIDER', 'feishu'),
-            'email_count': int(os.getenv('EMAIL_COUNT', '50'))
+            'email_count': int(os.getenv('EMAIL_COUNT', '50')),
+            'fetch_batch_size': int(os.getenv('FETCH_BATCH_SIZE', '100')),
+            'email_folder': os.getenv('EMAIL_FOLDER', 'INBOX'),
+            'email_folders': parse_folder_list(os.getenv('EMAIL_FOLDERS')),
+            'folder_concurrency': int(os.getenv('FOLDER_CONCURRENCY', '2')),
+            'incremental': os.getenv('EMAIL_INCREMENTAL', 'false').lower() == 'true',
+            'delta': os.getenv('EMAIL_DELTA', 'false').lower() == 'true',
+            'fetch_mode': os.getenv('EMAIL_FETCH_MODE', 'full'),
+            'attachment_mode': os.getenv('EMAIL_ATTACHMENT_MODE', 'inline'),
+            'search_filters': json.loads(os.getenv('EMAIL_SEARCH_FILTERS') or 'null'),
+            'page_cursor': os.getenv('EMAIL_PAGE_CURSOR') or None,
+            'use_connection_pool': connection_pool_enabled(),
+            'use_message_cache': os.getenv('MESSAGE_CACHE_ENABLED', 'false').lower() == 'true',
+            'use_search_index': os.getenv('SEARCH_INDEX_ENABLED', 'false').lower() == 'true',
+            'imap_engine': os.getenv('IMAP_ENGINE', 'imaplib')
         }
         
         # 验证必需的配置（仅邮件相关）
@@ -39,7 +112,10 @@ class EmailSyncAction:
         missing_fields = [field for field in required_fields if not config[field]]
         if missing_fields:
             raise ValueError(f"缺少必需的环境变量: {', '.join(missing_fields)}")
-            
+        
+        if config['delta']:
+            config['incremental'] = True
+        self._apply_page_cursor(config)
         return config
     
     def validate_config(self, config):
@@ -47,6 +123,27 @@ class EmailSyncAction:
         # 设置默认值
         config.setdefault('email_provider', 'feishu')
         config.setdefault('email_count', 50)
+        config.setdefault('fetch_batch_size', 100)
+        config.setdefault('email_folder', 'INBOX')
+        config['email_folders'] = parse_folder_list(config.get('email_folders'))
+        config.setdefault('folder_concurrency', int(os.getenv('FOLDER_CONCURRENCY', '2')))
+        config.setdefault('incremental', False)
+        config.setdefault('delta', False)
+        # delta 同步在增量获取新邮件的基础上返回已同步邮件的标志变化和删除
+        if config['delta']:
+            config['incremental'] = True
+        config.setdefault('fetch_mode', 'full')
+        config.setdefault('attachment_mode', 'inline')
+        config.setdefault('search_filters', None)
+        config.setdefault('page_cursor', None)
+        config.setdefault('use_connection_pool', connection_pool_enabled())
+        # 缓存和搜索索引会把邮件内容写入本地磁盘，需显式开启
+        config.setdefault('use_message_cache', os.getenv('MESSAGE_CACHE_ENABLED', 'false').lower() == 'true')
+        config.setdefault('use_search_index', os.getenv('SEARCH_INDEX_ENABLED', 'false').lower() == 'true')
+        config.setdefault('imap_engine', os.getenv('IMAP_ENGINE', 'imaplib'))
+        
+        if config['imap_engine'] not in IMAP_ENGINES:
+            raise ValueError(f"不支持的IMAP引擎: {config['imap_engine']}. 支持的引擎: {list(IMAP_ENGINES)}")
         
         # 验证必需的配置（仅邮件相关）
         required_fields = ['email_username', 'email_password']
@@ -54,9 +151,23 @@ class EmailSyncAction:
         missing_fields = [field for field in required_fields if not config.get(field)]
         if missing_fields:
             raise ValueError(f"缺少必需的配置参数: {', '.join(missing_fields)}")
-            
+        
+        self._apply_page_cursor(config)
         return config
     
+    @staticmethod
+    def _apply_page_cursor(config):
+        """解析分页游标，游标中的文件夹覆盖 email_folder；游标无效或与其他参数冲突时抛出 ValueError"""
+        if not config.get('page_cursor'):
+            config['page_cursor'] = None
+            return
+        page = decode_page_cursor(config['page_cursor'])
+        if config.get('incremental'):
+            raise ValueError("分页游标不能与增量同步同时使用")
+        if config.get('email_folders'):
+            raise ValueError("分页游标不能与多文件夹同步同时使用")
+        config['email_folder'] = page['folder']
+    
     def log_message(self, level, message, details=None):
         """记录日志消息"""
         log_entry = {
@@ -72,35 +183,487 @@ class EmailSyncAction:
         if details:
             print(f"详情: {details}")
     
+    def _create_provider(self):
+        """创建邮箱提供商实例"""
+        return EmailProviderFactory.create_provider(
+            self.config['email_provider'],
+            self.config['email_username'],
+            self.config['email_password'],
+            fetch_batch_size=self.config['fetch_batch_size'],
+            attachment_mode=self.config['attachment_mode'],
+            message_cache=get_default_message_cache() if self.config['use_message_cache'] else None,
+            parse_pool=get_parse_pool(),
+            memory_lease=self.memory_lease
+        )
+    
     def get_emails_from_imap(self):
         """从IMAP服务器获取邮件"""
+        if self.config['email_folders']:
+            return self.get_emails_from_folders()
         try:
             self.log_message('INFO', f"开始连接 {self.config['email_provider']} 邮箱服务器")
             
             # 创建邮箱提供商实例
-            email_provider = EmailProviderFactory.create_provider(
-                self.config['email_provider'],
-                self.config['email_username'],
-                self.config['email_password']
-            )
-            
-            # 连接到邮箱服务器
-            email_provider.connect()
-            self.log_message('INFO', "邮箱服务器连接成功")
+            email_provider = self._create_provider()
+            
+            # 连接池的连接用完归还，直接连接用完断开（获取失败时也一样）
+            with self._session(email_provider):
+                pooled = '（连接池）' if self.config['use_connection_pool'] else ''
+                self.log_message('INFO', f"邮箱服务器连接成功{pooled}")
+                emails = self._fetch_emails(email_provider)
             
-            # 获取邮件
-            emails = email_provider.get_emails(count=self.config['email_count'])
             self.log_message('INFO', f"成功获取 {len(emails)} 封邮件")
+            return emails
             
-            # 断开连接
-            email_provider.disconnect()
+        except Exception as e:
+            self.log_message('ERROR', "获取邮件失败", str(e))
+            raise
+    
+    @contextmanager
+    def _session(self, email_provider):
+        """为提供商打开一个IMAP会话（连接池或直接连接），退出时归还或断开"""
+        if self.config['use_connection_pool']:
+            with get_connection_pool().connection(email_provider):
+                yield email_provider
+        else:
+            email_provider.open_imap()
+            try:
+                yield email_provider
+            finally:
+                email_provider.disconnect()
+    
+    def _plan_folders(self, statuses):
+        """根据各文件夹的 STATUS 决定需要获取的文件夹
+        
+        增量模式下，STATUS 与上次完整同步时记录的相同的文件夹直接跳过，不再 SELECT；
+        delta 模式下标志变化不改变 STATUS，不跳过
+        
+        Args:
+            statuses: {文件夹: STATUS结果或查询时的异常}
+        
+        Returns:
+            list: [(文件夹, get_emails参数)]，跳过和失败的文件夹记入 self.folder_results
+        """
+        plan = []
+        self.folder_results = []
+        for folder, status in statuses.items():
+            if isinstance(status, Exception):
+                self._finish_folder(folder, None, error=status)
+                continue
+            if self.config['incremental'] and not self.config['delta']:
+                if self.watermark_store is None:
+                    self.watermark_store = get_default_watermark_store()
+                watermark = self.watermark_store.get(self.config['email_provider'],
+                                                     self.config['email_username'], folder)
+                if watermark and watermark.get('status') and watermark['status'] == status:
+                    self.log_message('INFO', f"文件夹 {folder} 自上次同步后没有变化，跳过")
+                    self.folder_results.append({
+                        'folder': folder,
+                        'state': 'unchanged',
+                        'fetched': 0,
+                        'uidvalidity': watermark['uidvalidity'],
+                        'last_uid': watermark['last_uid']
+                    })
+                    continue
+            plan.append((folder, self._get_emails_kwargs(folder)))
+        return plan
+    
+    def _finish_folder(self, folder, status, emails=None, mailbox_state=None, changes=None, error=None):
+        """记录单个文件夹的获取结果并推进其水位线"""
+        if error is not None:
+            self.log_message('WARNING', f"获取文件夹 {folder} 失败", str(error))
+            self.folder_results.append({'folder': folder, 'state': 'failed', 'fetched': 0, 'error': str(error),
+                                        **_error_fields(error)})
+            return []
+        for email in emails:
+            email['folder'] = folder
+        self._index_folder(folder, mailbox_state, map(index_document, emails), changes)
+        self._save_watermark(folder, mailbox_state, status, changes)
+        self.folder_results.append(self._synced_folder_result(folder, len(emails), mailbox_state, changes))
+        return emails
+    
+    def _synced_folder_result(self, folder, fetched, mailbox_state, changes=None):
+        result = {
+            'folder': folder,
+            'state': 'synced',
+            'fetched': fetched,
+            'uidvalidity': mailbox_state['uidvalidity'] if mailbox_state else None,
+            'last_uid': mailbox_state['last_uid'] if mailbox_state else None
+        }
+        result.update(self._skipped_result(mailbox_state))
+        if changes is not None:
+            result['changes'] = changes
+        return result
+    
+    def _skipped_result(self, mailbox_state):
+        """内容缺失或解析失败而跳过的邮件UID（skipped_uids），以及超过大小上限或内存预算不足而只返回描述符的
+        邮件UID（omitted_uids），没有时不返回对应字段"""
+        result = {}
+        skipped = (mailbox_state or {}).get('skipped_uids')
+        if skipped:
+            self.log_message('WARNING', f"文件夹 {mailbox_state['folder']} 中 {len(skipped)} 封邮件解析失败，已跳过",
+                             str(skipped))
+            result['skipped_uids'] = skipped
+        omitted = (mailbox_state or {}).get('omitted_uids')
+        if omitted:
+            self.log_message('WARNING', f"文件夹 {mailbox_state['folder']} 中 {len(omitted)} 封邮件只返回了描述符，"
+                             f"附件内容请通过附件下载接口获取", str(omitted))
+            result['omitted_uids'] = omitted
+        return result
+    
+    def _merge_folder_emails(self, folder_emails):
+        """按日期合并各文件夹的邮件（最新的在前），文件夹结果按配置顺序排列"""
+        order = {folder: index for index, folder in enumerate(self._resolved_folders)}
+        self.folder_results.sort(key=lambda result: order.get(result['folder'], len(order)))
+        emails = [email for batch in folder_emails for email in batch]
+        emails.sort(key=_email_timestamp, reverse=True)
+        self.log_message('INFO', f"成功从 {len(folder_emails)} 个文件夹获取 {len(emails)} 封邮件")
+        return emails
+    
+    @staticmethod
+    def _folder_statuses(email_provider, folders):
+        """查询各文件夹的 STATUS，单个文件夹查询失败时以异常作为结果"""
+        statuses = {}
+        for folder in folders:
+            try:
+                statuses[folder] = email_provider.folder_status(folder)
+            except Exception as e:
+                statuses[folder] = e
+        return statuses
+    
+    def _fetch_folder(self, folder, kwargs):
+        """在独立会话中获取单个文件夹的邮件，返回 (邮件列表, 文件夹状态, delta 模式下的变化)"""
+        email_provider = self._create_provider()
+        with self._session(email_provider):
+            emails = list(email_provider.iter_emails(**kwargs))
+            changes = self._folder_changes(email_provider, folder, email_provider.mailbox_state)
+            return emails, email_provider.mailbox_state, changes
+    
+    def get_emails_from_folders(self):
+        """多文件夹获取：先用 STATUS 查询全部文件夹，
+        再以最多 folder_concurrency 个并行会话获取有变化的文件夹，结果按日期合并
+        
+        单个文件夹获取失败不影响其他文件夹，失败信息记录在结果的 folders 字段中
+        """
+        try:
+            self.log_message('INFO', f"开始连接 {self.config['email_provider']} 邮箱服务器（多文件夹）")
+            email_provider = self._create_provider()
+            with self._session(email_provider):
+                folders = email_provider.resolve_folders(self.config['email_folders'])
+                statuses = self._folder_statuses(email_provider, folders)
+            self._resolved_folders = folders
+            plan = self._plan_folders(statuses)
+            
+            folder_emails = []
+            if plan:
+                workers = min(max(1, int(self.config['folder_concurrency'])), len(plan))
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='folder-sync') as executor:
+                    futures = [(folder, executor.submit(self._fetch_folder, folder, kwargs))
+                               for folder, kwargs in plan]
+                    for folder, future in futures:
+                        try:
+                            emails, mailbox_state, changes = future.result()
+                        except Exception as e:
+                            self._finish_folder(folder, statuses[folder], error=e)
+                            continue
+                        folder_emails.append(self._finish_folder(folder, statuses[folder], emails, mailbox_state,
+                                                                 changes))
+            return self._merge_folder_emails(folder_emails)
+            
+        except Exception as e:
+            self.log_message('ERROR', "获取邮件失败", str(e))
+            raise
+    
+    async def get_emails_from_folders_async(self):
+        """多文件夹获取（asyncio引擎），行为同 get_emails_from_folders"""
+        try:
+            self.log_message('INFO', f"开始连接 {self.config['email_provider']} 邮箱服务器（多文件夹，asyncio）")
+            email_provider = AsyncEmailProvider(self._create_provider())
+            await email_provider.open()
+            try:
+                folders = await email_provider.resolve_folders(self.config['email_folders'])
+                statuses = {}
+                for folder in folders:
+                    try:
+                        statuses[folder] = await email_provider.folder_status(folder)
+                    except Exception as e:
+                        statuses[folder] = e
+            finally:
+                await email_provider.disconnect()
+            self._resolved_folders = folders
+            plan = self._plan_folders(statuses)
+            
+            semaphore = asyncio.Semaphore(max(1, int(self.config['folder_concurrency'])))
+            
+            async def fetch(folder, kwargs):
+                async with semaphore:
+                    folder_provider = AsyncEmailProvider(self._create_provider())
+                    await folder_provider.open()
+                    try:
+                        emails = [email async for email in folder_provider.iter_emails(**kwargs)]
+                        return emails, folder_provider.mailbox_state
+                    finally:
+                        await folder_provider.disconnect()
+            
+            outcomes = await asyncio.gather(*(fetch(folder, kwargs) for folder, kwargs in plan),
+                                            return_exceptions=True)
+            folder_emails = []
+            for (folder, _), outcome in zip(plan, outcomes):
+                if isinstance(outcome, Exception):
+                    self._finish_folder(folder, statuses[folder], error=outcome)
+                    continue
+                folder_emails.append(self._finish_folder(folder, statuses[folder], *outcome))
+            return self._merge_folder_emails(folder_emails)
             
+        except Exception as e:
+            self.log_message('ERROR', "获取邮件失败", str(e))
+            raise
+    
+    def iter_emails_from_imap(self):
+        """从IMAP服务器逐封获取邮件的生成器，获取失败时抛出异常
+        
+        配置了多个文件夹时在同一个会话中依次获取各文件夹（不按日期合并），跳过未变化的文件夹
+        """
+        self.log_message('INFO', f"开始连接 {self.config['email_provider']} 邮箱服务器")
+        email_provider = self._create_provider()
+        
+        if self.config['use_connection_pool']:
+            pool = get_connection_pool()
+            pool.acquire(email_provider)
+            self.log_message('INFO', "邮箱服务器连接成功（连接池）")
+        else:
+            email_provider.open_imap()
+            self.log_message('INFO', "邮箱服务器连接成功")
+        
+        broken = True
+        try:
+            count = 0
+            if self.config['email_folders']:
+                folders = email_provider.resolve_folders(self.config['email_folders'])
+                self._resolved_folders = folders
+                statuses = self._folder_statuses(email_provider, folders)
+                for folder, kwargs in self._plan_folders(statuses):
+                    fetched, documents = 0, []
+                    for email in email_provider.iter_emails(**kwargs):
+                        email['folder'] = folder
+                        fetched += 1
+                        if self.config['use_search_index']:
+                            documents.append(index_document(email))
+                        yield email
+                    count += fetched
+                    changes = self._folder_changes(email_provider, folder, email_provider.mailbox_state)
+                    self._index_folder(folder, email_provider.mailbox_state, documents, changes)
+                    self._save_watermark(folder, email_provider.mailbox_state, statuses[folder], changes)
+                    self.folder_results.append(
+                        self._synced_folder_result(folder, fetched, email_provider.mailbox_state, changes))
+            else:
+                folder = self.config['email_folder']
+                documents = []
+                for email in email_provider.iter_emails(**self._get_emails_kwargs(folder)):
+                    count += 1
+                    if self.config['use_search_index']:
+                        documents.append(index_document(email))
+                    yield email
+                self.mailbox_state = email_provider.mailbox_state
+                self._check_page_cursor(self.mailbox_state)
+                self.changes = self._folder_changes(email_provider, folder, self.mailbox_state)
+                self._index_folder(folder, self.mailbox_state, documents, self.changes)
+                self._save_watermark(folder, changes=self.changes)
+            self.log_message('INFO', f"成功获取 {count} 封邮件")
+            broken = False
+        finally:
+            if self.config['use_connection_pool']:
+                pool.release(email_provider, broken=broken)
+            else:
+                email_provider.disconnect()
+    
+    async def get_emails_from_imap_async(self):
+        """从IMAP服务器获取邮件（asyncio引擎）"""
+        if self.config['email_folders']:
+            return await self.get_emails_from_folders_async()
+        try:
+            self.log_message('INFO', f"开始连接 {self.config['email_provider']} 邮箱服务器（asyncio）")
+            email_provider = AsyncEmailProvider(self._create_provider())
+            await email_provider.open()
+            self.log_message('INFO', "邮箱服务器连接成功")
+            
+            try:
+                folder = self.config['email_folder']
+                emails = await email_provider.get_emails(**self._get_emails_kwargs(folder))
+                self.mailbox_state = email_provider.mailbox_state
+                self._check_page_cursor(self.mailbox_state)
+                self._index_folder(folder, self.mailbox_state, map(index_document, emails))
+                self._save_watermark(folder)
+            finally:
+                await email_provider.disconnect()
+            
+            self.log_message('INFO', f"成功获取 {len(emails)} 封邮件")
             return emails
             
         except Exception as e:
             self.log_message('ERROR', "获取邮件失败", str(e))
             raise
     
+    def _fetch_emails(self, email_provider):
+        """在已连接的提供商上获取邮件"""
+        folder = self.config['email_folder']
+        emails = email_provider.get_emails(**self._get_emails_kwargs(folder))
+        self.mailbox_state = email_provider.mailbox_state
+        self._check_page_cursor(self.mailbox_state)
+        self.changes = self._folder_changes(email_provider, folder, self.mailbox_state)
+        self._index_folder(folder, self.mailbox_state, map(index_document, emails), self.changes)
+        self._save_watermark(folder, changes=self.changes)
+        return emails
+    
+    def _get_emails_kwargs(self, folder):
+        """构造 get_emails/iter_emails 的参数，增量模式下带上UID水位线"""
+        kwargs = {
+            'folder': folder,
+            'count': self.config['email_count'],
+            'mode': self.config['fetch_mode'],
+            'filters': self.config['search_filters']
+        }
+        if self.config['page_cursor']:
+            page = decode_page_cursor(self.config['page_cursor'])
+            self.log_message('INFO', f"分页获取，UID小于 {page['before_uid']} 的邮件")
+            kwargs['before_uid'] = page['before_uid']
+            kwargs['uidvalidity'] = page['uidvalidity']
+            return kwargs
+        if not self.config['incremental']:
+            return kwargs
+        
+        if self.watermark_store is None:
+            self.watermark_store = get_default_watermark_store()
+        watermark = self.watermark_store.get(self.config['email_provider'], self.config['email_username'], folder)
+        if watermark:
+            self.log_message('INFO', f"增量获取，上次同步UID: {watermark['last_uid']}")
+            kwargs['since_uid'] = watermark['last_uid']
+            kwargs['uidvalidity'] = watermark['uidvalidity']
+        else:
+            self.log_message('INFO', "未找到同步水位线，执行首次全量获取")
+        return kwargs
+    
+    def _save_watermark(self, folder, mailbox_state=None, status=None, changes=None):
+        """增量模式下推进水位线（仅在获取成功后调用）
+        
+        status 为获取前的文件夹 STATUS，只有本次已取完全部新邮件时才记录，下次据此跳过未变化的文件夹；
+        changes 为 delta 模式下 _folder_changes 的结果，其中的变化检测状态与水位线一起保存（并从结果中移除）
+        """
+        mailbox_state = mailbox_state or self.mailbox_state
+        if not self.config['incremental'] or not mailbox_state:
+            return
+        self.watermark_store.set(
+            self.config['email_provider'],
+            self.config['email_username'],
+            folder,
+            mailbox_state['uidvalidity'],
+            mailbox_state['last_uid'],
+            status if status and not mailbox_state.get('has_more') else None
+        )
+        if changes is not None:
+            self.watermark_store.set_delta_state(self.config['email_provider'], self.config['email_username'],
+                                                 folder, changes.pop('state'))
+    
+    def _index_folder(self, folder, mailbox_state, documents, changes=None):
+        """将本次获取的邮件（index_document 的结果）写入本地搜索索引，delta 模式下同时移除已删除的邮件
+        
+        仅在获取成功后调用：此时凭据已通过服务器验证，同时记录凭据摘要供搜索接口验证；
+        写入索引失败只记录警告，不影响获取结果
+        """
+        if not self.config['use_search_index'] or not mailbox_state:
+            return
+        index = get_search_index()
+        if index is None:
+            return
+        provider = EmailProviderFactory.metrics_name(self.config['email_provider'])
+        username = self.config['email_username']
+        try:
+            if not self._index_authorized:
+                index.authorize(provider, username, self.config['email_password'])
+                self._index_authorized = True
+            index.add(provider, username, folder, mailbox_state['uidvalidity'], documents)
+            if changes:
+                index.remove(provider, username, folder, changes['vanished'])
+        except Exception as e:
+            self.log_message('WARNING', f"更新文件夹 {folder} 的搜索索引失败", str(e))
+    
+    def _folder_changes(self, email_provider, folder, mailbox_state):
+        """delta 模式下查询已同步邮件的标志变化和已删除的邮件，非 delta 模式返回 None
+        
+        在获取新邮件之后查询：获取完整邮件会给新邮件加上 \\Seen 标志，之后记录的状态已包含该变化，
+        下次不会把本服务自己造成的变化当作变化返回
+        """
+        if not self.config['delta'] or not mailbox_state:
+            return None
+        if self.watermark_store is None:
+            self.watermark_store = get_default_watermark_store()
+        state = self.watermark_store.get_delta_state(self.config['email_provider'], self.config['email_username'],
+                                                     folder)
+        changes = email_provider.get_changes(folder, state, mailbox_state['last_uid'])
+        self.log_message('INFO', f"文件夹 {folder} 的变化（{changes['method']}）: "
+                                 f"{len(changes['flags'])} 封邮件标志变化，{len(changes['vanished'])} 封已删除")
+        return changes
+    
+    def _check_page_cursor(self, mailbox_state):
+        """分页游标生成后文件夹的UIDVALIDITY发生变化时，游标中的UID已不再对应原来的邮件"""
+        if not self.config['page_cursor'] or not mailbox_state:
+            return
+        page = decode_page_cursor(self.config['page_cursor'])
+        if page['uidvalidity'] is not None and page['uidvalidity'] != mailbox_state['uidvalidity']:
+            raise ValueError("分页游标已失效（文件夹UIDVALIDITY已变化），请从第一页重新获取")
+    
+    def _process_email(self, email):
+        """整理单封邮件的输出字段"""
+        processed_email = {
+            'uid': email.get('uid'),
+            'subject': email.get('subject', ''),
+            'sender': email.get('sender', ''),
+            'date': email.get('date', ''),
+            'body': email.get('body', ''),
+            'has_attachments': email.get('has_attachments', False),
+            'attachments': email.get('attachments', [])  # 添加附件详细信息
+        }
+        if email.get('size') is not None:
+            processed_email['size'] = email['size']
+        if email.get('folder') is not None:
+            processed_email['folder'] = email['folder']
+        if email.get('content_omitted'):
+            processed_email['content_omitted'] = email['content_omitted']
+        # 因大小上限或内存预算未内嵌的附件内容通过附件下载接口按块获取
+        folder = quote(email.get('folder') or self.config['email_folder'], safe='')
+        for attachment in processed_email['attachments']:
+            if attachment.get('part') and (email.get('content_omitted') or attachment.get('content_omitted')):
+                attachment['download_url'] = f"/api/attachments/{email.get('uid')}/{attachment['part']}" \
+                                             f"?folder={folder}"
+        return processed_email
+    
+    def _mailbox_result(self):
+        """结果中的文件夹状态字段"""
+        if self.folder_results is not None:
+            return {
+                'incremental': self.config['incremental'],
+                'folders': self.folder_results
+            }
+        if not self.mailbox_state:
+            return {}
+        result = {
+            'incremental': self.config['incremental'],
+            'folder': self.mailbox_state['folder'],
+            'uidvalidity': self.mailbox_state['uidvalidity'],
+            'last_uid': self.mailbox_state['last_uid']
+        }
+        result.update(self._skipped_result(self.mailbox_state))
+        if self.changes is not None:
+            result['changes'] = self.changes
+        if not self.config['incremental']:
+            # 下一页（更早的邮件）的游标，没有更早的邮件时为 None
+            result['next_cursor'] = encode_page_cursor(
+                self.mailbox_state['folder'],
+                self.mailbox_state['uidvalidity'],
+                self.mailbox_state['oldest_uid']
+            ) if self.mailbox_state.get('has_older') else None
+        return result
+    
     def sync_emails(self, emails=None):
         """
         邮件获取主函数（已移除飞书同步功能）
@@ -111,6 +674,10 @@ class EmailSyncAction:
         Returns:
             dict: 包含获取结果的字典
         """
+        # delta 同步的变化查询只有 imaplib 实现
+        if emails is None and self.config['imap_engine'] == 'asyncio' and not self.config['delta']:
+            return asyncio.run(self.sync_emails_async())
+        
         try:
             self.log_message('INFO', "开始邮件获取操作")
             
@@ -118,43 +685,153 @@ class EmailSyncAction:
             if emails is None:
                 emails = self.get_emails_from_imap()
             
-            # 处理邮件数据
-            processed_emails = []
-            for email in emails:
+            result = self._build_result(emails)
+            self._record_sync('imaplib')
+            return result
+            
+        except Exception as e:
+            error_msg = f"邮件获取失败: {str(e)}"
+            self.log_message('ERROR', error_msg)
+            self._record_sync('imaplib', e)
+            return {
+                'success': False,
+                'error': error_msg,
+                **_error_fields(e),
+                'logs': self.sync_logs
+            }
+        finally:
+            self.memory_lease.close()
+    
+    async def sync_emails_async(self, emails=None):
+        """
+        邮件获取主函数的asyncio版本，返回值同 sync_emails
+        
+        多个账号的同步可以在同一个事件循环中并发执行，见 sync_accounts_async；
+        delta 同步在线程中使用 imaplib 引擎执行
+        """
+        if emails is None and self.config['delta']:
+            return await asyncio.to_thread(self.sync_emails)
+        try:
+            self.log_message('INFO', "开始邮件获取操作（asyncio）")
+            
+            if emails is None:
+                emails = await self.get_emails_from_imap_async()
+            
+            result = self._build_result(emails)
+            self._record_sync('asyncio')
+            return result
+            
+        except Exception as e:
+            error_msg = f"邮件获取失败: {str(e)}"
+            self.log_message('ERROR', error_msg)
+            self._record_sync('asyncio', e)
+            return {
+                'success': False,
+                'error': error_msg,
+                **_error_fields(e),
+                'logs': self.sync_logs
+            }
+        finally:
+            self.memory_lease.close()
+    
+    def _record_sync(self, engine, error=None):
+        """记录一次获取请求的结果；IMAP 各阶段的错误已在阶段内计数，这里只计整体失败"""
+        provider = EmailProviderFactory.metrics_name(self.config['email_provider'])
+        SYNCS.inc(provider=provider, engine=engine, result='failure' if error else 'success')
+        if error is not None:
+            ERRORS.inc(provider=provider, phase='sync', type=type(error).__name__)
+    
+    def _build_result(self, emails):
+        """处理邮件数据并构造同步结果"""
+        processed_emails = []
+        for email in emails:
+            try:
+                processed_emails.append(self._process_email(email))
+                
+            except Exception as e:
+                self.log_message('WARNING', f"处理邮件时出错: {str(e)}")
+                continue
+        
+        # 记录结果
+        result = {
+            'success': True,
+            'total_emails': len(processed_emails),
+            'emails': processed_emails,
+            'logs': self.sync_logs
+        }
+        result.update(self._mailbox_result())
+        
+        self.log_message('INFO', f"邮件获取完成，共处理 {len(processed_emails)} 封邮件")
+        return result
+    
+    def iter_sync_emails(self):
+        """
+        流式邮件获取：每获取并解析一封邮件立即返回，最后返回汇总信息
+        
+        Yields:
+            dict: {'type': 'email', 'email': {...}}，最后一条为
+                {'type': 'summary', 'success': ..., 'total_emails': ..., 'logs': [...]}
+        """
+        total = 0
+        try:
+            self.log_message('INFO', "开始流式邮件获取操作")
+            for email in self.iter_emails_from_imap():
                 try:
-                    processed_email = {
-                        'subject': email.get('subject', ''),
-                        'sender': email.get('sender', ''),
-                        'date': email.get('date', ''),
-                        'body': email.get('body', ''),
-                        'has_attachments': email.get('has_attachments', False),
-                        'attachments': email.get('attachments', [])  # 添加附件详细信息
-                    }
-                    processed_emails.append(processed_email)
-                    
+                    processed_email = self._process_email(email)
                 except Exception as e:
                     self.log_message('WARNING', f"处理邮件时出错: {str(e)}")
                     continue
+                total += 1
+                yield {'type': 'email', 'email': processed_email}
             
-            # 记录结果
-            result = {
+            self.log_message('INFO', f"邮件获取完成，共处理 {total} 封邮件")
+            summary = {
+                'type': 'summary',
                 'success': True,
-                'total_emails': len(processed_emails),
-                'emails': processed_emails,
+                'total_emails': total,
                 'logs': self.sync_logs
             }
-            
-            self.log_message('INFO', f"邮件获取完成，共处理 {len(processed_emails)} 封邮件")
-            return result
+            summary.update(self._mailbox_result())
+            self._record_sync('stream')
+            yield summary
             
         except Exception as e:
             error_msg = f"邮件获取失败: {str(e)}"
             self.log_message('ERROR', error_msg)
-            return {
+            self._record_sync('stream', e)
+            yield {
+                'type': 'summary',
                 'success': False,
                 'error': error_msg,
+                **_error_fields(e),
+                'total_emails': total,
                 'logs': self.sync_logs
             }
+        finally:
+            self.memory_lease.close()
+
+async def sync_accounts_async(configs, max_concurrency=100):
+    """
+    在同一个事件循环中并发同步多个账号（asyncio引擎）
+    
+    Args:
+        configs: 账号配置列表，格式同 EmailSyncAction 的 config
+        max_concurrency: 同时进行的IMAP会话上限
+        
+    Returns:
+        list: 与 configs 顺序一致的同步结果
+    """
+    semaphore = asyncio.Semaphore(max(1, int(max_concurrency)))
+    
+    async def run(config):
+        async with semaphore:
+            try:
+                syncer = EmailSyncAction(dict(config, imap_engine='asyncio'))
+            except ValueError as e:
+                return {'success': False, 'error': str(e), 'logs': []}
+            return await syncer.sync_emails_async()
+    
+    return await asyncio.gather(*(run(config) for config in configs))
 
 def main():
     """主函数"""
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""IMAP协议辅助工具
+包含消息集合（message set）构造、FETCH响应解析、ENVELOPE/BODYSTRUCTURE结构解析以及SEARCH条件编译，
+供各邮箱提供商复用
+"""
+
+import re
+import json
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, Union
+
+# 词法单元类型
+_LPAREN = 'LPAREN'
+_RPAREN = 'RPAREN'
+_ATOM = 'ATOM'
+_STRING = 'STRING'
+
+# imaplib 在带字面量（literal）的响应行末尾保留了 {size} 标记
+_LITERAL_MARKER_RE = re.compile(rb'\{\d+\+?\}\s*$')
+
+
+def build_message_sets(ids: Iterable[Union[bytes, str, int]], chunk_size: int) -> List[str]:
+    """将消息ID列表按块大小切分，并压缩为IMAP消息集合字符串
+
+    例如 [1, 2, 3, 5, 7, 8] -> ['1:3,5,7:8']
+    """
+    numbers = [int(i) for i in ids]
+    chunk_size = max(1, int(chunk_size))
+
+    message_sets = []
+    for start in range(0, len(numbers), chunk_size):
+        chunk = sorted(set(numbers[start:start + chunk_size]))
+        ranges = []
+        run_start = run_end = chunk[0]
+        for number in chunk[1:]:
+            if number == run_end + 1:
+                run_end = number
+                continue
+            ranges.append(_format_range(run_start, run_end))
+            run_start = run_end = number
+        ranges.append(_format_range(run_start, run_end))
+        message_sets.append(','.join(ranges))
+    return message_sets
+
+
+def _format_range(start: int, end: int) -> str:
+    return str(start) if start == end else f"{start}:{end}"
+
+
+def compact_uid_set(uids: Iterable[int]) -> str:
+    """将UID集合压缩为一个消息集合字符串（空集合为空字符串），用于保存UID快照"""
+    uids = list(uids)
+    return build_message_sets(uids, len(uids))[0] if uids else ''
+
+
+def expand_uid_set(spec: Union[bytes, str, None]) -> List[int]:
+    """展开不含 * 的消息集合，如 '1:3,7' -> [1, 2, 3, 7]"""
+    uids = []
+    for item in imap_text(spec).split(','):
+        item = item.strip()
+        if not item:
+            continue
+        start, _, end = item.partition(':')
+        low, high = sorted((int(start), int(end or start)))
+        uids.extend(range(low, high + 1))
+    return uids
+
+
+def parse_vanished_response(data: Iterable[Any]) -> List[int]:
+    """解析 QRESYNC 的 VANISHED 响应，如 b'(EARLIER) 41,43:45' -> [41, 43, 44, 45]"""
+    uids = set()
+    for item in data or []:
+        if not item:
+            continue
+        text = imap_text(item).strip()
+        if text.upper().startswith('(EARLIER)'):
+            text = text[len('(EARLIER)'):]
+        uids.update(expand_uid_set(text))
+    return sorted(uids)
+
+
+def _scan(buf: bytes) -> Iterator[Tuple[str, Any]]:
+    """将一段响应文本切分为词法单元"""
+    i = 0
+    n = len(buf)
+    while i < n:
+        ch = buf[i]
+        if ch in b' \t\r\n':
+            i += 1
+        elif ch == 0x28:  # (
+            yield (_LPAREN, None)
+            i += 1
+        elif ch == 0x29:  # )
+            yield (_RPAREN, None)
+            i += 1
+        elif ch == 0x22:  # "
+            i += 1
+            value = bytearray()
+            while i < n and buf[i] != 0x22:
+                if buf[i] == 0x5C and i + 1 < n:  # 反斜杠转义
+                    i += 1
+                value.append(buf[i])
+                i += 1
+            i += 1
+            yield (_STRING, bytes(value))
+        else:
+            # 原子（atom），允许包含 [...] 段，如 BODY[HEADER.FIELDS (FROM)]<0>
+            j = i
+            depth = 0
+            while j < n:
+                c = buf[j]
+                if c == 0x5B:
+                    depth += 1
+                elif c == 0x5D:
+                    depth -= 1
+                elif depth <= 0 and c in b' \t\r\n()"':
+                    break
+                j += 1
+            atom = buf[i:j].decode('ascii', errors='replace')
+            i = j
+            if atom.upper() == 'NIL':
+                yield (_ATOM, None)
+            elif atom.isdigit():
+                yield (_ATOM, int(atom))
+            else:
+                yield (_ATOM, atom)
+
+
+def _tokenize(data: Iterable[Any]) -> Iterator[Tuple[str, Any]]:
+    """将imaplib返回的响应数据（bytes与(头部, 字面量)元组混合）转换为词法单元流"""
+    for item in data:
+        if item is None:
+            continue
+        if isinstance(item, tuple):
+            head, literal = item[0], item[1]
+            yield from _scan(_LITERAL_MARKER_RE.sub(b'', head))
+            yield (_STRING, literal)
+        else:
+            yield from _scan(item)
+
+
+def _parse_list(tokens: List[Tuple[str, Any]], pos: int) -> Tuple[List[Any], int]:
+    """从左括号处开始解析一个括号列表，返回(列表, 结束位置)"""
+    result = []
+    pos += 1  # 跳过左括号
+    while pos < len(tokens):
+        kind, value = tokens[pos]
+        if kind == _RPAREN:
+            return result, pos + 1
+        if kind == _LPAREN:
+            value, pos = _parse_list(tokens, pos)
+            result.append(value)
+            continue
+        result.append(value)
+        pos += 1
+    return result, pos
+
+
+def parse_imap_list(data: Iterable[Any]) -> List[Any]:
+    """解析任意IMAP响应为嵌套列表（字符串为bytes，原子为str/int，NIL为None）"""
+    tokens = list(_tokenize(data))
+    result = []
+    pos = 0
+    while pos < len(tokens):
+        kind, value = tokens[pos]
+        if kind == _LPAREN:
+            value, pos = _parse_list(tokens, pos)
+            result.append(value)
+            continue
+        if kind != _RPAREN:
+            result.append(value)
+        pos += 1
+    return result
+
+
+def parse_fetch_response(data: Iterable[Any]) -> List[Dict[str, Any]]:
+    """解析FETCH命令的多消息响应
+
+    每条消息返回一个字典，'seq' 为消息序号，其余键为大写的数据项名称，
+    例如 {'seq': 3, 'UID': 120, 'RFC822': b'...', 'FLAGS': ['\\\\Seen']}
+    """
+    tokens = list(_tokenize(data))
+    responses = []
+    pos = 0
+    while pos < len(tokens):
+        kind, value = tokens[pos]
+        if kind == _ATOM and isinstance(value, int) and pos + 1 < len(tokens) \
+                and tokens[pos + 1][0] == _LPAREN:
+            items, pos = _parse_list(tokens, pos + 1)
+            response = {'seq': value}
+            for index in range(0, len(items) - 1, 2):
+                key = items[index]
+                if isinstance(key, str):
+                    response[key.upper()] = items[index + 1]
+            responses.append(response)
+            continue
+        pos += 1
+    return responses
+
+
+def imap_text(value: Any) -> str:
+    """将IMAP字符串值（bytes/str/None）转换为str"""
+    if value is None:
+        return ''
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
+
+
+def _params_to_dict(params: Any) -> Dict[str, str]:
+    """将 ("name" "value" ...) 形式的参数列表转换为字典（键为小写）"""
+    if not isinstance(params, list):
+        return {}
+    return {imap_text(params[i]).lower(): imap_text(params[i + 1]) for i in range(0, len(params) - 1, 2)}
+
+
+def is_multipart_structure(bodystructure: Any) -> bool:
+    return isinstance(bodystructure, list) and bool(bodystructure) and isinstance(bodystructure[0], list)
+
+
+def multipart_info(bodystructure: List[Any]) -> Tuple[str, Dict[str, str]]:
+    """返回multipart结构的 (子类型, 参数)"""
+    subtype = ''
+    params = {}
+    for index, item in enumerate(bodystructure):
+        if not isinstance(item, list):
+            subtype = imap_text(item).lower()
+            if index + 1 < len(bodystructure):
+                params = _params_to_dict(bodystructure[index + 1])
+            break
+    return subtype, params
+
+
+def describe_body_part(part: List[Any]) -> Dict[str, Any]:
+    """解析BODYSTRUCTURE中单个非multipart部件"""
+    maintype = imap_text(part[0]).lower()
+    subtype = imap_text(part[1]).lower()
+    # 扩展字段的位置取决于部件类型：text 多一个行数，message/rfc822 多信封、结构和行数
+    if maintype == 'text':
+        extension = 8
+    elif (maintype, subtype) == ('message', 'rfc822'):
+        extension = 10
+    else:
+        extension = 7
+    disposition = None
+    disposition_params = {}
+    if len(part) > extension + 1 and isinstance(part[extension + 1], list) and part[extension + 1]:
+        disp = part[extension + 1]
+        disposition = imap_text(disp[0]).lower()
+        disposition_params = _params_to_dict(disp[1] if len(disp) > 1 else None)
+    return {
+        'content_type': f'{maintype}/{subtype}',
+        'params': _params_to_dict(part[2]) if len(part) > 2 else {},
+        'encoding': imap_text(part[5]).lower() if len(part) > 5 else '',
+        'size': part[6] if len(part) > 6 and isinstance(part[6], int) else 0,
+        'disposition': disposition,
+        'disposition_params': disposition_params,
+    }
+
+
+def iter_body_parts(bodystructure: List[Any], prefix: str = '') -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """遍历BODYSTRUCTURE中的叶子部件，返回 (IMAP部件路径, 部件信息)
+
+    部件路径即 BODY[...] 中使用的编号，如 '1'、'2.1'
+    """
+    if is_multipart_structure(bodystructure):
+        index = 0
+        for child in bodystructure:
+            if not isinstance(child, list):
+                break
+            index += 1
+            yield from iter_body_parts(child, f'{prefix}.{index}' if prefix else str(index))
+        return
+    yield prefix or '1', describe_body_part(bodystructure)
+
+
+def envelope_addresses(addresses: Any) -> List[Tuple[bytes, str]]:
+    """将ENVELOPE中的地址列表转换为 [(名称, 邮箱地址)]，名称保持原始bytes以便MIME解码"""
+    result = []
+    if not isinstance(addresses, list):
+        return result
+    for address in addresses:
+        if not isinstance(address, list) or len(address) < 4:
+            continue
+        name, _, mailbox, host = address[:4]
+        if mailbox is None or host is None:
+            continue  # 组语法的起止标记
+        result.append((name or b'', f'{imap_text(mailbox)}@{imap_text(host)}'))
+    return result
+
+
+# 支持的搜索条件：since/before 为 YYYY-MM-DD 日期，from/to/subject 为字符串，
+# unseen/flagged 为布尔值，larger 为字节数
+SEARCH_FILTERS = ('since', 'before', 'from', 'to', 'subject', 'unseen', 'flagged', 'larger')
+
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def normalize_search_filters(filters: Any) -> Dict[str, Any]:
+    """校验并规范化搜索条件，忽略空值；条件不合法时抛出 ValueError"""
+    if not filters:
+        return {}
+    if not isinstance(filters, dict):
+        raise ValueError("filters 必须是对象")
+    unknown = [key for key in filters if key not in SEARCH_FILTERS]
+    if unknown:
+        raise ValueError(f"不支持的搜索条件: {', '.join(unknown)}. 支持的条件: {list(SEARCH_FILTERS)}")
+
+    normalized = {}
+    for key in ('since', 'before'):
+        if filters.get(key):
+            try:
+                normalized[key] = datetime.strptime(str(filters[key])[:10], '%Y-%m-%d').date()
+            except ValueError:
+                raise ValueError(f"{key} 日期格式应为 YYYY-MM-DD: {filters[key]}")
+    for key in ('from', 'to', 'subject'):
+        if filters.get(key):
+            normalized[key] = str(filters[key])
+    for key in ('unseen', 'flagged'):
+        if filters.get(key) is not None and str(filters[key]).lower() in ('true', '1'):
+            normalized[key] = True
+    if filters.get('larger') not in (None, ''):
+        try:
+            normalized['larger'] = int(filters['larger'])
+        except (TypeError, ValueError):
+            raise ValueError(f"larger 应为字节数: {filters['larger']}")
+        if normalized['larger'] < 0:
+            raise ValueError(f"larger 不能为负数: {filters['larger']}")
+    return normalized
+
+
+def imap_quote(value: str) -> str:
+    """IMAP quoted string"""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def imap_date(value) -> str:
+    """IMAP SEARCH 日期格式（如 01-May-2024），不受系统区域设置影响"""
+    return f'{value.day:02d}-{_MONTHS[value.month - 1]}-{value.year}'
+
+
+def build_search_criteria(filters: Dict[str, Any]) -> List[Tuple[List[str], Any]]:
+    """将规范化后的搜索条件编译为一组 SEARCH 命令参数，返回 [(条件列表, 字面量或None), ...]
+
+    ASCII 条件合并为一条命令；非ASCII字符串需要以 UTF-8 字面量发送，
+    而每条命令只能携带一个字面量，因此每个非ASCII条件单独一条命令，结果取交集
+    """
+    criteria = []
+    literals = []
+    if filters.get('since'):
+        criteria += ['SINCE', imap_date(filters['since'])]
+    if filters.get('before'):
+        criteria += ['BEFORE', imap_date(filters['before'])]
+    for key in ('from', 'to', 'subject'):
+        value = filters.get(key)
+        if not value:
+            continue
+        if value.isascii():
+            criteria += [key.upper(), imap_quote(value)]
+        else:
+            literals.append(([key.upper()], value.encode('utf-8')))
+    if filters.get('unseen'):
+        criteria.append('UNSEEN')
+    if filters.get('flagged'):
+        criteria.append('FLAGGED')
+    if filters.get('larger') is not None:
+        criteria += ['LARGER', str(filters['larger'])]
+
+    searches = [(criteria, None)] if criteria or not literals else []
+    return searches + literals
+
+
+def build_gmail_raw_query(filters: Dict[str, Any]) -> str:
+    """将规范化后的搜索条件编译为 Gmail 搜索语法（用于 X-GM-RAW）"""
+    terms = []
+    if filters.get('since'):
+        terms.append(f"after:{filters['since'].strftime('%Y/%m/%d')}")
+    if filters.get('before'):
+        terms.append(f"before:{filters['before'].strftime('%Y/%m/%d')}")
+    for key in ('from', 'to', 'subject'):
+        if filters.get(key):
+            terms.append(f'{key}:"{filters[key].replace(chr(34), " ")}"')
+    if filters.get('unseen'):
+        terms.append('is:unread')
+    if filters.get('flagged'):
+        terms.append('is:starred')
+    if filters.get('larger') is not None:
+        terms.append(f"larger:{filters['larger']}")
+    return ' '.join(terms)
+
+
+# RFC 6154 特殊用途文件夹标记，可代替文件夹名使用（如 \Sent 表示已发送）
+SPECIAL_USE_FLAGS = ('\\All', '\\Archive', '\\Drafts', '\\Flagged', '\\Junk', '\\Sent', '\\Trash')
+
+
+def encode_imap_utf7(name: str) -> str:
+    """将文件夹名编码为IMAP修改版UTF-7（RFC 3501 5.1.3），如 "已发送" -> "&XfJT0ZAB-" """
+    result = []
+    pending = []
+
+    def flush():
+        if pending:
+            encoded = base64.b64encode(''.join(pending).encode('utf-16-be')).rstrip(b'=')
+            result.append('&' + encoded.decode('ascii').replace('/', ',') + '-')
+            pending.clear()
+
+    for char in name:
+        if 0x20 <= ord(char) <= 0x7e:
+            flush()
+            result.append('&-' if char == '&' else char)
+        else:
+            pending.append(char)
+    flush()
+    return ''.join(result)
+
+
+def decode_imap_utf7(name: Union[bytes, str]) -> str:
+    """解码IMAP修改版UTF-7文件夹名"""
+    name = imap_text(name)
+    if '&' not in name:
+        return name
+    result = []
+    pos = 0
+    while pos < len(name):
+        start = name.find('&', pos)
+        if start == -1:
+            result.append(name[pos:])
+            break
+        result.append(name[pos:start])
+        end = name.find('-', start)
+        if end == -1:
+            result.append(name[start:])
+            break
+        chunk = name[start + 1:end]
+        if not chunk:
+            result.append('&')
+        else:
+            data = chunk.replace(',', '/')
+            result.append(base64.b64decode(data + '=' * (-len(data) % 4)).decode('utf-16-be', errors='replace'))
+        pos = end + 1
+    return ''.join(result)
+
+
+def parse_list_response(data: Iterable[Any]) -> List[Dict[str, Any]]:
+    """解析 LIST 响应，返回 [{'name': 文件夹名（已解码）, 'delimiter': 分隔符, 'flags': [标记]}]"""
+    folders = []
+    for item in data or []:
+        if item is None:
+            continue
+        try:
+            parsed = parse_imap_list([item])
+        except Exception:
+            continue
+        if len(parsed) < 3:
+            continue
+        flags, delimiter, name = parsed[0], parsed[1], parsed[2]
+        folders.append({
+            'name': decode_imap_utf7(name),
+            'delimiter': imap_text(delimiter) or None,
+            'flags': [imap_text(flag) for flag in flags] if isinstance(flags, list) else []
+        })
+    return folders
+
+
+def parse_status_response(data: Iterable[Any]) -> Dict[str, int]:
+    """解析 STATUS 响应，如 '"INBOX" (MESSAGES 3 UIDNEXT 4)' -> {'messages': 3, 'uidnext': 4}"""
+    status = {}
+    for item in data or []:
+        if item is None:
+            continue
+        parsed = parse_imap_list([item])
+        values = next((value for value in parsed if isinstance(value, list)), [])
+        for key, value in zip(values[::2], values[1::2]):
+            status[imap_text(key).lower()] = int(imap_text(value))
+    return status
+
+
+def encode_page_cursor(folder: str, uidvalidity: Any, before_uid: int) -> str:
+    """生成分页游标：文件夹、UIDVALIDITY 和下一页的UID上界（不含），编码为URL安全的字符串"""
+    payload = json.dumps({'f': folder, 'v': uidvalidity, 'u': int(before_uid)},
+                         ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_page_cursor(cursor: str) -> Dict[str, Any]:
+    """解析分页游标，返回 {'folder', 'uidvalidity', 'before_uid'}；游标无效时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(str(cursor) + '=' * (-len(str(cursor)) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+        folder, uidvalidity, before_uid = payload['f'], payload['v'], int(payload['u'])
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError):
+        raise ValueError(f"无效的分页游标: {cursor}")
+    if not isinstance(folder, str) or before_uid < 1 or (uidvalidity is not None and not isinstance(uidvalidity, int)):
+        raise ValueError(f"无效的分页游标: {cursor}")
+    return {'folder': folder, 'uidvalidity': uidvalidity, 'before_uid': before_uid}
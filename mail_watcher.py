@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""新邮件推送
+为每个（邮箱类型, 账号, 文件夹）维持一个长连接：服务器支持 IDLE 时等待服务器推送 EXISTS，
+不支持时以自适应间隔发送 NOOP；发现新邮件后按UID增量获取邮件摘要（envelope模式），
+作为事件分发给 SSE 订阅者和已注册的 webhook。
+没有订阅者和 webhook 的监听在 WATCH_IDLE_GRACE 秒后自动关闭
+"""
+
+import os
+import re
+import ssl
+import hmac
+import json
+import time
+import queue
+import select
+import socket
+import hashlib
+import ipaddress
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+from email_providers import EmailProviderFactory
+from resilience import AuthenticationError
+
+logger = logging.getLogger(__name__)
+
+# 每次 IDLE 的最长时间（秒），RFC 2177 要求客户端在29分钟内重新发送 IDLE
+WATCH_IDLE_TIMEOUT = float(os.getenv('WATCH_IDLE_TIMEOUT', '1500'))
+# 不支持 IDLE 时 NOOP 轮询的最短/最长间隔（秒），没有新邮件时逐步拉长
+WATCH_POLL_MIN_INTERVAL = float(os.getenv('WATCH_POLL_MIN_INTERVAL', '5'))
+WATCH_POLL_MAX_INTERVAL = float(os.getenv('WATCH_POLL_MAX_INTERVAL', '120'))
+# 没有订阅者和 webhook 后保留监听的时间（秒）
+WATCH_IDLE_GRACE = float(os.getenv('WATCH_IDLE_GRACE', '60'))
+# 每个进程最多同时监听的文件夹数
+WATCH_MAX_WATCHERS = int(os.getenv('WATCH_MAX_WATCHERS', '100'))
+# 单个事件最多包含的邮件数，更多的新邮件拆分为多个事件
+WATCH_MAX_EVENT_EMAILS = int(os.getenv('WATCH_MAX_EVENT_EMAILS', '50'))
+# 每个 SSE 订阅者缓存的事件数，消费过慢时丢弃新事件（事件 id 不连续即表示有丢失）
+WATCH_QUEUE_SIZE = int(os.getenv('WATCH_QUEUE_SIZE', '100'))
+WATCH_WEBHOOK_TIMEOUT = float(os.getenv('WATCH_WEBHOOK_TIMEOUT', '10'))
+# 设置后 webhook 请求带 X-Email-Watch-Signature: sha256=<HMAC-SHA256(请求体)>
+WATCH_WEBHOOK_SECRET = os.getenv('WATCH_WEBHOOK_SECRET', '')
+# 允许的 webhook 主机（逗号分隔）；为空时允许任意公网主机，拒绝解析到内网、回环、链路本地等地址的主机
+WATCH_WEBHOOK_ALLOWED_HOSTS = {host.strip().lower() for host in os.getenv('WATCH_WEBHOOK_ALLOWED_HOSTS', '').split(',')
+                               if host.strip()}
+# 连接断开后重连的最长等待时间（秒）
+WATCH_RECONNECT_MAX_DELAY = 300
+
+_EXISTS_RE = re.compile(rb'^\* \d+ EXISTS', re.I)
+
+
+class WatchLimitError(RuntimeError):
+    """监听数已达上限"""
+
+
+def check_webhook_url(url: str):
+    """校验 webhook 地址，不允许时抛出 ValueError
+
+    设置 WATCH_WEBHOOK_ALLOWED_HOSTS 时只允许列出的主机；否则要求主机的所有解析地址都是公网地址，
+    防止借 webhook 访问服务所在网络的内部服务。推送时会重新校验，注册后解析结果变化也不会绕过
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError('url 必须是 http:// 或 https:// 地址')
+    host = parts.hostname.lower()
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    if WATCH_WEBHOOK_ALLOWED_HOSTS:
+        if host not in WATCH_WEBHOOK_ALLOWED_HOSTS:
+            raise ValueError(f"webhook 主机 {host} 不在 WATCH_WEBHOOK_ALLOWED_HOSTS 中")
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except socket.gaierror as e:
+        raise ValueError(f"无法解析 webhook 主机 {host}: {str(e)}")
+    for value in addresses:
+        address = ipaddress.ip_address(value.split('%')[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise ValueError(f"webhook 主机 {host} 解析到非公网地址 {address}")
+
+
+class MailboxWatcher:
+    """单个文件夹的新邮件监听
+
+    Args:
+        provider: 邮箱提供商实例（每个监听独占一个IMAP连接）
+        folder: 监听的文件夹
+        hub: 所属的 MailWatchHub，负责事件分发和监听的回收
+    """
+
+    def __init__(self, provider, folder: str, hub: 'MailWatchHub'):
+        self.provider = provider
+        self.folder = folder
+        self.hub = hub
+        self.key = hub.make_key(provider.__class__.__name__, provider.username, folder)
+        self.subscribers = set()
+        self.webhooks = set()
+        self.mode = None  # idle 或 poll
+        self.uidvalidity = None
+        self.last_uid = None
+        self._exists = None  # 最近一次得知的文件夹邮件数
+        self.stopping = threading.Event()
+        self._thread = None
+        self._sequence = 0
+        self._unused_since = time.monotonic()
+        self._stats = {'events': 0, 'checks': 0, 'reconnects': 0, 'dropped_events': 0}
+        self.started_at = time.time()
+
+    # ---- 生命周期 ----
+
+    def start(self):
+        """在当前线程完成首次连接（凭据错误等直接抛出异常），再启动后台监听线程"""
+        try:
+            self._connect()
+        except Exception:
+            # 登录成功但选择文件夹失败时连接已经建立
+            self._disconnect()
+            raise
+        self._thread = threading.Thread(target=self._run, name=f'mail-watch-{self.provider.username}',
+                                        daemon=True)
+        self._thread.start()
+        logger.info(f"开始监听 {self.provider.username} 的文件夹 {self.folder}（{self.mode}）")
+
+    def stop(self):
+        self.stopping.set()
+
+    def is_alive(self) -> bool:
+        return not self.stopping.is_set() and self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        delay = 1
+        try:
+            while not self.stopping.is_set():
+                try:
+                    self._watch()
+                except Exception as e:
+                    if self.stopping.is_set():
+                        break
+                    logger.warning(f"监听 {self.provider.username}/{self.folder} 出错，{delay} 秒后重连: {str(e)}")
+                    self._publish('error', {'error': str(e), 'retry_in': delay})
+                    self._disconnect()
+                    if self.stopping.wait(delay):
+                        break
+                    delay = min(delay * 2, WATCH_RECONNECT_MAX_DELAY)
+                    try:
+                        self._connect()
+                        self._stats['reconnects'] += 1
+                        delay = 1
+                        # 断线期间到达的邮件
+                        self._check_new()
+                    except AuthenticationError as e:
+                        # 密码已修改或授权码失效，重连不会成功
+                        logger.warning(f"重连 {self.provider.username} 认证失败，停止监听: {str(e)}")
+                        self._publish('error', {'error': str(e), 'retry_in': None, 'fatal': True})
+                        break
+                    except Exception as e:
+                        logger.warning(f"重连 {self.provider.username} 失败: {str(e)}")
+                        # 服务器熔断中时至少等到熔断恢复
+                        delay = max(delay, getattr(e, 'retry_after', None) or 0)
+        finally:
+            self._disconnect()
+            self.hub._remove(self)
+            logger.info(f"停止监听 {self.provider.username} 的文件夹 {self.folder}")
+
+    def _connect(self):
+        """连接、选择文件夹并确定基准UID；UIDVALIDITY未变化时保留原基准，断线期间的邮件不会遗漏"""
+        provider = self.provider
+        provider.open_imap()
+        client = provider.imap_client
+        typ, data = client.capability()
+        capabilities = b' '.join(d for d in data if isinstance(d, bytes)).upper().split() if typ == 'OK' else []
+        self.mode = 'idle' if b'IDLE' in capabilities else 'poll'
+
+        uidvalidity = provider._select_folder(self.folder)
+        self._exists = self._take_exists()
+        if self.last_uid is None or uidvalidity != self.uidvalidity:
+            _, values = client.response('UIDNEXT')
+            if values and values[-1]:
+                last_uid = int(values[-1]) - 1
+            else:
+                typ, data = client.uid('SEARCH', None, 'ALL')
+                uids = (data[0] or b'').split() if typ == 'OK' and data else []
+                last_uid = int(uids[-1]) if uids else 0
+            if self.uidvalidity is not None and uidvalidity != self.uidvalidity:
+                self._publish('reset', {'uidvalidity': uidvalidity, 'last_uid': last_uid})
+            self.uidvalidity, self.last_uid = uidvalidity, last_uid
+
+    def _disconnect(self):
+        try:
+            self.provider.disconnect()
+        except Exception:
+            pass
+        self.provider.imap_client = None
+
+    # ---- 监听 ----
+
+    def _watch(self):
+        interval = WATCH_POLL_MIN_INTERVAL
+        while not self.stopping.is_set():
+            if self.hub._stop_if_unused(self):
+                return
+            if self.mode == 'idle':
+                changed = self._idle(WATCH_IDLE_TIMEOUT)
+            else:
+                changed = self._poll(interval)
+                # 有新邮件时恢复最短间隔，否则逐步拉长
+                interval = WATCH_POLL_MIN_INTERVAL if changed else min(interval * 1.5, WATCH_POLL_MAX_INTERVAL)
+            if changed:
+                self._check_new()
+
+    def _idle(self, timeout: float) -> bool:
+        """发送 IDLE 并等待服务器推送，收到 EXISTS、超时或需要停止时发送 DONE 结束，返回是否有新邮件"""
+        client = self.provider.imap_client
+        tag = client._new_tag()
+        client.send(tag + b' IDLE\r\n')
+        line = client.readline()
+        if line.startswith(tag + b' '):
+            # 声明了 IDLE 但实际不支持，改为 NOOP 轮询
+            client.tagged_commands.pop(tag, None)
+            logger.warning(f"服务器拒绝 IDLE，改为轮询: {line!r}")
+            self.mode = 'poll'
+            return False
+        if not line.startswith(b'+'):
+            raise RuntimeError(f"IDLE 未收到继续响应: {line!r}")
+
+        changed = False
+        deadline = time.monotonic() + timeout
+        while not changed and not self.stopping.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self.hub._unused_expired(self):
+                break
+            if self._readable(client, min(1.0, remaining)):
+                line = client.readline()
+                if not line or line.startswith(b'* BYE'):
+                    raise ConnectionError("IMAP服务器关闭了连接")
+                changed = bool(_EXISTS_RE.match(line))
+
+        client.send(b'DONE\r\n')
+        while True:
+            line = client.readline()
+            if not line:
+                raise ConnectionError("IMAP服务器关闭了连接")
+            if line.startswith(tag + b' '):
+                client.tagged_commands.pop(tag, None)
+                if not line[len(tag) + 1:].upper().startswith(b'OK'):
+                    raise RuntimeError(f"IDLE 失败: {line!r}")
+                return changed
+            changed = changed or bool(_EXISTS_RE.match(line))
+
+    @staticmethod
+    def _readable(client, timeout: float) -> bool:
+        """连接上是否有可读数据（包括已读入缓冲区和SSL层的数据）"""
+        sock = client.sock
+        previous = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            if client.file.peek(1):
+                return True
+        except (BlockingIOError, ssl.SSLWantReadError):
+            pass
+        finally:
+            sock.settimeout(previous)
+        readable, _, _ = select.select([sock], [], [], timeout)
+        return bool(readable)
+
+    def _poll(self, interval: float) -> bool:
+        """等待 interval 秒后发送 NOOP，返回文件夹的邮件数是否变化"""
+        deadline = time.monotonic() + interval
+        while not self.stopping.is_set() and time.monotonic() < deadline:
+            if self.hub._unused_expired(self):
+                return False
+            self.stopping.wait(min(1.0, max(0.0, deadline - time.monotonic())))
+        if self.stopping.is_set():
+            return False
+        client = self.provider.imap_client
+        typ, data = client.noop()
+        if typ != 'OK':
+            raise RuntimeError(f"NOOP 失败: {data}")
+        expunged = client.untagged_responses.pop('EXPUNGE', None)
+        if expunged and self._exists is not None:
+            self._exists -= len(expunged)
+        exists = self._take_exists()
+        if exists is None or exists == self._exists:
+            return False
+        self._exists = exists
+        return True
+
+    def _take_exists(self) -> Optional[int]:
+        """取出并清除 imaplib 保存的 EXISTS 响应，返回最新的邮件数，没有时返回 None
+
+        imaplib 不会清除已读取的非标签响应，不清除时每次 NOOP 后都会读到 SELECT 留下的旧值
+        """
+        values = self.provider.imap_client.untagged_responses.pop('EXISTS', None)
+        return int(values[-1]) if values and values[-1] is not None else None
+
+    def _check_new(self):
+        """按UID增量获取新邮件摘要并发布事件"""
+        provider = self.provider
+        while not self.stopping.is_set():
+            self._stats['checks'] += 1
+            emails = provider.get_emails(self.folder, count=WATCH_MAX_EVENT_EMAILS, since_uid=self.last_uid,
+                                         uidvalidity=self.uidvalidity, mode='envelope')
+            state = provider.mailbox_state
+            if state is None:
+                raise RuntimeError("获取新邮件失败")
+            # 获取时重新 SELECT 了文件夹，以其返回的邮件数作为下次轮询的比较基准
+            exists = self._take_exists()
+            if exists is not None:
+                self._exists = exists
+            if state['uidvalidity'] != self.uidvalidity:
+                # UIDVALIDITY变化时原UID失效，从当前位置重新开始
+                self.uidvalidity, self.last_uid = state['uidvalidity'], state['last_uid']
+                self._publish('reset', {'uidvalidity': self.uidvalidity, 'last_uid': self.last_uid})
+                return
+            if emails:
+                self.last_uid = state['last_uid']
+                self._publish('new_mail', {'emails': emails})
+            if not state.get('has_more'):
+                return
+
+    # ---- 事件 ----
+
+    def _publish(self, event_type: str, data: Dict[str, Any]):
+        self._sequence += 1
+        event = {
+            'id': self._sequence,
+            'type': event_type,
+            'account': self.provider.username,
+            'folder': self.folder,
+            'uidvalidity': self.uidvalidity,
+            'timestamp': time.time(),
+            **data
+        }
+        self._stats['events'] += 1
+        self.hub._dispatch(self, event)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            'account': self.provider.username,
+            'provider': self.key[0],
+            'folder': self.folder,
+            'mode': self.mode,
+            'uidvalidity': self.uidvalidity,
+            'last_uid': self.last_uid,
+            'subscribers': len(self.subscribers),
+            'webhooks': sorted(self.webhooks),
+            'started_at': self.started_at,
+            **self._stats
+        }
+
+
+class MailWatchHub:
+    """进程内的监听管理：按（邮箱类型, 账号, 文件夹）复用监听，管理 SSE 订阅者和 webhook"""
+
+    def __init__(self, max_watchers: int = WATCH_MAX_WATCHERS, idle_grace: float = WATCH_IDLE_GRACE):
+        self.max_watchers = max(1, int(max_watchers))
+        self.idle_grace = idle_grace
+        self._watchers = {}
+        self._starting = {}  # 正在建立首次连接的监听 -> 锁
+        self._lock = threading.RLock()
+        self._webhook_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='mail-webhook')
+        self._stats = {'webhook_deliveries': 0, 'webhook_failures': 0}
+
+    @staticmethod
+    def make_key(provider_type: str, username: str, folder: str) -> Tuple[str, str, str]:
+        return (provider_type.lower(), username.lower(), folder)
+
+    def _find(self, provider_type: str, username: str, password: str,
+              folder: str) -> Tuple[Tuple[str, str, str], Optional[MailboxWatcher]]:
+        """查找正在运行的监听并校验密码，调用方需持有锁"""
+        provider_class = EmailProviderFactory.PROVIDERS.get(provider_type.lower())
+        if provider_class is None:
+            raise ValueError(f"不支持的邮箱类型: {provider_type}")
+        key = self.make_key(provider_class.__name__, username, folder)
+        watcher = self._watchers.get(key)
+        if watcher is None or not watcher.is_alive():
+            return key, None
+        if not hmac.compare_digest(watcher.provider.password.encode('utf-8'), password.encode('utf-8')):
+            raise PermissionError("凭据与正在运行的监听不一致")
+        return key, watcher
+
+    def _acquire(self, provider_type: str, username: str, password: str, folder: str, attach) -> MailboxWatcher:
+        """获取或新建监听，并在锁内调用 attach(watcher) 登记订阅者或 webhook
+        
+        新建监听的首次连接在全局锁之外进行，同一文件夹的并发请求只建立一个连接
+        """
+        with self._lock:
+            key, watcher = self._find(provider_type, username, password, folder)
+            if watcher is not None:
+                attach(watcher)
+                return watcher
+            starting = self._starting.setdefault(key, threading.Lock())
+        with starting:
+            try:
+                with self._lock:
+                    key, watcher = self._find(provider_type, username, password, folder)
+                    if watcher is not None:
+                        attach(watcher)
+                        return watcher
+                    if len(self._watchers) >= self.max_watchers:
+                        raise WatchLimitError(f"监听数已达上限 {self.max_watchers}")
+                watcher = MailboxWatcher(EmailProviderFactory.create_provider(provider_type, username, password),
+                                         folder, self)
+                watcher.start()
+                with self._lock:
+                    self._watchers[key] = watcher
+                    attach(watcher)
+                return watcher
+            finally:
+                with self._lock:
+                    self._starting.pop(key, None)
+
+    def subscribe(self, provider_type: str, username: str, password: str,
+                  folder: str = 'INBOX') -> Tuple[MailboxWatcher, queue.Queue]:
+        """订阅新邮件事件，返回 (监听, 事件队列)；用完后调用 unsubscribe"""
+        events = queue.Queue(maxsize=WATCH_QUEUE_SIZE)
+        watcher = self._acquire(provider_type, username, password, folder,
+                                lambda w: w.subscribers.add(events))
+        return watcher, events
+
+    def unsubscribe(self, watcher: MailboxWatcher, events: queue.Queue):
+        with self._lock:
+            watcher.subscribers.discard(events)
+            if not watcher.subscribers and not watcher.webhooks:
+                watcher._unused_since = time.monotonic()
+
+    def add_webhook(self, provider_type: str, username: str, password: str, url: str,
+                    folder: str = 'INBOX') -> Dict[str, Any]:
+        """注册 webhook，注册后即使没有 SSE 订阅者也保持监听"""
+        watcher = self._acquire(provider_type, username, password, folder, lambda w: w.webhooks.add(url))
+        return watcher.info()
+
+    def remove_webhook(self, provider_type: str, username: str, password: str, url: str,
+                       folder: str = 'INBOX') -> bool:
+        """注销 webhook，返回是否存在该 webhook"""
+        with self._lock:
+            _, watcher = self._find(provider_type, username, password, folder)
+            if watcher is None or url not in watcher.webhooks:
+                return False
+            watcher.webhooks.discard(url)
+            if not watcher.subscribers and not watcher.webhooks:
+                watcher._unused_since = time.monotonic()
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'watchers': len(self._watchers),
+                'max_watchers': self.max_watchers,
+                'subscribers': sum(len(w.subscribers) for w in self._watchers.values()),
+                'webhooks': sum(len(w.webhooks) for w in self._watchers.values()),
+                'modes': {mode: sum(1 for w in self._watchers.values() if w.mode == mode)
+                          for mode in ('idle', 'poll')},
+                **self._stats
+            }
+
+    def list_watchers(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [watcher.info() for watcher in self._watchers.values()]
+
+    def stop_all(self):
+        with self._lock:
+            for watcher in self._watchers.values():
+                watcher.stop()
+
+    # ---- 供 MailboxWatcher 调用 ----
+
+    def _unused_expired(self, watcher: MailboxWatcher) -> bool:
+        with self._lock:
+            return not watcher.subscribers and not watcher.webhooks and \
+                time.monotonic() - watcher._unused_since >= self.idle_grace
+
+    def _stop_if_unused(self, watcher: MailboxWatcher) -> bool:
+        """没有订阅者和 webhook 超过宽限期时停止监听（在锁内判断，避免与新订阅竞争）"""
+        with self._lock:
+            if self._unused_expired(watcher):
+                watcher.stop()
+                self._remove(watcher)
+                return True
+            return False
+
+    def _remove(self, watcher: MailboxWatcher):
+        with self._lock:
+            if self._watchers.get(watcher.key) is watcher:
+                del self._watchers[watcher.key]
+
+    def _dispatch(self, watcher: MailboxWatcher, event: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(watcher.subscribers)
+            webhooks = list(watcher.webhooks)
+        for events in subscribers:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                watcher._stats['dropped_events'] += 1
+        for url in webhooks:
+            self._webhook_executor.submit(self._deliver, url, event)
+
+    def _deliver(self, url: str, event: Dict[str, Any]):
+        body = json.dumps(event, ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json; charset=utf-8', 'X-Email-Watch-Event': event['type']}
+        if WATCH_WEBHOOK_SECRET:
+            digest = hmac.new(WATCH_WEBHOOK_SECRET.encode('utf-8'), body, hashlib.sha256).hexdigest()
+            headers['X-Email-Watch-Signature'] = f'sha256={digest}'
+        try:
+            check_webhook_url(url)
+            # requests 只在推送 webhook 时用到，延迟导入以缩短应用启动时间
+            import requests
+            # 不跟随重定向，否则可以经公网地址跳转到内部服务
+            response = requests.post(url, data=body, headers=headers, timeout=WATCH_WEBHOOK_TIMEOUT,
+                                     allow_redirects=False)
+            if response.is_redirect:
+                raise RuntimeError(f"webhook 返回重定向 {response.status_code}，不跟随")
+            response.raise_for_status()
+            with self._lock:
+                self._stats['webhook_deliveries'] += 1
+        except Exception as e:
+            with self._lock:
+                self._stats['webhook_failures'] += 1
+            logger.warning(f"webhook 推送失败 ({url}): {str(e)}")
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """将事件编码为 Server-Sent Events 格式"""
+    data = json.dumps(event, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+_default_hub = None
+_default_hub_lock = threading.Lock()
+
+
+def get_watch_hub() -> MailWatchHub:
+    """获取进程内共享的监听管理器"""
+    global _default_hub
+    with _default_hub_lock:
+        if _default_hub is None:
+            _default_hub = MailWatchHub()
+        return _default_hub
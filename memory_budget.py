@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""邮件内容的内存预算
+完整模式（full）下原始邮件、解析出的附件内容和JSON响应都在内存中，几封大邮件就可能超出容器的内存限制。
+设置了预算或单封上限时，获取前先通过 RFC822.SIZE 得到每封邮件的大小，按大小从进程内的全局预算中预留内存，
+邮件解析完成后立即归还：超过单封上限或预算不足的邮件不下载附件内容，只返回描述符（与列表模式 envelope 相同），
+结果中列出这些邮件（omitted_uids），附件内容可通过 /api/attachments 按块获取，而不是让 worker 因内存不足被杀掉。
+预算保存在进程内，每个 gunicorn worker 各自统计；默认不限制，auto 按容器内存上限和 worker 数（WEB_CONCURRENCY）计算
+"""
+
+import os
+import threading
+import logging
+from typing import Dict, Any, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# MESSAGE_MEMORY_BUDGET=auto 时，每个 worker 可用内存中留给邮件内容的比例
+MEMORY_BUDGET_FRACTION = 0.25
+# 检测不到容器内存上限时 auto 使用的每进程预算（字节）
+FALLBACK_MEMORY_BUDGET = 64 * 1024 * 1024
+# cgroup v2 / v1 的内存上限文件
+CGROUP_MEMORY_LIMIT_FILES = ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes')
+
+
+def container_memory_limit() -> Optional[int]:
+    """容器的内存上限（字节），未限制或无法读取时返回 None"""
+    for path in CGROUP_MEMORY_LIMIT_FILES:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # v2 未限制时为 max，v1 未限制时为接近 2^63 的值
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    return None
+
+
+def default_memory_budget() -> int:
+    """MESSAGE_MEMORY_BUDGET=auto 时的每进程预算：容器内存上限按 worker 数平分后的 MEMORY_BUDGET_FRACTION"""
+    limit = container_memory_limit()
+    if not limit:
+        return FALLBACK_MEMORY_BUDGET
+    workers = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+    return int(limit / workers * MEMORY_BUDGET_FRACTION)
+
+
+def _budget_from_env(value: str) -> int:
+    return default_memory_budget() if value.strip().lower() == 'auto' else int(value)
+
+
+# 进程内同时在解析的邮件内容合计上限（字节），auto 按容器内存上限计算，0 表示不限制（默认）
+MESSAGE_MEMORY_BUDGET = _budget_from_env(os.getenv('MESSAGE_MEMORY_BUDGET') or '0')
+# 单封邮件超过该大小时只返回描述符，0 表示不限制（默认）
+LARGE_MESSAGE_BYTES = int(os.getenv('LARGE_MESSAGE_BYTES', '0'))
+# 单个附件超过该大小（解码后）时不返回内容，0 表示不限制（默认，附件内容与以前一样全部内嵌）
+ATTACHMENT_INLINE_MAX_BYTES = int(os.getenv('ATTACHMENT_INLINE_MAX_BYTES', '0'))
+
+# 附件内容以base64返回时，原始邮件和解析结果同时存在，按邮件大小的两倍预留
+INLINE_MEMORY_FACTOR = 2
+
+
+def estimate_message_memory(size: int, attachment_mode: str = 'inline') -> int:
+    """完整模式下解析一封 size 字节的邮件需要预留的内存"""
+    return size * INLINE_MEMORY_FACTOR if attachment_mode == 'inline' else size
+
+
+class MemoryBudget:
+    """进程内共享的内存预算，try_reserve 失败时调用方降级而不是等待
+
+    Args:
+        limit: 预算上限（字节），0 表示不限制
+    """
+
+    def __init__(self, limit: int = MESSAGE_MEMORY_BUDGET):
+        self.limit = max(0, int(limit))
+        self._in_use = 0
+        self._peak = 0
+        self._stats = {'reserved': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+
+    def try_reserve(self, nbytes: int) -> bool:
+        with self._lock:
+            if self.limit and self._in_use + nbytes > self.limit:
+                self._stats['rejected'] += 1
+                return False
+            self._in_use += nbytes
+            self._peak = max(self._peak, self._in_use)
+            self._stats['reserved'] += 1
+            return True
+
+    def release(self, nbytes: int):
+        with self._lock:
+            self._in_use = max(0, self._in_use - nbytes)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'limit_bytes': self.limit,
+                'in_use_bytes': self._in_use,
+                'peak_bytes': self._peak,
+                **self._stats
+            }
+
+
+class MemoryLease:
+    """一次请求从预算中预留的内存，按键（如 (文件夹, UID)）记录，可逐条归还，请求结束时 close() 全部归还"""
+
+    def __init__(self, budget: Optional[MemoryBudget] = None):
+        self.budget = budget or get_memory_budget()
+        self._held = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, key: Hashable, nbytes: int) -> bool:
+        if not self.budget.try_reserve(nbytes):
+            return False
+        with self._lock:
+            previous = self._held.get(key, 0)
+            self._held[key] = previous + nbytes
+        return True
+
+    def release(self, key: Hashable):
+        with self._lock:
+            nbytes = self._held.pop(key, 0)
+        if nbytes:
+            self.budget.release(nbytes)
+
+    def close(self):
+        with self._lock:
+            nbytes = sum(self._held.values())
+            self._held = {}
+        if nbytes:
+            self.budget.release(nbytes)
+
+
+_memory_budget = None
+_memory_budget_lock = threading.Lock()
+
+
+def get_memory_budget() -> MemoryBudget:
+    """进程内共享的内存预算"""
+    global _memory_budget
+    with _memory_budget_lock:
+        if _memory_budget is None:
+            _memory_budget = MemoryBudget()
+        return _memory_budget
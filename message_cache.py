@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""已解析邮件缓存
+UIDVALIDITY 和 UID 确定后邮件内容不再变化，因此解析结果可以按
+(账号, 文件夹, UIDVALIDITY, UID, 解析参数) 缓存，重复轮询时只需向服务器请求UID列表
+内存中保留一层LRU，磁盘使用SQLite，两层都按字节数上限淘汰最久未访问的条目
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+DEFAULT_CACHE_DB = os.getenv('MESSAGE_CACHE_DB_PATH', 'message_cache.db')
+
+
+class MessageCache:
+    """两级邮件缓存
+
+    Args:
+        db_path: SQLite文件路径，为None时只使用内存缓存
+        memory_max_bytes: 内存LRU的字节上限
+        disk_max_bytes: 磁盘缓存的字节上限
+    """
+
+    def __init__(self, db_path: Optional[str] = DEFAULT_CACHE_DB,
+                 memory_max_bytes: int = 32 * 1024 * 1024,
+                 disk_max_bytes: int = 256 * 1024 * 1024):
+        self.db_path = db_path
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> 序列化后的bytes
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._stats = {
+            'hits': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0
+        }
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS messages (
+                    account TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    uidvalidity INTEGER NOT NULL,
+                    uid INTEGER NOT NULL,
+                    variant TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL,
+                    PRIMARY KEY (account, folder, uidvalidity, uid, variant)
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_accessed ON messages (accessed)')
+            self._conn.commit()
+            row = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM messages').fetchone()
+            self._disk_bytes = row[0]
+
+    def get_many(self, account: str, folder: str, uidvalidity: Optional[int], uids: List[int],
+                 variant: str) -> Dict[int, Dict[str, Any]]:
+        """批量查询缓存，返回 {UID: 邮件信息}（未命中的UID不在结果中）"""
+        if uidvalidity is None or not uids:
+            return {}
+        found = {}
+        disk_lookup = []
+        with self._lock:
+            for uid in uids:
+                key = (account, folder, uidvalidity, uid, variant)
+                data = self._memory.get(key)
+                if data is not None:
+                    self._memory.move_to_end(key)
+                    found[uid] = data
+                    self._stats['memory_hits'] += 1
+                else:
+                    disk_lookup.append(uid)
+
+            if disk_lookup and self._conn is not None:
+                now = time.time()
+                for start in range(0, len(disk_lookup), 500):
+                    chunk = disk_lookup[start:start + 500]
+                    rows = self._conn.execute(
+                        f'SELECT uid, data FROM messages WHERE account = ? AND folder = ? AND uidvalidity = ? '
+                        f'AND variant = ? AND uid IN ({",".join("?" * len(chunk))})',
+                        [account, folder, uidvalidity, variant] + chunk
+                    ).fetchall()
+                    for uid, data in rows:
+                        found[uid] = data
+                        self._stats['disk_hits'] += 1
+                        self._remember(account, folder, uidvalidity, uid, variant, data)
+                    if rows:
+                        self._conn.executemany(
+                            'UPDATE messages SET accessed = ? WHERE account = ? AND folder = ? AND uidvalidity = ? '
+                            'AND uid = ? AND variant = ?',
+                            [(now, account, folder, uidvalidity, uid, variant) for uid, _ in rows]
+                        )
+                self._conn.commit()
+
+            self._stats['hits'] += len(found)
+            self._stats['misses'] += len(uids) - len(found)
+        return {uid: json.loads(data) for uid, data in found.items()}
+
+    def put(self, account: str, folder: str, uidvalidity: Optional[int], uid: int,
+            variant: str, email_info: Dict[str, Any]):
+        """写入缓存"""
+        if uidvalidity is None:
+            return
+        data = json.dumps(email_info, ensure_ascii=False).encode('utf-8')
+        with self._lock:
+            self._stats['stores'] += 1
+            self._remember(account, folder, uidvalidity, uid, variant, data)
+            if self._conn is None or len(data) > self.disk_max_bytes:
+                return
+            old = self._conn.execute(
+                'SELECT size FROM messages WHERE account = ? AND folder = ? AND uidvalidity = ? AND uid = ? AND variant = ?',
+                (account, folder, uidvalidity, uid, variant)
+            ).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO messages (account, folder, uidvalidity, uid, variant, data, size, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (account, folder, uidvalidity, uid, variant, data, len(data), time.time())
+            )
+            self._disk_bytes += len(data) - (old[0] if old else 0)
+            self._evict_disk()
+            self._conn.commit()
+
+    def invalidate(self, account: str, folder: str):
+        """删除某个文件夹的全部缓存（如UIDVALIDITY变化时）"""
+        with self._lock:
+            for key in [k for k in self._memory if k[0] == account and k[1] == folder]:
+                self._memory_bytes -= len(self._memory.pop(key))
+            if self._conn is not None:
+                self._conn.execute('DELETE FROM messages WHERE account = ? AND folder = ?', (account, folder))
+                self._conn.commit()
+                row = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM messages').fetchone()
+                self._disk_bytes = row[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'memory_max_bytes': self.memory_max_bytes,
+                'disk_bytes': self._disk_bytes,
+                'disk_max_bytes': self.disk_max_bytes if self._conn is not None else 0,
+                'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else 0.0,
+                **self._stats
+            }
+
+    def _remember(self, account, folder, uidvalidity, uid, variant, data: bytes):
+        """写入内存LRU（调用方需持有锁）"""
+        if len(data) > self.memory_max_bytes:
+            return
+        key = (account, folder, uidvalidity, uid, variant)
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._stats['memory_evictions'] += 1
+
+    def _evict_disk(self):
+        """按最久未访问淘汰磁盘条目直到低于字节上限（调用方需持有锁）"""
+        while self._disk_bytes > self.disk_max_bytes:
+            rows = self._conn.execute(
+                'SELECT account, folder, uidvalidity, uid, variant, size FROM messages ORDER BY accessed LIMIT 100'
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                return
+            for account, folder, uidvalidity, uid, variant, size in rows:
+                self._conn.execute(
+                    'DELETE FROM messages WHERE account = ? AND folder = ? AND uidvalidity = ? AND uid = ? AND variant = ?',
+                    (account, folder, uidvalidity, uid, variant)
+                )
+                self._disk_bytes -= size
+                self._stats['disk_evictions'] += 1
+                if self._disk_bytes <= self.disk_max_bytes:
+                    break
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_message_cache() -> MessageCache:
+    """获取进程内共享的邮件缓存（参数可通过环境变量配置）"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = MessageCache(
+                db_path=os.getenv('MESSAGE_CACHE_DB_PATH', DEFAULT_CACHE_DB) or None,
+                memory_max_bytes=int(os.getenv('MESSAGE_CACHE_MEMORY_BYTES', str(32 * 1024 * 1024))),
+                disk_max_bytes=int(os.getenv('MESSAGE_CACHE_DISK_BYTES', str(256 * 1024 * 1024)))
+            )
+        return _default_cache
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""运行指标
+进程内的计数器和直方图，/metrics 接口以 Prometheus 文本格式输出。
+每次记录只是一次加锁的字典更新，可以在生产环境常开；
+多个 gunicorn worker 各自统计，由 Prometheus 按实例分别抓取
+"""
+
+import time
+import bisect
+import threading
+import logging
+from contextlib import contextmanager
+from typing import List, Dict, Any, Tuple, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+# 耗时直方图的桶上界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """单调递增的计数器"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """耗时等数值的分布，按桶累计"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # key -> [各桶计数..., 总和, 总数]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(state[-2])}')
+            lines.append(f'{self.name}_count{labels} {state[-1]}')
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表；collectors 在输出时调用，返回 [(指标名, 说明, {标签: 值} 或 None, 数值)]，作为 gauge 输出"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, Dict[str, Any], float]]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        gauges = {}
+        for collector in self._collectors:
+            try:
+                for name, documentation, labels, value in collector():
+                    gauges.setdefault(name, (documentation, []))[1].append((labels or {}, value))
+            except Exception as e:
+                logger.warning(f"收集指标失败: {str(e)}")
+        for name, (documentation, samples) in gauges.items():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in samples:
+                names = tuple(labels)
+                lines.append(f'{name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+PHASE_SECONDS = REGISTRY.histogram(
+    'email_phase_seconds', '各阶段耗时：connect（TCP+TLS+问候）、login、select、search、fetch、parse、serialize',
+    ('provider', 'phase'))
+FETCHED_BYTES = REGISTRY.counter('email_fetched_bytes_total', 'FETCH 响应的字节数', ('provider',))
+MESSAGES_PARSED = REGISTRY.counter('email_messages_parsed_total', '解析的邮件数', ('provider', 'mode'))
+MESSAGES_OMITTED = REGISTRY.counter('email_messages_omitted_total',
+                                    '完整模式下因邮件过大（size）或内存预算不足（memory）只返回描述符的邮件数',
+                                    ('provider', 'reason'))
+ATTACHMENT_BYTES = REGISTRY.counter('email_attachment_bytes_total', '完整模式下解析的附件字节数', ('provider',))
+ERRORS = REGISTRY.counter('email_errors_total', '按阶段和异常类型统计的错误数', ('provider', 'phase', 'type'))
+SYNCS = REGISTRY.counter('email_syncs_total', '邮件获取请求数', ('provider', 'engine', 'result'))
+DELTA_SYNCS = REGISTRY.counter('email_delta_syncs_total',
+                               'delta 同步的文件夹数，method 为 qresync、condstore、snapshot、initial 或 reset',
+                               ('provider', 'method'))
+SYNC_COALESCED = REGISTRY.counter('email_sync_coalesced_total',
+                                  '与相同请求合并的同步请求数，source 为 inflight（等待进行中的同步）或 recent（复用刚完成的结果）',
+                                  ('provider', 'source'))
+
+
+@contextmanager
+def observe_phase(provider: str, phase: str):
+    """记录一个阶段的耗时，阶段内抛出的异常按类型计数后继续抛出"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        ERRORS.inc(provider=provider, phase=phase, type=type(e).__name__)
+        raise
+    finally:
+        PHASE_SECONDS.observe(time.perf_counter() - started, provider=provider, phase=phase)
+
+
+def response_bytes(data) -> int:
+    """imaplib 格式响应数据（bytes 和 (头部, 字面量) 元组）的字节数"""
+    total = 0
+    for item in data or []:
+        if isinstance(item, tuple):
+            total += sum(len(part) for part in item if isinstance(part, (bytes, bytearray)))
+        elif isinstance(item, (bytes, bytearray)):
+            total += len(item)
+    return total
+
+
+def stats_collector(prefix: str, documentation: str, get_stats: Callable[[], Dict[str, Any]]):
+    """将组件 stats() 中的数值字段转为 gauge：{prefix}_{字段名}，嵌套一层的字典以 key 标签展开"""
+    def collect():
+        stats = get_stats()
+        if not stats:
+            return
+        for field, value in stats.items():
+            if isinstance(value, bool):
+                yield f'{prefix}_{field}', documentation, None, int(value)
+            elif isinstance(value, (int, float)):
+                yield f'{prefix}_{field}', documentation, None, value
+            elif isinstance(value, dict):
+                for key, item in value.items():
+                    if isinstance(item, (int, float)) and not isinstance(item, bool):
+                        yield f'{prefix}_{field}', documentation, {'key': key}, item
+    return collect
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""邮件解析进程池
+批量获取时MIME解析、base64解码和字符集转换的CPU开销会成为瓶颈，且受GIL限制与网络读写串行执行。
+启用后完整模式（full）获取的原始邮件交给工作进程解析，返回解析后的邮件信息
+"""
+
+import os
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Dict, Any, Optional
+
+from email_providers import parse_raw_email
+
+logger = logging.getLogger(__name__)
+
+# 工作进程数，0 表示不启用进程池
+PARSE_POOL_WORKERS = int(os.getenv('PARSE_POOL_WORKERS', '0'))
+# 单批邮件数少于该值时在当前线程解析
+PARSE_POOL_MIN_BATCH = int(os.getenv('PARSE_POOL_MIN_BATCH', '16'))
+
+
+class ParsePool:
+    """解析进程池
+
+    Args:
+        workers: 工作进程数
+        min_batch: 使用进程池的最小批次大小
+        start_method: 进程启动方式，默认 spawn（服务进程中有其他线程时 fork 不安全）
+    """
+
+    def __init__(self, workers: int = PARSE_POOL_WORKERS, min_batch: int = PARSE_POOL_MIN_BATCH,
+                 start_method: str = 'spawn'):
+        self.workers = max(1, int(workers))
+        self.min_batch = max(1, int(min_batch))
+        self.start_method = start_method
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {'pooled': 0, 'in_thread_batches': 0}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method)
+                )
+                logger.info(f"解析进程池已启动，进程数: {self.workers}")
+            return self._executor
+
+    def submit(self, raw: bytes, attachment_mode: str = 'inline') -> Future:
+        with self._lock:
+            self._stats['pooled'] += 1
+        return self._get_executor().submit(parse_raw_email, raw, attachment_mode)
+
+    def submit_batch(self, responses: Dict[int, Dict[str, Any]], attachment_mode: str = 'inline'):
+        """为一批FETCH响应提交解析任务，结果以 Future 存入响应的 'PARSED' 字段
+
+        批次过小时不提交，由调用方在当前线程解析
+        """
+        raw_responses = [response for response in responses.values() if 'RFC822' in response]
+        if len(raw_responses) < self.min_batch:
+            with self._lock:
+                self._stats['in_thread_batches'] += 1
+            return
+        try:
+            for response in raw_responses:
+                response['PARSED'] = self.submit(response['RFC822'], attachment_mode)
+        except Exception as e:
+            # 进程池无法启动时退回当前线程解析
+            logger.warning(f"提交解析任务失败，改为在当前线程解析: {str(e)}")
+            for response in raw_responses:
+                future = response.pop('PARSED', None)
+                if future is not None:
+                    future.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'min_batch': self.min_batch,
+                'started': self._executor is not None,
+                **self._stats
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> Optional[ParsePool]:
+    """获取进程内共享的解析进程池，PARSE_POOL_WORKERS 为0时返回None"""
+    global _default_pool
+    if PARSE_POOL_WORKERS <= 0:
+        return None
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ParsePool()
+        return _default_pool
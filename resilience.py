@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""IMAP 连接的错误分类、重试和熔断
+连接失败按原因分为认证失败、临时故障（超时、连接断开）和服务器限流：
+临时故障按带随机抖动的指数退避重试；同一服务器（host）连续失败或被限流时熔断，
+熔断期间直接拒绝连接，不再占用处理线程等待注定失败的连接。
+熔断状态保存在进程内，每个 gunicorn worker 各自统计
+"""
+
+import os
+import ssl
+import time
+import random
+import socket
+import asyncio
+import imaplib
+import threading
+import logging
+from typing import Dict, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+# 重试：最多尝试次数（含第一次），退避基数和上限（秒）
+RETRY_MAX_ATTEMPTS = int(os.getenv('IMAP_RETRY_MAX_ATTEMPTS', '3'))
+RETRY_BASE_DELAY = float(os.getenv('IMAP_RETRY_BASE_DELAY', '0.5'))
+RETRY_MAX_DELAY = float(os.getenv('IMAP_RETRY_MAX_DELAY', '8'))
+# 熔断：连续失败次数阈值，熔断后首次允许试探连接的等待时间（秒），连续试探失败时加倍直到上限
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('IMAP_BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv('IMAP_BREAKER_RECOVERY_TIMEOUT', '30'))
+BREAKER_MAX_RECOVERY_TIMEOUT = float(os.getenv('IMAP_BREAKER_MAX_RECOVERY_TIMEOUT', '300'))
+
+# 服务器响应中表示限流的文本（Gmail、网易、QQ 等）
+THROTTLE_MARKERS = (
+    '[THROTTLED]', '[LIMIT]', '[UNAVAILABLE]', 'TOO MANY', 'RATE LIMIT', 'EXCEEDED', 'TRY AGAIN LATER',
+    'SYSTEM BUSY', 'SERVER BUSY'
+)
+# 表示认证失败的文本
+AUTH_MARKERS = (
+    '[AUTHENTICATIONFAILED]', '[AUTHORIZATIONFAILED]', 'INVALID CREDENTIALS', 'AUTHENTICATION FAILED',
+    'LOGIN FAILED', 'LOGIN ERROR', 'PASSWORD ERROR', 'UNSAFE LOGIN'
+)
+
+
+class EmailServiceError(ConnectionError):
+    """已分类的邮箱服务错误，kind 为 auth/transient/throttle/circuit_open"""
+    kind = 'error'
+
+    def __init__(self, message: str, host: str = '', retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.host = host
+        self.retry_after = retry_after
+
+
+class AuthenticationError(EmailServiceError):
+    """用户名或密码（授权码）错误，重试不会成功"""
+    kind = 'auth'
+
+
+class TransientError(EmailServiceError):
+    """超时、连接被重置等临时故障，可以重试"""
+    kind = 'transient'
+
+
+class ThrottledError(TransientError):
+    """服务器限流，不在当前请求内重试，并立即熔断该服务器"""
+    kind = 'throttle'
+
+
+class CircuitOpenError(EmailServiceError):
+    """服务器处于熔断状态，未发起连接"""
+    kind = 'circuit_open'
+
+
+def classify_error(error: BaseException, phase: str = '') -> str:
+    """判断错误类型：auth、throttle、transient 或 error（其他错误，不重试）
+
+    phase 为 login 时，服务器对 LOGIN 返回的 NO 视为认证失败
+    """
+    if isinstance(error, EmailServiceError):
+        return error.kind
+    text = str(error).upper()
+    if any(marker in text for marker in THROTTLE_MARKERS):
+        return 'throttle'
+    if any(marker in text for marker in AUTH_MARKERS) or isinstance(error, PermissionError):
+        return 'auth'
+    # 证书校验失败（含主机名不匹配）和域名不存在是配置问题，重试和熔断都无济于事；DNS 临时失败仍可重试
+    if isinstance(error, ssl.SSLCertVerificationError):
+        return 'error'
+    if isinstance(error, socket.gaierror) and error.errno != socket.EAI_AGAIN:
+        return 'error'
+    if isinstance(error, (imaplib.IMAP4.abort, OSError, EOFError, asyncio.TimeoutError)):
+        return 'transient'
+    if phase == 'login' and isinstance(error, imaplib.IMAP4.error):
+        return 'auth'
+    return 'error'
+
+
+def classified_error(error: BaseException, host: str = '', phase: str = '') -> BaseException:
+    """将原始异常转为对应的 EmailServiceError 子类，无法归类的原样返回"""
+    if isinstance(error, EmailServiceError):
+        return error
+    error_class = {
+        'auth': AuthenticationError,
+        'throttle': ThrottledError,
+        'transient': TransientError
+    }.get(classify_error(error, phase))
+    if error_class is None:
+        return error
+    wrapped = error_class(f"{host}: {error}" if host else str(error), host)
+    wrapped.__cause__ = error
+    return wrapped
+
+
+class CircuitBreaker:
+    """单个服务器的熔断器
+
+    closed：正常连接，连续 failure_threshold 次临时故障或一次限流后转为 open；
+    open：直接拒绝，recovery_timeout 秒后转为 half_open；
+    half_open：只放行一个试探连接，成功则恢复 closed，失败则重新 open 且等待时间加倍
+    """
+
+    def __init__(self, host: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 recovery_timeout: float = BREAKER_RECOVERY_TIMEOUT,
+                 max_recovery_timeout: float = BREAKER_MAX_RECOVERY_TIMEOUT):
+        self.host = host
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max(recovery_timeout, max_recovery_timeout)
+        self.state = 'closed'
+        self._failures = 0
+        self._current_timeout = recovery_timeout
+        self._opened_at = 0.0
+        self._probing = False
+        self._last_error = None
+        self._stats = {'rejected': 0, 'opened': 0, 'failures': 0, 'successes': 0}
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """发起连接前调用；熔断中抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == 'open':
+                remaining = self._opened_at + self._current_timeout - time.monotonic()
+                if remaining > 0:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError(f"{self.host} 熔断中，{remaining:.0f} 秒后重试: {self._last_error}",
+                                           self.host, retry_after=remaining)
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open':
+                if self._probing:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError(f"{self.host} 熔断恢复中，正在试探连接", self.host,
+                                           retry_after=self._current_timeout)
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._stats['successes'] += 1
+            if self.state != 'closed':
+                logger.info(f"{self.host} 熔断恢复")
+            self.state = 'closed'
+            self._failures = 0
+            self._probing = False
+            self._current_timeout = self.recovery_timeout
+
+    def record_failure(self, error: BaseException, kind: str):
+        """记录一次临时故障或限流"""
+        with self._lock:
+            self._stats['failures'] += 1
+            self._failures += 1
+            self._last_error = str(error)
+            if self.state == 'half_open':
+                self._current_timeout = min(self._current_timeout * 2, self.max_recovery_timeout)
+                self._open()
+            elif kind == 'throttle' or self._failures >= self.failure_threshold:
+                self._open()
+
+    def release_probe(self):
+        """连接因与服务器状态无关的错误结束：不改变熔断状态，只释放试探连接的名额"""
+        with self._lock:
+            self._probing = False
+
+    def _open(self):
+        if self.state != 'open':
+            self._stats['opened'] += 1
+            logger.warning(f"{self.host} 熔断 {self._current_timeout:.0f} 秒: {self._last_error}")
+        self.state = 'open'
+        self._opened_at = time.monotonic()
+        self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_after = None
+            if self.state == 'open':
+                retry_after = round(max(0.0, self._opened_at + self._current_timeout - time.monotonic()), 1)
+            return {
+                'state': self.state,
+                'consecutive_failures': self._failures,
+                'retry_after': retry_after,
+                'last_error': self._last_error,
+                **self._stats
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    """获取服务器对应的熔断器（进程内共享）"""
+    host = host.lower()
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host)
+        return breaker
+
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    """各服务器的熔断状态，用于 /api/status"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.host: breaker.stats() for breaker in breakers}
+
+
+def backoff_delay(attempt: int, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY) -> float:
+    """第 attempt 次重试（从 1 开始）前的等待时间：指数退避加完全随机抖动，避免多个 worker 同时重试"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+
+
+def _record_failure(breaker: CircuitBreaker, error: BaseException) -> BaseException:
+    wrapped = classified_error(error, breaker.host)
+    kind = classify_error(wrapped)
+    if kind in ('transient', 'throttle'):
+        breaker.record_failure(error, kind)
+    elif kind == 'auth':
+        # 认证失败说明服务器可达，不计入熔断
+        breaker.record_success()
+    else:
+        # 未归类的错误不能说明服务器是否可用，不改变熔断状态
+        breaker.release_probe()
+    return wrapped
+
+
+def _should_retry(error: BaseException, attempt: int, max_attempts: int) -> bool:
+    return isinstance(error, TransientError) and not isinstance(error, ThrottledError) and attempt < max_attempts
+
+
+def call_with_retry(host: str, connect: Callable[[], Any], max_attempts: int = RETRY_MAX_ATTEMPTS):
+    """经过熔断器调用 connect，临时故障时退避重试，失败时抛出已分类的异常"""
+    breaker = get_breaker(host)
+    attempt = 0
+    while True:
+        attempt += 1
+        breaker.before_call()
+        try:
+            result = connect()
+        except Exception as e:
+            wrapped = _record_failure(breaker, e)
+            if not _should_retry(wrapped, attempt, max_attempts):
+                raise wrapped from e
+            delay = backoff_delay(attempt)
+            logger.warning(f"连接 {host} 失败（第 {attempt} 次），{delay:.1f} 秒后重试: {str(e)}")
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+async def call_with_retry_async(host: str, connect: Callable[[], Any], max_attempts: int = RETRY_MAX_ATTEMPTS):
+    """call_with_retry 的 asyncio 版本，connect 返回协程"""
+    breaker = get_breaker(host)
+    attempt = 0
+    while True:
+        attempt += 1
+        breaker.before_call()
+        try:
+            result = await connect()
+        except Exception as e:
+            wrapped = _record_failure(breaker, e)
+            if not _should_retry(wrapped, attempt, max_attempts):
+                raise wrapped from e
+            delay = backoff_delay(attempt)
+            logger.warning(f"连接 {host} 失败（第 {attempt} 次），{delay:.1f} 秒后重试: {str(e)}")
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
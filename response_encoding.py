@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""同步结果的响应编码
+响应格式：json（默认）、msgpack、cbor。二进制格式中附件内容为原始字节而不是base64，体积约小四分之一。
+响应压缩按请求的 Accept-Encoding 协商：zstd、br、gzip。
+结果按层次逐段编码、压缩后流式返回，不在内存中拼出完整的响应体；
+msgpack、cbor、brotli、zstd 依赖可选的第三方库，未安装时不提供对应的格式或压缩算法
+"""
+
+import os
+import json
+import zlib
+import base64
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# 是否按 Accept-Encoding 压缩同步结果
+RESPONSE_COMPRESSION_ENABLED = os.getenv('RESPONSE_COMPRESSION_ENABLED', 'true').lower() == 'true'
+# 各压缩算法的级别；附件内容本身多为已压缩数据，较低的级别压缩率相近而耗时少得多
+RESPONSE_COMPRESSION_LEVELS = {
+    'zstd': int(os.getenv('RESPONSE_ZSTD_LEVEL', '3')),
+    'br': int(os.getenv('RESPONSE_BROTLI_QUALITY', '4')),
+    'gzip': int(os.getenv('RESPONSE_GZIP_LEVEL', '6')),
+}
+# 压缩前累积的字节数，避免为每个小片段单独压缩
+RESPONSE_CHUNK_BYTES = 64 * 1024
+
+# 响应格式 -> (单个文档的 Content-Type, 流式记录序列的 Content-Type)
+RESPONSE_FORMATS = {
+    'json': ('application/json', 'application/x-ndjson'),
+    'msgpack': ('application/msgpack', 'application/msgpack'),
+    'cbor': ('application/cbor', 'application/cbor-seq'),
+}
+_FORMAT_MEDIA_TYPES = {
+    'application/msgpack': 'msgpack',
+    'application/x-msgpack': 'msgpack',
+    'application/vnd.msgpack': 'msgpack',
+    'application/cbor': 'cbor',
+    'application/cbor-seq': 'cbor',
+}
+# 客户端对多个压缩算法的权重相同时按此顺序选择
+COMPRESSION_PREFERENCE = ('zstd', 'br', 'gzip')
+
+# 逐段编码的层数：{success, data: {emails: [每封邮件]}}，每封邮件整体编码
+_DOCUMENT_DEPTH = 3
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def available_formats() -> List[str]:
+    """当前环境可用的响应格式"""
+    return [name for name in RESPONSE_FORMATS
+            if name == 'json' or (name == 'msgpack' and msgpack) or (name == 'cbor' and cbor2)]
+
+
+def available_encodings() -> List[str]:
+    """当前环境可用的压缩算法"""
+    return [name for name in COMPRESSION_PREFERENCE
+            if name == 'gzip' or (name == 'br' and brotli) or (name == 'zstd' and zstandard)]
+
+
+def negotiate_format(requested: Optional[str], accept: str = '') -> Tuple[Optional[str], Optional[str]]:
+    """根据请求参数 format 或 Accept 头选择响应格式，返回 (格式, 错误信息)"""
+    if not requested:
+        requested = 'json'
+        for media_type in accept.split(','):
+            media_type = media_type.split(';')[0].strip().lower()
+            if media_type in _FORMAT_MEDIA_TYPES:
+                requested = _FORMAT_MEDIA_TYPES[media_type]
+                break
+    requested = str(requested).lower()
+    if requested not in RESPONSE_FORMATS:
+        return None, f'不支持的响应格式: {requested}. 支持的格式: {list(RESPONSE_FORMATS)}'
+    if requested not in available_formats():
+        return None, f'响应格式 {requested} 不可用（未安装 {"cbor2" if requested == "cbor" else requested}）'
+    return requested, None
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """按 Accept-Encoding 的权重选择压缩算法，不压缩时返回None"""
+    if not RESPONSE_COMPRESSION_ENABLED or not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().lower().partition(';')
+        name = name.strip()
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            weights[name] = quality
+    candidates = []
+    for rank, name in enumerate(available_encodings()):
+        quality = weights.get(name, weights.get('*', 0.0))
+        if quality > 0:
+            candidates.append((-quality, rank, name))
+    return min(candidates)[2] if candidates else None
+
+
+class _Compressor:
+    """统一 gzip/brotli/zstd 的流式压缩接口"""
+
+    def __init__(self, encoding: str):
+        level = RESPONSE_COMPRESSION_LEVELS[encoding]
+        if encoding == 'gzip':
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self.compress = compressor.compress
+            self.flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.finish = compressor.flush
+        elif encoding == 'br':
+            compressor = brotli.Compressor(quality=level)
+            self.compress = compressor.process
+            self.flush = compressor.flush
+            self.finish = compressor.finish
+        else:
+            compressor = zstandard.ZstdCompressor(level=level).compressobj()
+            self.compress = compressor.compress
+            self.flush = lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            self.finish = compressor.flush
+
+
+def compress_chunks(chunks: Iterable[bytes], encoding: Optional[str], flush_each: bool = False) -> Iterator[bytes]:
+    """压缩编码后的片段，encoding 为None时只合并小片段
+
+    flush_each 为真时每个片段都立即输出（流式获取中每封邮件到达客户端不需要等待后续邮件）
+    """
+    compressor = _Compressor(encoding) if encoding else None
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        if not flush_each and len(buffer) < RESPONSE_CHUNK_BYTES:
+            continue
+        if compressor is None:
+            yield bytes(buffer)
+        else:
+            data = compressor.compress(bytes(buffer))
+            if flush_each:
+                data += compressor.flush()
+            if data:
+                yield data
+        buffer.clear()
+    if compressor is None:
+        if buffer:
+            yield bytes(buffer)
+        return
+    yield compressor.compress(bytes(buffer)) + compressor.finish()
+
+
+def _raw_content(value: Any) -> Any:
+    """二进制格式中附件内容使用原始字节而不是base64"""
+    if isinstance(value, dict):
+        converted = {key: _raw_content(item) for key, item in value.items()}
+        if 'filename' in converted and isinstance(converted.get('content'), str):
+            converted['content'] = base64.b64decode(converted['content'])
+        return converted
+    if isinstance(value, list):
+        return [_raw_content(item) for item in value]
+    return value
+
+
+def _cbor_head(major_type: int, length: int) -> bytes:
+    """CBOR 数组（4）或映射（5）的头部"""
+    if length < 24:
+        return bytes([major_type << 5 | length])
+    for info, size in ((24, 1), (25, 2), (26, 4), (27, 8)):
+        if length < 1 << (8 * size):
+            return bytes([major_type << 5 | info]) + length.to_bytes(size, 'big')
+    raise ValueError(f"CBOR 长度过大: {length}")
+
+
+class _BinaryWriter:
+    """msgpack/cbor 的标量编码和容器头部"""
+
+    def __init__(self, fmt: str):
+        if fmt == 'msgpack':
+            packer = msgpack.Packer(use_bin_type=True)
+            self.value = packer.pack
+            self.map_head = packer.pack_map_header
+            self.array_head = packer.pack_array_header
+        else:
+            self.value = cbor2.dumps
+            self.map_head = lambda length: _cbor_head(5, length)
+            self.array_head = lambda length: _cbor_head(4, length)
+
+
+def _iter_json(value: Any, depth: int) -> Iterator[bytes]:
+    if depth and isinstance(value, dict):
+        yield b'{'
+        for index, (key, item) in enumerate(value.items()):
+            yield (b',' if index else b'') + _JSON_ENCODER.encode(str(key)).encode() + b':'
+            yield from _iter_json(item, depth - 1)
+        yield b'}'
+    elif depth and isinstance(value, list):
+        yield b'['
+        for index, item in enumerate(value):
+            if index:
+                yield b','
+            yield from _iter_json(item, depth - 1)
+        yield b']'
+    else:
+        yield _JSON_ENCODER.encode(value).encode()
+
+
+def _iter_binary(writer: _BinaryWriter, value: Any, depth: int) -> Iterator[bytes]:
+    if depth and isinstance(value, dict):
+        yield writer.map_head(len(value))
+        for key, item in value.items():
+            yield writer.value(key)
+            yield from _iter_binary(writer, item, depth - 1)
+    elif depth and isinstance(value, list):
+        yield writer.array_head(len(value))
+        for item in value:
+            yield from _iter_binary(writer, item, depth - 1)
+    else:
+        yield writer.value(_raw_content(value))
+
+
+def iter_document(document: Dict[str, Any], fmt: str = 'json') -> Iterator[bytes]:
+    """逐段编码一个响应文档，外层结构逐个键编码，每封邮件整体编码"""
+    if fmt == 'json':
+        return _iter_json(document, _DOCUMENT_DEPTH)
+    return _iter_binary(_BinaryWriter(fmt), document, _DOCUMENT_DEPTH)
+
+
+def encode_record(record: Dict[str, Any], fmt: str = 'json') -> bytes:
+    """编码流式获取中的一条记录：json 为一行 NDJSON，msgpack/cbor 为序列中的一个对象"""
+    if fmt == 'json':
+        return (json.dumps(record, ensure_ascii=False) + '\n').encode()
+    if fmt == 'msgpack':
+        return msgpack.packb(_raw_content(record), use_bin_type=True)
+    return cbor2.dumps(_raw_content(record))
+
+
+def media_type(fmt: str, stream: bool = False) -> str:
+    return RESPONSE_FORMATS[fmt][1 if stream else 0]
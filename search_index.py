@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""本地全文搜索索引
+同步获取的邮件（主题、发件人、收件人、正文、附件名）写入 SQLite FTS5 索引，
+搜索接口直接查询本地索引，不再访问邮箱服务器
+索引按 (邮箱类型, 用户名, 文件夹, UID) 保存，同一封邮件再次同步时更新；
+文件夹的 UIDVALIDITY 变化或 delta 同步发现邮件已删除时移除对应条目
+
+unicode61 分词器不切分中日韩文字，索引和查询时在每个中日韩字符两侧加空格（单字分词），
+查询词按短语匹配，因此"会议"只匹配相邻的"会""议"
+"""
+
+import os
+import re
+import hmac
+import json
+import hashlib
+import sqlite3
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import List, Dict, Any, Optional, Iterable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEARCH_DB = os.getenv('SEARCH_INDEX_DB_PATH', 'search_index.db')
+
+# 全文索引的字段，查询参数名 -> 索引字段
+SEARCH_FIELDS = {
+    'subject': 'subject',
+    'from': 'sender',
+    'to': 'recipient',
+    'body': 'body',
+    'attachment': 'attachments'
+}
+
+# bm25 中各字段的权重，顺序同 emails_fts 的列：主题、发件人、收件人、正文、附件名
+RANK_WEIGHTS = (10.0, 5.0, 3.0, 1.0, 2.0)
+
+# 排序方式：rank 按相关度（没有查询词时按日期），date 按日期从新到旧
+SORT_ORDERS = ('rank', 'date')
+
+# 凭据摘要的 PBKDF2 迭代次数
+PASSWORD_HASH_ITERATIONS = 200000
+# 同一账号在 SEARCH_AUTH_FAILURE_WINDOW 秒内验证失败 SEARCH_AUTH_MAX_FAILURES 次后暂停验证，
+# 防止借搜索接口猜测密码（按进程计数）
+SEARCH_AUTH_MAX_FAILURES = int(os.getenv('SEARCH_AUTH_MAX_FAILURES', '5'))
+SEARCH_AUTH_FAILURE_WINDOW = int(os.getenv('SEARCH_AUTH_FAILURE_WINDOW', '300'))
+# 记录验证失败的账号数上限，超过时清理已过窗口期的记录
+_MAX_TRACKED_FAILURES = 10000
+
+_CJK = re.compile('([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af])')
+_QUERY_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def segment_text(text: str) -> str:
+    """在每个中日韩字符两侧加空格，使 unicode61 分词器按单字切分"""
+    return _CJK.sub(r' \1 ', text or '')
+
+
+def _phrase(term: str) -> Optional[str]:
+    """查询词转为 FTS5 短语，以 * 结尾时按前缀匹配；不含文字的词返回 None"""
+    prefix = term.endswith('*')
+    term = term.rstrip('*')
+    if not re.search(r'\w', term):
+        return None
+    phrase = '"' + segment_text(term).strip().replace('"', '""') + '"'
+    return phrase + ' *' if prefix else phrase
+
+
+def build_match_query(query: Optional[str], fields: Optional[Dict[str, str]] = None) -> Optional[str]:
+    """将查询词和字段条件编译为 FTS5 MATCH 表达式，各条件之间为 AND；没有条件时返回 None
+
+    查询词以空白分隔，双引号括起的部分作为一个短语，以 * 结尾的词按前缀匹配；
+    fields 为 {查询参数名: 查询词}（见 SEARCH_FIELDS），只在对应字段中匹配
+    """
+    clauses = []
+    for name, text in [(None, query)] + sorted((fields or {}).items()):
+        if not text:
+            continue
+        if name is not None and name not in SEARCH_FIELDS:
+            raise ValueError(f"不支持的搜索字段: {name}. 支持的字段: {list(SEARCH_FIELDS)}")
+        for quoted, word in _QUERY_TERM.findall(text):
+            phrase = _phrase(quoted or word)
+            if phrase is None:
+                continue
+            clauses.append(f'{SEARCH_FIELDS[name]} : {phrase}' if name else phrase)
+    return ' AND '.join(clauses) or None
+
+
+def parse_date_param(value: Optional[str], end: bool = False) -> Optional[float]:
+    """将 ISO 日期或时间（如 2024-05-01、2024-05-01T08:00:00+08:00）转为时间戳，未带时区时按 UTC
+
+    end 为 True 且只有日期时取次日零点，作为不含的上界（until=2024-05-31 包含当天）
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"无效的日期: {value}，应为 ISO 格式（如 2024-05-01 或 2024-05-01T08:00:00+08:00）")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.timestamp()
+
+
+def _date_timestamp(date: str) -> float:
+    """邮件 Date 头的时间戳，无法解析时为 0（不匹配日期范围，按日期排序时排在最后）"""
+    try:
+        return parsedate_to_datetime(date or '').timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return 0.0
+
+
+def index_document(email: Dict[str, Any]) -> Dict[str, Any]:
+    """从获取的邮件中取出需要索引和在搜索结果中返回的字段（附件只保留元信息，不含内容）"""
+    return {
+        'uid': int(email['uid']),
+        'subject': email.get('subject') or '',
+        'sender': email.get('sender') or '',
+        'recipient': email.get('recipient') or '',
+        'date': email.get('date') or '',
+        'body': email.get('body') or '',
+        'attachments': [{key: attachment.get(key) for key in ('filename', 'size', 'content_type', 'part')}
+                        for attachment in email.get('attachments') or []],
+        'has_attachments': bool(email.get('has_attachments')),
+        'size': email.get('size')
+    }
+
+
+class SearchIndex:
+    """邮件全文索引
+
+    Args:
+        db_path: SQLite文件路径，为None时使用内存数据库（进程重启后丢失）
+        max_messages: 每个账号最多保留的邮件数，超过时删除日期最早的邮件
+    """
+
+    def __init__(self, db_path: Optional[str] = DEFAULT_SEARCH_DB, max_messages: int = 100000):
+        self.db_path = db_path
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        # 本进程内已验证过的凭据：账号 -> HMAC(盐, 密码)，避免每次搜索都计算 PBKDF2
+        self._verified = {}
+        # 验证失败的时间：账号 -> deque[time.monotonic()]
+        self._failures = {}
+        self._stats = {
+            'queries': 0,
+            'indexed': 0,
+            'removed': 0,
+            'evicted': 0,
+            'auth_failures': 0,
+            'auth_throttled': 0
+        }
+        self._conn = sqlite3.connect(db_path or ':memory:', check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS emails (
+                id INTEGER PRIMARY KEY,
+                account TEXT NOT NULL,
+                folder TEXT NOT NULL,
+                uidvalidity INTEGER NOT NULL,
+                uid INTEGER NOT NULL,
+                date_ts REAL NOT NULL,
+                has_attachments INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                UNIQUE (account, folder, uid)
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_emails_date ON emails (account, date_ts)')
+        # rowid 与 emails.id 相同；保存的是分词后的文本，结果中的字段从 emails.data 读取
+        self._conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+                subject, sender, recipient, body, attachments, tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS accounts (
+                account TEXT PRIMARY KEY,
+                salt BLOB NOT NULL,
+                password_hash BLOB NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    @staticmethod
+    def _account(provider: str, username: str) -> str:
+        return f"{provider.lower()}:{username.lower()}"
+
+    def add(self, provider: str, username: str, folder: str, uidvalidity: Optional[int],
+            documents: Iterable[Dict[str, Any]]):
+        """写入或更新一个文件夹中的邮件（index_document 的结果）
+
+        文件夹的 UIDVALIDITY 变化时先删除该文件夹的旧条目；已索引的邮件再次写入时保留较长的正文
+        （列表模式和内存不足时只有正文前缀或没有正文）
+        """
+        if uidvalidity is None:
+            return
+        account = self._account(provider, username)
+        documents = list(documents)
+        with self._lock:
+            self._delete_where('account = ? AND folder = ? AND uidvalidity != ?', (account, folder, uidvalidity))
+            for start in range(0, len(documents), 500):
+                chunk = documents[start:start + 500]
+                rows = self._conn.execute(
+                    f'SELECT id, uid, data FROM emails WHERE account = ? AND folder = ? '
+                    f'AND uid IN ({",".join("?" * len(chunk))})',
+                    [account, folder] + [document['uid'] for document in chunk]
+                ).fetchall()
+                existing = {uid: (row_id, json.loads(data)) for row_id, uid, data in rows}
+                self._delete_ids([row_id for row_id, _ in existing.values()])
+                for document in chunk:
+                    previous = existing.get(document['uid'])
+                    if previous and len(previous[1].get('body') or '') > len(document['body']):
+                        document = {**document, 'body': previous[1]['body']}
+                    self._insert(account, folder, uidvalidity, document)
+            self._stats['indexed'] += len(documents)
+            self._evict(account)
+            self._conn.commit()
+
+    def remove(self, provider: str, username: str, folder: str, uids: List[int]):
+        """删除文件夹中已不存在的邮件"""
+        if not uids:
+            return
+        account = self._account(provider, username)
+        with self._lock:
+            for start in range(0, len(uids), 500):
+                chunk = [int(uid) for uid in uids[start:start + 500]]
+                self._stats['removed'] += self._delete_where(
+                    f'account = ? AND folder = ? AND uid IN ({",".join("?" * len(chunk))})',
+                    [account, folder] + chunk)
+            self._conn.commit()
+
+    def authorize(self, provider: str, username: str, password: str):
+        """记录已通过邮箱服务器登录验证的凭据（加盐的 PBKDF2 摘要），搜索时据此验证"""
+        account = self._account(provider, username)
+        with self._lock:
+            self._failures.pop(account, None)
+        if self._check(account, password):
+            return
+        salt = os.urandom(16)
+        password_hash = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, PASSWORD_HASH_ITERATIONS)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO accounts (account, salt, password_hash, updated_at) VALUES (?, ?, ?, ?)',
+                (account, salt, password_hash, datetime.now().isoformat())
+            )
+            self._conn.commit()
+            self._verified[account] = hmac.new(salt, password.encode('utf-8'), hashlib.sha256).digest()
+
+    def auth_retry_after(self, provider: str, username: str) -> Optional[float]:
+        """该账号验证失败次数过多时返回需要等待的秒数，否则返回 None"""
+        account = self._account(provider, username)
+        now = time.monotonic()
+        with self._lock:
+            failures = self._failures.get(account)
+            if not failures:
+                return None
+            while failures and now - failures[0] >= SEARCH_AUTH_FAILURE_WINDOW:
+                failures.popleft()
+            if len(failures) < SEARCH_AUTH_MAX_FAILURES:
+                return None
+            self._stats['auth_throttled'] += 1
+            return SEARCH_AUTH_FAILURE_WINDOW - (now - failures[0])
+
+    def verify(self, provider: str, username: str, password: str) -> Optional[bool]:
+        """验证凭据是否与最近一次同步时一致；该账号从未同步过时返回 None
+
+        账号不存在时同样计算一次 PBKDF2，响应时间不会暴露账号是否已同步；两种失败都计入失败次数
+        """
+        account = self._account(provider, username)
+        verified = self._check(account, password)
+        if verified is None:
+            hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), b'\0' * 16, PASSWORD_HASH_ITERATIONS)
+        if not verified:
+            self._record_failure(account)
+        return verified
+
+    def _check(self, account: str, password: str) -> Optional[bool]:
+        with self._lock:
+            row = self._conn.execute('SELECT salt, password_hash FROM accounts WHERE account = ?',
+                                     (account,)).fetchone()
+            verified = self._verified.get(account)
+        if row is None:
+            return None
+        salt, password_hash = row
+        digest = hmac.new(salt, password.encode('utf-8'), hashlib.sha256).digest()
+        if verified is not None and hmac.compare_digest(verified, digest):
+            return True
+        candidate = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, PASSWORD_HASH_ITERATIONS)
+        if not hmac.compare_digest(candidate, password_hash):
+            return False
+        with self._lock:
+            self._verified[account] = digest
+        return True
+
+    def _record_failure(self, account: str):
+        now = time.monotonic()
+        with self._lock:
+            self._stats['auth_failures'] += 1
+            if account not in self._failures and len(self._failures) >= _MAX_TRACKED_FAILURES:
+                self._failures = {key: failures for key, failures in self._failures.items()
+                                  if failures and now - failures[-1] < SEARCH_AUTH_FAILURE_WINDOW}
+            self._failures.setdefault(account, deque(maxlen=max(1, SEARCH_AUTH_MAX_FAILURES))).append(now)
+
+    def search(self, provider: str, username: str, query: Optional[str] = None,
+               fields: Optional[Dict[str, str]] = None, folder: Optional[str] = None,
+               since: Optional[float] = None, until: Optional[float] = None,
+               has_attachments: Optional[bool] = None, sort: str = 'rank',
+               limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """搜索一个账号的邮件
+
+        Args:
+            query: 在全部字段中匹配的查询词
+            fields: 字段条件 {查询参数名: 查询词}，见 SEARCH_FIELDS
+            folder: 只搜索该文件夹
+            since/until: 邮件日期的时间戳范围 [since, until)
+            has_attachments: 只返回有（或没有）附件的邮件
+            sort: rank 按相关度（bm25，主题和发件人的权重较高），date 按日期从新到旧
+
+        Returns:
+            dict: {'total': 匹配的邮件数, 'emails': [邮件信息 + folder/uidvalidity/score]}
+        """
+        if sort not in SORT_ORDERS:
+            raise ValueError(f"不支持的排序方式: {sort}. 支持的排序方式: {list(SORT_ORDERS)}")
+        match = build_match_query(query, fields)
+        conditions, params = ['e.account = ?'], [self._account(provider, username)]
+        if folder:
+            conditions.append('e.folder = ?')
+            params.append(folder)
+        if since is not None:
+            conditions.append('e.date_ts >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('e.date_ts < ?')
+            params.append(until)
+        if has_attachments is not None:
+            conditions.append('e.has_attachments = ?')
+            params.append(int(has_attachments))
+        if match:
+            # CROSS JOIN 固定先执行全文匹配再按 rowid 查找 emails，否则 SQLite 可能逐行重复匹配
+            source = 'emails_fts CROSS JOIN emails e ON e.id = emails_fts.rowid'
+            conditions.insert(0, 'emails_fts MATCH ?')
+            params.insert(0, match)
+            score = f"bm25(emails_fts, {', '.join(str(weight) for weight in RANK_WEIGHTS)})"
+        else:
+            source, score = 'emails e', 'NULL'
+        order = 'score, date_ts DESC' if match and sort == 'rank' else 'date_ts DESC, uid DESC'
+        where = ' AND '.join(conditions)
+        with self._lock:
+            self._stats['queries'] += 1
+            try:
+                # 排序时只带 id 和得分，本页的邮件内容排序后再读取；总数用窗口函数在同一次匹配中得到
+                page = self._conn.execute(
+                    f'SELECT id, score, COUNT(*) OVER () FROM (SELECT e.id AS id, {score} AS score, '
+                    f'e.date_ts AS date_ts, e.uid AS uid FROM {source} WHERE {where}) ORDER BY {order} LIMIT ? OFFSET ?',
+                    params + [int(limit), int(offset)]
+                ).fetchall()
+                if page:
+                    total = page[0][2]
+                else:
+                    total = self._conn.execute(f'SELECT COUNT(*) FROM {source} WHERE {where}', params).fetchone()[0]
+                rows = dict(((row_id, (folder_name, uidvalidity, data)) for row_id, folder_name, uidvalidity, data
+                             in self._conn.execute(
+                                 f'SELECT id, folder, uidvalidity, data FROM emails '
+                                 f'WHERE id IN ({",".join("?" * len(page))})', [row[0] for row in page])))
+            except sqlite3.OperationalError as e:
+                raise ValueError(f"无效的查询: {e}")
+        emails = []
+        for row_id, rank, _ in page:
+            folder_name, uidvalidity, data = rows[row_id]
+            email_info = json.loads(data)
+            email_info['folder'] = folder_name
+            email_info['uidvalidity'] = uidvalidity
+            if rank is not None:
+                # bm25 越小越相关，取反后越大越相关
+                email_info['score'] = round(-rank, 4)
+            emails.append(email_info)
+        return {'total': total, 'emails': emails}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            documents = self._conn.execute('SELECT COUNT(*) FROM emails').fetchone()[0]
+            accounts = self._conn.execute('SELECT COUNT(*) FROM accounts').fetchone()[0]
+            page_count = self._conn.execute('PRAGMA page_count').fetchone()[0]
+            page_size = self._conn.execute('PRAGMA page_size').fetchone()[0]
+            return {
+                'documents': documents,
+                'accounts': accounts,
+                'disk_bytes': page_count * page_size if self.db_path else 0,
+                'max_messages': self.max_messages,
+                **self._stats
+            }
+
+    def _insert(self, account: str, folder: str, uidvalidity: int, document: Dict[str, Any]):
+        """写入一封邮件（调用方需持有锁）"""
+        cursor = self._conn.execute(
+            'INSERT INTO emails (account, folder, uidvalidity, uid, date_ts, has_attachments, data) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (account, folder, uidvalidity, document['uid'], _date_timestamp(document['date']),
+             int(document['has_attachments']), json.dumps(document, ensure_ascii=False))
+        )
+        attachments = ' '.join(attachment.get('filename') or '' for attachment in document['attachments'])
+        self._conn.execute(
+            'INSERT INTO emails_fts (rowid, subject, sender, recipient, body, attachments) VALUES (?, ?, ?, ?, ?, ?)',
+            (cursor.lastrowid, *(segment_text(text) for text in (document['subject'], document['sender'],
+                                                                   document['recipient'], document['body'],
+                                                                   attachments)))
+        )
+
+    def _delete_ids(self, ids: List[int]):
+        """删除指定的邮件条目（调用方需持有锁）"""
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            self._conn.execute(f'DELETE FROM emails_fts WHERE rowid IN ({placeholders})', chunk)
+            self._conn.execute(f'DELETE FROM emails WHERE id IN ({placeholders})', chunk)
+
+    def _delete_where(self, condition: str, params) -> int:
+        """删除满足条件的邮件条目，返回删除的条目数（调用方需持有锁）"""
+        ids = [row[0] for row in self._conn.execute(f'SELECT id FROM emails WHERE {condition}', params)]
+        self._delete_ids(ids)
+        return len(ids)
+
+    def _evict(self, account: str):
+        """账号的邮件数超过上限时删除日期最早的邮件（调用方需持有锁）"""
+        excess = self._conn.execute('SELECT COUNT(*) FROM emails WHERE account = ?',
+                                    (account,)).fetchone()[0] - self.max_messages
+        if excess <= 0:
+            return
+        ids = [row[0] for row in self._conn.execute(
+            'SELECT id FROM emails WHERE account = ? ORDER BY date_ts, uid LIMIT ?', (account, excess))]
+        self._delete_ids(ids)
+        self._stats['evicted'] += len(ids)
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+_default_index_failed = False
+
+
+def get_search_index() -> Optional[SearchIndex]:
+    """获取进程内共享的搜索索引（参数可通过环境变量配置）；SQLite 不支持 FTS5 时返回 None"""
+    global _default_index, _default_index_failed
+    with _default_index_lock:
+        if _default_index is None and not _default_index_failed:
+            try:
+                _default_index = SearchIndex(
+                    db_path=os.getenv('SEARCH_INDEX_DB_PATH', DEFAULT_SEARCH_DB) or None,
+                    max_messages=int(os.getenv('SEARCH_INDEX_MAX_MESSAGES', '100000'))
+                )
+            except sqlite3.OperationalError as e:
+                logger.warning(f"无法创建搜索索引（SQLite 可能不支持 FTS5），本地搜索不可用: {e}")
+                _default_index_failed = True
+        return _default_index
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""同一邮箱并发同步请求的合并
+客户端常在几秒内对同一账号重复调用 /api/sync/email，每次都打开新的 IMAP 会话获取相同的邮件，
+负载翻倍且容易触发服务器限流。参数完全相同（包括凭据）的请求在进程内共用一次同步：
+第一个请求执行同步，同步进行中到达的请求等待并返回同一个结果；
+不改变同步状态的请求（非增量）在同步完成后 SYNC_COALESCE_TTL 秒内直接返回该结果
+合并只在同一进程内进行，多个 gunicorn worker 之间不共享
+"""
+
+import os
+import hmac
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Optional, Tuple
+
+from metrics import SYNC_COALESCED
+
+# 同步完成后结果的复用时间（秒），0 表示只合并进行中的请求
+SYNC_COALESCE_TTL = float(os.getenv('SYNC_COALESCE_TTL', '2'))
+# 保留的已完成结果的邮件内容合计上限（字节）
+SYNC_COALESCE_MAX_BYTES = int(os.getenv('SYNC_COALESCE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# 请求键中的密码摘要使用进程内随机密钥，键不会泄露密码
+_KEY_SECRET = os.urandom(32)
+
+
+def sync_key(config: Dict[str, Any]) -> str:
+    """同步配置的请求键：邮箱类型、用户名、文件夹和全部获取参数相同，且密码相同的请求才会合并"""
+    fields = dict(config)
+    password = str(fields.pop('email_password', '') or '')
+    fields['email_password'] = hmac.new(_KEY_SECRET, password.encode('utf-8'), hashlib.sha256).hexdigest()
+    fields['email_provider'] = str(fields.get('email_provider') or '').lower()
+    fields['email_username'] = str(fields.get('email_username') or '').lower()
+    return json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _result_bytes(result: Dict[str, Any]) -> int:
+    """估算结果占用的内存：正文和附件内容的长度"""
+    total = 0
+    for email in result.get('emails') or []:
+        total += len(email.get('body') or '')
+        for attachment in email.get('attachments') or []:
+            total += len(attachment.get('content') or '')
+    return total
+
+
+class _Flight:
+    """一次进行中的同步"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SyncCoalescer:
+    """按请求键合并并发的同步
+
+    Args:
+        ttl: 已完成结果的复用时间（秒），0 表示只合并进行中的请求
+        max_bytes: 保留的已完成结果的邮件内容合计上限（字节），超过时淘汰最早的结果
+    """
+
+    def __init__(self, ttl: float = SYNC_COALESCE_TTL, max_bytes: int = SYNC_COALESCE_MAX_BYTES):
+        self.ttl = max(0.0, float(ttl))
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._inflight = {}  # 请求键 -> _Flight
+        self._recent = OrderedDict()  # 请求键 -> (过期时间, 结果, 字节数)
+        self._recent_bytes = 0
+        self._stats = {
+            'executions': 0,
+            'inflight_hits': 0,
+            'recent_hits': 0
+        }
+
+    def run(self, key: str, execute: Callable[[], Dict[str, Any]], reuse: bool = True,
+            metrics_provider: str = '') -> Tuple[Dict[str, Any], Optional[str]]:
+        """执行同步或复用相同请求的结果，返回 (结果, 来源)
+
+        来源为 None（本请求执行了同步）、inflight（等待进行中的同步）或 recent（TTL 内的已完成结果）。
+        reuse 为 False 时（增量/delta 同步会推进水位线，重复执行应返回新的结果）不使用已完成的结果，
+        但仍与进行中的相同请求合并。失败的结果（success 为 False 或抛出异常）只返回给等待中的请求，不保留
+        """
+        with self._lock:
+            if reuse:
+                cached = self._recent.get(key)
+                if cached is not None and cached[0] > time.monotonic():
+                    self._stats['recent_hits'] += 1
+                    SYNC_COALESCED.inc(provider=metrics_provider, source='recent')
+                    return cached[1], 'recent'
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self._stats['executions'] += 1
+            else:
+                flight.waiters += 1
+                self._stats['inflight_hits'] += 1
+
+        if not leader:
+            SYNC_COALESCED.inc(provider=metrics_provider, source='inflight')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, 'inflight'
+
+        try:
+            flight.result = execute()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if reuse and flight.result is not None and flight.result.get('success'):
+                    self._remember(key, flight.result)
+            flight.done.set()
+        return flight.result, None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'inflight': len(self._inflight),
+                'waiting': sum(flight.waiters for flight in self._inflight.values()),
+                'recent_entries': len(self._recent),
+                'recent_bytes': self._recent_bytes,
+                'ttl': self.ttl,
+                **self._stats
+            }
+
+    def _remember(self, key: str, result: Dict[str, Any]):
+        """保留已完成的结果，同时清理过期和超出字节上限的结果（调用方需持有锁）"""
+        now = time.monotonic()
+        for old_key in [k for k, (expires, _, _) in self._recent.items() if expires <= now]:
+            self._recent_bytes -= self._recent.pop(old_key)[2]
+        if self.ttl <= 0:
+            return
+        size = _result_bytes(result)
+        if size > self.max_bytes:
+            return
+        old = self._recent.pop(key, None)
+        if old is not None:
+            self._recent_bytes -= old[2]
+        self._recent[key] = (now + self.ttl, result, size)
+        self._recent_bytes += size
+        while self._recent_bytes > self.max_bytes and self._recent:
+            self._recent_bytes -= self._recent.popitem(last=False)[1][2]
+
+
+_default_coalescer = None
+_default_coalescer_lock = threading.Lock()
+
+
+def get_sync_coalescer() -> SyncCoalescer:
+    """获取进程内共享的同步合并器（参数可通过环境变量配置）"""
+    global _default_coalescer
+    with _default_coalescer_lock:
+        if _default_coalescer is None:
+            _default_coalescer = SyncCoalescer(
+                ttl=float(os.getenv('SYNC_COALESCE_TTL', str(SYNC_COALESCE_TTL))),
+                max_bytes=int(os.getenv('SYNC_COALESCE_MAX_BYTES', str(SYNC_COALESCE_MAX_BYTES)))
+            )
+        return _default_coalescer
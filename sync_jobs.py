@@ -0,0 +1,606 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""后台同步任务
+HTTP请求只负责提交任务并立即返回任务ID，由后台线程执行 EmailSyncAction.sync_emails，
+支持按账号设置周期性同步计划。单进程时任务队列默认在进程内存中，
+多个gunicorn worker（WEB_CONCURRENCY > 1）时默认使用SQLite持久化（各进程共享同一队列，进程重启后未完成的任务重新执行）
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# gunicorn 的 worker 数（gunicorn 未指定 --workers 时也读取该变量）
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+# 进程内队列只对提交任务的 worker 可见，多个 worker 时默认使用SQLite队列
+JOB_STORE = os.getenv('JOB_STORE') or ('sqlite' if WEB_CONCURRENCY > 1 else 'memory')
+DEFAULT_JOB_DB = os.getenv('JOB_DB_PATH', 'email_sync_jobs.db')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', '600'))
+# 保存的任务结果（JSON）超过该大小时只保留摘要，不保留邮件内容
+JOB_RESULT_MAX_BYTES = int(os.getenv('JOB_RESULT_MAX_BYTES', str(1024 * 1024)))
+JOB_MIN_INTERVAL = int(os.getenv('JOB_MIN_INTERVAL', '60'))
+# 执行中的任务由所在进程定期刷新心跳时间
+JOB_HEARTBEAT_INTERVAL = int(os.getenv('JOB_HEARTBEAT_INTERVAL', '30'))
+# running 状态的任务超过该时间没有心跳时视为执行进程已退出，重新排队
+JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', '180'))
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+if JOB_STORE not in ('memory', 'sqlite'):
+    raise ValueError(f"JOB_STORE 只能是 memory 或 sqlite: {JOB_STORE}")
+if JOB_STORE == 'memory' and WEB_CONCURRENCY > 1:
+    # 提交任务和查询任务的请求可能落在不同的 worker 上，查询会返回 404
+    raise ValueError(f"WEB_CONCURRENCY={WEB_CONCURRENCY} 时不能使用进程内任务队列，请设置 JOB_STORE=sqlite")
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex
+
+
+def result_summary(result: Optional[Dict[str, Any]], max_bytes: int = JOB_RESULT_MAX_BYTES) -> Optional[Dict[str, Any]]:
+    """任务结果在保留期内一直占用内存或数据库空间：结果超过 max_bytes 时去掉邮件列表和日志，
+    只保留邮件数、水位线等摘要（emails_omitted 为 True），0 表示不限制"""
+    if not result or max_bytes <= 0:
+        return result
+    if len(json.dumps(result, ensure_ascii=False, default=str).encode('utf-8')) <= max_bytes:
+        return result
+    summary = {key: value for key, value in result.items() if key not in ('emails', 'logs')}
+    summary['emails_omitted'] = True
+    return summary
+
+
+def _worker_id() -> str:
+    """当前进程的标识（主机名:进程号），gunicorn --preload 时 fork 后进程号才确定，每次调用时计算"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+def _public_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """去掉密码后的配置，用于接口返回"""
+    return {k: v for k, v in config.items() if k != 'email_password'}
+
+
+class JobStore(ABC):
+    """任务和同步计划存储基类"""
+
+    @abstractmethod
+    def enqueue(self, job: Dict[str, Any]):
+        """加入队列"""
+        pass
+
+    @abstractmethod
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """取出最早的排队任务并标记为 running，队列为空时返回None"""
+        pass
+
+    @abstractmethod
+    def update(self, job_id: str, **fields):
+        """更新任务字段"""
+        pass
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def prune(self, before: float) -> int:
+        """删除在 before 之前结束的任务，返回删除数量"""
+        pass
+
+    @abstractmethod
+    def add_schedule(self, schedule: Dict[str, Any]):
+        pass
+
+    @abstractmethod
+    def list_schedules(self) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def delete_schedule(self, schedule_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def claim_due_schedules(self, now: float) -> List[Dict[str, Any]]:
+        """取出到期的计划并将其下次执行时间推后一个周期"""
+        pass
+
+    @abstractmethod
+    def set_schedule_job(self, schedule_id: str, job_id: str):
+        """记录计划最近一次提交的任务"""
+        pass
+
+    def heartbeat(self, job_ids: List[str], now: float):
+        """刷新执行中任务的心跳时间"""
+        pass
+
+    def requeue_stale(self, before: float) -> int:
+        """将最近心跳在 before 之前、仍处于 running 的任务重新排队（执行进程已退出），返回数量"""
+        return 0
+
+    def counts(self) -> Dict[str, int]:
+        return {}
+
+
+class MemoryJobStore(JobStore):
+    """进程内存储（默认），进程重启后丢失"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._queue = deque()
+        self._schedules = {}
+
+    def enqueue(self, job):
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+            self._queue.append(job['id'])
+
+    def claim(self):
+        with self._lock:
+            while self._queue:
+                job = self._jobs.get(self._queue.popleft())
+                if job and job['status'] == 'queued':
+                    job['status'] = 'running'
+                    job['started_at'] = time.time()
+                    return dict(job)
+            return None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def prune(self, before):
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.get('finished_at') and job['finished_at'] < before]
+            for job_id in expired:
+                del self._jobs[job_id]
+            return len(expired)
+
+    def add_schedule(self, schedule):
+        with self._lock:
+            self._schedules[schedule['id']] = dict(schedule)
+
+    def list_schedules(self):
+        with self._lock:
+            return [dict(schedule) for schedule in self._schedules.values()]
+
+    def delete_schedule(self, schedule_id):
+        with self._lock:
+            return self._schedules.pop(schedule_id, None) is not None
+
+    def claim_due_schedules(self, now):
+        with self._lock:
+            due = []
+            for schedule in self._schedules.values():
+                if schedule['next_run'] <= now:
+                    schedule['next_run'] = now + schedule['interval_seconds']
+                    due.append(dict(schedule))
+            return due
+
+    def set_schedule_job(self, schedule_id, job_id):
+        with self._lock:
+            if schedule_id in self._schedules:
+                self._schedules[schedule_id]['last_job_id'] = job_id
+
+    def counts(self):
+        with self._lock:
+            counts = dict.fromkeys(JOB_STATUSES, 0)
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
+
+
+class SqliteJobStore(JobStore):
+    """SQLite持久化存储
+
+    同一数据库可被多个进程共享；任务领取和计划触发都在写事务中完成，不会重复执行。
+    领取任务时记录执行进程（owner），执行期间由该进程定期刷新 heartbeat_at，心跳过期的任务才重新排队。
+    注意：为了在重启后继续执行，任务配置（包括邮箱密码）以明文保存在数据库中
+    """
+
+    _JOB_COLUMNS = ('id', 'status', 'config', 'schedule_id', 'created_at', 'started_at',
+                    'finished_at', 'result', 'error', 'owner', 'heartbeat_at')
+    _SCHEDULE_COLUMNS = ('id', 'config', 'interval_seconds', 'next_run', 'created_at', 'last_job_id')
+
+    def __init__(self, db_path: str = DEFAULT_JOB_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                config TEXT NOT NULL,
+                schedule_id TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                result TEXT,
+                error TEXT,
+                owner TEXT,
+                heartbeat_at REAL
+            )
+        ''')
+        # 旧版本创建的数据库没有心跳字段
+        existing = {row[1] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+        for column, column_type in (('owner', 'TEXT'), ('heartbeat_at', 'REAL')):
+            if column not in existing:
+                self._conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {column_type}')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS schedules (
+                id TEXT PRIMARY KEY,
+                config TEXT NOT NULL,
+                interval_seconds INTEGER NOT NULL,
+                next_run REAL NOT NULL,
+                created_at REAL NOT NULL,
+                last_job_id TEXT
+            )
+        ''')
+
+    def _job_from_row(self, row) -> Dict[str, Any]:
+        job = dict(zip(self._JOB_COLUMNS, row))
+        job['config'] = json.loads(job['config'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def enqueue(self, job):
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, status, config, schedule_id, created_at) VALUES (?, ?, ?, ?, ?)',
+                (job['id'], job['status'], json.dumps(job['config'], ensure_ascii=False),
+                 job.get('schedule_id'), job['created_at'])
+            )
+
+    def claim(self):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    f'SELECT {", ".join(self._JOB_COLUMNS)} FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1',
+                    ('queued',)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute('COMMIT')
+                    return None
+                started_at, owner = time.time(), _worker_id()
+                self._conn.execute('UPDATE jobs SET status = ?, started_at = ?, owner = ?, heartbeat_at = ? '
+                                   'WHERE id = ?', ('running', started_at, owner, started_at, row[0]))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        job = self._job_from_row(row)
+        job.update(status='running', started_at=started_at, owner=owner, heartbeat_at=started_at)
+        return job
+
+    def heartbeat(self, job_ids, now):
+        with self._lock:
+            self._conn.executemany('UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?',
+                                   [(now, job_id, 'running') for job_id in job_ids])
+
+    def requeue_stale(self, before):
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET status = ?, started_at = NULL, owner = NULL, heartbeat_at = NULL '
+                'WHERE status = ? AND COALESCE(heartbeat_at, started_at) < ?',
+                ('queued', 'running', before)
+            )
+            return cursor.rowcount
+
+    def update(self, job_id, **fields):
+        if 'result' in fields:
+            fields['result'] = json.dumps(fields['result'], ensure_ascii=False) if fields['result'] is not None else None
+        columns = [column for column in fields if column in self._JOB_COLUMNS]
+        if not columns:
+            return
+        with self._lock:
+            self._conn.execute(
+                f'UPDATE jobs SET {", ".join(f"{column} = ?" for column in columns)} WHERE id = ?',
+                [fields[column] for column in columns] + [job_id]
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT {", ".join(self._JOB_COLUMNS)} FROM jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+        return self._job_from_row(row) if row else None
+
+    def prune(self, before):
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?',
+                                        (before,))
+            return cursor.rowcount
+
+    def add_schedule(self, schedule):
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO schedules (id, config, interval_seconds, next_run, created_at, last_job_id) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (schedule['id'], json.dumps(schedule['config'], ensure_ascii=False), schedule['interval_seconds'],
+                 schedule['next_run'], schedule['created_at'], schedule.get('last_job_id'))
+            )
+
+    def _schedule_from_row(self, row) -> Dict[str, Any]:
+        schedule = dict(zip(self._SCHEDULE_COLUMNS, row))
+        schedule['config'] = json.loads(schedule['config'])
+        return schedule
+
+    def list_schedules(self):
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT {", ".join(self._SCHEDULE_COLUMNS)} FROM schedules ORDER BY created_at'
+            ).fetchall()
+        return [self._schedule_from_row(row) for row in rows]
+
+    def delete_schedule(self, schedule_id):
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM schedules WHERE id = ?', (schedule_id,))
+            return cursor.rowcount > 0
+
+    def claim_due_schedules(self, now):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._conn.execute(
+                    f'SELECT {", ".join(self._SCHEDULE_COLUMNS)} FROM schedules WHERE next_run <= ?', (now,)
+                ).fetchall()
+                self._conn.executemany('UPDATE schedules SET next_run = ? WHERE id = ?',
+                                       [(now + row[2], row[0]) for row in rows])
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return [self._schedule_from_row(row) for row in rows]
+
+    def set_schedule_job(self, schedule_id, job_id):
+        with self._lock:
+            self._conn.execute('UPDATE schedules SET last_job_id = ? WHERE id = ?', (job_id, schedule_id))
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update(dict(rows))
+        return counts
+
+
+class SyncJobManager:
+    """后台任务执行器
+
+    Args:
+        store: 任务存储，默认进程内存储
+        workers: 执行任务的后台线程数
+        poll_interval: 空闲时检查队列和计划的间隔（秒）
+        result_ttl: 已结束任务的保留时间（秒）
+        heartbeat_interval: 刷新执行中任务心跳的间隔（秒）
+    """
+
+    def __init__(self, store: Optional[JobStore] = None, workers: int = JOB_WORKERS,
+                 poll_interval: float = 1.0, result_ttl: int = JOB_RESULT_TTL,
+                 heartbeat_interval: float = JOB_HEARTBEAT_INTERVAL):
+        self.store = store or MemoryJobStore()
+        self.workers = max(1, int(workers))
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self._running = set()  # 本进程正在执行的任务ID
+        self._running_lock = threading.Lock()
+        self._threads = []
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """启动后台线程（重复调用无副作用）"""
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f'sync-job-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._scheduler_loop, name='sync-job-scheduler', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            logger.info(f"后台任务执行器已启动，工作线程数: {self.workers}")
+
+    def stop(self, timeout: float = 5):
+        """停止后台线程，正在执行的任务会执行完毕"""
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, config: Dict[str, Any], schedule_id: Optional[str] = None) -> Dict[str, Any]:
+        """提交一次同步任务，立即返回任务信息"""
+        job = {
+            'id': _new_id(),
+            'status': 'queued',
+            'config': dict(config),
+            'schedule_id': schedule_id,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None
+        }
+        self.store.enqueue(job)
+        with self._wakeup:
+            self._wakeup.notify()
+        return self.public_job(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.store.get(job_id)
+        return self.public_job(job) if job else None
+
+    def add_schedule(self, config: Dict[str, Any], interval_seconds: int,
+                     run_immediately: bool = True) -> Dict[str, Any]:
+        """添加周期性同步计划"""
+        now = time.time()
+        schedule = {
+            'id': _new_id(),
+            'config': dict(config),
+            'interval_seconds': int(interval_seconds),
+            'next_run': now if run_immediately else now + int(interval_seconds),
+            'created_at': now,
+            'last_job_id': None
+        }
+        self.store.add_schedule(schedule)
+        with self._wakeup:
+            self._wakeup.notify_all()
+        return self.public_schedule(schedule)
+
+    def list_schedules(self) -> List[Dict[str, Any]]:
+        return [self.public_schedule(schedule) for schedule in self.store.list_schedules()]
+
+    def delete_schedule(self, schedule_id: str) -> bool:
+        return self.store.delete_schedule(schedule_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'store': self.store.__class__.__name__,
+            'workers': self.workers,
+            'running': bool(self._threads),
+            'jobs': self.store.counts(),
+            'schedules': len(self.store.list_schedules())
+        }
+
+    @staticmethod
+    def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'job_id': job['id'],
+            'status': job['status'],
+            'schedule_id': job.get('schedule_id'),
+            'config': _public_config(job['config']),
+            'created_at': _isoformat(job['created_at']),
+            'started_at': _isoformat(job.get('started_at')),
+            'finished_at': _isoformat(job.get('finished_at')),
+            'result': job.get('result'),
+            'error': job.get('error')
+        }
+
+    @staticmethod
+    def public_schedule(schedule: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'schedule_id': schedule['id'],
+            'config': _public_config(schedule['config']),
+            'interval_seconds': schedule['interval_seconds'],
+            'next_run': _isoformat(schedule['next_run']),
+            'created_at': _isoformat(schedule['created_at']),
+            'last_job_id': schedule.get('last_job_id')
+        }
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            try:
+                job = self.store.claim()
+            except Exception as e:
+                logger.error(f"领取任务失败: {str(e)}")
+                job = None
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]):
+        """执行单个任务并记录结果"""
+        from email_sync_action import EmailSyncAction
+
+        logger.info(f"开始执行后台任务 {job['id']}，用户: {job['config'].get('email_username')}")
+        with self._running_lock:
+            self._running.add(job['id'])
+        try:
+            result = EmailSyncAction(dict(job['config'])).sync_emails()
+            status = 'succeeded' if result.get('success') else 'failed'
+            error = None if result.get('success') else result.get('error')
+        except Exception as e:
+            logger.error(f"后台任务 {job['id']} 执行失败: {str(e)}")
+            result, status, error = None, 'failed', str(e)
+        finally:
+            with self._running_lock:
+                self._running.discard(job['id'])
+        self.store.update(job['id'], status=status, result=result_summary(result), error=error,
+                          finished_at=time.time())
+        logger.info(f"后台任务 {job['id']} 执行完成，状态: {status}")
+
+    def _scheduler_loop(self):
+        """触发到期的同步计划、刷新执行中任务的心跳并清理过期任务"""
+        last_prune = last_heartbeat = 0
+        while not self._stopping.is_set():
+            now = time.time()
+            try:
+                if now - last_heartbeat >= self.heartbeat_interval:
+                    with self._running_lock:
+                        running = list(self._running)
+                    if running:
+                        self.store.heartbeat(running, now)
+                    last_heartbeat = now
+                for schedule in self.store.claim_due_schedules(now):
+                    # 上一次提交的任务尚未结束时跳过本周期，避免同一账号的任务堆积
+                    last_job = self.store.get(schedule['last_job_id']) if schedule.get('last_job_id') else None
+                    if last_job and last_job['status'] in ('queued', 'running'):
+                        logger.info(f"同步计划 {schedule['id']} 的上一次任务尚未结束，跳过本周期")
+                        continue
+                    job = self.submit(schedule['config'], schedule_id=schedule['id'])
+                    self.store.set_schedule_job(schedule['id'], job['job_id'])
+                if now - last_prune > 60:
+                    self.store.prune(now - self.result_ttl)
+                    requeued = self.store.requeue_stale(now - JOB_STALE_SECONDS)
+                    if requeued:
+                        logger.warning(f"{requeued} 个任务的执行进程已无心跳，已重新排队")
+                    last_prune = now
+            except Exception as e:
+                logger.error(f"同步计划检查失败: {str(e)}")
+            self._stopping.wait(self.poll_interval)
+
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> SyncJobManager:
+    """获取进程内共享的任务执行器（首次调用时启动后台线程）
+
+    JOB_STORE=sqlite（WEB_CONCURRENCY > 1 时的默认值）时使用 JOB_DB_PATH 指定的SQLite队列
+    """
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            store = SqliteJobStore(DEFAULT_JOB_DB) if JOB_STORE == 'sqlite' else MemoryJobStore()
+            _default_manager = SyncJobManager(store)
+            _default_manager.start()
+        return _default_manager
+
+
+def peek_job_manager() -> Optional[SyncJobManager]:
+    """返回已创建的任务执行器，尚未创建时返回 None（不启动后台线程，供状态查询使用）"""
+    return _default_manager
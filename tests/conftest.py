@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""测试公共配置
+所有测试连接 benchmarks/fake_imap_server.py 中的本地模拟服务器（明文IMAP），不访问真实邮箱。
+本地状态数据库放在临时目录中，邮件缓存和搜索索引只使用内存
+"""
+
+import os
+import sys
+import uuid
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+_STATE_DIR = tempfile.mkdtemp(prefix='email_api_tests_')
+os.environ['WATERMARK_DB_PATH'] = os.path.join(_STATE_DIR, 'state.db')
+os.environ['JOB_DB_PATH'] = os.path.join(_STATE_DIR, 'jobs.db')
+os.environ['MESSAGE_CACHE_DB_PATH'] = ''
+os.environ['SEARCH_INDEX_DB_PATH'] = ''
+# 各测试使用相同的请求参数，不复用其他测试刚完成的同步结果
+os.environ['SYNC_COALESCE_TTL'] = '0'
+
+from email_providers import EmailProviderFactory  # noqa: E402
+from fake_imap_server import FakeIMAPServer, FakeMailbox  # noqa: E402
+from mailbox_generator import generate_messages  # noqa: E402
+from bench_fetch import LocalEmailProvider  # noqa: E402
+
+PROVIDER = 'test-local'
+MESSAGE_COUNT = 30
+
+
+@pytest.fixture
+def mailbox():
+    """30 封合成邮件（纯文本、HTML、中文、附件），UID 为 1-30"""
+    return FakeMailbox(generate_messages(MESSAGE_COUNT, mix='plain:40,html:20,cjk:20,small:20', seed=1))
+
+
+@pytest.fixture
+def imap_server(mailbox):
+    """只有 INBOX 的模拟服务器，同时注册连接该服务器的提供商 test-local"""
+    server = FakeIMAPServer({'INBOX': mailbox}).start()
+
+    class TestProvider(LocalEmailProvider):
+        def __init__(self, username, password, **kwargs):
+            super().__init__(username, password, host='127.0.0.1', port=server.port, **kwargs)
+
+    EmailProviderFactory.PROVIDERS[PROVIDER] = TestProvider
+    try:
+        yield server
+    finally:
+        EmailProviderFactory.PROVIDERS.pop(PROVIDER, None)
+        server.stop()
+
+
+@pytest.fixture
+def account(imap_server):
+    """同步请求的账号参数；每个测试使用不同的用户名，水位线互不影响"""
+    return {
+        'email_username': f'user-{uuid.uuid4().hex[:8]}@example.com',
+        'email_password': 'secret',
+        'email_provider': PROVIDER
+    }
+
+
+@pytest.fixture
+def client():
+    from app import app
+    return app.test_client()
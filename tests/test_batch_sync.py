@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""多账号批量同步：服务商并发上限、客户端参数校验"""
+
+import time
+import threading
+
+import batch_sync
+from batch_sync import BatchSyncRunner
+
+
+def test_client_cannot_raise_provider_limits():
+    runner = BatchSyncRunner(provider_concurrency={'gmail': 100, 'qq': 1})
+    assert runner._limit_for(runner._provider_key('gmail')) == batch_sync.BATCH_PROVIDER_CONCURRENCY['gmail']
+    assert runner._limit_for(runner._provider_key('qq')) == 1
+
+
+def test_saturated_provider_does_not_block_others(monkeypatch):
+    """gmail 并发为 1 时第二个 gmail 账号排队，qq 账号不在其后等待"""
+    started, release = {}, threading.Event()
+
+    def sync_one(config):
+        started[config['email_username']] = time.perf_counter()
+        if config['email_provider'] == 'gmail':
+            release.wait(5)
+        return {'success': True}
+
+    monkeypatch.setattr(BatchSyncRunner, '_sync_one', staticmethod(sync_one))
+    runner = BatchSyncRunner(max_workers=2, provider_concurrency={'gmail': 1})
+    configs = [{'email_username': 'g1', 'email_provider': 'gmail'},
+               {'email_username': 'g2', 'email_provider': 'gmail'},
+               {'email_username': 'q1', 'email_provider': 'qq'}]
+    results = []
+    thread = threading.Thread(target=lambda: results.extend(runner.run(configs)))
+    thread.start()
+    deadline = time.monotonic() + 5
+    while 'q1' not in started and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert 'q1' in started and 'g2' not in started
+    release.set()
+    thread.join()
+    assert [result['email_username'] for result in results] == ['g1', 'g2', 'q1']
+
+
+def test_invalid_concurrency_is_rejected(client, account):
+    for body in ({'max_workers': 'many'}, {'provider_concurrency': {'gmail': 'x'}},
+                 {'provider_concurrency': [1]}):
+        response = client.post('/api/sync/batch', json={'accounts': [account], **body})
+        assert response.status_code == 400, body
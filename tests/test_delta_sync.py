@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""delta 同步：新邮件、标志变化和已删除的UID（快照对比、CONDSTORE、QRESYNC 三种方式结果相同）"""
+
+import pytest
+
+from email_providers import EmailProviderFactory
+from email_sync_action import EmailSyncAction
+from fake_imap_server import FakeIMAPServer, make_message
+from watermark_store import SqliteWatermarkStore
+from bench_fetch import LocalEmailProvider
+from tests.conftest import PROVIDER
+
+METHODS = {
+    'snapshot': {},
+    'condstore': {'condstore': True},
+    'qresync': {'qresync': True},
+}
+
+
+@pytest.fixture(params=list(METHODS))
+def imap_server(request, mailbox):
+    """按参数声明 CONDSTORE/QRESYNC 能力的模拟服务器"""
+    server = FakeIMAPServer({'INBOX': mailbox}, **METHODS[request.param]).start()
+    server.method = request.param
+
+    class TestProvider(LocalEmailProvider):
+        def __init__(self, username, password, **kwargs):
+            super().__init__(username, password, host='127.0.0.1', port=server.port, **kwargs)
+
+    EmailProviderFactory.PROVIDERS[PROVIDER] = TestProvider
+    try:
+        yield server
+    finally:
+        EmailProviderFactory.PROVIDERS.pop(PROVIDER, None)
+        server.stop()
+
+
+def test_delta_reports_new_flagged_and_expunged(imap_server, mailbox, account):
+    store = SqliteWatermarkStore(':memory:')
+
+    def sync():
+        config = {**account, 'email_count': 10, 'delta': True, 'use_connection_pool': False}
+        result = EmailSyncAction(config, watermark_store=store).sync_emails()
+        assert result['success'] is True, result.get('error')
+        return result
+
+    first = sync()
+    assert first['changes']['method'] == 'initial'
+    assert first['total_emails'] == 10
+
+    unchanged = sync()
+    assert unchanged['total_emails'] == 0
+    assert unchanged['changes'] == {'method': imap_server.method, 'flags': [], 'vanished': []}
+
+    messages = {message['uid']: message for message in mailbox.messages}
+    mailbox.set_flags(messages[3], {'\\Seen', '\\Flagged'})
+    mailbox.expunge([5, 7])
+    new_uid = mailbox.append(make_message(99))
+
+    changed = sync()
+    assert [email['uid'] for email in changed['emails']] == [new_uid]
+    assert changed['last_uid'] == new_uid
+    assert changed['changes']['flags'] == [{'uid': 3, 'flags': ['\\Flagged', '\\Seen']}]
+    assert changed['changes']['vanished'] == [5, 7]
+
+    assert sync()['changes'] == {'method': imap_server.method, 'flags': [], 'vanished': []}
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""自定义邮箱提供商配置不能无意中替换内置提供商"""
+
+import json
+
+import pytest
+
+import email_providers
+from email_providers import EmailProviderFactory
+
+CUSTOM_GMAIL = {'imap': {'server': 'imap.example.com'}}
+
+
+@pytest.fixture(autouse=True)
+def providers(monkeypatch):
+    monkeypatch.setattr(EmailProviderFactory, 'PROVIDERS', dict(EmailProviderFactory.PROVIDERS))
+
+
+@pytest.mark.parametrize('specs', [
+    {'gmail': CUSTOM_GMAIL},
+    {'corp': {**CUSTOM_GMAIL, 'aliases': ['Feishu']}},
+])
+def test_config_cannot_replace_builtin_by_accident(specs):
+    with pytest.raises(ValueError, match='override'):
+        EmailProviderFactory.load_config(text=json.dumps(specs))
+    assert EmailProviderFactory.PROVIDERS['gmail'] is email_providers.GmailProvider
+    assert 'corp' not in EmailProviderFactory.PROVIDERS
+
+
+def test_explicit_override_keeps_builtin_class_aliases():
+    EmailProviderFactory.load_config(text=json.dumps({'gmail': {**CUSTOM_GMAIL, 'override': True}}))
+    assert EmailProviderFactory.PROVIDERS['gmail'].spec['imap']['server'] == 'imap.example.com'
+    assert email_providers.GmailProvider.spec['imap']['server'] == 'imap.gmail.com'
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""新邮件监听：轮询只在邮件数变化时获取新邮件，首次连接失败时不残留连接，webhook 不能指向内部地址"""
+
+import pytest
+
+import mail_watcher
+from email_providers import EmailProviderFactory
+from fake_imap_server import make_message
+from mail_watcher import MailWatchHub, MailboxWatcher, check_webhook_url
+from tests.conftest import PROVIDER
+
+
+@pytest.fixture
+def watcher(account):
+    hub = MailWatchHub()
+    provider = EmailProviderFactory.create_provider(PROVIDER, account['email_username'], account['email_password'])
+    watcher = MailboxWatcher(provider, 'INBOX', hub)
+    watcher._connect()
+    yield watcher
+    watcher._disconnect()
+
+
+def test_poll_without_changes_does_not_check(watcher):
+    for _ in range(3):
+        assert watcher._poll(0) is False
+    assert watcher._stats['checks'] == 0
+
+
+def test_poll_detects_new_mail_once(watcher, mailbox):
+    last_uid = watcher.last_uid
+    mailbox.append(make_message(100))
+    assert watcher._poll(0) is True
+    watcher._check_new()
+    assert watcher.last_uid == last_uid + 1
+    assert watcher._poll(0) is False
+    assert watcher._stats['checks'] == 1
+
+
+def test_failed_start_closes_connection_and_clears_starting(account, monkeypatch):
+    disconnected = []
+    original = MailboxWatcher._disconnect
+
+    def disconnect(self):
+        disconnected.append(self.provider.imap_client is not None)
+        original(self)
+
+    monkeypatch.setattr(MailboxWatcher, '_disconnect', disconnect)
+    hub = MailWatchHub()
+    with pytest.raises(Exception):
+        hub.subscribe(PROVIDER, account['email_username'], account['email_password'], folder='Missing')
+    assert disconnected == [True]
+    assert hub._starting == {} and hub._watchers == {}
+
+
+@pytest.mark.parametrize('url', [
+    'ftp://example.com/hook',
+    'http://127.0.0.1:8080/hook',
+    'http://localhost/hook',
+    'http://169.254.169.254/latest/meta-data',
+    'http://10.0.0.5/hook',
+    'http://[::1]/hook',
+    'http://[::ffff:192.168.1.1]/hook',
+])
+def test_webhook_to_internal_address_is_rejected(client, account, url):
+    response = client.post(f"/api/watch/{account['email_username']}/webhooks", json={'url': url},
+                           headers={'X-Email-Password': account['email_password'],
+                                    'X-Email-Provider': account['email_provider']})
+    assert response.status_code == 400
+
+
+def test_allowed_hosts_permit_internal_webhook(monkeypatch):
+    monkeypatch.setattr(mail_watcher, 'WATCH_WEBHOOK_ALLOWED_HOSTS', {'127.0.0.1'})
+    check_webhook_url('http://127.0.0.1:8080/hook')
+    with pytest.raises(ValueError):
+        check_webhook_url('http://10.0.0.5/hook')
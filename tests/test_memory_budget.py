@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""内存预算：默认不限制；预算不足的邮件只返回描述符并在结果中列出，附件可通过下载接口获取"""
+
+import base64
+
+import pytest
+
+import memory_budget
+from email_providers import EmailProvider
+from memory_budget import MemoryBudget
+
+
+@pytest.fixture
+def small_budget(monkeypatch):
+    budget = MemoryBudget(limit=96 * 1024)
+    monkeypatch.setattr(memory_budget, '_memory_budget', budget)
+    return budget
+
+
+def test_no_size_prefetch_without_limits(client, account, monkeypatch):
+    assert memory_budget.MESSAGE_MEMORY_BUDGET == 0 and memory_budget.LARGE_MESSAGE_BYTES == 0
+
+    def fail(*args, **kwargs):
+        raise AssertionError('未设置内存上限时不应查询 RFC822.SIZE')
+
+    monkeypatch.setattr(EmailProvider, '_fetch_sizes', fail)
+    result = client.post('/api/sync/email', json={**account, 'email_count': 10}).get_json()['data']
+    assert result['success'] is True
+    assert 'omitted_uids' not in result
+    assert not any(email.get('content_omitted') for email in result['emails'])
+
+
+def test_over_budget_messages_are_listed_and_downloadable(client, account, small_budget):
+    body = {**account, 'email_count': 30, 'fetch_batch_size': 30}
+    result = client.post('/api/sync/email', json=body).get_json()['data']
+    assert result['success'] is True
+    omitted = [email for email in result['emails'] if email.get('content_omitted')]
+    assert omitted
+    assert sorted(result['omitted_uids']) == sorted(email['uid'] for email in omitted)
+    # 每封邮件解析后立即归还预留
+    assert small_budget.stats()['in_use_bytes'] == 0
+
+    attachment = next(a for email in omitted for a in email['attachments'])
+    headers = {'X-Email-Username': account['email_username'], 'X-Email-Password': account['email_password'],
+               'X-Email-Provider': account['email_provider']}
+    response = client.get(attachment['download_url'], headers=headers)
+    assert response.status_code == 200
+
+    small_budget.limit = 0
+    full = client.post('/api/sync/email', json={**account, 'email_count': 30}).get_json()['data']
+    inline = next(a for email in full['emails'] for a in email['attachments'] if a['part'] == attachment['part']
+                  and email['uid'] == attachment['uid'])
+    assert base64.b64decode(inline['content']) == response.data
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""解析结果与原有实现（benchmarks/bench_parse.py 中的 legacy_parse）一致"""
+
+import pytest
+
+from bench_parse import legacy_parse, current_parse, build_corpus, _comparable
+from email_providers import EmailProviderFactory
+from mailbox_generator import generate_messages
+from tests.conftest import PROVIDER
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    """300 封按默认比例生成的邮件（含大附件和转发邮件）加上解析基准测试的语料"""
+    return generate_messages(300, seed=0) + [raw for _, raw in build_corpus(1)]
+
+
+def test_single_pass_parser_matches_legacy(corpus):
+    mismatches = [index for index, raw in enumerate(corpus)
+                  if _comparable(current_parse(raw)) != _comparable(legacy_parse(raw))]
+    assert mismatches == []
+
+
+def test_descriptor_mode_omits_content_only(corpus):
+    for raw in corpus[:50]:
+        inline, descriptor = current_parse(raw), current_parse(raw, 'descriptor')
+        assert descriptor['subject'] == inline['subject']
+        assert descriptor['body'] == inline['body']
+        assert [(a['filename'], a['size']) for a in descriptor['attachments']] == \
+            [(a['filename'], a['size']) for a in inline['attachments']]
+        assert all('content' not in attachment for attachment in descriptor['attachments'])
+
+
+def test_fetched_messages_match_legacy_parse(mailbox, account):
+    """经过模拟服务器批量获取和解析的结果与直接解析原始邮件一致"""
+    provider = EmailProviderFactory.create_provider(PROVIDER, account['email_username'], account['email_password'])
+    provider.connect()
+    try:
+        emails = provider.get_emails(count=len(mailbox.messages))
+    finally:
+        provider.disconnect()
+
+    raws = {message['uid']: message['raw'] for message in mailbox.messages}
+    assert sorted(email['uid'] for email in emails) == sorted(raws)
+    for email in emails:
+        assert _comparable(email) == _comparable(legacy_parse(raws[email['uid']]))
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""错误分类、重试和熔断"""
+
+import ssl
+import socket
+import imaplib
+
+import pytest
+
+from resilience import (classify_error, call_with_retry, CircuitBreaker, CircuitOpenError, AuthenticationError,
+                        TransientError, _record_failure)
+
+
+@pytest.mark.parametrize('error, phase, kind', [
+    (imaplib.IMAP4.error('[AUTHENTICATIONFAILED] Invalid credentials'), '', 'auth'),
+    (imaplib.IMAP4.error('LOGIN rejected'), 'login', 'auth'),
+    (imaplib.IMAP4.error('[THROTTLED] Too many connections'), '', 'throttle'),
+    (ConnectionResetError('reset by peer'), '', 'transient'),
+    (socket.timeout('timed out'), '', 'transient'),
+    (socket.gaierror(socket.EAI_AGAIN, 'Temporary failure in name resolution'), '', 'transient'),
+    (socket.gaierror(socket.EAI_NONAME, 'Name or service not known'), '', 'error'),
+    (ssl.SSLCertVerificationError(1, 'certificate verify failed: Hostname mismatch'), '', 'error'),
+    (ValueError('mailbox does not exist'), '', 'error'),
+])
+def test_classify_error(error, phase, kind):
+    assert classify_error(error, phase) == kind
+
+
+def test_breaker_opens_after_threshold_and_recovers_after_probe():
+    breaker = CircuitBreaker('imap.example.com', failure_threshold=2, recovery_timeout=0)
+    for _ in range(2):
+        breaker.before_call()
+        _record_failure(breaker, ConnectionResetError('reset'))
+    assert breaker.state == 'open'
+
+    breaker.before_call()  # 等待时间为 0，转为 half_open 并放行一个试探连接
+    assert breaker.state == 'half_open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_unclassified_error_leaves_breaker_state_unchanged():
+    breaker = CircuitBreaker('imap.example.com', failure_threshold=3)
+    _record_failure(breaker, ConnectionResetError('reset'))
+    _record_failure(breaker, ValueError('unexpected'))
+    assert breaker.stats()['consecutive_failures'] == 1
+    assert breaker.stats()['successes'] == 0
+
+    _record_failure(breaker, imaplib.IMAP4.error('[AUTHENTICATIONFAILED] Invalid credentials'))
+    assert breaker.stats()['consecutive_failures'] == 0
+
+
+def test_unclassified_error_releases_half_open_probe():
+    breaker = CircuitBreaker('imap.example.com', failure_threshold=1, recovery_timeout=0)
+    _record_failure(breaker, ConnectionResetError('reset'))
+    breaker.before_call()
+    _record_failure(breaker, ValueError('unexpected'))
+    assert breaker.state == 'half_open'
+    breaker.before_call()  # 试探名额已释放
+
+
+def test_call_with_retry_retries_transient_errors_only(monkeypatch):
+    monkeypatch.setattr('resilience.backoff_delay', lambda attempt: 0)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionResetError('reset')
+        return 'connected'
+
+    assert call_with_retry('retry.example.com', flaky, max_attempts=3) == 'connected'
+    assert len(attempts) == 3
+
+    def refused():
+        raise ConnectionRefusedError('refused')
+
+    with pytest.raises(TransientError):
+        call_with_retry('refused.example.com', refused, max_attempts=2)
+
+    def bad_login():
+        attempts.append(1)
+        raise PermissionError('bad password')
+
+    attempts.clear()
+    with pytest.raises(AuthenticationError):
+        call_with_retry('auth.example.com', bad_login, max_attempts=3)
+    assert len(attempts) == 1
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""本地搜索索引：默认关闭，开启后同步的邮件可通过 /api/search 搜索，凭据错误时不暴露账号是否存在"""
+
+
+def _headers(account, password=None):
+    return {
+        'X-Email-Username': account['email_username'],
+        'X-Email-Password': password or account['email_password'],
+        'X-Email-Provider': account['email_provider']
+    }
+
+
+def test_search_disabled_by_default(client, account, monkeypatch):
+    monkeypatch.delenv('SEARCH_INDEX_ENABLED', raising=False)
+    response = client.get('/api/search?q=invoice', headers=_headers(account))
+    assert response.status_code == 503
+
+
+def test_synced_messages_are_searchable(client, account, mailbox, monkeypatch):
+    monkeypatch.setenv('SEARCH_INDEX_ENABLED', 'true')
+    response = client.post('/api/sync/email', json={**account, 'email_count': len(mailbox.messages)})
+    assert response.get_json()['data']['success'] is True
+
+    subject = response.get_json()['data']['emails'][0]['subject']
+    word = max(subject.split(), key=len)
+    response = client.get('/api/search', query_string={'subject': word}, headers=_headers(account))
+    assert response.status_code == 200
+    found = response.get_json()
+    assert found['total'] >= 1
+    assert all(word.lower() in email['subject'].lower() for email in found['emails'])
+
+
+def test_unknown_account_and_wrong_password_look_the_same(client, account, monkeypatch):
+    monkeypatch.setenv('SEARCH_INDEX_ENABLED', 'true')
+    client.post('/api/sync/email', json={**account, 'email_count': 1})
+    wrong = client.get('/api/search?q=x', headers=_headers(account, 'wrong'))
+    unknown = client.get('/api/search?q=x', headers=_headers({**account, 'email_username': 'nobody@example.com'}))
+    assert wrong.status_code == unknown.status_code == 401
+    assert wrong.get_json()['error'] == unknown.get_json()['error']
+
+
+def test_repeated_failures_are_throttled(client, account, monkeypatch):
+    import search_index
+
+    monkeypatch.setenv('SEARCH_INDEX_ENABLED', 'true')
+    monkeypatch.setattr(search_index, 'SEARCH_AUTH_MAX_FAILURES', 2)
+    client.post('/api/sync/email', json={**account, 'email_count': 1})
+    for _ in range(2):
+        assert client.get('/api/search?q=x', headers=_headers(account, 'wrong')).status_code == 401
+    response = client.get('/api/search?q=x', headers=_headers(account))
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
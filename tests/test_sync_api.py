@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""/api/sync/email 端到端测试：完整获取、分页、增量、列表模式和NDJSON流式获取"""
+
+import json
+
+from tests.conftest import MESSAGE_COUNT
+from fake_imap_server import make_message
+
+
+def _sync(client, account, **params):
+    response = client.post('/api/sync/email', json={**account, **params})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    document = response.get_json()
+    assert document['success'] is True
+    assert document['data']['success'] is True, document['data'].get('error')
+    return document['data']
+
+
+def test_full_sync_returns_latest_messages(client, account):
+    result = _sync(client, account, email_count=10)
+    assert result['total_emails'] == 10
+    assert [email['uid'] for email in result['emails']] == list(range(MESSAGE_COUNT, MESSAGE_COUNT - 10, -1))
+    assert result['folder'] == 'INBOX'
+    assert result['last_uid'] == MESSAGE_COUNT
+    for email in result['emails']:
+        assert email['subject']
+        assert email['has_attachments'] == bool(email['attachments'])
+        for attachment in email['attachments']:
+            assert attachment['content']
+
+
+def test_pagination_walks_older_pages_without_overlap(client, account):
+    seen, cursor, pages = [], None, 0
+    while True:
+        result = _sync(client, account, email_count=12, cursor=cursor)
+        seen.extend(email['uid'] for email in result['emails'])
+        pages += 1
+        cursor = result['next_cursor']
+        if cursor is None:
+            break
+    assert pages == 3
+    assert seen == list(range(MESSAGE_COUNT, 0, -1))
+
+
+def test_incremental_sync_returns_only_new_messages(client, account, mailbox):
+    first = _sync(client, account, email_count=5, incremental=True)
+    assert first['incremental'] is True
+    assert first['last_uid'] == MESSAGE_COUNT
+
+    assert _sync(client, account, email_count=5, incremental=True)['total_emails'] == 0
+
+    new_uids = [mailbox.append(make_message(100)), mailbox.append(make_message(101))]
+    result = _sync(client, account, email_count=5, incremental=True)
+    assert sorted(email['uid'] for email in result['emails']) == new_uids
+    assert result['last_uid'] == new_uids[-1]
+
+
+def test_envelope_mode_matches_full_headers_with_less_data(client, account, imap_server):
+    imap_server.reset_stats()
+    full = _sync(client, account, email_count=10)
+    full_bytes = imap_server.bytes_sent
+
+    imap_server.reset_stats()
+    envelope = _sync(client, account, email_count=10, mode='envelope')
+    assert imap_server.bytes_sent < full_bytes
+
+    assert [email['uid'] for email in envelope['emails']] == [email['uid'] for email in full['emails']]
+    for listed, fetched in zip(envelope['emails'], full['emails']):
+        assert listed['subject'] == fetched['subject']
+        assert listed['sender'] == fetched['sender']
+        assert listed['has_attachments'] == fetched['has_attachments']
+        assert [a['filename'] for a in listed['attachments']] == [a['filename'] for a in fetched['attachments']]
+        assert all('content' not in attachment for attachment in listed['attachments'])
+
+
+def test_ndjson_stream_matches_buffered_result(client, account):
+    buffered = _sync(client, account, email_count=8)
+
+    response = client.post('/api/sync/email', json={**account, 'email_count': 8},
+                           headers={'Accept': 'application/x-ndjson'})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+    assert [record['type'] for record in records] == ['email'] * 8 + ['summary']
+    assert records[-1]['success'] is True
+    assert records[-1]['total_emails'] == 8
+    assert [record['email'] for record in records[:-1]] == buffered['emails']
+
+
+def test_invalid_provider_is_rejected(client, account):
+    response = client.post('/api/sync/email', json={**account, 'email_provider': 'nope'})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_direct_connection_is_closed_when_fetch_fails(client, account, monkeypatch):
+    from email_providers import EmailProvider
+    from email_sync_action import EmailSyncAction
+
+    disconnected = []
+    original = EmailProvider.disconnect
+
+    def disconnect(self):
+        disconnected.append(self.imap_client is not None)
+        original(self)
+
+    def fail(self, email_provider):
+        raise RuntimeError('fetch failed')
+
+    monkeypatch.setenv('IMAP_POOL_ENABLED', 'false')
+    monkeypatch.setattr(EmailProvider, 'disconnect', disconnect)
+    monkeypatch.setattr(EmailSyncAction, '_fetch_emails', fail)
+    response = client.post('/api/sync/email', json=account)
+    assert response.get_json()['data']['success'] is False
+    assert disconnected == [True]
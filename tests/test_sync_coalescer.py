@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""相同同步请求的合并"""
+
+import time
+import threading
+from collections import Counter
+
+import pytest
+
+from sync_coalescer import SyncCoalescer, sync_key
+
+
+def _concurrent(coalescer, key, count, execute, **kwargs):
+    results = [None] * count
+
+    def run(index):
+        results[index] = coalescer.run(key, execute, **kwargs)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, '等待超时'
+        time.sleep(0.01)
+
+
+def test_concurrent_requests_share_one_execution():
+    coalescer = SyncCoalescer(ttl=0)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def execute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {'success': True, 'emails': []}
+
+    leader = threading.Thread(target=coalescer.run, args=('key', execute))
+    leader.start()
+    started.wait(5)
+    waiters = threading.Thread(target=lambda: _concurrent(coalescer, 'key', 4, execute))
+    waiters.start()
+    _wait_until(lambda: coalescer.stats()['waiting'] == 4)
+    release.set()
+    leader.join()
+    waiters.join()
+    assert len(calls) == 1
+    assert coalescer.stats()['inflight_hits'] == 4
+
+
+def test_recent_result_reused_only_when_allowed():
+    coalescer = SyncCoalescer(ttl=60)
+    calls = []
+
+    def execute():
+        calls.append(1)
+        return {'success': True, 'emails': [{'body': 'x', 'attachments': []}]}
+
+    assert coalescer.run('key', execute)[1] is None
+    assert coalescer.run('key', execute)[1] == 'recent'
+    assert coalescer.run('key', execute, reuse=False)[1] is None
+    assert len(calls) == 2
+
+
+def test_failures_are_not_reused():
+    coalescer = SyncCoalescer(ttl=60)
+
+    def fail():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        coalescer.run('key', fail)
+    assert coalescer.run('key', lambda: {'success': False})[1] is None
+    assert coalescer.stats()['recent_entries'] == 0
+
+
+def test_sync_key_ignores_case_and_hides_password():
+    config = {'email_username': 'User@Example.com', 'email_password': 'secret', 'email_provider': 'Gmail'}
+    key = sync_key(config)
+    assert 'secret' not in key
+    assert key == sync_key({**config, 'email_username': 'user@example.com', 'email_provider': 'gmail'})
+    assert key != sync_key({**config, 'email_password': 'other'})
+
+
+def test_waiting_requests_do_not_build_a_syncer(client, account, monkeypatch):
+    """只有执行同步的请求创建 EmailSyncAction"""
+    import app as app_module
+
+    created, release = [], threading.Event()
+    original = app_module.EmailSyncAction
+
+    class GatedSyncAction(original):
+        def __init__(self, *args, **kwargs):
+            created.append(1)
+            super().__init__(*args, **kwargs)
+
+        def sync_emails(self, emails=None):
+            release.wait(5)
+            return super().sync_emails(emails)
+
+    monkeypatch.setattr(app_module, 'EmailSyncAction', GatedSyncAction)
+    monkeypatch.setenv('SYNC_COALESCE_ENABLED', 'true')
+    from sync_coalescer import get_sync_coalescer
+    coalescer = get_sync_coalescer()
+    statuses = []
+
+    def request():
+        response = client.post('/api/sync/email', json={**account, 'email_count': 3, 'mode': 'envelope'})
+        statuses.append((response.status_code, response.headers.get('X-Sync-Coalesced')))
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    _wait_until(lambda: coalescer.stats()['waiting'] == 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
+    assert Counter(statuses) == {(200, None): 1, (200, 'inflight'): 3}
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""后台同步任务：任务执行、SQLite 队列在进程间共享、心跳和结果摘要"""
+
+import os
+import time
+import threading
+
+from sync_jobs import SyncJobManager, SqliteJobStore, MemoryJobStore, result_summary
+
+
+def _wait_finished(manager, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job['status'] in ('succeeded', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"任务 {job_id} 未在 {timeout} 秒内结束")
+
+
+def test_job_runs_sync_and_hides_password(account):
+    manager = SyncJobManager(MemoryJobStore(), workers=1, poll_interval=0.05)
+    manager.start()
+    try:
+        job = manager.submit({**account, 'email_count': 5, 'use_connection_pool': False})
+        assert job['status'] == 'queued'
+        assert 'email_password' not in job['config']
+        finished = _wait_finished(manager, job['job_id'])
+    finally:
+        manager.stop()
+    assert finished['status'] == 'succeeded', finished['error']
+    assert finished['result']['total_emails'] == 5
+
+
+def test_sqlite_store_is_shared_between_processes(account, tmp_path):
+    """两个 worker 各自打开同一个数据库：一个提交任务，另一个执行并能查询到结果"""
+    db_path = os.path.join(tmp_path, 'jobs.db')
+    submitter = SyncJobManager(SqliteJobStore(db_path), workers=1)
+    runner = SyncJobManager(SqliteJobStore(db_path), workers=1, poll_interval=0.05)
+    job = submitter.submit({**account, 'email_count': 3, 'use_connection_pool': False})
+    runner.start()
+    try:
+        finished = _wait_finished(submitter, job['job_id'])
+    finally:
+        runner.stop()
+    assert finished['status'] == 'succeeded', finished['error']
+    assert finished['result']['total_emails'] == 3
+
+
+def test_only_jobs_without_heartbeat_are_requeued(account, tmp_path, monkeypatch):
+    """执行时间超过 JOB_STALE_SECONDS 但仍有心跳的任务不重新排队"""
+    from email_sync_action import EmailSyncAction
+
+    started, release = threading.Event(), threading.Event()
+
+    def slow_sync(self, emails=None):
+        started.set()
+        release.wait(10)
+        return {'success': True, 'total_emails': 0}
+
+    monkeypatch.setattr(EmailSyncAction, 'sync_emails', slow_sync)
+    db_path = os.path.join(tmp_path, 'jobs.db')
+    runner = SyncJobManager(SqliteJobStore(db_path), workers=1, poll_interval=0.05, heartbeat_interval=0.05)
+    other = SqliteJobStore(db_path)
+    job = runner.submit({**account, 'email_count': 1})
+    runner.start()
+    try:
+        assert started.wait(5)
+        time.sleep(0.3)
+        assert other.requeue_stale(time.time() - 0.2) == 0
+        claimed = other.get(job['job_id'])
+        assert claimed['owner'] == f"{os.uname().nodename}:{os.getpid()}"
+        assert claimed['heartbeat_at'] > claimed['started_at']
+    finally:
+        release.set()
+        runner.stop()
+    assert _wait_finished(runner, job['job_id'])['status'] == 'succeeded'
+
+    # 执行进程退出后心跳停止
+    orphan = SqliteJobStore(db_path)
+    job = SyncJobManager(orphan).submit({**account, 'email_count': 1})
+    orphan.claim()
+    assert other.requeue_stale(time.time() + 1) == 1
+    assert other.get(job['job_id'])['status'] == 'queued'
+
+
+def test_large_results_keep_only_summary():
+    result = {
+        'success': True,
+        'total_emails': 2,
+        'last_uid': 42,
+        'emails': [{'uid': 42, 'body': 'x' * 4096, 'attachments': []}],
+        'logs': ['[INFO] done']
+    }
+    assert result_summary(result, max_bytes=0) is result
+    assert result_summary(result, max_bytes=1024 * 1024) is result
+    assert result_summary(result, max_bytes=1024) == {
+        'success': True,
+        'total_emails': 2,
+        'last_uid': 42,
+        'emails_omitted': True
+    }
+    assert result_summary(None) is None
+
+
+def test_status_does_not_start_job_manager(client, monkeypatch):
+    import sync_jobs
+
+    monkeypatch.setattr(sync_jobs, '_default_manager', None)
+    assert client.get('/api/status').get_json()['jobs'] is None
+    assert client.get('/metrics').status_code == 200
+    assert sync_jobs._default_manager is None
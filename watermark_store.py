@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""增量同步水位线存储
+按 (邮箱类型, 用户名, 文件夹) 记录上次同步的 UIDVALIDITY 和最后一个UID，
+以及同步完成时文件夹的 STATUS（多文件夹同步据此跳过未变化的文件夹）；
+delta 同步另外保存文件夹的变化检测状态（HIGHESTMODSEQ 或压缩的 UID+标志 快照，见 EmailProvider.get_changes）
+默认使用SQLite持久化，可通过继承 WatermarkStore 替换为其他存储
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+DEFAULT_WATERMARK_DB = os.getenv('WATERMARK_DB_PATH', 'email_sync_state.db')
+
+
+class WatermarkStore(ABC):
+    """水位线存储基类"""
+
+    @abstractmethod
+    def get(self, provider: str, username: str, folder: str) -> Optional[Dict[str, Any]]:
+        """获取水位线，返回 {'uidvalidity': int, 'last_uid': int, 'status': dict或None} 或 None"""
+        pass
+
+    @abstractmethod
+    def set(self, provider: str, username: str, folder: str, uidvalidity: Optional[int], last_uid: int,
+            status: Optional[Dict[str, int]] = None):
+        """保存水位线，status 为文件夹已全部同步时的 STATUS 结果"""
+        pass
+
+    def delete(self, provider: str, username: str, folder: str):
+        """删除水位线（下次同步退回全量获取）"""
+        pass
+
+    def get_delta_state(self, provider: str, username: str, folder: str) -> Optional[Dict[str, Any]]:
+        """获取 delta 同步的变化检测状态，不支持时返回 None（每次 delta 同步都只记录状态、不返回变化）"""
+        return None
+
+    def set_delta_state(self, provider: str, username: str, folder: str, state: Dict[str, Any]):
+        """保存 delta 同步的变化检测状态"""
+        pass
+
+
+class MemoryWatermarkStore(WatermarkStore):
+    """进程内存储，进程重启后丢失"""
+
+    def __init__(self):
+        self._data = {}
+        self._delta = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(provider: str, username: str, folder: str) -> Tuple[str, str, str]:
+        return (provider.lower(), username.lower(), folder)
+
+    def get(self, provider, username, folder):
+        with self._lock:
+            value = self._data.get(self._key(provider, username, folder))
+            return dict(value) if value else None
+
+    def set(self, provider, username, folder, uidvalidity, last_uid, status=None):
+        with self._lock:
+            self._data[self._key(provider, username, folder)] = {
+                'uidvalidity': uidvalidity,
+                'last_uid': last_uid,
+                'status': dict(status) if status else None
+            }
+
+    def delete(self, provider, username, folder):
+        with self._lock:
+            self._data.pop(self._key(provider, username, folder), None)
+            self._delta.pop(self._key(provider, username, folder), None)
+
+    def get_delta_state(self, provider, username, folder):
+        with self._lock:
+            value = self._delta.get(self._key(provider, username, folder))
+            return json.loads(value) if value else None
+
+    def set_delta_state(self, provider, username, folder, state):
+        with self._lock:
+            self._delta[self._key(provider, username, folder)] = json.dumps(state)
+
+
+class SqliteWatermarkStore(WatermarkStore):
+    """SQLite存储（默认）"""
+
+    def __init__(self, db_path: str = DEFAULT_WATERMARK_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS watermarks (
+                provider TEXT NOT NULL,
+                username TEXT NOT NULL,
+                folder TEXT NOT NULL,
+                uidvalidity INTEGER,
+                last_uid INTEGER NOT NULL,
+                updated_at TEXT NOT NULL,
+                status TEXT,
+                PRIMARY KEY (provider, username, folder)
+            )
+        ''')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS delta_states (
+                provider TEXT NOT NULL,
+                username TEXT NOT NULL,
+                folder TEXT NOT NULL,
+                state TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (provider, username, folder)
+            )
+        ''')
+        # 旧版本创建的表没有 status 列
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(watermarks)')]
+        if 'status' not in columns:
+            self._conn.execute('ALTER TABLE watermarks ADD COLUMN status TEXT')
+        self._conn.commit()
+
+    def get(self, provider, username, folder):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT uidvalidity, last_uid, status FROM watermarks '
+                'WHERE provider = ? AND username = ? AND folder = ?',
+                (provider.lower(), username.lower(), folder)
+            ).fetchone()
+        if not row:
+            return None
+        return {'uidvalidity': row[0], 'last_uid': row[1], 'status': json.loads(row[2]) if row[2] else None}
+
+    def set(self, provider, username, folder, uidvalidity, last_uid, status=None):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO watermarks (provider, username, folder, uidvalidity, last_uid, updated_at, status) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (provider.lower(), username.lower(), folder, uidvalidity, last_uid, datetime.now().isoformat(),
+                 json.dumps(status, sort_keys=True) if status else None)
+            )
+            self._conn.commit()
+
+    def delete(self, provider, username, folder):
+        with self._lock:
+            for table in ('watermarks', 'delta_states'):
+                self._conn.execute(
+                    f'DELETE FROM {table} WHERE provider = ? AND username = ? AND folder = ?',
+                    (provider.lower(), username.lower(), folder)
+                )
+            self._conn.commit()
+
+    def get_delta_state(self, provider, username, folder):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT state FROM delta_states WHERE provider = ? AND username = ? AND folder = ?',
+                (provider.lower(), username.lower(), folder)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_delta_state(self, provider, username, folder, state):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO delta_states (provider, username, folder, state, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (provider.lower(), username.lower(), folder, json.dumps(state), datetime.now().isoformat())
+            )
+            self._conn.commit()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_watermark_store() -> WatermarkStore:
+    """获取进程内共享的默认水位线存储"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SqliteWatermarkStore()
+        return _default_store